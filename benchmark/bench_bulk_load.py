@@ -0,0 +1,70 @@
+import argparse
+import numpy as np
+import os
+import pandas as pd
+import sqlite3
+import tempfile
+import time
+
+from src.create_museum_db import MUSEUM_COLUMN_NAMES, create_db
+
+
+def make_museum_db_dfs(rows: int, cities: int = 1000, seed: int = 0):
+    '''
+    Make synthetic city and museum tables in the shape create_db expects.
+
+    :param rows: number of museums
+    :param cities: number of cities
+    :param seed: random seed
+    :return:
+        city_df_for_sql: a dataframe for the city table
+        museum_df_for_sql: a dataframe for the museum table
+    '''
+
+    rng = np.random.default_rng(seed)
+    city_df_for_sql = pd.DataFrame({
+        'city': np.char.add('City ', np.arange(cities).astype(str)).astype(object),
+        'country': np.char.add('Country ', (np.arange(cities) % 50).astype(str)).astype(object),
+        'population': rng.integers(10_000, 20_000_000, cities).astype(float),
+        'city_id': np.arange(1, cities + 1),
+    })
+
+    names = np.char.add('Museum ', np.arange(rows).astype(str)).astype(object)
+    museum_df_for_sql = pd.DataFrame(index=range(rows), columns=list(MUSEUM_COLUMN_NAMES.values()), dtype=object)
+    museum_df_for_sql = museum_df_for_sql.assign(
+        name=names, city_id=rng.integers(1, cities + 1, rows), visitors=rng.integers(1_000, 10_000_000, rows),
+        wiki_link=names, latitude=rng.uniform(-60, 70, rows), longitude=rng.uniform(-180, 180, rows),
+        established_year=rng.integers(1500, 2020, rows).astype(str).astype(object), museum_key=names,
+        revision_id=rng.integers(1, 10 ** 9, rows),
+        **{column: rng.integers(0, 2, rows, dtype=np.int8) for column in MUSEUM_COLUMN_NAMES.values()
+           if column.startswith('is_')})
+    museum_df_for_sql['id'] = range(1, rows + 1)
+    return city_df_for_sql, museum_df_for_sql
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk loading synthetic museums into sqlite.')
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--cities', type=int, default=1000)
+    args = parser.parse_args()
+
+    city_df_for_sql, museum_df_for_sql = make_museum_db_dfs(args.rows, args.cities)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path = os.path.join(tmp_dir, 'museum_analysis.db')
+        start = time.perf_counter()
+        create_db(city_df_for_sql, museum_df_for_sql, database_path)
+        seconds = time.perf_counter() - start
+
+        with sqlite3.connect(database_path) as conn:
+            museums = conn.execute('SELECT COUNT(*) FROM museum').fetchone()[0]
+            primary_keys = [row[1] for row in conn.execute('PRAGMA table_info(museum)') if row[5]]
+            indexes = [row[1] for row in conn.execute('PRAGMA index_list(museum)')]
+            foreign_keys = [(row[2], row[3], row[4]) for row in conn.execute('PRAGMA foreign_key_list(museum)')]
+
+    print(f'{museums} museums loaded in {seconds:.3f} s, {museums / seconds:,.0f} rows/s, indexes included')
+    print(f'primary key: {primary_keys}, foreign keys: {foreign_keys}')
+    print(f'indexes: {indexes}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import numpy as np
+import pandas as pd
+import time
+
+from src.clean_museum_data import (clean_established, clean_established_column, clean_museum_character_data,
+                                   one_hot_encode_museum_types, one_hot_encoding_museum_type)
+
+MUSEUM_TYPES = np.array(['Art museum', 'Natural history museum', 'Science museum', 'Archaeology museum',
+                         'History and culture museum', 'Maritime museum', np.nan], dtype=object)
+
+
+def make_museum_character_df(rows: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    Make a synthetic museum dataframe with the columns clean_museum_character_data needs.
+
+    :param rows: number of museums
+    :param seed: random seed
+    :return: a dataframe with name, Type, Established and Visitors columns
+    '''
+
+    rng = np.random.default_rng(seed)
+    established = np.array([f'{day} March {year}' for year in range(1500, 2020) for day in (1, 15)] + [np.nan],
+                           dtype=object)
+    return pd.DataFrame({
+        'name': np.char.add('Museum ', np.arange(rows).astype(str)).astype(object),
+        'Type': MUSEUM_TYPES[rng.integers(0, len(MUSEUM_TYPES), rows)],
+        'Established': established[rng.integers(0, len(established), rows)],
+        'Visitors': '1 million (2019)',
+    })
+
+
+def time_it(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark museum character cleaning on synthetic data.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--row-function-rows', type=int, default=100_000,
+                        help='rows for the per-row reference functions, which are much slower')
+    args = parser.parse_args()
+
+    df = make_museum_character_df(args.rows)
+    print(f'{args.rows} rows')
+    print(f'clean_established_column:     {time_it(clean_established_column, df["Established"]):.3f} s')
+    print(f'one_hot_encode_museum_types:  {time_it(one_hot_encode_museum_types, df["Type"]):.3f} s')
+    print(f'clean_museum_character_data:  {time_it(clean_museum_character_data, df.copy()):.3f} s')
+
+    small_df = df.head(args.row_function_rows)
+    print(f'{args.row_function_rows} rows with the per-row functions')
+    print(f'clean_established:            '
+          f'{time_it(lambda: small_df["Established"].apply(clean_established)):.3f} s')
+    print(f'one_hot_encoding_museum_type: '
+          f'{time_it(lambda: small_df.apply(one_hot_encoding_museum_type, axis=1, result_type="expand")):.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import glob
+import os
+import timeit
+
+from src.infobox_parser import parse_infobox, parse_infobox_with_soup
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '../test/fixtures')
+
+
+def benchmark_infobox_parse(fixtures_dir: str = FIXTURES_DIR, repeat: int = 20) -> list:
+    '''
+    Time the lxml infobox extractor against the BeautifulSoup parser on modelled article html.
+    Only parsing is timed, the html is read from disk before timing.
+
+    :param fixtures_dir: directory of the .html fixtures
+    :param repeat: number of times every page is parsed
+    :return: a list of (fixture name, page bytes, soup seconds per page, lxml seconds per page)
+    '''
+
+    results = []
+    for fixture_file in sorted(glob.glob(os.path.join(fixtures_dir, '*.html'))):
+        with open(fixture_file, encoding='utf-8') as f:
+            html = f.read()
+
+        if parse_infobox(html) != parse_infobox_with_soup(html):
+            raise AssertionError(f'The parsers disagree on {fixture_file}.')
+
+        soup_seconds = min(timeit.repeat(lambda: parse_infobox_with_soup(html), number=1, repeat=repeat))
+        lxml_seconds = min(timeit.repeat(lambda: parse_infobox(html), number=1, repeat=repeat))
+        results.append((os.path.basename(fixture_file), len(html.encode('utf-8')), soup_seconds, lxml_seconds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark infobox parsing on modelled article html.')
+    parser.add_argument('--fixtures-dir', default=FIXTURES_DIR)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"page":<45}{"bytes":>10}{"soup ms":>12}{"lxml ms":>12}{"speedup":>10}')
+    for name, size, soup_seconds, lxml_seconds in benchmark_infobox_parse(args.fixtures_dir, args.repeat):
+        print(f'{name:<45}{size:>10}{soup_seconds * 1000:>12.3f}{lxml_seconds * 1000:>12.3f}'
+              f'{soup_seconds / lxml_seconds:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import numpy as np
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmark.bench_bulk_load import make_museum_db_dfs
+from src.connection_pool import ConnectionPool
+from src.create_museum_db import create_db
+from src.geo import haversine_km
+from src.museum_queries import MuseumQueries
+
+SCAN_MUSEUM_LOCATIONS_SQL = 'SELECT id, latitude, longitude FROM museum;'
+
+
+def scan_museum_locations(conn: sqlite3.Connection) -> tuple:
+    '''
+    Read the coordinates of all museums, like a query without the R*Tree has to.
+
+    :param conn: a connection to the museum database
+    :return: arrays of the ids, latitudes and longitudes of the museums
+    '''
+
+    rows = np.array(conn.execute(SCAN_MUSEUM_LOCATIONS_SQL).fetchall(), dtype=np.float64)
+    return rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+
+
+def scan_box(conn: sqlite3.Connection, min_latitude: float, min_longitude: float, max_latitude: float,
+             max_longitude: float) -> list:
+    ids, latitudes, longitudes = scan_museum_locations(conn)
+    inside = ((latitudes >= min_latitude) & (latitudes <= max_latitude) & (longitudes >= min_longitude)
+              & (longitudes <= max_longitude))
+    return sorted(ids[inside])
+
+
+def scan_radius(conn: sqlite3.Connection, latitude: float, longitude: float, radius_km: float) -> list:
+    ids, latitudes, longitudes = scan_museum_locations(conn)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    order = np.lexsort((ids, distances))
+    return list(ids[order][distances[order] <= radius_km])
+
+
+def scan_nearest(conn: sqlite3.Connection, latitude: float, longitude: float, count: int) -> list:
+    ids, latitudes, longitudes = scan_museum_locations(conn)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    return list(ids[np.lexsort((ids, distances))][:count])
+
+
+def time_queries(run, points: list) -> tuple:
+    '''
+    :param run: a function of a point which runs a query
+    :param points: the (latitude, longitude) of every query
+    :return: the seconds per query and the results
+    '''
+
+    start = time.perf_counter()
+    results = [run(latitude, longitude) for latitude, longitude in points]
+    return (time.perf_counter() - start) / len(points), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark R*Tree spatial queries against scanning the museums.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--box-degrees', type=float, default=2.0, help='width and height of the searched boxes')
+    parser.add_argument('--radius-km', type=float, default=100.0)
+    parser.add_argument('--count', type=int, default=10, help='number of nearest museums')
+    args = parser.parse_args()
+
+    city_df_for_sql, museum_df_for_sql = make_museum_db_dfs(args.rows)
+    rng = np.random.default_rng(1)
+    points = list(zip(rng.uniform(-55, 65, args.queries), rng.uniform(-175, 175, args.queries)))
+    half = args.box_degrees / 2
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path = os.path.join(tmp_dir, 'museum_analysis.db')
+        start = time.perf_counter()
+        create_db(city_df_for_sql, museum_df_for_sql, database_path)
+        print(f'{args.rows} museums loaded in {time.perf_counter() - start:.3f} s, R*Tree included')
+
+        pool = ConnectionPool(database_path)
+        queries = MuseumQueries(pool, cache_size=0)
+        benchmarks = {
+            'box': (lambda lat, lng: [museum.id for museum in queries.museums_in_box(lat - half, lng - half,
+                                                                                      lat + half, lng + half)],
+                    lambda conn, lat, lng: scan_box(conn, lat - half, lng - half, lat + half, lng + half)),
+            'radius': (lambda lat, lng: [museum.id for museum in queries.museums_within_radius(lat, lng,
+                                                                                                args.radius_km)],
+                       lambda conn, lat, lng: scan_radius(conn, lat, lng, args.radius_km)),
+            'nearest': (lambda lat, lng: [museum.id for museum in queries.nearest_museums(lat, lng, args.count)],
+                        lambda conn, lat, lng: scan_nearest(conn, lat, lng, args.count)),
+        }
+
+        with sqlite3.connect(database_path) as conn:
+            for name, (rtree_query, scan_query) in benchmarks.items():
+                rtree_seconds, rtree_results = time_queries(rtree_query, points)
+                scan_seconds, scan_results = time_queries(lambda lat, lng: scan_query(conn, lat, lng), points)
+                same = all(list(rtree) == list(scan) for rtree, scan in zip(rtree_results, scan_results))
+                museums = np.mean([len(result) for result in rtree_results])
+                print(f'{name}: R*Tree {rtree_seconds * 1000:.2f} ms, scan {scan_seconds * 1000:.2f} ms per query, '
+                      f'{scan_seconds / rtree_seconds:.0f}x faster, {museums:.1f} museums per query, '
+                      f'same results: {same}')
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
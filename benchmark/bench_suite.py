@@ -0,0 +1,289 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmark.bench_bulk_load import make_museum_db_dfs
+from benchmark.bench_clean_museum_data import make_museum_character_df
+from benchmark.generators import (FIXTURES_DIR, make_infobox_html, make_museum_all_data_df, make_wiki_pages,
+                                  make_wiki_wikitexts, make_world_cities_df, read_modelled_fixtures,
+                                  write_world_cities_csv)
+from collections import namedtuple
+from contextlib import ExitStack
+from src import add_city_population
+from src.add_city_population import add_city_population_to_museum
+from src.city_resolver import CityResolver
+from src.clean_museum_data import clean_museum_character_data
+from src.correlate_pop_visitor import correlate_population_visitors
+from src.create_museum_db import create_db
+from src.infobox_parser import parse_infobox
+from src.log_handler import get_logger
+from src.museum_pipeline import stream_museum_data
+from src.page_source import MediaWikiPageSource, WikitextPageSource
+from src.world_cities_index import WorldCitiesIndex
+
+# The stub wiki server is a test helper, shared with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../test'))
+from stub_wiki_server import StubWikiServer  # noqa: E402
+
+# No real Wikipedia pages are recorded in this repository. The articles of test/fixtures are modelled by hand on
+# the parse API output, and all other articles are synthetic, so the benchmarks measure the code on pages of a
+# realistic shape and size, not on the real articles.
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_SIZES = [100, 10_000]
+DEFAULT_REPEAT = 3
+DEFAULT_MAX_FETCH_PAGES = 1000
+
+# A benchmark regressed when it is this much slower than its baseline, and by more than MIN_REGRESSION_SECONDS,
+# so the timer noise of very short benchmarks does not fail the run
+DEFAULT_THRESHOLD = 0.25
+MIN_REGRESSION_SECONDS = 0.005
+
+# Cities of the museums on the stub list page, which are in doc/worldcities.csv
+FETCH_CITIES = ['Paris', 'London', 'Tokyo', 'Madrid', 'Rome', 'Washington, D.C.', 'Beijing', 'New York City']
+
+BenchmarkResult = namedtuple('BenchmarkResult', ['stage', 'size', 'rows', 'seconds', 'rows_per_second'])
+Regression = namedtuple('Regression', ['stage', 'size', 'seconds', 'baseline_seconds', 'slowdown'])
+
+
+def setup_fetch(size: int, stack: ExitStack, tmp_dir: str, max_fetch_pages: int = DEFAULT_MAX_FETCH_PAGES) -> tuple:
+    '''
+    Fetch, parse, clean and enrich museums through the MediaWiki page source, from a local stub wiki which
+    serves the modelled articles and synthetic articles. The number of pages is capped by max_fetch_pages.
+    '''
+
+    pages = min(size, max_fetch_pages)
+    server = stack.enter_context(StubWikiServer(make_wiki_pages(pages, FETCH_CITIES)))
+    page_source = MediaWikiPageSource(server.api_url)
+    return pages, lambda: stream_museum_data(page_source)
+
+
+def setup_fetch_wikitext(size: int, stack: ExitStack, tmp_dir: str,
+                         max_fetch_pages: int = DEFAULT_MAX_FETCH_PAGES) -> tuple:
+    '''
+    The fetch benchmark with the wikitext page source, which fetches the museum pages in batches as wikitext.
+    '''
+
+    pages = min(size, max_fetch_pages)
+    wiki_pages = make_wiki_pages(pages, FETCH_CITIES)
+    server = stack.enter_context(StubWikiServer(wiki_pages, wikitexts=make_wiki_wikitexts(wiki_pages)))
+    page_source = WikitextPageSource(server.api_url)
+    return pages, lambda: stream_museum_data(page_source)
+
+
+def setup_parse(size: int, stack: ExitStack, tmp_dir: str) -> tuple:
+    '''
+    Parse the infoboxes of size pages, cycling through the modelled articles and up to 1000 synthetic articles.
+    '''
+
+    pages = list(read_modelled_fixtures(FIXTURES_DIR).values()) + [make_infobox_html(i) for i in range(min(size, 1000))]
+
+    def parse_all():
+        for i in range(size):
+            parse_infobox(pages[i % len(pages)])
+
+    return size, parse_all
+
+
+def setup_clean(size: int, stack: ExitStack, tmp_dir: str) -> tuple:
+    '''
+    Clean size synthetic museums of the list page and their infoboxes.
+    '''
+
+    museum_character_df = make_museum_character_df(size)
+    return size, lambda: clean_museum_character_data(museum_character_df.copy())
+
+
+def setup_city_join(size: int, stack: ExitStack, tmp_dir: str) -> tuple:
+    '''
+    Join size synthetic museums with a synthetic world cities table of size cities.
+    Compiling the cities index and building its KD-tree are not timed.
+    '''
+
+    world_cities_df = make_world_cities_df(size)
+    csv_path = write_world_cities_csv(world_cities_df, os.path.join(tmp_dir, 'worldcities.csv'))
+    index = WorldCitiesIndex.load(csv_path, index_dir=os.path.join(tmp_dir, 'world_cities'))
+
+    saved = add_city_population.world_cities_index, add_city_population.city_resolver
+    stack.callback(lambda: setattr(add_city_population, 'world_cities_index', saved[0]))
+    stack.callback(lambda: setattr(add_city_population, 'city_resolver', saved[1]))
+    add_city_population.world_cities_index = index
+    add_city_population.city_resolver = CityResolver(index)
+
+    museum_df = make_museum_all_data_df(size, world_cities_df).drop(columns=['country', 'population'])
+    return size, lambda: add_city_population_to_museum(museum_df)
+
+
+def setup_sqlite_load(size: int, stack: ExitStack, tmp_dir: str) -> tuple:
+    '''
+    Load size synthetic museums and their cities into a new SQLite database, indexes included.
+    '''
+
+    city_df_for_sql, museum_df_for_sql = make_museum_db_dfs(size, cities=max(size // 100, 10))
+    database_path = os.path.join(tmp_dir, 'museum_analysis.db')
+    return size, lambda: create_db(city_df_for_sql, museum_df_for_sql, database_path)
+
+
+def setup_correlation(size: int, stack: ExitStack, tmp_dir: str) -> tuple:
+    '''
+    Correlate the population and visitors of size synthetic museums. Every bootstrap batch holds
+    resamples x museums indices, so the number of resamples shrinks as the museums grow.
+    '''
+
+    museum_all_data_df = make_museum_all_data_df(size)
+    resamples = max(10, min(1000, 10_000_000 // size))
+    return size, lambda: correlate_population_visitors(museum_all_data_df, resamples=resamples)
+
+
+BENCHMARK_STAGES = {
+    'fetch': setup_fetch,
+    'fetch_wikitext': setup_fetch_wikitext,
+    'parse': setup_parse,
+    'clean': setup_clean,
+    'city_join': setup_city_join,
+    'sqlite_load': setup_sqlite_load,
+    'correlation': setup_correlation,
+}
+
+# The stages which fetch pages from the stub wiki, their number of pages is capped
+FETCH_STAGES = ['fetch', 'fetch_wikitext']
+
+
+def run_benchmarks(stages: list = None, sizes: list = None, repeat: int = DEFAULT_REPEAT,
+                   max_fetch_pages: int = DEFAULT_MAX_FETCH_PAGES) -> list:
+    '''
+    Run the benchmark of every stage at every size. The data is generated before timing,
+    and the fastest of repeat runs is kept, which is the least disturbed by other processes.
+
+    :param stages: names of the stages, defaults to all of BENCHMARK_STAGES
+    :param sizes: numbers of rows, defaults to DEFAULT_SIZES
+    :param repeat: number of timed runs of every benchmark
+    :param max_fetch_pages: maximum number of pages served to the fetch benchmark
+    :return: a list of BenchmarkResults
+    '''
+
+    results = []
+    for stage in stages or list(BENCHMARK_STAGES):
+        for size in sizes or DEFAULT_SIZES:
+            with tempfile.TemporaryDirectory() as tmp_dir, ExitStack() as stack:
+                if stage in FETCH_STAGES:
+                    rows, run = BENCHMARK_STAGES[stage](size, stack, tmp_dir, max_fetch_pages)
+                else:
+                    rows, run = BENCHMARK_STAGES[stage](size, stack, tmp_dir)
+
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    run()
+                    seconds.append(time.perf_counter() - start)
+
+            best = min(seconds)
+            results.append(BenchmarkResult(stage, size, rows, best, rows / best if best > 0 else float('inf')))
+    return results
+
+
+def compare_to_baseline(results: list, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    '''
+    Find the benchmarks which are slower than their baseline by more than threshold.
+    Benchmarks without a baseline are not compared.
+
+    :param results: a list of BenchmarkResults
+    :param baseline: a baseline read by read_baseline
+    :param threshold: allowed slowdown, 0.25 allows 25% slower than the baseline
+    :return: a list of Regressions
+    '''
+
+    regressions = []
+    for result in results:
+        expected = baseline.get('results', {}).get(baseline_key(result.stage, result.size))
+        if expected is None:
+            continue
+        if result.seconds > expected['seconds'] * (1 + threshold) \
+                and result.seconds - expected['seconds'] > MIN_REGRESSION_SECONDS:
+            regressions.append(Regression(result.stage, result.size, result.seconds, expected['seconds'],
+                                          result.seconds / expected['seconds']))
+    return regressions
+
+
+def baseline_key(stage: str, size: int) -> str:
+    return f'{stage}:{size}'
+
+
+def read_baseline(path: str) -> dict:
+    '''
+    :param path: path of the baseline file
+    :return: the baseline, an empty baseline when the file does not exist
+    '''
+
+    if not os.path.exists(path):
+        return {'results': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_baseline(path: str, results: list) -> None:
+    '''
+    Save results as the baseline. Benchmarks of the baseline which were not run are kept.
+
+    :param path: path of the baseline file
+    :param results: a list of BenchmarkResults
+    :return: None
+    '''
+
+    baseline = read_baseline(path)
+    baseline.update({'python': platform.python_version(), 'platform': platform.platform(), 'updated': time.time()})
+    for result in results:
+        baseline['results'][baseline_key(result.stage, result.size)] = {'rows': result.rows, 'seconds': result.seconds,
+                                                                      'rows_per_second': result.rows_per_second}
+    baseline['results'] = dict(sorted(baseline['results'].items()))
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage offline, and fail on regressions '
+                                                 'against a saved baseline.')
+    parser.add_argument('--stages', nargs='+', choices=list(BENCHMARK_STAGES), default=list(BENCHMARK_STAGES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help='numbers of rows, from 100 to 1000000')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--max-fetch-pages', type=int, default=DEFAULT_MAX_FETCH_PAGES,
+                        help='maximum number of pages served to the fetch benchmarks')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown against the baseline, 0.25 is 25%%')
+    parser.add_argument('--update-baseline', action='store_true', help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    # The stages log every step at INFO, which would bury the results
+    get_logger().setLevel(logging.WARNING)
+
+    baseline = read_baseline(args.baseline)
+    results = run_benchmarks(args.stages, args.sizes, args.repeat, args.max_fetch_pages)
+
+    print(f'{"stage":<14}{"size":>10}{"rows":>10}{"seconds":>12}{"rows/s":>14}{"baseline":>12}')
+    for result in results:
+        expected = baseline['results'].get(baseline_key(result.stage, result.size))
+        baseline_seconds = f'{expected["seconds"]:.4f}' if expected else '-'
+        print(f'{result.stage:<14}{result.size:>10}{result.rows:>10}{result.seconds:>12.4f}'
+              f'{result.rows_per_second:>14,.0f}{baseline_seconds:>12}')
+
+    if args.update_baseline:
+        write_baseline(args.baseline, results)
+        print(f'Saved the baseline to {args.baseline}.')
+        return
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression.stage} at {regression.size} rows: {regression.seconds:.4f}s, '
+              f'baseline {regression.baseline_seconds:.4f}s, {regression.slowdown:.2f}x')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
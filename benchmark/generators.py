@@ -0,0 +1,234 @@
+import glob
+import numpy as np
+import os
+import pandas as pd
+import re
+
+from src.clean_museum_data import MUSEUM_TYPE_KEYWORDS
+from src.fetch_museum_data import MOST_VISITED_MUSEUMS_PAGE_NAME
+
+# Article html modelled on the output of the MediaWiki parse API for a few museums. They were written by hand,
+# Wikipedia was not reachable, so they are not recordings of the real pages.
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '../test/fixtures')
+
+MUSEUM_TYPES = ['Art museum', 'Natural history museum', 'Science museum', 'Archaeology museum',
+                'History and culture museum', 'Maritime museum']
+
+# Paragraphs of article text around the infobox, so a synthetic page is about as big as a short article
+DEFAULT_FILLER_PARAGRAPHS = 40
+FILLER_PARAGRAPH = ('<p>The museum holds a collection of paintings, sculptures and objects from many periods. '
+                    '<a href="/wiki/Collection">Collection</a> items are shown in permanent and temporary '
+                    'exhibitions.<sup class="reference"><a href="#cite_note-1">[1]</a></sup></p>')
+
+FILLER_WIKITEXT_PARAGRAPH = ('The museum holds a collection of paintings, sculptures and objects from many periods. '
+                             '[[Collection]] items are shown in permanent and temporary exhibitions.'
+                             '<ref>{{cite web |url=https://example.org/collection |title=Collection}}</ref>\n\n')
+
+# Titles of the synthetic articles of make_wiki_pages, with the number of the museum
+SYNTHETIC_TITLE_PATTERN = re.compile(r'Museum_(\d+)')
+
+
+def make_world_cities_df(rows: int, countries: int = 200, seed: int = 0) -> pd.DataFrame:
+    '''
+    Make a synthetic world cities table with the columns of doc/worldcities.csv.
+    Every city has a unique name, and the populations follow a heavy-tailed distribution like real cities.
+
+    :param rows: number of cities
+    :param countries: number of countries
+    :param seed: random seed
+    :return: a dataframe of the world cities
+    '''
+
+    rng = np.random.default_rng(seed)
+    names = np.char.add('City ', np.arange(rows).astype(str)).astype(object)
+    country_numbers = rng.integers(0, countries, rows)
+    return pd.DataFrame({
+        'city': names,
+        'city_ascii': names,
+        'lat': np.round(np.degrees(np.arcsin(rng.uniform(-1, 1, rows))), 4),
+        'lng': np.round(rng.uniform(-180, 180, rows), 4),
+        'country': np.char.add('Country ', country_numbers.astype(str)).astype(object),
+        'iso2': np.char.add('C', country_numbers.astype(str)).astype(object),
+        'iso3': np.char.add('CC', country_numbers.astype(str)).astype(object),
+        'admin_name': np.char.add('Region ', (np.arange(rows) % 1000).astype(str)).astype(object),
+        'capital': np.where(np.arange(rows) < countries, 'primary', '').astype(object),
+        'population': np.round(rng.pareto(1.2, rows) * 20_000 + 1_000),
+        'id': np.arange(1_000_000_000, 1_000_000_000 + rows),
+    })
+
+
+def write_world_cities_csv(world_cities_df: pd.DataFrame, csv_path: str) -> str:
+    '''
+    Write a world cities table as a csv file which WorldCitiesIndex.load can compile.
+
+    :param world_cities_df: a dataframe made by make_world_cities_df
+    :param csv_path: path of the csv file
+    :return: csv_path
+    '''
+
+    world_cities_df.to_csv(csv_path, index=False)
+    return csv_path
+
+
+def make_museum_all_data_df(rows: int, world_cities_df: pd.DataFrame = None, seed: int = 0) -> pd.DataFrame:
+    '''
+    Make a synthetic dataframe in the shape of the cleaned and enriched pipeline output.
+
+    Museums are placed within a few kilometres of a city of world_cities_df, so they can be joined with it.
+    Visitors grow with the city population plus noise, so the correlation has something to find.
+
+    :param rows: number of museums
+    :param world_cities_df: the cities of the museums, defaults to make_world_cities_df(max(rows // 10, 10))
+    :param seed: random seed
+    :return: museum_all_data_df: a dataframe which contains all main character data of the museums
+    '''
+
+    rng = np.random.default_rng(seed)
+    if world_cities_df is None:
+        world_cities_df = make_world_cities_df(max(rows // 10, 10), seed=seed)
+    cities = world_cities_df.iloc[rng.integers(0, len(world_cities_df), rows)].reset_index(drop=True)
+    names = np.char.add('Museum ', np.arange(rows).astype(str)).astype(object)
+    population = cities['population'].to_numpy()
+    visitors = (population * 0.05 + rng.lognormal(11, 1, rows)).astype(np.int64)
+
+    established = rng.integers(1500, 2020, rows).astype(str).astype(object)
+    established[rng.random(rows) < 0.2] = np.nan
+    return pd.DataFrame({
+        'name': names,
+        'city': cities['city'].to_numpy(),
+        'visitors': visitors,
+        'wiki_link': np.char.replace(names.astype(str), ' ', '_').astype(object),
+        'latitude': (cities['lat'] + rng.normal(0, 0.02, rows)).round(4).astype(str).to_numpy(),
+        'longitude': (cities['lng'] + rng.normal(0, 0.02, rows)).round(4).astype(str).to_numpy(),
+        'revision_id': rng.integers(1, 10 ** 9, rows),
+        'Established_year': established,
+        **{flag: rng.integers(0, 2, rows, dtype=np.int8) for flag in MUSEUM_TYPE_KEYWORDS},
+        'country': cities['country'].to_numpy(),
+        'population': population.astype(float),
+    })
+
+
+def make_infobox_html(i: int, filler_paragraphs: int = DEFAULT_FILLER_PARAGRAPHS) -> str:
+    '''
+    Make the html of a synthetic museum article with an infobox like the real articles.
+
+    :param i: number of the museum, which varies the infobox values and rows
+    :param filler_paragraphs: number of article paragraphs after the infobox
+    :return: the html of the article
+    '''
+
+    rows = [f'<tr><th class="infobox-label">Established</th><td class="infobox-data">{1 + i % 28} March '
+            f'{1700 + i % 320}<sup class="reference"><a href="#cite_note-2">[2]</a></sup></td></tr>',
+            f'<tr><th class="infobox-label">Location</th><td class="infobox-data">{i} Museum Street, '
+            f'<a href="/wiki/City_{i % 100}">City {i % 100}</a></td></tr>',
+            f'<tr><th class="infobox-label">Coordinates</th><td class="infobox-data"><span class="geo">'
+            f'{(i % 170) - 85}.{i % 97}; {(i % 360) - 180}.{i % 89}</span></td></tr>',
+            f'<tr><th class="infobox-label">Type</th><td class="infobox-data">'
+            f'{MUSEUM_TYPES[i % len(MUSEUM_TYPES)]}</td></tr>',
+            f'<tr><th class="infobox-label">Visitors</th><td class="infobox-data">{1000 + 37 * i:,} (2019)</td></tr>']
+    if i % 3 == 0:
+        rows.append(f'<tr><th class="infobox-label">Director</th><td class="infobox-data">Director {i}</td></tr>')
+    if i % 4 == 0:
+        rows.append(f'<tr><th class="infobox-label">Website</th><td class="infobox-data">'
+                    f'<a href="https://museum{i}.example.org">museum{i}.example.org</a></td></tr>')
+
+    infobox = (f'<table class="infobox vcard"><tbody><tr><th colspan="2" class="infobox-above">Museum {i}</th></tr>'
+               f'{"".join(rows)}</tbody></table>')
+    return f'<div class="mw-parser-output">{infobox}{FILLER_PARAGRAPH * filler_paragraphs}</div>'
+
+
+def make_infobox_wikitext(i: int, filler_paragraphs: int = DEFAULT_FILLER_PARAGRAPHS) -> str:
+    '''
+    Make the wikitext of the synthetic museum article of make_infobox_html, whose infobox renders to the same rows.
+
+    :param i: number of the museum, which varies the infobox values and rows
+    :param filler_paragraphs: number of article paragraphs after the infobox
+    :return: the wikitext of the article
+    '''
+
+    parameters = [f'name = Museum {i}', 'image = Museum.jpg',
+                  f'established = {{{{start date|{1700 + i % 320}|3|{1 + i % 28}}}}}<ref name="established">'
+                  f'{{{{cite book |title=History of Museum {i}}}}}</ref>',
+                  f'location = {i} Museum Street, [[City_{i % 100}|City {i % 100}]]',
+                  f'coordinates = {{{{coord|{(i % 170) - 85}.{i % 97}|{(i % 360) - 180}.{i % 89}'
+                  f'|display=inline,title}}}}',
+                  f'type = {MUSEUM_TYPES[i % len(MUSEUM_TYPES)]}',
+                  f'visitors = {1000 + 37 * i:,} (2019)']
+    if i % 3 == 0:
+        parameters.append(f'director = Director {i}')
+    if i % 4 == 0:
+        parameters.append(f'website = {{{{URL|https://museum{i}.example.org}}}}')
+
+    infobox = '{{Infobox museum\n' + ''.join(f'| {parameter}\n' for parameter in parameters) + '}}\n'
+    return infobox + FILLER_WIKITEXT_PARAGRAPH * filler_paragraphs
+
+
+def make_museum_list_html(titles: list, cities: list, visitors: list = None) -> str:
+    '''
+    Make the html of the most visited museums list page.
+
+    :param titles: the page titles of the museums
+    :param cities: the city of every museum
+    :param visitors: the visitors of every museum as written on the page, by default 1000, 2000, ...
+    :return: the html of the list page
+    '''
+
+    if visitors is None:
+        visitors = [1000 * (i + 1) for i in range(len(titles))]
+    rows = ''.join(f'<tr><td><a href="/wiki/{title}">{title.replace("_", " ")}</a></td><td>{city}</td>'
+                   f'<td>{museum_visitors}</td><td>2019</td></tr>'
+                   for title, city, museum_visitors in zip(titles, cities, visitors))
+    return f'''<table><tr><th>Name<a href="#cite_note-13">[13]</a></th><th>City</th><th>Visitors</th>
+        <th>Year</th></tr>{rows}</table>'''
+
+
+def read_modelled_fixtures(fixtures_dir: str = FIXTURES_DIR) -> dict:
+    '''
+    :param fixtures_dir: directory of the modelled article html
+    :return: a dictionary of page titles and the modelled html of the articles
+    '''
+
+    pages = {}
+    for fixture_file in sorted(glob.glob(os.path.join(fixtures_dir, '*.html'))):
+        with open(fixture_file, encoding='utf-8') as f:
+            pages[os.path.splitext(os.path.basename(fixture_file))[0]] = f.read()
+    return pages
+
+
+def make_wiki_pages(museums: int, cities: list, fixtures_dir: str = FIXTURES_DIR) -> dict:
+    '''
+    Make the pages a stub wiki serves for a run of the pipeline: the list page, the modelled
+    articles and synthetic articles for the other museums.
+
+    :param museums: number of museums on the list page
+    :param cities: city names, every museum is in one of them
+    :param fixtures_dir: directory of the modelled article html
+    :return: a dictionary of page titles and html
+    '''
+
+    pages = dict(list(read_modelled_fixtures(fixtures_dir).items())[:museums])
+    modelled_titles = list(pages)
+    synthetic_titles = [f'Museum_{i}' for i in range(museums - len(modelled_titles))]
+    pages.update((title, make_infobox_html(i)) for i, title in enumerate(synthetic_titles))
+
+    titles = modelled_titles + synthetic_titles
+    pages[MOST_VISITED_MUSEUMS_PAGE_NAME] = make_museum_list_html(
+        titles, [cities[i % len(cities)] for i in range(len(titles))])
+    return pages
+
+
+def make_wiki_wikitexts(pages: dict) -> dict:
+    '''
+    Make the wikitext of the synthetic articles of the pages made by make_wiki_pages.
+    The modelled articles have no wikitext, they are served as empty pages.
+
+    :param pages: a dictionary of page titles and html, made by make_wiki_pages
+    :return: a dictionary of page titles and wikitext
+    '''
+
+    wikitexts = {}
+    for title in pages:
+        match = SYNTHETIC_TITLE_PATTERN.fullmatch(title)
+        if match is not None:
+            wikitexts[title] = make_infobox_wikitext(int(match.group(1)))
+    return wikitexts
@@ -1,68 +1,373 @@
+import argparse
+import datetime
+import logging
 import pandas as pd
 
-from src.fetch_museum_data import create_museum_dataframe
-from src.clean_museum_data import clean_museum_character_data
-from src.add_city_population import add_city_population_to_museum
-from src.create_museum_db import build_museum_db
-from src.correlate_pop_visitor import correlate_population_visitors
-from src.log_handler import get_logger
+from src.create_museum_db import build_museum_db, DATABASE_PATH, read_museum_data_from_db
+from src.log_handler import configure_logging, DEFAULT_RATE_LIMIT, get_logger
+from src.page_cache import CachedPageSource, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_TTL
+from src.page_source import MediaWikiPageSource, PageSource, WIKIPEDIA_API_URL, WikitextPageSource
+from src.profiling import profile_stage, RunProfiler
+from src.stage_defaults import (DEFAULT_BUFFER_SIZE, DEFAULT_CHUNK_SIZE, DEFAULT_CRAWL_RATE, DEFAULT_CRAWL_STATE_PATH,
+                                DEFAULT_DATASET_DIR, DEFAULT_FETCH_CHECKPOINT_MAX_AGE, DEFAULT_FETCH_RETRIES,
+                                DEFAULT_FETCH_TIMEOUT, DEFAULT_FOLDS, DEFAULT_HOST_RATE, DEFAULT_MAX_DEPTH,
+                                DEFAULT_REPEATS)
+from src.stage_registry import LazyFunction, STAGE_MODULES, STAGE_NAMES
+from src.stage_runner import DEFAULT_CHECKPOINT_DIR, Stage, StageRunner
 
 log = get_logger()
 
+# The stages are imported when they run, so a run which only builds the database or correlates
+# does not import the scraping stack, and reading checkpoints imports neither of them
+stream_museum_data = LazyFunction('src.museum_pipeline:stream_museum_data')
+crawl_museum_list = LazyFunction('src.crawler:crawl_museum_list')
+parse_seed = LazyFunction('src.crawler:parse_seed')
+refresh_museum_db = LazyFunction('src.incremental_refresh:refresh_museum_db')
+export_museum_dataset = LazyFunction('src.museum_dataset:export_museum_dataset')
+correlate_population_visitors = LazyFunction('src.correlate_pop_visitor:correlate_population_visitors')
+correlate_population_visitors_in_db = LazyFunction('src.correlate_pop_visitor:correlate_population_visitors_in_db')
+cross_validate_population_visitors = LazyFunction('src.correlate_pop_visitor:cross_validate_population_visitors')
+model_visitors_with_features = LazyFunction('src.correlate_pop_visitor:model_visitors_with_features')
+correlate_population_visitor_history = LazyFunction('src.correlate_pop_visitor:correlate_population_visitor_history')
 
-def fetch_museum_data() -> pd.DataFrame:
+
+def create_page_source(args: argparse.Namespace) -> PageSource:
+    '''
+    Create the page source for fetching Wikipedia pages, cached on disk unless --no-cache is given.
+    With --wikitext, the museum pages are fetched as wikitext in batches and the page cache is not used.
+
+    :param args: the parsed command line arguments
+    :return: the page source
+    '''
+
+    if args.wikitext:
+        return WikitextPageSource()
+    if args.no_cache:
+        return MediaWikiPageSource()
+
+    page_source = None if args.offline else MediaWikiPageSource()
+    return CachedPageSource(page_source, cache_dir=args.cache_dir, ttl=args.cache_ttl,
+                            max_bytes=args.cache_max_bytes, offline=args.offline)
+
+
+@profile_stage()
+def fetch_museum_data(page_source: PageSource = None, max_workers: int = 1, parse_workers: int = None,
+                      buffer_size: int = DEFAULT_BUFFER_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      timeout: float = DEFAULT_FETCH_TIMEOUT, retries: int = DEFAULT_FETCH_RETRIES,
+                      museums_df: pd.DataFrame = None) -> pd.DataFrame:
     '''
     Fetch all museum data from wikipedia page.
+    Downloading, parsing and cleaning run as a streaming pipeline, see stream_museum_data.
 
+    :param page_source: where to fetch the Wikipedia pages from, defaults to the MediaWiki API
+    :param max_workers: number of museum pages fetched at the same time
+    :param parse_workers: number of processes parsing museum pages, defaults to the number of cores
+    :param buffer_size: maximum number of pages waiting between two pipeline stages
+    :param chunk_size: number of museums cleaned together
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param museums_df: the museums to fetch, defaults to the museums of the most visited museums list
     :return: museum_all_data_df: a dataframe which contains all main character data of the museums
     '''
 
-    museum_all_data_df = create_museum_dataframe()
-    museum_all_data_df = clean_museum_character_data(museum_all_data_df)
-    museum_all_data_df = add_city_population_to_museum(museum_all_data_df)
+    museum_all_data_df = stream_museum_data(page_source or MediaWikiPageSource(), download_workers=max_workers,
+                                            parse_workers=parse_workers, buffer_size=buffer_size,
+                                            chunk_size=chunk_size, timeout=timeout, retries=retries,
+                                            museums_df=museums_df)
     return museum_all_data_df
 
 
+def crawl_museums(args: argparse.Namespace, api_url: str = WIKIPEDIA_API_URL) -> pd.DataFrame:
+    '''
+    Crawl the museums of the --crawl-seed list pages and category pages, see crawl_museum_list.
+    The museum pages are fetched from the wiki of api_url, so museums of other language editions are left out.
+
+    :param args: the parsed command line arguments
+    :param api_url: the api url of the wiki the museum pages are fetched from, and of seeds which are page names
+    :return: a dataframe of the museums to fetch, with a name, city, visitors and wiki_link column
+    '''
+
+    seeds = [parse_seed(seed, api_url) for seed in args.crawl_seeds]
+    museums_df = crawl_museum_list(seeds, state_path=args.crawl_state, rate=args.crawl_rate,
+                                   host_rate=args.crawl_host_rate, max_depth=args.crawl_max_depth,
+                                   timeout=args.timeout, retries=args.retries)
+    fetched = museums_df['api_url'] == api_url
+    if not fetched.all():
+        log.warning(f'{(~fetched).sum()} crawled museums of other language editions are not fetched.')
+    return museums_df.loc[fetched, ['name', 'city', 'visitors', 'wiki_link']].reset_index(drop=True)
+
+
 def build_database(museum_all_data_df: pd.DataFrame) -> pd.DataFrame:
     '''
     Build museum_analysis database.
 
     :param museum_all_data_df: a dataframe which contains all main character data of the museums
-    :return: None
+    :return: the museum data read back from the database
     '''
 
     build_museum_db(museum_all_data_df)
+    return read_museum_data_from_db()
+
+
+def refresh_database(page_source: PageSource, max_workers: int = 1, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                     retries: int = DEFAULT_FETCH_RETRIES) -> pd.DataFrame:
+    '''
+    Refresh museum_analysis database incrementally, see refresh_museum_db.
+
+    :param page_source: where to fetch the Wikipedia pages from
+    :param max_workers: number of museum pages fetched at the same time
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :return: the museum data read back from the database
+    '''
 
+    refresh_museum_db(page_source, max_workers=max_workers, timeout=timeout, retries=retries)
+    return read_museum_data_from_db()
 
-def correlate_population_and_influx_of_visitors(museum_all_data_df: pd.DataFrame) -> pd.DataFrame:
+
+def correlate_population_and_influx_of_visitors(museum_all_data_df: pd.DataFrame, streaming_stats: bool = False,
+                                                cv: bool = False, multi_feature: bool = False,
+                                                folds: int = DEFAULT_FOLDS, repeats: int = DEFAULT_REPEATS,
+                                                workers: int = 1, history_dataset_dir: str = None) -> pd.DataFrame:
     '''
     Correlate city population and the influx of visitors of the museums.
 
     :param museum_all_data_df: a dataframe which contains all main character data of the museums
-    :return: None
+    :param streaming_stats: correlate in one pass over the database instead of in pandas
+    :param cv: also cross-validate the linear regression with repeated k-fold
+    :param multi_feature: also cross-validate visitor models with all museum features
+    :param folds: number of cross-validation folds
+    :param repeats: number of repeats of the cross-validation folds
+    :param workers: number of processes fitting folds
+    :param history_dataset_dir: also correlate every snapshot of the museum dataset in this directory
+    :return: a dataframe of the results, with a model, metric and value column
     '''
 
-    correlate_population_visitors(museum_all_data_df)
+    if streaming_stats:
+        results = {'population_visitors': correlate_population_visitors_in_db()._asdict()}
+    else:
+        results = {'population_visitors': correlate_population_visitors(museum_all_data_df)}
+    if cv:
+        result = cross_validate_population_visitors(museum_all_data_df, folds=folds, repeats=repeats,
+                                                    workers=workers)
+        results['population_visitors_cv'] = summarize_cross_validation(result)
+    if multi_feature:
+        for name, result in model_visitors_with_features(museum_all_data_df, folds=folds, repeats=repeats,
+                                                         workers=workers).items():
+            results[f'features_{name}_cv'] = summarize_cross_validation(result)
+    if history_dataset_dir is not None:
+        for run_date, result in correlate_population_visitor_history(history_dataset_dir).items():
+            results[f'population_visitors_{run_date}'] = result._asdict()
+
+    return pd.DataFrame([(model, metric, float(value)) for model, values in results.items()
+                         for metric, value in values.items()], columns=['model', 'metric', 'value'])
+
 
+def summarize_cross_validation(result: tuple) -> dict:
+    return {**{f'{name}_mean': value for name, value in result.mean.items()},
+            **{f'{name}_std': value for name, value in result.std.items()}}
 
-def main():
+
+def fetch_params(args: argparse.Namespace) -> dict:
+    '''
+    :param args: the parsed command line arguments
+    :return: the parameters which change the output of the fetch stage, None when they are the defaults
+    '''
+
+    params = {}
+    if args.crawl_seeds:
+        params.update({'crawl_seeds': args.crawl_seeds, 'crawl_max_depth': args.crawl_max_depth})
+    if args.wikitext:
+        params.update({'wikitext': True})
+    return params or None
+
+
+def build_stages(args: argparse.Namespace, page_source: PageSource) -> list:
+    '''
+    Build the stages of a run: fetch the museum data, build the database and correlate.
+    With --incremental, the fetch stage refreshes the database and there is no build_db stage.
+    The checkpoint of the fetch stage expires after --max-checkpoint-age seconds, except with --offline,
+    where fetching again could only read the same cached pages.
+
+    :param args: the parsed command line arguments
+    :param page_source: where to fetch the Wikipedia pages from
+    :return: the stages, in the order they run
+    '''
+
+    if args.incremental:
+        fetch_stage = Stage('fetch', lambda: refresh_database(page_source, max_workers=args.workers,
+                                                              timeout=args.timeout, retries=args.retries),
+                            modules=STAGE_MODULES['fetch'] + STAGE_MODULES['refresh'] + STAGE_MODULES['build_db'],
+                            params={'incremental': True}, artifacts=(DATABASE_PATH,))
+        stages = [fetch_stage]
+    else:
+        fetch_stage = Stage('fetch', lambda: fetch_museum_data(page_source, max_workers=args.workers,
+                                                               parse_workers=args.parse_workers,
+                                                               buffer_size=args.buffer_size,
+                                                               chunk_size=args.chunk_size, timeout=args.timeout,
+                                                               retries=args.retries,
+                                                               museums_df=crawl_museums(args) if args.crawl_seeds
+                                                               else None),
+                            modules=STAGE_MODULES['fetch'] + (STAGE_MODULES['crawl'] if args.crawl_seeds else ()),
+                            params=fetch_params(args), max_age=None if args.offline else args.max_checkpoint_age)
+        stages = [fetch_stage, Stage('build_db', build_database, inputs=('fetch',), modules=STAGE_MODULES['build_db'],
+                                     artifacts=(DATABASE_PATH,))]
+
+    # The snapshot of this run is exported from the museums as the database holds them
+    stages.append(Stage('export', lambda df: export_museum_dataset(df, dataset_dir=args.dataset_dir,
+                                                                   run_date=args.run_date),
+                        inputs=('fetch' if args.incremental else 'build_db',), modules=STAGE_MODULES['export'],
+                        params={'dataset_dir': args.dataset_dir, 'run_date': args.run_date},
+                        artifacts=(args.dataset_dir,)))
+
+    # The streaming regression reads the database, so it runs again when the database changed,
+    # and the history reads the exported snapshots, so it runs again when a snapshot was exported
+    correlate_input = 'build_db' if args.streaming_stats and not args.incremental else 'fetch'
+    correlate_params = {'streaming_stats': args.streaming_stats, 'cv': args.cv, 'multi_feature': args.multi_feature,
+                        'cv_folds': args.cv_folds, 'cv_repeats': args.cv_repeats}
+    if args.history:
+        correlate_params.update({'history': True, 'dataset_dir': args.dataset_dir})
+    stages.append(Stage('correlate', lambda df, *_: correlate_population_and_influx_of_visitors(
+        df, streaming_stats=args.streaming_stats, cv=args.cv, multi_feature=args.multi_feature,
+        folds=args.cv_folds, repeats=args.cv_repeats, workers=args.cv_workers,
+        history_dataset_dir=args.dataset_dir if args.history else None),
+        inputs=(correlate_input,) + (('export',) if args.history else ()), modules=STAGE_MODULES['correlate'],
+        params=correlate_params))
+    return stages
+
+
+def iso_date(value: str) -> str:
+    '''
+    :param value: a date like 2024-05-31
+    :return: the date in the same format, ValueError when it is not a date
+    '''
+
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    '''
+    Parse command line arguments.
+
+    :param argv: command line arguments, defaults to sys.argv
+    :return: the parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='Analyse the most visited museums on Wikipedia.')
+    parser.add_argument('--workers', type=int, default=1, help='number of museum pages fetched at the same time')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_FETCH_TIMEOUT,
+                        help='seconds to wait for each page request')
+    parser.add_argument('--retries', type=int, default=DEFAULT_FETCH_RETRIES,
+                        help='number of retries for a failed page request')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='number of processes parsing museum pages, defaults to the number of cores')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE,
+                        help='maximum number of pages waiting between two pipeline stages')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='number of museums cleaned together')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch changed museum pages and upsert them into the existing db')
+    parser.add_argument('--streaming-stats', action='store_true',
+                        help='correlate population and visitors in one pass over the db instead of in pandas')
+    parser.add_argument('--cv', action='store_true',
+                        help='also cross-validate the visitor model with repeated k-fold')
+    parser.add_argument('--cv-folds', type=int, default=DEFAULT_FOLDS, help='number of cross-validation folds')
+    parser.add_argument('--cv-repeats', type=int, default=DEFAULT_REPEATS,
+                        help='number of repeats of the cross-validation folds')
+    parser.add_argument('--cv-workers', type=int, default=1, help='number of processes fitting folds')
+    parser.add_argument('--multi-feature', action='store_true',
+                        help='also cross-validate visitor models with all museum features')
+    parser.add_argument('--stage', action='append', choices=STAGE_NAMES, dest='stages',
+                        help='only run this stage and the stages it reads, can be given several times')
+    parser.add_argument('--force', action='append', choices=STAGE_NAMES, default=[],
+                        help='run this stage even when its checkpoint is unchanged, can be given several times')
+    parser.add_argument('--no-checkpoints', action='store_true',
+                        help='run every stage and do not save stage checkpoints')
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIR, help='directory of the stage checkpoints')
+    parser.add_argument('--max-checkpoint-age', type=float, default=DEFAULT_FETCH_CHECKPOINT_MAX_AGE,
+                        help='seconds the checkpoint of the fetch stage is used before the museums are fetched again')
+    parser.add_argument('--report', default=None, help='write a JSON run report with the measurements of every stage')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure the peak of memory allocated by Python in every stage, slows the run down')
+    parser.add_argument('--cprofile-dir', default=None, help='profile the stages with cProfile and dump them here')
+    parser.add_argument('--cprofile-stage', action='append', dest='cprofile_stages',
+                        help='only profile this stage with cProfile, like clean_museum_character_data, '
+                             'can be given several times')
+    parser.add_argument('--dataset-dir', default=DEFAULT_DATASET_DIR,
+                        help='directory of the Parquet snapshots of the museum and city tables')
+    parser.add_argument('--run-date', type=iso_date, default=datetime.date.today().isoformat(),
+                        help='date of the exported snapshot, like 2024-05-31, defaults to today')
+    parser.add_argument('--history', action='store_true',
+                        help='also correlate population and visitors in every exported snapshot')
+    parser.add_argument('--offline', action='store_true', help='only use pages from the page cache')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the page cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='directory of the page cache')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_CACHE_TTL,
+                        help='seconds a cached page is used without checking its revision')
+    parser.add_argument('--cache-max-bytes', type=int, default=DEFAULT_CACHE_MAX_BYTES,
+                        help='maximum size of the page cache on disk')
+    parser.add_argument('--wikitext', action='store_true',
+                        help='fetch the museum pages as wikitext, 50 pages per API request, without the page cache')
+    parser.add_argument('--crawl-seed', action='append', dest='crawl_seeds',
+                        help='crawl the museums of this list page or category page, and of the lists it links to, '
+                             'instead of the most visited museums list, can be given several times')
+    parser.add_argument('--crawl-state', default=DEFAULT_CRAWL_STATE_PATH,
+                        help='database of the crawl, a stopped crawl resumes from it')
+    parser.add_argument('--crawl-rate', type=float, default=DEFAULT_CRAWL_RATE,
+                        help='requests per second of the crawl over all hosts')
+    parser.add_argument('--crawl-host-rate', type=float, default=DEFAULT_HOST_RATE,
+                        help='requests per second of the crawl to a host')
+    parser.add_argument('--crawl-max-depth', type=int, default=DEFAULT_MAX_DEPTH,
+                        help='number of links followed from a seed to other list pages and subcategories')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--log-json', action='store_true', help='write the log as one JSON object per line')
+    parser.add_argument('--log-rate-limit', type=int, default=DEFAULT_RATE_LIMIT,
+                        help='records below WARNING a log call may write per second, 0 writes all of them')
+    args = parser.parse_args(argv)
+
+    if args.offline and args.no_cache:
+        parser.error('--offline needs the page cache, it cannot be used with --no-cache')
+    if args.offline and args.wikitext:
+        parser.error('--wikitext fetches the pages without the page cache, it cannot be used with --offline')
+    if args.incremental and args.crawl_seeds:
+        parser.error('--incremental refreshes the museums of the most visited museums list, it cannot crawl')
+    if args.incremental and 'build_db' in (args.stages or []) + args.force:
+        parser.error('--incremental refreshes the db in the fetch stage, there is no build_db stage')
+    return args
+
+
+def main(argv: list = None) -> dict:
     '''
     Main function of museum_analysis.
+    Every stage whose inputs and code did not change since its last run is read from its checkpoint.
 
-    :return: None
+    :param argv: command line arguments, defaults to sys.argv
+    :return: a dictionary of stage names and StageResults
     '''
 
-    log.info('Start to fetch museum data...')
-    museum_all_data_df = fetch_museum_data()
-    log.info('Finished fetching museum data.')
+    args = parse_args(argv)
+    configure_logging(level=logging.getLevelName(args.log_level), json_output=args.log_json,
+                      rate_limit=args.log_rate_limit)
+
+    page_source = create_page_source(args)
 
-    log.info('Start to build museum db...')
-    build_database(museum_all_data_df)
-    log.info('Finished building museum db.')
+    # An incremental refresh checks the pages for changes, which its checkpoint cannot know about
+    force = args.force + (['fetch'] if args.incremental else [])
+    runner = StageRunner(build_stages(args, page_source), checkpoint_dir=args.checkpoint_dir, selected=args.stages,
+                         force=force, use_checkpoints=not args.no_checkpoints)
+    with RunProfiler(trace_memory=args.trace_memory, cprofile_dir=args.cprofile_dir,
+                     cprofile_stages=args.cprofile_stages) as profiler:
+        results = runner.run()
+    profiler.metadata['checkpoint_stages'] = {name: {'skipped': result.skipped, 'seconds': result.seconds,
+                                                     'rows': len(result.df)} for name, result in results.items()}
+    if args.report:
+        profiler.write_report(args.report)
 
-    log.info('Start to correlate city population and influx of visitors...')
-    correlate_population_and_influx_of_visitors(museum_all_data_df)
-    log.info('Finished correlating city population and influx of visitors.')
+    if 'correlate' in results:
+        log.info('The results of correlating city population and influx of visitors are:\n '
+                 + '\n '.join(f'{row.model} {row.metric}: {row.value}'
+                              for row in results['correlate'].df.itertuples()))
+    return results
 
 
 if __name__ == '__main__':
@@ -1,27 +1,69 @@
 import os
 import pandas as pd
 
+from src.city_resolver import CityResolver
 from src.log_handler import get_logger
+from src.museum_schema import enforce_museum_schema
+from src.profiling import profile_stage
+from src.world_cities_index import WorldCitiesIndex
 
 log = get_logger()
 WORLD_CITIES_POPULATION_FILE_PATH = '../doc/worldcities.csv'
 
+# Loaded on first use by get_world_cities_index and get_city_resolver
+world_cities_index = None
+city_resolver = None
 
+
+@profile_stage()
 def add_city_population_to_museum(museum_all_data_df: pd.DataFrame) -> pd.DataFrame:
     '''
     Add city, population and country to the main museum dataframe.
+    Museums with coordinates are matched to the nearest plausible city, the others by city name.
 
     :param museum_all_data_df: a dataframe which contains all main character data of the museums
-    :return: museum_all_data_df: a dataframe which contains all main character, plus population and country
+    :return: museum_all_data_df: a dataframe which contains all main character, plus population and country,
+        with the compact dtypes of MUSEUM_SCHEMA
     '''
 
-    world_cities_df = fetch_world_cities_df()
+    index = get_world_cities_index()
 
-    log.info('Merging museum dataframe and population dataframe...')
-    museum_all_data_df = pd.merge(left=museum_all_data_df, right=world_cities_df, how='left',
-                                  left_on=['city'], right_on=['city'])
+    log.info('Resolving museum cities in the world cities index...')
+    rows = get_city_resolver().resolve(museum_all_data_df['city'], museum_all_data_df.get('latitude'),
+                                       museum_all_data_df.get('longitude'))
+    museum_all_data_df = museum_all_data_df.reset_index(drop=True)
+    museum_all_data_df['country'] = index.country_of(rows)
+    museum_all_data_df['population'] = index.population_of(rows)
     log.info('Successfully added population and country to museum dataframe.')
-    return museum_all_data_df
+    return enforce_museum_schema(museum_all_data_df, boundary='enrich')
+
+
+def get_world_cities_index() -> WorldCitiesIndex:
+    '''
+    Load the compiled world cities index on first use, compiling it when the csv file changed.
+
+    :return: the world cities index
+    '''
+
+    global world_cities_index
+    if world_cities_index is None:
+        current_dir = os.path.dirname(__file__)
+        world_cities_population_file = os.path.join(current_dir, WORLD_CITIES_POPULATION_FILE_PATH)
+        world_cities_index = WorldCitiesIndex.load(world_cities_population_file)
+    return world_cities_index
+
+
+def get_city_resolver() -> CityResolver:
+    '''
+    Build the spatial index of the world cities on first use.
+
+    :return: the city resolver
+    '''
+
+    global city_resolver
+    if city_resolver is None:
+        city_resolver = CityResolver(get_world_cities_index())
+    return city_resolver
 
 
 def fetch_world_cities_df() -> pd.DataFrame:
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.neighbors import KDTree
+from src.geo import EARTH_RADIUS_KM
+from src.log_handler import get_logger
+from src.world_cities_index import EMPTY_SLOT, WorldCitiesIndex
+
+log = get_logger()
+
+# A city further away from a museum than this is not a plausible city of the museum
+DEFAULT_MAX_DISTANCE_KM = 50.0
+
+# Number of nearest cities checked for a city with the museum's city name
+DEFAULT_CANDIDATES = 16
+
+
+class CityResolver:
+    '''
+    Resolve museums to rows of the world cities index by their coordinates.
+
+    The cities are points on the unit sphere in a KD-tree. The straight line distance between two
+    points on the sphere grows with the great circle distance, so the nearest points in the tree are
+    the nearest cities by haversine distance, and all museums are queried in one vectorized call.
+    '''
+
+    def __init__(self, index: WorldCitiesIndex, max_distance_km: float = DEFAULT_MAX_DISTANCE_KM,
+                 candidates: int = DEFAULT_CANDIDATES) -> None:
+        '''
+        :param index: the world cities index
+        :param max_distance_km: a city further away from a museum is not a plausible city of the museum
+        :param candidates: number of nearest cities checked for a city with the museum's city name
+        :return: None
+        '''
+
+        self.index = index
+        self.max_distance_km = max_distance_km
+        self.candidates = min(candidates, len(index))
+        self.tree = KDTree(to_unit_vectors(np.asarray(index.lat), np.asarray(index.lng)))
+
+    def resolve(self, names: pd.Series, latitudes: pd.Series, longitudes: pd.Series) -> np.ndarray:
+        '''
+        Find the city row of every museum. For a museum with coordinates, the first match is used of:
+        the nearest plausible city with the museum's city name, the most populous city with that name
+        when it is plausible, and the nearest plausible city. Museums without coordinates, or without a
+        plausible city, are matched by name only.
+
+        :param names: city names of the museums
+        :param latitudes: latitudes of the museums in degrees, NaN when unknown, None when no museum has them
+        :param longitudes: longitudes of the museums in degrees, NaN when unknown, None when no museum has them
+        :return: an array of rows, -1 for museums which are not matched to a city
+        '''
+
+        rows = self.index.lookup_many(names)
+        if latitudes is None or longitudes is None:
+            return rows
+
+        latitudes = pd.to_numeric(pd.Series(latitudes), errors='coerce').to_numpy(dtype=np.float64)
+        longitudes = pd.to_numeric(pd.Series(longitudes), errors='coerce').to_numpy(dtype=np.float64)
+        located = (np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)
+        if not located.any():
+            return rows
+
+        points = to_unit_vectors(latitudes[located], longitudes[located])
+        chord_distances, candidate_rows = self.tree.query(points, k=self.candidates)
+        plausible = chord_to_km(chord_distances) <= self.max_distance_km
+
+        name_hashes = self.index.name_hashes_of(pd.Series(names).reset_index(drop=True)[located])
+        name_matches = plausible & (np.asarray(self.index.name_hashes)[candidate_rows] == name_hashes[:, None])
+        name_rows = rows[located]
+        name_row_plausible = (name_rows != EMPTY_SLOT) & (self.distance_km(name_rows, points) <= self.max_distance_km)
+
+        # Candidates are sorted by distance, so argmax finds the nearest one
+        nearest_match = candidate_rows[np.arange(len(points)), name_matches.argmax(axis=1)]
+        resolved = np.where(plausible[:, 0], candidate_rows[:, 0], name_rows)
+        resolved = np.where(name_row_plausible, name_rows, resolved)
+        resolved = np.where(name_matches.any(axis=1), nearest_match, resolved)
+
+        changed = np.count_nonzero(resolved != name_rows)
+        log.info(f'Resolved {len(points)} museums by coordinates, {changed} differ from the city name lookup.')
+        rows[located] = resolved
+        return rows
+
+    def distance_km(self, rows: np.ndarray, points: np.ndarray) -> np.ndarray:
+        city_points = to_unit_vectors(np.asarray(self.index.lat)[rows], np.asarray(self.index.lng)[rows])
+        return chord_to_km(np.linalg.norm(city_points - points, axis=1))
+
+
+def to_unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    '''
+    Convert coordinates to points on the unit sphere.
+
+    :param latitudes: latitudes in degrees
+    :param longitudes: longitudes in degrees
+    :return: an array of shape (n, 3)
+    '''
+
+    lat = np.radians(latitudes)
+    lng = np.radians(longitudes)
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def chord_to_km(chord_distances: np.ndarray) -> np.ndarray:
+    # The great circle distance of two points on the unit sphere, from the straight line distance between them
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord_distances / 2, 0, 1))
@@ -1,40 +1,67 @@
 import math
+import numpy as np
 import pandas as pd
 import re
 
 from src.onehot_enum import YesOrNo;
 from typing import Tuple, Union
 from src.log_handler import get_logger
+from src.profiling import profile_stage
 
 log = get_logger()
 
+# Infobox fields which the cleaning needs, they are added with NaN values when no museum has them
+REQUIRED_COLUMNS = ['Established', 'Type']
 
-def clean_museum_character_data(df: pd.DataFrame) -> pd.DataFrame:
+# Matches years from 1000 to 2999
+ESTABLISHED_YEAR_PATTERN = re.compile(r'.*([1-2][0-9]{3})')
+
+# One-hot columns for Type, a museum gets 1 in a column when its lower case Type contains any of the keywords
+MUSEUM_TYPE_KEYWORDS = {
+    'is_art_museum': ['art'],
+    'is_history_museum': ['history'],
+    'is_natural_museum': ['natural'],
+    'is_culture_museum': ['culture', 'archaeology'],
+    'is_science_museum': ['science'],
+}
+MUSEUM_TYPE_PATTERNS = {column: re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+                        for column, keywords in MUSEUM_TYPE_KEYWORDS.items()}
+
+
+@profile_stage()
+def clean_museum_character_data(df: pd.DataFrame, reduce_columns: bool = True) -> pd.DataFrame:
     '''
     Clean museum characters and only leave main characters for analysis.
 
     :param df: a dataframe which contains all museums character data
+    :param reduce_columns: whether to drop columns with mostly NaN values, which should be False when df is
+        only a part of the museums, so the columns do not depend on which museums are in it
     :return: df: a dataframe which contains all main character data of the museums
     '''
 
     log.info('Start to clean museum character data...')
-    log.info('Reducing columns which has more than 90% NaN values...')
-    df = reduce_columns_with_most_nan(df)
+    if reduce_columns:
+        log.info('Reducing columns which has more than 90% NaN values...')
+        df = reduce_columns_with_most_nan(df)
+    if not set(REQUIRED_COLUMNS).issubset(df.columns):
+        df = df.reindex(columns=df.columns.union(REQUIRED_COLUMNS, sort=False))
 
     log.info('Cleaning Established, leave only the established year...')
-    df['Established_year'] = df['Established'].apply(lambda x: clean_established(x))
-    df = df.drop('Established', axis=1)
-
-    log.info('Renaming Visitors to Visitors_rank...')
-    df = df.rename({'Visitors': 'Visitors_rank'}, axis=1)
+    established_year = clean_established_column(df['Established'])
 
     log.info('Applying One-Hot encoding for Type...')
-    one_hot_column_list = ['is_art_museum', 'is_history_museum', 'is_natural_museum',
-                           'is_culture_museum', 'is_science_museum']
-    df[one_hot_column_list] = df.apply(one_hot_encoding_museum_type, axis=1, result_type='expand')
+    one_hot_columns = one_hot_encode_museum_types(df['Type'])
+
+    # drop returns a new dataframe, so the columns below can be changed in place without copying it again
+    log.info('Dropping Established and Type columns...')
+    df = df.drop(['Established', 'Type'], axis=1)
 
-    log.info('Dropping Type column...')
-    df = df.drop('Type', axis=1)
+    log.info('Renaming Visitors to Visitors_rank...')
+    df.rename({'Visitors': 'Visitors_rank'}, axis=1, inplace=True)
+
+    df['Established_year'] = established_year
+    for column in one_hot_columns:
+        df[column] = one_hot_columns[column]
 
     log.info('Successfully finished museum character data cleaning.')
     return df
@@ -53,6 +80,48 @@ def reduce_columns_with_most_nan(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def clean_established_column(established: pd.Series) -> pd.Series:
+    '''
+    Clean the Established column, only keep the values as years in between of 1000 to 2999.
+    The same as clean_established for every value, but the regex only runs once for every distinct value.
+    Values without a year become NaN.
+
+    :param established: the Established column
+    :return: a series of years as strings
+    '''
+
+    codes, uniques = pd.factorize(established)
+    years = pd.Series(uniques, dtype=object).str.extract(ESTABLISHED_YEAR_PATTERN, expand=False)
+
+    # factorize gives NaN the code -1, which picks the NaN appended at the end
+    years = np.append(years.to_numpy(dtype=object), np.nan)
+    return pd.Series(years[codes], index=established.index, name=established.name, dtype=object)
+
+
+def one_hot_encode_museum_types(types: pd.Series) -> pd.DataFrame:
+    '''
+    Apply one hot encoding for the Type column with the keywords in MUSEUM_TYPE_KEYWORDS.
+    The same as one_hot_encoding_museum_type for every value, but the keywords are only searched once
+    for every distinct value.
+
+    :param types: the Type column
+    :return: a dataframe with an int8 column for every museum type, 1 for Yes and 0 for No
+    '''
+
+    codes, uniques = pd.factorize(types)
+    lower_types = pd.Series(uniques, dtype=object).str.lower()
+
+    one_hot_columns = {}
+    for column, pattern in MUSEUM_TYPE_PATTERNS.items():
+        matches = lower_types.str.contains(pattern, na=False).to_numpy(dtype=bool)
+        flags = np.where(matches, YesOrNo.Yes.value, YesOrNo.No.value).astype(np.int8)
+
+        # factorize gives NaN the code -1, which picks the No appended at the end
+        flags = np.append(flags, np.int8(YesOrNo.No.value))
+        one_hot_columns[column] = pd.Series(flags[codes], index=types.index)
+    return pd.DataFrame(one_hot_columns)
+
+
 def clean_established(value: Union[int, str]) -> str:
     '''
     Clean values in Established column, only keep the value as a year in between of 1000 to 2999.
@@ -65,7 +134,7 @@ def clean_established(value: Union[int, str]) -> str:
         return value
 
     # Matches years from 1000 to 2999
-    return str(re.match(r'.*([1-2][0-9]{3})', value).group(1))
+    return str(ESTABLISHED_YEAR_PATTERN.match(value).group(1))
 
 
 def one_hot_encoding_museum_type(values: pd.DataFrame) -> Tuple[int, int, int, int, int]:
@@ -89,7 +158,7 @@ def one_hot_encoding_museum_type(values: pd.DataFrame) -> Tuple[int, int, int, i
     is_art_museum = YesOrNo.Yes if 'art' in value.lower() else YesOrNo.No
     is_history_museum = YesOrNo.Yes if 'history' in value.lower() else YesOrNo.No
     is_natural_museum = YesOrNo.Yes if 'natural' in value.lower() else YesOrNo.No
-    is_culture_museum = YesOrNo.Yes if 'culture' or 'archaeology' in value.lower() else YesOrNo.No
+    is_culture_museum = YesOrNo.Yes if 'culture' in value.lower() or 'archaeology' in value.lower() else YesOrNo.No
     is_science_museum = YesOrNo.Yes if 'science' in value.lower() else YesOrNo.No
     return is_art_museum.value, is_history_museum.value, is_natural_museum.value \
         , is_culture_museum.value, is_science_museum.value
@@ -0,0 +1,233 @@
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from src.log_handler import get_logger
+from typing import Iterator
+
+log = get_logger()
+DEFAULT_READERS = 4
+DEFAULT_CHECKOUT_TIMEOUT = 10.0
+
+# Seconds sqlite waits for a lock before failing a statement
+BUSY_TIMEOUT = 5.0
+
+HEALTH_CHECK_SQL = 'SELECT 1;'
+
+
+class PoolTimeoutError(TimeoutError):
+    '''
+    Raised when no connection of the pool could be checked out in time.
+    '''
+
+
+class PoolClosedError(RuntimeError):
+    '''
+    Raised when a connection is checked out of a closed pool.
+    '''
+
+
+class ConnectionPool:
+    '''
+    A thread-safe pool of connections to one sqlite database: a single writer connection and up to
+    max_readers read-only connections.
+
+    The database is switched to WAL mode, so readers keep reading the last committed state while the
+    writer rebuilds or refreshes the database, and never wait for it. Only one thread at a time can
+    check out the writer. Read-only connections are opened when they are first needed, checked with
+    a cheap query when they are checked out, and replaced when they are broken.
+    '''
+
+    def __init__(self, database_path: str, max_readers: int = DEFAULT_READERS,
+                 checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT) -> None:
+        '''
+        :param database_path: the path and database name
+        :param max_readers: maximum number of read-only connections
+        :param checkout_timeout: default seconds to wait for a free connection
+        :return: None
+        '''
+
+        self.database_path = database_path
+        self.max_readers = max_readers
+        self.checkout_timeout = checkout_timeout
+        self.stats = {'reader_checkouts': 0, 'writer_checkouts': 0, 'timeouts': 0, 'replaced': 0,
+                      'opened': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        self.closed = False
+        self.lock = threading.Lock()
+        self.readers_available = threading.Condition(self.lock)
+        self.idle_readers = []
+        self.open_readers = 0
+        self.writer_lock = threading.Lock()
+
+        self.writer_conn = self._connect(database_path)
+        journal_mode = self.writer_conn.execute('PRAGMA journal_mode = WAL;').fetchone()[0]
+        if journal_mode != 'wal':
+            log.warning(f'Could not switch {database_path} to WAL mode, readers may wait for the writer.')
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @contextmanager
+    def writer(self, timeout: float = None) -> Iterator[sqlite3.Connection]:
+        '''
+        Check out the writer connection. The transaction is committed when the block ends,
+        or rolled back when it raises.
+
+        :param timeout: seconds to wait for the writer, defaults to checkout_timeout
+        :return: the writer connection
+        '''
+
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        if not self.writer_lock.acquire(timeout=timeout):
+            self._count_timeout()
+            raise PoolTimeoutError(f'Timed out after {timeout}s waiting for the writer of {self.database_path}.')
+
+        try:
+            self._check_open()
+            self._count_checkout('writer_checkouts', time.perf_counter() - start)
+            self.writer_conn = self._healthy(self.writer_conn, self.database_path)
+            with self.writer_conn:
+                yield self.writer_conn
+        finally:
+            self.writer_lock.release()
+
+    @contextmanager
+    def reader(self, timeout: float = None) -> Iterator[sqlite3.Connection]:
+        '''
+        Check out a read-only connection, it is returned to the pool when the block ends.
+
+        :param timeout: seconds to wait for a free connection, defaults to checkout_timeout
+        :return: a read-only connection
+        '''
+
+        conn = self._checkout_reader(self.checkout_timeout if timeout is None else timeout)
+        try:
+            yield conn
+        finally:
+            self._return_reader(conn)
+
+    def metrics(self) -> dict:
+        '''
+        A snapshot of the pool metrics.
+
+        :return: a dictionary of checkout counts, timeouts, replaced connections, wait times and connections in use
+        '''
+
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics['idle_readers'] = len(self.idle_readers)
+            metrics['readers_in_use'] = self.open_readers - len(self.idle_readers)
+            metrics['writer_in_use'] = self.writer_lock.locked()
+        checkouts = metrics['reader_checkouts'] + metrics['writer_checkouts']
+        metrics['mean_wait_seconds'] = metrics['wait_seconds'] / checkouts if checkouts else 0.0
+        return metrics
+
+    def close(self) -> None:
+        '''
+        Close the idle connections and the writer, connections in use are closed when they are returned.
+
+        :return: None
+        '''
+
+        with self.lock:
+            self.closed = True
+            idle_readers, self.idle_readers = self.idle_readers, []
+            self.open_readers -= len(idle_readers)
+            self.readers_available.notify_all()
+        for conn in idle_readers:
+            conn.close()
+
+        with self.writer_lock:
+            self.writer_conn.close()
+        log.info(f'Closed connection pool of {self.database_path}.')
+
+    def _checkout_reader(self, timeout: float) -> sqlite3.Connection:
+        start = time.perf_counter()
+        deadline = start + timeout
+        with self.lock:
+            while True:
+                self._check_open()
+                if self.idle_readers:
+                    conn = self.idle_readers.pop()
+                    break
+                if self.open_readers < self.max_readers:
+                    # Reserve a slot, the connection is opened outside the lock
+                    self.open_readers += 1
+                    conn = None
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeoutError(f'Timed out after {timeout}s waiting for a reader of '
+                                           f'{self.database_path}, {self.max_readers} readers are in use.')
+                self.readers_available.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._connect_reader()
+            else:
+                conn = self._healthy(conn, None)
+        except sqlite3.Error:
+            with self.lock:
+                self.open_readers -= 1
+                self.readers_available.notify()
+            raise
+
+        self._count_checkout('reader_checkouts', time.perf_counter() - start)
+        return conn
+
+    def _return_reader(self, conn: sqlite3.Connection) -> None:
+        # End the read transaction, so the reader does not hold back WAL checkpoints
+        if conn.in_transaction:
+            conn.rollback()
+        with self.lock:
+            if self.closed:
+                self.open_readers -= 1
+                conn.close()
+                return
+            self.idle_readers.append(conn)
+            self.readers_available.notify()
+
+    def _healthy(self, conn: sqlite3.Connection, database_path: str) -> sqlite3.Connection:
+        # Replace a broken connection with a new one, database_path is None for readers
+        try:
+            conn.execute(HEALTH_CHECK_SQL).fetchone()
+            return conn
+        except sqlite3.Error as e:
+            log.warning(f'Replacing a broken connection to {self.database_path}: {e}.')
+            with self.lock:
+                self.stats['replaced'] += 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return self._connect(database_path) if database_path is not None else self._connect_reader()
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        return self._connect(f'file:{self.database_path}?mode=ro', uri=True)
+
+    def _connect(self, database: str, uri: bool = False) -> sqlite3.Connection:
+        # Connections are used by one thread at a time, but not always by the thread which opened them
+        conn = sqlite3.connect(database, timeout=BUSY_TIMEOUT, uri=uri, check_same_thread=False)
+        with self.lock:
+            self.stats['opened'] += 1
+        return conn
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise PoolClosedError(f'The connection pool of {self.database_path} is closed.')
+
+    def _count_checkout(self, name: str, wait_seconds: float) -> None:
+        with self.lock:
+            self.stats[name] += 1
+            self.stats['wait_seconds'] += wait_seconds
+            self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], wait_seconds)
+
+    def _count_timeout(self) -> None:
+        with self.lock:
+            self.stats['timeouts'] += 1
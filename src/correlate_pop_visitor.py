@@ -1,28 +1,52 @@
 import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
 
 from sklearn import metrics
 from sklearn.base import RegressorMixin
-from sklearn.linear_model import LinearRegression
+from sklearn.linear_model import LinearRegression, Ridge
 from sklearn.model_selection import train_test_split
+from src.create_museum_db import DATABASE_PATH, MUSEUM_TABLE_NAME
+from src.cross_validation import (cross_validate, CrossValidationResult, DEFAULT_CV_SEED, DEFAULT_FOLDS,
+                                  DEFAULT_REPEATS)
+from src.feature_matrix import DEFAULT_FEATURE_CACHE_DIR, load_or_build_design_matrix
 from src.log_handler import get_logger
+from src.museum_dataset import list_run_dates, read_dataset
+from src.profiling import profile_stage
+from src.resampling import DEFAULT_RESAMPLES, DEFAULT_SEED, resample_correlation
+from src.stage_defaults import DEFAULT_DATASET_DIR
+from src.streaming_stats import RegressionResult, stream_population_visitor_history, stream_population_visitor_stats
 from typing import Tuple
 
 log = get_logger()
 
+# Estimators compared by model_visitors_with_features, every one is cross-validated on the same cached matrix
+DEFAULT_VISITOR_MODELS = {
+    'linear_regression': LinearRegression(),
+    'ridge_alpha_0.1': Ridge(alpha=0.1),
+    'ridge_alpha_1': Ridge(alpha=1.0),
+    'ridge_alpha_10': Ridge(alpha=10.0),
+}
 
-def correlate_population_visitors(museum_all_data_df: pd.DataFrame) -> None:
+
+@profile_stage()
+def correlate_population_visitors(museum_all_data_df: pd.DataFrame, resamples: int = DEFAULT_RESAMPLES,
+                                  seed: int = DEFAULT_SEED) -> dict:
     '''
     Correlate the city population and the influx of visitors.
+    The coefficient, intercept and Pearson's r are estimated on all museums, like their confidence intervals,
+    and the performance metrics are measured on a 30% test set of a split seeded with seed.
 
     :param museum_all_data_df: a dataframe which contains all main character data of the museums
-    :return: None
+    :param resamples: number of bootstrap resamples and permutations for the confidence intervals
+    :param seed: random seed of the train and test split and of the resampling
+    :return: a dictionary of the names and values of the coefficients, intervals and performance metrics
     '''
 
     # Split the dataset into traning dataset(70%) and test dataset(30%) randomly
     log.info('Start to prepare training and testing dataset for linear regression model... ')
     log.info('Splitting the dataset into 70% training set and 30% testing set...')
-    x_train, x_test, y_train, y_test = prepare_train_test_set(museum_all_data_df)
+    x_train, x_test, y_train, y_test = prepare_train_test_set(museum_all_data_df, seed=seed)
 
     # Build the linear regression model
     log.info('Building linear regression model...')
@@ -40,6 +64,15 @@ def correlate_population_visitors(museum_all_data_df: pd.DataFrame) -> None:
     log.info(f'''The model's Pearson's correlation coefficient from linear regression coefficient is:\n '''
              f'''Pearson's correlation coefficient: {correlation_coef}''')
 
+    # Resample all museums for the uncertainty of r and of the slope, which one split does not show
+    log.info(f'Calculating bootstrap confidence intervals and permutation test with {resamples} resamples...')
+    resampling = calculate_resampling_statistics(museum_all_data_df, resamples, seed)
+    log.info(f'''The 95% confidence intervals and the permutation test p-value are:\n '''
+             f'''Pearson's correlation coefficient: {resampling.pearson_r.estimate} '''
+             f'[{resampling.pearson_r.low}, {resampling.pearson_r.high}]\n '
+             f'Coefficient: {resampling.slope.estimate} [{resampling.slope.low}, {resampling.slope.high}]\n '
+             f'p-value: {resampling.p_value}')
+
     # Make prediction from the model
     log.info('Predicting testing dataset...')
     predictions = model_prediction(model, x_test)
@@ -53,12 +86,157 @@ def correlate_population_visitors(museum_all_data_df: pd.DataFrame) -> None:
              f'Mean squared error: {mean_squared_error} \n '
              f'Root mean squared error: {root_mean_squared_error}')
 
+    # The estimates of all museums go with their intervals, the estimates of the training set can be outside them
+    population, visitors = population_visitor_values(museum_all_data_df)
+    intercept = np.mean(visitors) - resampling.slope.estimate * np.mean(population)
+    return {'coefficient': float(resampling.slope.estimate), 'intercept': float(intercept),
+            'pearson_r': float(resampling.pearson_r.estimate), 'pearson_r_low': resampling.pearson_r.low,
+            'pearson_r_high': resampling.pearson_r.high, 'coefficient_low': resampling.slope.low,
+            'coefficient_high': resampling.slope.high, 'p_value': float(resampling.p_value),
+            'mean_absolute_error': float(mean_absolute_error), 'mean_squared_error': float(mean_squared_error),
+            'root_mean_squared_error': float(root_mean_squared_error)}
+
+
+@profile_stage()
+def cross_validate_population_visitors(museum_all_data_df: pd.DataFrame, folds: int = DEFAULT_FOLDS,
+                                       repeats: int = DEFAULT_REPEATS, seed: int = DEFAULT_CV_SEED,
+                                       workers: int = 1) -> CrossValidationResult:
+    '''
+    Cross-validate the linear regression of visitors on city population with repeated k-fold,
+    instead of measuring it on one random split. Museums without population or visitors are left out.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param folds: number of folds
+    :param repeats: number of repeats of the k-fold split
+    :param seed: random seed of the splits
+    :param workers: number of processes fitting folds
+    :return: the result of every fold, and the mean and standard deviation of the metrics
+    '''
+
+    df = museum_all_data_df[['population', 'visitors']].apply(pd.to_numeric, errors='coerce').dropna()
+    log.info(f'Cross-validating the linear regression model with {repeats} x {folds}-fold...')
+    result = cross_validate(df[['population']].to_numpy(), df['visitors'].to_numpy(), LinearRegression(),
+                            folds=folds, repeats=repeats, seed=seed, workers=workers)
+    log.info(f'The cross-validated performance metrics are (mean +- std over {len(result.folds)} folds): \n '
+             f'''Mean absolute error: {result.mean['mean_absolute_error']} +- {result.std['mean_absolute_error']} \n '''
+             f'''Mean squared error: {result.mean['mean_squared_error']} +- {result.std['mean_squared_error']} \n '''
+             f'''Root mean squared error: {result.mean['root_mean_squared_error']} +- '''
+             f'''{result.std['root_mean_squared_error']}''')
+    return result
+
+
+@profile_stage()
+def model_visitors_with_features(museum_all_data_df: pd.DataFrame, estimators: dict = None,
+                                 folds: int = DEFAULT_FOLDS, repeats: int = DEFAULT_REPEATS,
+                                 seed: int = DEFAULT_CV_SEED, workers: int = 1,
+                                 cache_dir: str = DEFAULT_FEATURE_CACHE_DIR) -> dict:
+    '''
+    Model visitors with population, coordinates, established year and museum types, and cross-validate
+    every estimator on the same splits of one cached design matrix.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param estimators: a dictionary of names and estimators, defaults to DEFAULT_VISITOR_MODELS
+    :param folds: number of folds
+    :param repeats: number of repeats of the k-fold split
+    :param seed: random seed of the splits
+    :param workers: number of processes fitting folds
+    :param cache_dir: directory of the cached design matrices
+    :return: a dictionary of names and cross-validation results
+    '''
+
+    design = load_or_build_design_matrix(museum_all_data_df, cache_dir)
+    log.info(f'Cross-validating {len(estimators or DEFAULT_VISITOR_MODELS)} models with features '
+             f'{design.feature_names} of {len(design.y)} museums...')
+
+    results = {}
+    for name, estimator in (estimators or DEFAULT_VISITOR_MODELS).items():
+        results[name] = cross_validate(design.x, design.y, estimator, folds=folds, repeats=repeats, seed=seed,
+                                       workers=workers, x_path=design.x_path)
+        log.info(f'''{name}: Root mean squared error: {results[name].mean['root_mean_squared_error']} +- '''
+                 f'''{results[name].std['root_mean_squared_error']}''')
+    return results
+
+
+@profile_stage()
+def correlate_population_visitors_in_db(database_path: str = DATABASE_PATH, workers: int = 1) -> RegressionResult:
+    '''
+    Correlate the city population and the influx of visitors in one pass over the museum database,
+    without loading it into a dataframe. The model is fitted on a fixed 70% of the museums and tested
+    on the other 30%, so the results are the same on every run.
+
+    :param database_path: the path and database name
+    :param workers: number of threads reading the database
+    :return: the regression result
+    '''
+
+    log.info(f'Streaming population and visitors from {database_path}...')
+    result = stream_population_visitor_stats(database_path, workers=workers)
+    log.info(f'''The model's linear regression coefficient and intercept are:\n '''
+             f'Coefficient: {result.slope}\n '
+             f'Intercept: {result.intercept}')
+    log.info(f'''The model's Pearson's correlation coefficient is:\n '''
+             f'''Pearson's correlation coefficient: {result.pearson_r}''')
+    log.info(f'The performance metrics has below values: \n '
+             f'Mean squared error: {result.mean_squared_error} \n '
+             f'Root mean squared error: {result.root_mean_squared_error}')
+    return result
+
 
-def prepare_train_test_set(museum_all_data_df: pd.DataFrame):
+@profile_stage()
+def correlate_population_visitors_in_dataset(dataset_dir: str = DEFAULT_DATASET_DIR, run_date: str = None,
+                                             countries: list = None, resamples: int = DEFAULT_RESAMPLES,
+                                             seed: int = DEFAULT_SEED) -> dict:
+    '''
+    Correlate the city population and the influx of visitors of one snapshot of the exported museum dataset.
+    Only the population and visitors columns of the snapshot's files are read.
+
+    :param dataset_dir: directory of the datasets written by export_museum_dataset
+    :param run_date: run date of the snapshot, like '2024-05-31', defaults to the latest snapshot
+    :param countries: only correlate the museums of these countries, defaults to all countries
+    :param resamples: number of bootstrap resamples and permutations for the confidence intervals
+    :param seed: random seed of the resampling
+    :return: a dictionary of the names and values of the coefficients, intervals and performance metrics
+    '''
+
+    run_dates = list_run_dates(MUSEUM_TABLE_NAME, dataset_dir)
+    if not run_dates:
+        raise FileNotFoundError(f'There is no museum dataset snapshot in {dataset_dir}.')
+    run_date = run_date or run_dates[-1]
+
+    log.info(f'Reading population and visitors of the {run_date} snapshot from {dataset_dir}...')
+    museum_df = read_dataset(MUSEUM_TABLE_NAME, dataset_dir, columns=['population', 'visitors'],
+                             run_dates=[run_date], countries=countries,
+                             where=ds.field('population').is_valid() & ds.field('visitors').is_valid())
+    return correlate_population_visitors(museum_df, resamples=resamples, seed=seed)
+
+
+@profile_stage()
+def correlate_population_visitor_history(dataset_dir: str = DEFAULT_DATASET_DIR, run_dates: list = None,
+                                         countries: list = None) -> dict:
+    '''
+    Correlate the city population and the influx of visitors in every snapshot of the exported museum dataset,
+    in one pass which only reads the id, population and visitors columns.
+
+    :param dataset_dir: directory of the datasets written by export_museum_dataset
+    :param run_dates: the run dates of the snapshots, defaults to all snapshots
+    :param countries: only correlate the museums of these countries, defaults to all countries
+    :return: a dictionary of run dates and their regression results, oldest first
+    '''
+
+    results = stream_population_visitor_history(dataset_dir, run_dates=run_dates, countries=countries)
+    for run_date, result in results.items():
+        museums = result.train_size + result.test_size
+        log.info(f'Snapshot {run_date}: coefficient {result.slope}, intercept {result.intercept}, '
+                 f"Pearson's correlation coefficient {result.pearson_r} of {museums} museums")
+    return results
+
+
+def prepare_train_test_set(museum_all_data_df: pd.DataFrame, seed: int = None):
     '''
     Prepare dataset for training and testing.
 
     :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param seed: random seed of the split, None splits differently on every run
     :return:
         x_train: training set for population
         x_test: testing set for population
@@ -69,7 +247,7 @@ def prepare_train_test_set(museum_all_data_df: pd.DataFrame):
     x = museum_all_data_df[['population']]
     y = museum_all_data_df[['visitors']]
 
-    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.3)
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.3, random_state=seed)
     return x_train, x_test, y_train, y_test
 
 
@@ -100,8 +278,34 @@ def calculate_pearson_correlation_coefficient(linear_reg_coef: float, museum_all
     return correlation_coefficient
 
 
+def calculate_resampling_statistics(museum_all_data_df: pd.DataFrame, resamples: int = DEFAULT_RESAMPLES,
+                                    seed: int = DEFAULT_SEED):
+    '''
+    Bootstrap confidence intervals of Pearson's r and of the slope, and the permutation test p-value of r.
+    Museums without population or visitors are left out.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param resamples: number of bootstrap resamples and permutations
+    :param seed: random seed
+    :return: a CorrelationResampling
+    '''
+
+    population, visitors = population_visitor_values(museum_all_data_df)
+    return resample_correlation(population, visitors, resamples=resamples, seed=seed)
+
+
+def population_visitor_values(museum_all_data_df: pd.DataFrame) -> tuple:
+    '''
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :return: arrays of the population and visitors of the museums which have both
+    '''
+
+    df = museum_all_data_df[['population', 'visitors']].apply(pd.to_numeric, errors='coerce').dropna()
+    return df['population'].to_numpy(), df['visitors'].to_numpy()
+
+
 def calculate_performance_metrics(y_test: pd.DataFrame, predictions: RegressorMixin) -> Tuple[float, float, float]:
     mean_absolute_error = metrics.mean_absolute_error(y_test, predictions)
     mean_squared_error = metrics.mean_squared_error(y_test, predictions)
-    root_mean_squared_error = np.sqrt(metrics.mean_squared_error(y_test, predictions))
+    root_mean_squared_error = np.sqrt(mean_squared_error)
     return mean_absolute_error, mean_squared_error, root_mean_squared_error
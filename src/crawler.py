@@ -0,0 +1,613 @@
+import lxml.html
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+import pandas as pd
+
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from src.fetch_museum_data import DEFAULT_RETRY_BACKOFF, fetch_with_retry
+from src.log_handler import get_logger
+from src.page_source import MediaWikiPageSource, RESOLVE_BATCH_SIZE, USER_AGENT, WIKIPEDIA_API_URL
+from src.profiling import count
+from src.stage_defaults import (DEFAULT_CRAWL_RATE, DEFAULT_CRAWL_STATE_PATH, DEFAULT_FETCH_RETRIES,
+                                DEFAULT_FETCH_TIMEOUT, DEFAULT_HOST_RATE, DEFAULT_MAX_DEPTH)
+
+log = get_logger()
+DEFAULT_CRAWL_WORKERS = 4
+
+# Requests per second over all hosts, and per host, are DEFAULT_CRAWL_RATE and DEFAULT_HOST_RATE.
+# At most DEFAULT_HOST_CONCURRENCY requests are sent to a host at the same time.
+DEFAULT_HOST_CONCURRENCY = 2
+
+LIST_PAGE = 'list'
+CATEGORY_PAGE = 'category'
+CATEGORY_NAMESPACE = 14
+CATEGORY_PREFIXES = ('Category:', 'Catégorie:', 'Categoría:', 'Kategorie:', 'Categoria:')
+
+# Status of a crawled page of the frontier, the others are 'pending'. Pages which are not done are crawled
+# by the next run.
+DONE = 'done'
+FAILED = 'failed'
+
+# Links from a list page to these pages are crawled as list pages too, like the lists of museums by country,
+# in English and other language editions
+DEFAULT_FOLLOW_PATTERN = r'^(Lists?_of_|Liste_|Lista_|Liste_der_).*(museum|musée|museo|museen)'
+
+# Headers of the list table columns, the first matching column is used. A table without a name or
+# museum column uses the first column with a link.
+VISITORS_HEADER = re.compile(r'visitors|attendance|visiteurs|visitantes|besucher', re.IGNORECASE)
+CITY_HEADER = re.compile(r'city|location|town|ville|ciudad|città|stadt', re.IGNORECASE)
+NAME_HEADER = re.compile(r'name|museum|nom|nombre|musée|museo', re.IGNORECASE)
+SKIPPED_TABLE_CLASSES = {'navbox', 'infobox', 'metadata', 'sidebar', 'vertical-navbox'}
+
+# A number with thousands separated by commas or spaces, like '9,600,000' or '500 000', and an optional million
+VISITORS_PATTERN = re.compile(r'(\d{1,3}(?:[,\u00a0\u202f ]\d{3})+|\d+)(\.\d+)?\s*(million)?', re.IGNORECASE)
+
+# A page of the frontier, keyed by its host and canonical page id, so a page reached through a redirect
+# or linked from several pages is crawled once
+CrawlPage = namedtuple('CrawlPage', ['host', 'page_id', 'api_url', 'title', 'kind', 'depth'])
+
+CREATE_FRONTIER_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS frontier (
+    host TEXT NOT NULL, page_id INTEGER NOT NULL, api_url TEXT NOT NULL, title TEXT NOT NULL, kind TEXT NOT NULL,
+    depth INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'pending', PRIMARY KEY (host, page_id));'''
+CREATE_MUSEUM_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS museum (
+    host TEXT NOT NULL, page_id INTEGER NOT NULL, api_url TEXT NOT NULL, wiki_link TEXT NOT NULL, name TEXT,
+    city TEXT, visitors INTEGER, source TEXT, PRIMARY KEY (host, page_id));'''
+# A museum found again, for example in a category after a list, keeps its values and gets the ones it missed
+UPSERT_MUSEUM_SQL = '''INSERT INTO museum (host, page_id, api_url, wiki_link, name, city, visitors, source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (host, page_id) DO UPDATE SET name = COALESCE(name, excluded.name),
+    city = COALESCE(city, excluded.city), visitors = COALESCE(visitors, excluded.visitors);'''
+MUSEUM_COLUMNS = ['name', 'city', 'visitors', 'wiki_link', 'page_id', 'api_url', 'source']
+
+
+class TokenBucket:
+    '''
+    Allow rate events per second on average, and bursts of up to capacity events.
+    '''
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep) -> None:
+        '''
+        :param rate: tokens added per second, 0 or less does not limit
+        :param capacity: maximum number of tokens, defaults to one second of tokens and at least 1
+        :param clock: returns the current time in seconds
+        :param sleep: sleeps for a number of seconds
+        :return: None
+        '''
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        '''
+        Take a token. When there is none, the token is taken from the future, so waiting callers are served
+        in the order they came.
+
+        :return: seconds to wait before the token may be used
+        '''
+
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self) -> float:
+        '''
+        Take a token, waiting until it may be used.
+
+        :return: seconds waited
+        '''
+
+        wait_seconds = self.reserve()
+        if wait_seconds > 0:
+            self.sleep(wait_seconds)
+        return wait_seconds
+
+
+class HostPoliteness:
+    '''
+    Rate limit requests over all hosts and per host, and limit the requests sent to a host at the same time.
+    '''
+
+    def __init__(self, rate: float = DEFAULT_CRAWL_RATE, host_rate: float = DEFAULT_HOST_RATE,
+                 host_concurrency: int = DEFAULT_HOST_CONCURRENCY, clock=time.monotonic, sleep=time.sleep) -> None:
+        '''
+        :param rate: requests per second over all hosts
+        :param host_rate: requests per second to a host
+        :param host_concurrency: maximum number of requests sent to a host at the same time
+        :param clock: returns the current time in seconds
+        :param sleep: sleeps for a number of seconds
+        :return: None
+        '''
+
+        self.bucket = TokenBucket(rate, clock=clock, sleep=sleep)
+        self.host_rate = host_rate
+        self.host_concurrency = host_concurrency
+        self.clock = clock
+        self.sleep = sleep
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def request(self, url: str):
+        '''
+        Wait until a request to the host of url is allowed, and hold one of the host's request slots.
+
+        :param url: url of the request
+        '''
+
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (TokenBucket(self.host_rate, clock=self.clock, sleep=self.sleep),
+                                    threading.BoundedSemaphore(self.host_concurrency))
+            host_bucket, slots = self.hosts[host]
+
+        with slots:
+            host_bucket.acquire()
+            self.bucket.acquire()
+            yield
+
+
+class PoliteMediaWikiPageSource(MediaWikiPageSource):
+    '''
+    MediaWiki page source which sends every API request through a HostPoliteness.
+    '''
+
+    def __init__(self, politeness: HostPoliteness, api_url: str = WIKIPEDIA_API_URL,
+                 user_agent: str = USER_AGENT) -> None:
+        super().__init__(api_url, user_agent)
+        self.politeness = politeness
+
+    def api_request(self, params: dict, timeout: float = None) -> dict:
+        with self.politeness.request(self.api_url):
+            return super().api_request(params, timeout=timeout)
+
+
+class CrawlState:
+    '''
+    The frontier and the museums of a crawl, in an SQLite database. A page and what was found on it
+    are written in one transaction, so a crawl stopped at any point resumes where it was.
+    '''
+
+    def __init__(self, path: str = DEFAULT_CRAWL_STATE_PATH) -> None:
+        '''
+        :param path: path of the database, ':memory:' keeps the state in memory
+        :return: None
+        '''
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(CREATE_FRONTIER_TABLE_SQL)
+            self.conn.execute(CREATE_MUSEUM_TABLE_SQL)
+
+    def unfinished_pages(self) -> list:
+        '''
+        :return: the pages of the frontier which are not done, failed pages included, in the order they were found
+        '''
+
+        rows = self.conn.execute('SELECT host, page_id, api_url, title, kind, depth FROM frontier '
+                                 'WHERE status != ? ORDER BY rowid;', (DONE,)).fetchall()
+        return [CrawlPage(*row) for row in rows]
+
+    def add_pages(self, pages: list) -> list:
+        '''
+        Add pages to the frontier, pages which are in it are ignored.
+
+        :param pages: a list of CrawlPages
+        :return: the pages which were added
+        '''
+
+        with self.conn:
+            return self._add_pages(pages)
+
+    def _add_pages(self, pages: list) -> list:
+        added = []
+        for page in pages:
+            cursor = self.conn.execute('INSERT OR IGNORE INTO frontier (host, page_id, api_url, title, kind, depth) '
+                                       'VALUES (?, ?, ?, ?, ?, ?);', tuple(page))
+            if cursor.rowcount:
+                added.append(page)
+        return added
+
+    def record(self, page: CrawlPage, status: str, museums: list = (), pages: list = ()) -> list:
+        '''
+        Save the museums and pages found on a crawled page, and its status.
+
+        :param page: the crawled page
+        :param status: DONE or FAILED
+        :param museums: a list of museum value tuples, in the column order of the museum table
+        :param pages: a list of CrawlPages linked from the page
+        :return: the pages which were added to the frontier
+        '''
+
+        with self.conn:
+            self.conn.executemany(UPSERT_MUSEUM_SQL, museums)
+            added = self._add_pages(pages)
+            self.conn.execute('UPDATE frontier SET status = ? WHERE host = ? AND page_id = ?;',
+                              (status, page.host, page.page_id))
+        return added
+
+    def status_counts(self) -> dict:
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM frontier GROUP BY status;').fetchall())
+
+    def museums_df(self) -> pd.DataFrame:
+        '''
+        :return: a dataframe of the museums found, in the order they were found
+        '''
+
+        return pd.read_sql_query(f'SELECT {", ".join(MUSEUM_COLUMNS)} FROM museum ORDER BY rowid;', self.conn)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class Crawler:
+    '''
+    Crawl museum list pages and category pages of one or more MediaWiki sites, and collect the museums on them.
+
+    Every link is resolved to its canonical page id before it is crawled or saved, following redirects,
+    so a museum or list page reached through several links or redirects is only crawled and saved once.
+    The state of the crawl is saved after every page, see CrawlState.
+    '''
+
+    def __init__(self, state_path: str = DEFAULT_CRAWL_STATE_PATH, workers: int = DEFAULT_CRAWL_WORKERS,
+                 politeness: HostPoliteness = None, max_depth: int = DEFAULT_MAX_DEPTH,
+                 follow_pattern: str = DEFAULT_FOLLOW_PATTERN, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                 retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF) -> None:
+        '''
+        :param state_path: path of the crawl state database
+        :param workers: number of pages crawled at the same time
+        :param politeness: the rate limits of the requests, defaults to HostPoliteness()
+        :param max_depth: number of links followed from a seed to a list page or subcategory
+        :param follow_pattern: regular expression of the page names of linked list pages which are crawled
+        :param timeout: seconds to wait for each request
+        :param retries: number of retries for a failed request
+        :param backoff: seconds to wait before the first retry, doubled for every next retry
+        :return: None
+        '''
+
+        self.state = CrawlState(state_path)
+        self.workers = workers
+        self.politeness = politeness or HostPoliteness()
+        self.max_depth = max_depth
+        self.follow_pattern = re.compile(follow_pattern, re.IGNORECASE)
+        self.fetch_options = {'timeout': timeout, 'retries': retries, 'backoff': backoff}
+        self.page_sources = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.state.close()
+
+    def page_source(self, api_url: str) -> PoliteMediaWikiPageSource:
+        with self.lock:
+            if api_url not in self.page_sources:
+                self.page_sources[api_url] = PoliteMediaWikiPageSource(self.politeness, api_url)
+            return self.page_sources[api_url]
+
+    def add_seeds(self, seeds: list) -> list:
+        '''
+        Add list pages and category pages to the frontier. Seeds which were added before are ignored,
+        so a crawl is resumed by adding the same seeds again.
+
+        :param seeds: a list of (api url, page name), or page names and page urls, see parse_seed
+        :return: the pages which were added to the frontier
+        '''
+
+        seeds = [parse_seed(seed) if isinstance(seed, str) else seed for seed in seeds]
+        pages = []
+        for api_url in dict.fromkeys(api_url for api_url, _ in seeds):
+            titles = [title for seed_api_url, title in seeds if seed_api_url == api_url]
+            for title, (page_id, canonical_title) in self.resolve(api_url, titles).items():
+                pages.append(CrawlPage(host_of(api_url), page_id, api_url, canonical_title,
+                                       page_kind(canonical_title), 0))
+        missing = len(seeds) - len(pages)
+        if missing:
+            log.warning(f'{missing} crawl seed(s) do not exist.')
+        return self.state.add_pages(pages)
+
+    def run(self, max_pages: int = None) -> int:
+        '''
+        Crawl the pages of the frontier, and the pages found on them, until the frontier is empty.
+
+        :param max_pages: stop after crawling this many pages, None crawls all of them
+        :return: number of pages crawled
+        '''
+
+        pending = deque(self.state.unfinished_pages())
+        in_flight = {}
+        crawled = 0
+        log.info(f'Crawling {len(pending)} page(s) with {self.workers} worker(s)...')
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.workers \
+                        and (max_pages is None or crawled + len(in_flight) < max_pages):
+                    page = pending.popleft()
+                    in_flight[executor.submit(self.crawl_page, page)] = page
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = in_flight.pop(future)
+                    crawled += 1
+                    try:
+                        museums, linked_pages = future.result()
+                    except Exception as e:
+                        log.error(f'Error while crawling {page.title} on {page.host}: {e}')
+                        self.state.record(page, FAILED)
+                        continue
+                    pending.extend(self.state.record(page, DONE, museums, linked_pages))
+                    count('crawl_pages')
+
+        log.info(f'Crawled {crawled} page(s), the frontier is {self.state.status_counts()}.')
+        return crawled
+
+    def crawl_page(self, page: CrawlPage) -> tuple:
+        '''
+        Fetch a list page or category page, and resolve the museums and pages linked from it.
+
+        :param page: the page to crawl
+        :return: a list of museum value tuples, and a list of the CrawlPages linked from the page
+        '''
+
+        source = self.page_source(page.api_url)
+        follow = page.depth < self.max_depth
+
+        if page.kind == CATEGORY_PAGE:
+            members = fetch_with_retry(source.fetch_category_members, page.title, **self.fetch_options)
+            museums = [(page.host, page_id, page.api_url, title, title.replace('_', ' '), None, None, page.title)
+                       for page_id, namespace, title in members if namespace != CATEGORY_NAMESPACE]
+            linked_pages = [CrawlPage(page.host, page_id, page.api_url, title, CATEGORY_PAGE, page.depth + 1)
+                            for page_id, namespace, title in members if namespace == CATEGORY_NAMESPACE and follow]
+            return museums, linked_pages
+
+        html = fetch_with_retry(source.fetch_page, page.title, **self.fetch_options).html
+        rows, list_titles = parse_museum_list(html, self.follow_pattern)
+        list_titles = list_titles if follow else []
+        resolved = self.resolve(page.api_url, [row['title'] for row in rows] + list_titles)
+
+        museums = []
+        for row in rows:
+            if row['title'] in resolved:
+                page_id, title = resolved[row['title']]
+                museums.append((page.host, page_id, page.api_url, title, row['name'], row['city'], row['visitors'],
+                                page.title))
+        linked_pages = [CrawlPage(page.host, resolved[title][0], page.api_url, resolved[title][1], LIST_PAGE,
+                                  page.depth + 1) for title in list_titles if title in resolved]
+        return museums, linked_pages
+
+    def resolve(self, api_url: str, titles: list) -> dict:
+        '''
+        Resolve page names to their canonical page, in batches of RESOLVE_BATCH_SIZE.
+
+        :param api_url: the api url of the site of the pages
+        :param titles: the page names
+        :return: a dictionary of page names and (page id, canonical page name), without missing pages
+        '''
+
+        source = self.page_source(api_url)
+        titles = list(dict.fromkeys(titles))
+        resolved = {}
+        for start in range(0, len(titles), RESOLVE_BATCH_SIZE):
+            batch = titles[start:start + RESOLVE_BATCH_SIZE]
+            resolved.update(fetch_with_retry(source.resolve_titles, batch, **self.fetch_options))
+        return {title: page for title, page in resolved.items() if page is not None}
+
+    def museums_df(self) -> pd.DataFrame:
+        return self.state.museums_df()
+
+
+def crawl_museum_list(seeds: list, state_path: str = DEFAULT_CRAWL_STATE_PATH, rate: float = DEFAULT_CRAWL_RATE,
+                      host_rate: float = DEFAULT_HOST_RATE, **crawler_options) -> pd.DataFrame:
+    '''
+    Crawl the museums of list pages and category pages, resuming the crawl saved at state_path.
+
+    :param seeds: the list pages and category pages to start from, see Crawler.add_seeds
+    :param state_path: path of the crawl state database
+    :param rate: requests per second over all hosts
+    :param host_rate: requests per second to a host
+    :param crawler_options: the other arguments of Crawler
+    :return: a dataframe of the museums, with a name, city, visitors, wiki_link, page_id, api_url and source column
+    '''
+
+    with Crawler(state_path, politeness=HostPoliteness(rate, host_rate), **crawler_options) as crawler:
+        crawler.add_seeds(seeds)
+        crawler.run()
+        return crawler.museums_df()
+
+
+def parse_seed(seed: str, api_url: str = WIKIPEDIA_API_URL) -> tuple:
+    '''
+    :param seed: a page name, or the url of a page like 'https://fr.wikipedia.org/wiki/Liste_de_musées_en_France'
+    :param api_url: the api url of page names
+    :return: the api url of the page's site and the page name
+    '''
+
+    parts = urllib.parse.urlsplit(seed)
+    if parts.scheme and parts.netloc and '/wiki/' in parts.path:
+        title = urllib.parse.unquote(parts.path.split('/wiki/', 1)[1])
+        return f'{parts.scheme}://{parts.netloc}/w/api.php', title.replace(' ', '_')
+    return api_url, seed.replace(' ', '_')
+
+
+def host_of(api_url: str) -> str:
+    return urllib.parse.urlsplit(api_url).netloc
+
+
+def page_kind(title: str) -> str:
+    return CATEGORY_PAGE if title.startswith(CATEGORY_PREFIXES) else LIST_PAGE
+
+
+def parse_museum_list(html: str, follow_pattern: re.Pattern = None) -> tuple:
+    '''
+    Find the museums in the tables of a list page, and the links to other list pages.
+
+    The columns of a table are found by their headers rather than by position, so a list with other or
+    reordered columns is read too. Reference links, links to other namespaces and red links are not museums.
+
+    :param html: the html of the list page
+    :param follow_pattern: compiled regular expression of the page names of list pages to follow
+    :return: a list of museum dictionaries with a title, name, city and visitors key, and a list of
+        the page names of linked list pages
+    '''
+
+    document = lxml.html.fromstring(html)
+    for reference in document.xpath('//sup[contains(@class, "reference")]'):
+        reference.drop_tree()
+
+    rows = []
+    for table in document.iter('table'):
+        if SKIPPED_TABLE_CLASSES & set(table.get('class', '').split()):
+            continue
+        rows.extend(parse_museum_table(table))
+
+    list_titles = []
+    if follow_pattern is not None:
+        row_titles = {row['title'] for row in rows}
+        for link in document.iter('a'):
+            title = article_title(link.get('href'))
+            if title and title not in row_titles and follow_pattern.search(title):
+                list_titles.append(title)
+    return rows, list(dict.fromkeys(list_titles))
+
+
+def parse_museum_table(table) -> list:
+    '''
+    :param table: an lxml table element
+    :return: a list of museum dictionaries with a title, name, city and visitors key
+    '''
+
+    grid = table_grid(table)
+    header = next((cells for cells, is_header in grid if is_header), None)
+    if header is None:
+        return []
+
+    headers = [' '.join(cell.text_content().split()) for cell in header]
+    visitors_column = first_match(VISITORS_HEADER, headers)
+    city_column = first_match(CITY_HEADER, headers, exclude=[visitors_column])
+    name_column = first_match(NAME_HEADER, headers, exclude=[visitors_column, city_column])
+
+    museums = []
+    for cells, is_header in grid:
+        if is_header:
+            continue
+        columns = [name_column] if name_column is not None else range(len(cells))
+        link = next((link for column in columns if column < len(cells) for link in cells[column].iter('a')
+                     if article_title(link.get('href'))), None)
+        if link is None:
+            continue
+        museums.append({
+            'title': article_title(link.get('href')),
+            'name': ' '.join(link.text_content().split()) or None,
+            'city': cell_text(cells, city_column),
+            'visitors': parse_visitors(cell_text(cells, visitors_column)),
+        })
+    return museums
+
+
+def table_grid(table) -> list:
+    '''
+    Lay out the cells of a table in rows and columns, repeating cells which span several rows or columns.
+
+    :param table: an lxml table element
+    :return: a list of (cells of a row, True when all of them are header cells)
+    '''
+
+    grid = []
+    spans = {}
+    for row in table.xpath('./tr|./thead/tr|./tbody/tr|./tfoot/tr'):
+        own_cells = row.xpath('./th|./td')
+        if not own_cells:
+            continue
+        cells = []
+        remaining = iter(own_cells)
+        while True:
+            column = len(cells)
+            if column in spans:
+                cell, rows_left = spans[column]
+                cells.append(cell)
+                if rows_left > 1:
+                    spans[column] = (cell, rows_left - 1)
+                else:
+                    del spans[column]
+                continue
+            cell = next(remaining, None)
+            if cell is None:
+                break
+            row_span, column_span = span(cell.get('rowspan')), span(cell.get('colspan'))
+            for offset in range(column_span):
+                cells.append(cell)
+                if row_span > 1:
+                    spans[column + offset] = (cell, row_span - 1)
+        grid.append((cells, all(cell.tag == 'th' for cell in own_cells)))
+    return grid
+
+
+def span(value: str) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def first_match(pattern: re.Pattern, headers: list, exclude: list = ()):
+    return next((i for i, header in enumerate(headers) if i not in exclude and pattern.search(header)), None)
+
+
+def cell_text(cells: list, column: int):
+    if column is None or column >= len(cells):
+        return None
+    return ' '.join(cells[column].text_content().split()) or None
+
+
+def article_title(href: str):
+    '''
+    :param href: the href of a link
+    :return: the page name of an article link like '/wiki/Louvre', None for other links, like references,
+        red links and links to files or categories
+    '''
+
+    if not href or not href.startswith('/wiki/'):
+        return None
+    title = urllib.parse.unquote(href[len('/wiki/'):]).split('#')[0]
+    if not title or ':' in title:
+        return None
+    return title.replace(' ', '_')
+
+
+def parse_visitors(text: str):
+    '''
+    :param text: the text of a visitors cell, like '9,600,000' or '2.5 million (2019)'
+    :return: the number of visitors, None when the text has no number
+    '''
+
+    match = VISITORS_PATTERN.search(text or '')
+    if match is None:
+        return None
+    number = float(re.sub(r'\D', '', match.group(1)) + (match.group(2) or ''))
+    return int(round(number * 1_000_000)) if match.group(3) else int(number)
@@ -1,12 +1,22 @@
 import pandas as pd
+import sqlite3
 
-from src.db_operations import DatabaseOperations
+from src.clean_museum_data import MUSEUM_TYPE_KEYWORDS
+from src.db_operations import BULK_LOAD_PRAGMAS, DatabaseOperations
 from src.log_handler import get_logger
+from src.museum_schema import enforce_museum_schema
+from src.profiling import profile_stage
 
 log = get_logger()
 DATABASE_PATH = 'museum_analysis.db'
 CITY_TABLE_NAME = 'city'
 MUSEUM_TABLE_NAME = 'museum'
+MUSEUM_LOCATION_TABLE_NAME = 'museum_location'
+
+# The generation of the museum database is stored in the user_version of its header. It is bumped in the
+# transaction of every build or refresh, by any process, and cached query results of an older generation are stale.
+READ_DATABASE_GENERATION_SQL = 'PRAGMA user_version;'
+SET_DATABASE_GENERATION_SQL = 'PRAGMA user_version = {generation};'
 
 CREATE_CITY_TABLE_SQL = '''CREATE TABLE city (
   city_id INTEGER PRIMARY KEY, city TEXT, country TEXT, population NUMBER);'''
@@ -18,14 +28,59 @@ CREATE_MUSEUM_TABLE_SQL = '''CREATE TABLE museum (
   public_transit_access TEXT, website TEXT, architect TEXT, 
   established_year TEXT, is_art_museum INTEGER, is_history_museum INTEGER, 
   is_natural_museum INTEGER, is_culture_museum INTEGER, is_science_museum INTEGER,
-  FOREIGN KEY(city_id) REFERENCES city(id));'''
-
-
-def build_museum_db(museum_all_data_df: pd.DataFrame) -> None:
+  museum_key TEXT UNIQUE, revision_id INTEGER,
+  FOREIGN KEY(city_id) REFERENCES city(city_id));'''
+
+DROP_TABLE_SQL = 'DROP TABLE IF EXISTS {table_name};'
+
+# Secondary indexes are built after the rows are loaded, which is faster than updating them for every row.
+# They cover the queries of museum_queries, so those are answered from the indexes without reading the tables.
+CREATE_MUSEUM_INDEXES_SQL = [
+    'CREATE INDEX museum_city_id_index ON museum(city_id, visitors, name);',
+    'CREATE INDEX museum_visitors_index ON museum(visitors, name, city_id);',
+    'CREATE INDEX city_city_index ON city(city, city_id);',
+    'CREATE INDEX city_country_index ON city(country, city_id);',
+] + [f'CREATE INDEX museum_{flag}_index ON museum(visitors, name, city_id) WHERE {flag} = 1;'
+     for flag in MUSEUM_TYPE_KEYWORDS]
+
+# An R*Tree of the museum coordinates, a box of zero size per museum with coordinates, with the museum id as id.
+# It stores 32-bit floats rounded outwards, so a search finds a few museums just outside of the searched box too,
+# and the coordinates of the museum table are checked afterwards.
+CREATE_MUSEUM_LOCATION_TABLE_SQL = '''CREATE VIRTUAL TABLE IF NOT EXISTS museum_location USING rtree(
+  id, min_latitude, max_latitude, min_longitude, max_longitude);'''
+
+MUSEUM_LOCATION_EXISTS_SQL = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'museum_location';"
+
+MUSEUM_LOCATION_SELECT_SQL = '''SELECT id, latitude, latitude, longitude, longitude FROM museum
+  WHERE latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180'''
+INSERT_MUSEUM_LOCATIONS_SQL = f'INSERT INTO museum_location {MUSEUM_LOCATION_SELECT_SQL};'
+INSERT_MUSEUM_LOCATION_SQL = f'INSERT INTO museum_location {MUSEUM_LOCATION_SELECT_SQL} AND id = ?;'
+DELETE_MUSEUM_LOCATION_SQL = 'DELETE FROM museum_location WHERE id = ?;'
+COUNT_MUSEUM_LOCATIONS_SQL = 'SELECT COUNT(*) FROM museum_location;'
+
+MUSEUM_COLUMN_NAMES = {'name': 'name', 'city_id': 'city_id', 'visitors': 'visitors', 'wiki_link': 'wiki_link',
+                       'Location': 'location', 'latitude': 'latitude', 'longitude': 'longitude',
+                       'Collection size': 'collection_size', 'Visitors_rank': 'visitors_rank',
+                       'Director': 'director', 'Public transit access': 'public_transit_access',
+                       'Website': 'website', 'Architect': 'architect',
+                       'Established_year': 'established_year', 'is_art_museum': 'is_art_museum',
+                       'is_history_museum': 'is_history_museum', 'is_natural_museum': 'is_natural_museum',
+                       'is_culture_museum': 'is_culture_museum', 'is_science_museum': 'is_science_museum',
+                       'museum_key': 'museum_key', 'revision_id': 'revision_id'}
+
+READ_MUSEUM_DATA_SQL = '''SELECT museum.*, city.city, city.country, city.population
+  FROM museum LEFT JOIN city ON museum.city_id = city.city_id'''
+
+
+@profile_stage()
+def build_museum_db(museum_all_data_df: pd.DataFrame, database_path: str = DATABASE_PATH,
+                    conn: sqlite3.Connection = None) -> None:
     '''
     Build a database for museum character data.
 
     :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param database_path: the path and database name
+    :param conn: an open connection to build the database with, like the writer of a ConnectionPool
     :return: None
     '''
 
@@ -34,10 +89,34 @@ def build_museum_db(museum_all_data_df: pd.DataFrame) -> None:
     log.info('Successfully created dataframes for city and museum tables.')
 
     log.info('Creating museum_analysis db...')
-    create_db(city_df_for_sql, museum_df_for_sql)
+    create_db(city_df_for_sql, museum_df_for_sql, database_path, conn=conn)
     log.info('Successfully created museum_analysis db and closed db connection.')
 
 
+def bump_database_generation(db: DatabaseOperations) -> int:
+    '''
+    Mark the museum database as changed, which invalidates cached query results.
+    Inside a transaction of db, the generation only changes when the transaction is committed.
+
+    :param db: the database operations of an open connection
+    :return: the new generation
+    '''
+
+    with db.transaction():
+        generation = read_database_generation(db.conn) + 1
+        db.execute(SET_DATABASE_GENERATION_SQL.format(generation=generation))
+    return generation
+
+
+def read_database_generation(conn: sqlite3.Connection) -> int:
+    '''
+    :param conn: a connection to the museum database
+    :return: the generation of the database, 0 for a database which was never built
+    '''
+
+    return conn.execute(READ_DATABASE_GENERATION_SQL).fetchone()[0]
+
+
 def prepare_df_for_db_creat(museum_all_data_df: pd.DataFrame):
     '''
     Prepare dataframes for creating database tables.
@@ -48,7 +127,9 @@ def prepare_df_for_db_creat(museum_all_data_df: pd.DataFrame):
         museum_df_for_sql: a dataframe which contains all info for museum table
     '''
 
-    city_df_for_sql = museum_all_data_df[['city', 'country', 'population']].drop_duplicates('city')
+    # Cities with the same name, like Cambridge in England and in Massachusetts, are resolved to different
+    # world cities, so a city is one distinct city, country and population, the keys of the merge below
+    city_df_for_sql = museum_all_data_df[['city', 'country', 'population']].drop_duplicates()
     city_df_for_sql['city_id'] = range(1, len(city_df_for_sql) + 1)
 
     # Merge the two dataframes in order to have city_id in museum_all_data_df.
@@ -59,41 +140,110 @@ def prepare_df_for_db_creat(museum_all_data_df: pd.DataFrame):
                                           how='left', left_on=['city', 'country', 'population'],
                                           right_on=['city', 'country', 'population'], sort=False)
 
-    museum_df_for_sql = merged_museum_city_for_sql[['name', 'city_id', 'visitors', 'wiki_link',
-                                                    'Location', 'latitude', 'longitude',
-                                                    'Collection size', 'Visitors_rank',
-                                                    'Director', 'Public transit access',
-                                                    'Website', 'Architect',
-                                                    'Established_year', 'is_art_museum',
-                                                    'is_history_museum', 'is_natural_museum',
-                                                    'is_culture_museum', 'is_science_museum']]
-
-    museum_df_for_sql = museum_df_for_sql.rename(columns={'Location': 'location', 'Collection size': 'collection_size',
-                                                          'Visitors_rank': 'visitors_rank', 'Director': 'director',
-                                                          'Public transit access': 'public_transit_access',
-                                                          'Website': 'website', 'Architect': 'architect',
-                                                          'Established_year': 'established_year'})
+    museum_df_for_sql = select_museum_columns_for_sql(merged_museum_city_for_sql)
 
     museum_df_for_sql['id'] = range(1, len(museum_df_for_sql) + 1)
 
     return city_df_for_sql, museum_df_for_sql
 
 
-def create_db(city_df_for_sql: pd.DataFrame, museum_df_for_sql: pd.DataFrame) -> None:
+def select_museum_columns_for_sql(museum_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Select and rename the columns of the museum table.
+    Columns which were dropped during cleaning are added back with NaN values.
+
+    :param museum_df: a dataframe which contains museum character data and city_id
+    :return: museum_df_for_sql: a dataframe which contains all info for museum table
+    '''
+
+    museum_df = museum_df.assign(museum_key=create_museum_keys(museum_df))
+    museum_df_for_sql = museum_df.reindex(columns=list(MUSEUM_COLUMN_NAMES))
+    return museum_df_for_sql.rename(columns=MUSEUM_COLUMN_NAMES)
+
+
+def create_museum_keys(museum_df: pd.DataFrame) -> pd.Series:
     '''
-    Create museum database.
+    Create a stable key for every museum, its Wikipedia link or its name when it has no Wikipedia page.
+
+    :param museum_df: a dataframe which contains name and wiki_link columns
+    :return: a series of museum keys
+    '''
+
+    return museum_df['wiki_link'].fillna(museum_df['name'])
+
+
+def read_museum_data_from_db(database_path: str = DATABASE_PATH) -> pd.DataFrame:
+    '''
+    Read all museums joined with their city from the database.
+
+    :param database_path: the path and database name
+    :return: a dataframe which contains the museum table columns plus city, country and population,
+        with the compact dtypes of MUSEUM_SCHEMA
+    '''
+
+    db = DatabaseOperations(database_path)
+    museum_data_df = db.read_sql(READ_MUSEUM_DATA_SQL)
+    db.close_conn()
+    return enforce_museum_schema(museum_data_df, boundary='database')
+
+
+def create_db(city_df_for_sql: pd.DataFrame, museum_df_for_sql: pd.DataFrame,
+              database_path: str = DATABASE_PATH, pragmas: dict = BULK_LOAD_PRAGMAS,
+              conn: sqlite3.Connection = None) -> None:
+    '''
+    Create museum database, replacing the tables of an existing database.
+    The rows are bulk loaded into the declared tables, and the secondary indexes are built afterwards.
 
     :param city_df_for_sql: a dataframe which contains all info for city table
     :param museum_df_for_sql: a dataframe which contains all info for museum table
+    :param database_path: the path and database name
+    :param pragmas: PRAGMAs of the connection used for loading
+    :param conn: an open connection to use instead of connecting to database_path, it is left open
     :return: None
     '''
 
-    db = DatabaseOperations(DATABASE_PATH)
+    db = DatabaseOperations(database_path, conn=conn)
+    db.set_pragmas(pragmas)
+
+    # One transaction, so readers of a WAL database see the old tables until the new ones are complete
+    with db.transaction():
+        db.execute(DROP_TABLE_SQL.format(table_name=MUSEUM_LOCATION_TABLE_NAME))
+        db.execute(DROP_TABLE_SQL.format(table_name=MUSEUM_TABLE_NAME))
+        db.execute(DROP_TABLE_SQL.format(table_name=CITY_TABLE_NAME))
+        db.execute(CREATE_CITY_TABLE_SQL)
+        db.execute(CREATE_MUSEUM_TABLE_SQL)
 
-    db.execute(CREATE_CITY_TABLE_SQL)
-    db.execute(CREATE_MUSEUM_TABLE_SQL)
+        db.bulk_insert(city_df_for_sql, CITY_TABLE_NAME)
+        db.bulk_insert(museum_df_for_sql, MUSEUM_TABLE_NAME)
 
-    db.df_to_db_table(city_df_for_sql, CITY_TABLE_NAME)
-    db.df_to_db_table(museum_df_for_sql, MUSEUM_TABLE_NAME)
+        for create_index_sql in CREATE_MUSEUM_INDEXES_SQL:
+            db.execute(create_index_sql)
+        index_museum_locations(db)
+        bump_database_generation(db)
 
     db.close_conn()
+
+
+def index_museum_locations(db: DatabaseOperations, museum_ids: list = None) -> None:
+    '''
+    Fill the R*Tree of the museum coordinates from the museum table.
+    A database without the R*Tree, like one built before it existed, gets it with all museums.
+
+    :param db: the database operations of an open connection
+    :param museum_ids: only index these museums again, like after they were upserted or deleted,
+        defaults to all museums
+    :return: None
+    '''
+
+    with db.transaction():
+        if museum_ids is not None and db.execute(MUSEUM_LOCATION_EXISTS_SQL).fetchone() is None:
+            museum_ids = None
+        db.execute(CREATE_MUSEUM_LOCATION_TABLE_SQL)
+        if museum_ids is None:
+            db.execute(INSERT_MUSEUM_LOCATIONS_SQL)
+            count = db.execute(COUNT_MUSEUM_LOCATIONS_SQL).fetchone()[0]
+            log.info(f'Indexed the coordinates of {count} museums.')
+            return
+        rows = [(int(museum_id),) for museum_id in museum_ids]
+        db.cursor.executemany(DELETE_MUSEUM_LOCATION_SQL, rows)
+        db.cursor.executemany(INSERT_MUSEUM_LOCATION_SQL, rows)
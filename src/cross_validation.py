@@ -0,0 +1,137 @@
+import logging
+import multiprocessing
+import numpy as np
+import os
+import tempfile
+import time
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from sklearn import metrics
+from sklearn.base import clone, RegressorMixin
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import RepeatedKFold
+from src.log_handler import configure_worker_logging, get_logger, worker_logging_args
+from src.stage_defaults import DEFAULT_FOLDS, DEFAULT_REPEATS
+
+log = get_logger()
+DEFAULT_CV_SEED = 0
+METRIC_NAMES = ['mean_absolute_error', 'mean_squared_error', 'root_mean_squared_error', 'fit_seconds',
+                'predict_seconds']
+
+FoldResult = namedtuple('FoldResult', ['repeat', 'fold', 'train_size', 'test_size'] + METRIC_NAMES)
+CrossValidationResult = namedtuple('CrossValidationResult', ['folds', 'mean', 'std'])
+
+# The feature matrix and target of a worker process, memory-mapped once by load_shared_arrays
+shared_arrays = {}
+
+
+def cross_validate(x: np.ndarray, y: np.ndarray, estimator: RegressorMixin = None, folds: int = DEFAULT_FOLDS,
+                   repeats: int = DEFAULT_REPEATS, seed: int = DEFAULT_CV_SEED, workers: int = 1,
+                   x_path: str = None) -> CrossValidationResult:
+    '''
+    Repeated k-fold cross-validation of a regression model.
+
+    With several workers, the folds are fitted in worker processes. The feature matrix and target are
+    written to .npy files once, or the cached matrix at x_path is used, and every worker memory-maps
+    them, so all processes share the same pages instead of receiving a copy of the data per fold.
+
+    :param x: the feature matrix, one row per museum
+    :param y: the target, like visitors
+    :param estimator: the model to fit, a fresh clone per fold, defaults to LinearRegression
+    :param folds: number of folds
+    :param repeats: number of times the k-fold split is repeated with a different shuffle
+    :param seed: random seed of the splits
+    :param workers: number of processes fitting folds, 1 fits them in the current process
+    :param x_path: path of x saved as .npy, used by the workers instead of saving x again
+    :return: the result of every fold, and the mean and standard deviation of every metric over the folds
+    '''
+
+    estimator = LinearRegression() if estimator is None else estimator
+    x = np.asarray(x)
+    x = x.reshape(-1, 1) if x.ndim == 1 else x
+    y = np.asarray(y, dtype=np.float64)
+
+    splitter = RepeatedKFold(n_splits=folds, n_repeats=repeats, random_state=seed)
+    tasks = [(i // folds, i % folds, test_index) for i, (_, test_index) in enumerate(splitter.split(x))]
+
+    if workers > 1:
+        fold_results = cross_validate_in_processes(x, y, estimator, tasks, workers, x_path)
+    else:
+        fold_results = [evaluate_fold(x, y, estimator, *task) for task in tasks]
+
+    values = np.array([[getattr(fold, name) for name in METRIC_NAMES] for fold in fold_results])
+    mean = dict(zip(METRIC_NAMES, values.mean(axis=0).tolist()))
+    std = dict(zip(METRIC_NAMES, values.std(axis=0, ddof=1).tolist()))
+    return CrossValidationResult(fold_results, mean, std)
+
+
+def cross_validate_in_processes(x: np.ndarray, y: np.ndarray, estimator: RegressorMixin, tasks: list, workers: int,
+                                x_path: str = None) -> list:
+    '''
+    Evaluate folds in worker processes which memory-map the feature matrix and target.
+
+    :param x: the feature matrix
+    :param y: the target
+    :param estimator: the model to fit
+    :param tasks: a list of (repeat, fold, test indices)
+    :param workers: number of processes
+    :param x_path: path of x saved as .npy, x is saved to a temporary file when it is None
+    :return: the fold results, in the order of tasks
+    '''
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if x_path is None:
+            x_path = os.path.join(tmp_dir, 'x.npy')
+            np.save(x_path, x)
+        y_path = os.path.join(tmp_dir, 'y.npy')
+        np.save(y_path, y)
+
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=load_shared_arrays,
+                                       initargs=(x_path, y_path, *worker_logging_args()))
+        with executor:
+            futures = [executor.submit(evaluate_shared_fold, estimator, *task) for task in tasks]
+            return [future.result() for future in futures]
+
+
+def load_shared_arrays(x_path: str, y_path: str, log_queue=None, log_level: int = logging.INFO) -> None:
+    if log_queue is not None:
+        configure_worker_logging(log_queue, log_level)
+    shared_arrays['x'] = np.load(x_path, mmap_mode='r')
+    shared_arrays['y'] = np.load(y_path, mmap_mode='r')
+
+
+def evaluate_shared_fold(estimator: RegressorMixin, repeat: int, fold: int, test_index: np.ndarray) -> FoldResult:
+    return evaluate_fold(shared_arrays['x'], shared_arrays['y'], estimator, repeat, fold, test_index)
+
+
+def evaluate_fold(x: np.ndarray, y: np.ndarray, estimator: RegressorMixin, repeat: int, fold: int,
+                  test_index: np.ndarray) -> FoldResult:
+    '''
+    Fit a clone of the estimator on all rows but the test rows, and measure its error on the test rows.
+
+    :param x: the feature matrix
+    :param y: the target
+    :param estimator: the model to fit
+    :param repeat: number of the repeat
+    :param fold: number of the fold in the repeat
+    :param test_index: the rows of the test set
+    :return: the fold result
+    '''
+
+    is_test = np.zeros(len(y), dtype=bool)
+    is_test[test_index] = True
+
+    start = time.perf_counter()
+    model = clone(estimator).fit(x[~is_test], y[~is_test])
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictions = model.predict(x[is_test])
+    predict_seconds = time.perf_counter() - start
+
+    mean_squared_error = metrics.mean_squared_error(y[is_test], predictions)
+    return FoldResult(repeat, fold, int((~is_test).sum()), len(test_index),
+                      metrics.mean_absolute_error(y[is_test], predictions), mean_squared_error,
+                      float(np.sqrt(mean_squared_error)), fit_seconds, predict_seconds)
@@ -1,51 +1,181 @@
+import numpy as np
 import pandas as pd
 import sqlite3
+import time
 
+from contextlib import contextmanager
 from sqlite3 import Cursor
 from src.log_handler import get_logger
+from src.profiling import count
+from typing import Iterator
 
 log = get_logger()
 
+# Connection settings for loading many rows: a write-ahead log, fewer fsyncs and a 64MB page cache
+BULK_LOAD_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -64000, 'temp_store': 'MEMORY'}
+
 
 class DatabaseOperations:
     '''
     A class for database operations
     '''
 
-    def __init__(self, database_path: str) -> None:
+    def __init__(self, database_path: str = None, conn: sqlite3.Connection = None) -> None:
         '''
-        Connect to database.
+        Connect to database, or use an open connection, like the writer of a ConnectionPool.
 
         :param database_path: the path and database name
+        :param conn: an open connection to use instead of connecting, close_conn does not close it
         :return: None
         '''
 
-        try:
-            self.conn = sqlite3.connect(database_path)
-            self.cursor = self.conn.cursor()
+        self.owns_conn = conn is None
+        self.in_transaction = False
+        if conn is None:
+            try:
+                conn = sqlite3.connect(database_path)
+            except sqlite3.Error as e:
+                log.error(f'Error while connecting to db: {e}.')
+                raise
             log.info(f'Successfully connected to {database_path}.')
-        except sqlite3.Error as e:
-            log.error(f'Error while connecting to db: {e}.')
+        self.conn = conn
+        self.cursor = self.conn.cursor()
 
-    def execute(self, query: str) -> Cursor:
+    def execute(self, query: str, params: tuple = ()) -> Cursor:
         '''
         Execute sql statement.
 
         :param query: sql statement to execute
+        :param params: values for the ? placeholders in the statement
         :return: cursor
         '''
 
         try:
-            self.cursor.execute(query)
-            self.conn.commit()
-            log.info(f'Successfully executed query: {query}')
+            self.cursor.execute(query, params)
+            if not self.in_transaction:
+                self.conn.commit()
+            log.debug('Successfully executed query: %s', query)
+        except sqlite3.Error as e:
+            log.error(f'SQLite error while executing query: {query}, error message: {e}.')
+            self.raise_in_transaction()
+        return self.cursor
+
+    def executemany(self, query: str, rows: list) -> Cursor:
+        '''
+        Execute sql statement for every row, in a single transaction.
+
+        :param query: sql statement to execute
+        :param rows: a list of value tuples for the ? placeholders in the statement
+        :return: cursor
+        '''
+
+        try:
+            with self.transaction():
+                self.cursor.executemany(query, rows)
+            log.debug('Successfully executed query for %d rows: %s', len(rows), query)
         except sqlite3.Error as e:
             log.error(f'SQLite error while executing query: {query}, error message: {e}.')
+            self.raise_in_transaction()
         return self.cursor
 
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        '''
+        Run the statements of the block in one transaction, including CREATE and DROP statements.
+        It is committed when the block ends and rolled back when the block raises.
+        A transaction inside another transaction is part of the outer one.
+
+        :return: None
+        '''
+
+        if self.in_transaction:
+            yield
+            return
+
+        if not self.conn.in_transaction:
+            self.cursor.execute('BEGIN;')
+        self.in_transaction = True
+        try:
+            yield
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+
+    def raise_in_transaction(self) -> None:
+        '''
+        Re-raise the error being handled when it happened inside an outer transaction, so the transaction
+        is rolled back instead of committing the statements before the error.
+        Outside of a transaction, the failed statement was already rolled back and the error is only logged.
+
+        :return: None
+        '''
+
+        if self.in_transaction:
+            raise
+
+    def read_sql(self, query: str, params: tuple = ()) -> pd.DataFrame:
+        '''
+        Read the result of a sql query into a dataframe.
+
+        :param query: sql query to execute
+        :param params: values for the ? placeholders in the query
+        :return: a dataframe of the query result
+        '''
+
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def set_pragmas(self, pragmas: dict) -> None:
+        '''
+        Set PRAGMAs of the connection.
+
+        :param pragmas: a dictionary of PRAGMA names and values, like {'synchronous': 'OFF'}
+        :return: None
+        '''
+
+        for name, value in pragmas.items():
+            self.cursor.execute(f'PRAGMA {name} = {value};')
+        log.info(f'Set PRAGMAs {pragmas}.')
+
+    def bulk_insert(self, df: pd.DataFrame, table_name: str) -> float:
+        '''
+        Insert all rows of a dataframe into an existing table, in a single transaction.
+        Unlike df_to_db_table, the table keeps its declared schema. Columns are matched by name,
+        and missing values are inserted as NULL.
+
+        :param df: the dataframe to insert, its column names are the column names of the table
+        :param table_name: table name
+        :return: rows per second of the insert
+        '''
+
+        columns = ', '.join(df.columns)
+        placeholders = ', '.join('?' * len(df.columns))
+        query = f'INSERT INTO {table_name} ({columns}) VALUES ({placeholders});'
+
+        values = [to_sql_column(column) for _, column in df.items()]
+
+        start = time.perf_counter()
+        try:
+            with self.transaction():
+                self.cursor.executemany(query, zip(*values))
+        except sqlite3.Error as e:
+            log.error(f'SQLite error while inserting rows into db table {table_name}, error message: {e}.')
+            self.raise_in_transaction()
+            return 0.0
+        seconds = time.perf_counter() - start
+        count('rows_inserted', len(df))
+
+        rows_per_second = len(df) / seconds if seconds > 0 else float('inf')
+        log.info(f'Inserted {len(df)} rows into db table {table_name} in {seconds:.3f}s, '
+                 f'{rows_per_second:,.0f} rows/s.')
+        return rows_per_second
+
     def df_to_db_table(self, df: pd.DataFrame, table_name: str) -> None:
         '''
-        Convert dataframe to database table.
+        Convert dataframe to database table, replacing the table and its declared schema.
+        Use bulk_insert to insert into an existing table.
 
         :param df: the dataframe for creating database table
         :param table_name: table name
@@ -60,11 +190,27 @@ class DatabaseOperations:
 
     def close_conn(self) -> None:
         '''
-        Destroy instance and connection.
+        Destroy instance and connection, a connection passed to __init__ is left open.
 
         :return: None
         '''
 
         self.cursor.close()
-        self.conn.close()
-        log.info('Successfully closed db connection.')
+        if self.owns_conn:
+            self.conn.close()
+            log.info('Successfully closed db connection.')
+
+
+def to_sql_column(column: pd.Series) -> pd.Series:
+    '''
+    Convert a column to python objects which sqlite3 accepts, with None for missing values.
+
+    :param column: a dataframe column
+    :return: an object series of python ints, floats and strs
+    '''
+
+    if column.dtype == np.float32:
+        # Widen float32 through its shortest decimal, so 48.8606 is stored as 48.8606 and not 48.86059951782227
+        column = column.astype(str).astype(np.float64)
+    column = column.astype(object)
+    return column.where(column.notna(), None)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+
+from collections import namedtuple
+from src.clean_museum_data import MUSEUM_TYPE_KEYWORDS
+from src.log_handler import get_logger
+
+log = get_logger()
+DEFAULT_FEATURE_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../cache/features')
+
+# Changing how the matrix is built must change this, so cached matrices of the old format are not used
+FEATURE_FORMAT_VERSION = 1
+
+# Feature names and their columns in museum_all_data_df, the museum table names its columns in lower case
+FEATURE_COLUMNS = {'population': 'population', 'latitude': 'latitude', 'longitude': 'longitude',
+                   'established_year': 'Established_year', **{flag: flag for flag in MUSEUM_TYPE_KEYWORDS}}
+TARGET_COLUMN = 'visitors'
+
+DesignMatrix = namedtuple('DesignMatrix', ['x', 'y', 'feature_names', 'x_path', 'input_hash'])
+
+
+def load_or_build_design_matrix(museum_all_data_df: pd.DataFrame,
+                                cache_dir: str = DEFAULT_FEATURE_CACHE_DIR) -> DesignMatrix:
+    '''
+    Load the design matrix of the museums from the cache, or build and cache it when the inputs changed.
+
+    The matrix is cached as .npy files named by a hash of its input columns, and loaded memory-mapped,
+    so several estimators, hyperparameter sweeps and cross-validation workers reuse one matrix.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param cache_dir: directory of the cached matrices
+    :return: the design matrix
+    '''
+
+    inputs_df = select_feature_inputs(museum_all_data_df)
+    input_hash = hash_feature_inputs(inputs_df)
+    x_path, y_path, names_path = [os.path.join(cache_dir, f'{input_hash}.{suffix}')
+                                  for suffix in ('x.npy', 'y.npy', 'json')]
+
+    # The feature names are written last, so a matrix is only used when all its files were written
+    if not os.path.exists(names_path):
+        log.info(f'Building the design matrix of {len(inputs_df)} museums...')
+        x, y, feature_names = build_design_matrix(inputs_df)
+        os.makedirs(cache_dir, exist_ok=True)
+        save_atomically(x_path, lambda f: np.save(f, x))
+        save_atomically(y_path, lambda f: np.save(f, y))
+        save_atomically(names_path, lambda f: f.write(json.dumps(feature_names).encode('utf-8')))
+    else:
+        log.info(f'Using the cached design matrix {x_path}.')
+
+    with open(names_path) as f:
+        feature_names = json.load(f)
+    return DesignMatrix(np.load(x_path, mmap_mode='r'), np.load(y_path, mmap_mode='r'), feature_names, x_path,
+                        input_hash)
+
+
+def select_feature_inputs(museum_all_data_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Select the feature and target columns, from a dataframe of the pipeline or of the museum table.
+    Missing columns are added with NaN values.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :return: a dataframe with a column for every feature and the target, named by FEATURE_COLUMNS keys
+    '''
+
+    inputs = {}
+    for name, column in list(FEATURE_COLUMNS.items()) + [(TARGET_COLUMN, TARGET_COLUMN)]:
+        if column not in museum_all_data_df and name in museum_all_data_df:
+            column = name
+        inputs[name] = museum_all_data_df[column] if column in museum_all_data_df else np.nan
+    return pd.DataFrame(inputs, index=museum_all_data_df.index).reset_index(drop=True)
+
+
+def hash_feature_inputs(inputs_df: pd.DataFrame) -> str:
+    '''
+    Hash the input columns of the design matrix, their names and FEATURE_FORMAT_VERSION.
+
+    :param inputs_df: the selected feature and target columns
+    :return: a hex digest
+    '''
+
+    digest = hashlib.sha256(f'{FEATURE_FORMAT_VERSION}:{list(inputs_df.columns)}'.encode('utf-8'))
+    # Hash the values as strings, so the hash does not change with the dtype a column was read with
+    row_hashes = pd.util.hash_pandas_object(inputs_df.astype(str), index=False)
+    digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_design_matrix(inputs_df: pd.DataFrame) -> tuple:
+    '''
+    Build a contiguous float32 design matrix and the target of the museums with a known visitor count.
+
+    Established years and coordinates are parsed to numbers. Missing values of a numeric feature are
+    filled with the median of the feature, missing type flags with 0.
+
+    :param inputs_df: the selected feature and target columns
+    :return:
+        x: a C-contiguous float32 matrix, one row per museum and one column per feature
+        y: the visitors of the museums, float64
+        feature_names: the names of the columns of x
+    '''
+
+    numbers_df = inputs_df.apply(pd.to_numeric, errors='coerce')
+    numbers_df = numbers_df[numbers_df[TARGET_COLUMN].notna()]
+
+    feature_names = list(FEATURE_COLUMNS)
+    features_df = numbers_df[feature_names]
+    fill_values = features_df.median().fillna(0)
+    fill_values[list(MUSEUM_TYPE_KEYWORDS)] = 0
+
+    x = np.ascontiguousarray(features_df.fillna(fill_values).to_numpy(dtype=np.float32))
+    y = numbers_df[TARGET_COLUMN].to_numpy(dtype=np.float64)
+    return x, y, feature_names
+
+
+def save_atomically(path: str, save) -> None:
+    # save writes to an open binary file, which is renamed to path when it is complete
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        save(f)
+    os.replace(tmp_path, path)
@@ -1,29 +1,43 @@
 import bs4
+import functools
+import io
 import pandas as pd
+import time
 import urllib
-import wikipedia
 
+from concurrent.futures import ThreadPoolExecutor
+from src.infobox_parser import parse_infobox
 from src.log_handler import get_logger
+from src.page_source import MediaWikiPageSource, Page, PageNotFoundError, PageSource
+from src.stage_defaults import DEFAULT_FETCH_RETRIES, DEFAULT_FETCH_TIMEOUT
 
 log = get_logger()
 MOST_VISITED_MUSEUMS_PAGE_NAME = 'List_of_most-visited_museums'
+DEFAULT_FETCH_WORKERS = 1
+DEFAULT_RETRY_BACKOFF = 1.0
 
 
-def create_museum_dataframe() -> pd.DataFrame:
+def create_museum_dataframe(page_source: PageSource = None, max_workers: int = DEFAULT_FETCH_WORKERS,
+                            timeout: float = DEFAULT_FETCH_TIMEOUT, retries: int = DEFAULT_FETCH_RETRIES,
+                            backoff: float = DEFAULT_RETRY_BACKOFF) -> pd.DataFrame:
     '''
     Create museum dataframe which contains all museum characters.
 
+    :param page_source: where to fetch the Wikipedia pages from, defaults to the MediaWiki API
+    :param max_workers: number of museum pages fetched at the same time
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
     :return: museum_all_data_df: a dataframe which contains all character data of the museums
     '''
 
-    wiki_links = fetch_most_visited_museum_list()
-    museums_df = most_visited_museum_to_dataframe(wiki_links)
+    page_source = page_source or MediaWikiPageSource()
 
-    log.info('Fetching museum characters from Wikipedia...')
-    all_museums_detail = []
-    for museum_wiki_page_name in museums_df['wiki_link']:
-        museum_detail = fetch_museum_detail_dict(museum_wiki_page_name)
-        all_museums_detail.append(museum_detail)
+    museums_df = fetch_museum_list_dataframe(page_source)
+
+    log.info(f'Fetching museum characters from Wikipedia with {max_workers} worker(s)...')
+    all_museums_detail = fetch_all_museum_details(museums_df['wiki_link'], page_source, max_workers=max_workers,
+                                                  timeout=timeout, retries=retries, backoff=backoff)
     log.info('''Finished fetching all museums' characters.''')
 
     museum_details_df = pd.DataFrame(all_museums_detail)
@@ -33,21 +47,175 @@ def create_museum_dataframe() -> pd.DataFrame:
     return museum_all_data_df
 
 
-def fetch_most_visited_museum_list() -> list:
+def fetch_museum_list_dataframe(page_source: PageSource) -> pd.DataFrame:
+    '''
+    Fetch the museum list page and convert it to a dataframe.
+
+    :param page_source: where to fetch the Wikipedia page from
+    :return: museums_df: a dataframe which contains basic museum info, such as name, city, visitors and wiki_link
+    '''
+
+    wiki_links = fetch_most_visited_museum_list(page_source)
+    return most_visited_museum_to_dataframe(wiki_links, page_source)
+
+
+def map_in_order(func, items: list, max_workers: int = DEFAULT_FETCH_WORKERS) -> list:
+    '''
+    Apply func to every item, using a thread pool when max_workers is more than 1.
+
+    :param func: the function to apply
+    :param items: the items to apply func to
+    :param max_workers: number of items processed at the same time
+    :return: a list of results, in the same order as items
+    '''
+
+    if max_workers <= 1:
+        return [func(item) for item in items]
+
+    # executor.map yields results in the order of the input, which keeps the rows aligned with items
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def fetch_all_museum_details(wiki_links: list, page_source: PageSource, max_workers: int = DEFAULT_FETCH_WORKERS,
+                             timeout: float = DEFAULT_FETCH_TIMEOUT, retries: int = DEFAULT_FETCH_RETRIES,
+                             backoff: float = DEFAULT_RETRY_BACKOFF, revision_ids: list = None) -> list:
+    '''
+    Fetch museum detail info for all museum pages, using a thread pool when max_workers is more than 1.
+
+    :param wiki_links: a list of Wikipedia links of the museums
+    :param page_source: where to fetch the Wikipedia pages from
+    :param max_workers: number of museum pages fetched at the same time
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :param revision_ids: the expected revision id of every page, in the same order as wiki_links,
+        None where it is unknown
+    :return: all_museums_detail: a list of museum character dictionaries, in the same order as wiki_links
+    '''
+
+    def fetch(link_and_revision_id):
+        museum_wiki_page_name, revision_id = link_and_revision_id
+        return fetch_museum_detail_dict(museum_wiki_page_name, page_source, timeout=timeout,
+                                        retries=retries, backoff=backoff, revision_id=revision_id)
+
+    revision_ids = revision_ids if revision_ids is not None else [None] * len(wiki_links)
+    return map_in_order(fetch, list(zip(wiki_links, revision_ids)), max_workers=max_workers)
+
+
+def fetch_all_revision_ids(wiki_links: list, page_source: PageSource, max_workers: int = DEFAULT_FETCH_WORKERS,
+                           timeout: float = DEFAULT_FETCH_TIMEOUT, retries: int = DEFAULT_FETCH_RETRIES,
+                           backoff: float = DEFAULT_RETRY_BACKOFF) -> list:
+    '''
+    Fetch the current revision id of all museum pages, which is much cheaper than fetching the pages.
+    The revision ids are fetched in batches of the page source's revision_batch_size, so a page source
+    of the MediaWiki API needs one request per 50 museums.
+
+    :param wiki_links: a list of Wikipedia links of the museums
+    :param page_source: where to fetch the revision ids from
+    :param max_workers: number of batches fetched at the same time
+    :param timeout: seconds to wait for each request
+    :param retries: number of retries for a failed request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :return: a list of revision ids in the same order as wiki_links, None when the page has no link or failed
+    '''
+
+    def fetch(page_names):
+        try:
+            return fetch_with_retry(page_source.fetch_revision_ids, page_names, timeout=timeout, retries=retries,
+                                    backoff=backoff)
+        except Exception as e:
+            log.error(f'Error while fetching the revision ids of {len(page_names)} Wikipedia pages from '
+                      f'{page_names[0]}: {e}')
+            return {}
+
+    page_names = [link for link in dict.fromkeys(wiki_links) if link is not None]
+    batch_size = page_source.revision_batch_size
+    revision_ids = {}
+    for batch_revision_ids in map_in_order(fetch, [page_names[start:start + batch_size]
+                                                   for start in range(0, len(page_names), batch_size)],
+                                           max_workers=max_workers):
+        revision_ids.update(batch_revision_ids)
+    return [revision_ids.get(link) for link in wiki_links]
+
+
+def fetch_page(page_name: str, page_source: PageSource, timeout: float = DEFAULT_FETCH_TIMEOUT,
+               retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF,
+               revision_id: int = None) -> Page:
+    '''
+    Fetch a Wikipedia page, retrying with exponential backoff on errors.
+
+    :param page_name: the Wikipedia page name
+    :param page_source: where to fetch the Wikipedia page from
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :param revision_id: the expected revision id of the page, None when it is unknown
+    :return: the fetched page
+    '''
+
+    fetch = page_source.fetch_page
+    if revision_id is not None:
+        fetch = functools.partial(page_source.fetch_page_at_revision, revision_id=revision_id)
+    return fetch_with_retry(fetch, page_name, timeout=timeout, retries=retries, backoff=backoff)
+
+
+def fetch_page_html(page_name: str, page_source: PageSource, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                    retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF) -> str:
+    '''
+    Fetch the html of a Wikipedia page, retrying with exponential backoff on errors.
+
+    :param page_name: the Wikipedia page name
+    :param page_source: where to fetch the Wikipedia page from
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :return: html of the page
+    '''
+
+    return fetch_page(page_name, page_source, timeout=timeout, retries=retries, backoff=backoff).html
+
+
+def fetch_with_retry(fetch, page_name: str, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                     retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF):
+    '''
+    Call fetch(page_name, timeout=timeout), retrying with exponential backoff on errors.
+    A missing page is not retried.
+
+    :param fetch: a page source method, such as fetch_page or fetch_revision_id
+    :param page_name: the Wikipedia page name
+    :param timeout: seconds to wait for each request
+    :param retries: number of retries for a failed request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :return: the result of fetch
+    '''
+
+    for attempt in range(retries + 1):
+        try:
+            return fetch(page_name, timeout=timeout)
+        except PageNotFoundError:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = backoff * 2 ** attempt
+            log.warning(f'Error while fetching Wikipedia page {page_name}: {e}, retrying in {wait} seconds...')
+            time.sleep(wait)
+
+
+def fetch_most_visited_museum_list(page_source: PageSource) -> list:
     '''
     Fetch museum Wikipedia links from main wikipedia page.
 
+    :param page_source: where to fetch the Wikipedia page from
     :return: museum_wiki_pages: a list of Wikipedia links of the museums
     '''
 
     log.info('Fetching the most visited museum list from '
              'https://en.wikipedia.org/wiki/List_of_most_visited_museums.')
-    try:
-        # Get wikipedia page html source
-        soup = bs4.BeautifulSoup(wikipedia.page(MOST_VISITED_MUSEUMS_PAGE_NAME).html(), 'lxml')
-        log.info(f'Successfully opened Wikipedia page {MOST_VISITED_MUSEUMS_PAGE_NAME}.')
-    except wikipedia.exceptions.PageError as e:
-        log.error(f'Error while opening Wikipedia page {MOST_VISITED_MUSEUMS_PAGE_NAME}: {e}.')
+    # Get wikipedia page html source
+    soup = bs4.BeautifulSoup(fetch_page_html(MOST_VISITED_MUSEUMS_PAGE_NAME, page_source), 'lxml')
+    log.info(f'Successfully opened Wikipedia page {MOST_VISITED_MUSEUMS_PAGE_NAME}.')
 
     museum_wiki_pages = []
     for each_museum_info in soup.findAll('tr'):
@@ -58,7 +226,7 @@ def fetch_most_visited_museum_list() -> list:
             continue
 
         if 'redlink' in href:
-            log.info(f'Redlink found in {href}, add None to the museum info.')
+            log.info('Redlink found in %s, add None to the museum info.', href)
             museum_wiki_pages.append(None)
             continue
 
@@ -68,26 +236,34 @@ def fetch_most_visited_museum_list() -> list:
     return museum_wiki_pages
 
 
-def most_visited_museum_to_dataframe(wiki_links: str) -> pd.DataFrame:
+def most_visited_museum_to_dataframe(wiki_links: list, page_source: PageSource) -> pd.DataFrame:
     '''
     Fetch museum basic info from the museum table on the main wikipedia page, and convert the data to a dataframe.
 
     :param wiki_links: a list of Wikipedia links of the museums
+    :param page_source: where to fetch the Wikipedia page from
     :return: museum_all_data_df: a dataframe which contains basic museum info, such as name, city, visitors and wiki_link
     '''
 
-    df = pd.read_html(wikipedia.page(MOST_VISITED_MUSEUMS_PAGE_NAME).html())[0]
+    df = pd.read_html(io.StringIO(fetch_page_html(MOST_VISITED_MUSEUMS_PAGE_NAME, page_source)))[0]
     df.columns = ['name', 'city', 'visitors', 'year_reported']
     df = df[['name', 'city', 'visitors']]
     df['wiki_link'] = wiki_links
     return df
 
 
-def fetch_museum_detail_dict(museum_wiki_page_name: str) -> dict:
+def fetch_museum_detail_dict(museum_wiki_page_name: str, page_source: PageSource,
+                             timeout: float = DEFAULT_FETCH_TIMEOUT, retries: int = DEFAULT_FETCH_RETRIES,
+                             backoff: float = DEFAULT_RETRY_BACKOFF, revision_id: int = None) -> dict:
     '''
     Fetch museum detail info from each museum wikipedia page.
 
     :param museum_wiki_page_name: String of Wikipedia link of the museum
+    :param page_source: where to fetch the Wikipedia page from
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :param revision_id: the expected revision id of the page, None when it is unknown
     :return: museum_data: a dictionary of museum characters
     '''
 
@@ -97,39 +273,25 @@ def fetch_museum_detail_dict(museum_wiki_page_name: str) -> dict:
 
     try:
         # Get wikipedia page html source
-        soup = bs4.BeautifulSoup(wikipedia.page(museum_wiki_page_name).html(), 'lxml')
-    except wikipedia.exceptions.PageError as e:
+        page = fetch_page(museum_wiki_page_name, page_source, timeout=timeout, retries=retries, backoff=backoff,
+                          revision_id=revision_id)
+    except Exception as e:
         log.error(f'Error while opening Wikipedia page {museum_wiki_page_name}: {e}')
-
-    # info_table is the table on the right side of the page which contains museum character info
-    info_table = soup.find("table", {"class": "infobox vcard"})
-    if info_table is None:
         return {}
 
-    museum_data = {}
+    museum_data = parse_museum_detail_html(page.html)
 
-    # Iterating across the rows in the info_table
-    for info_field in info_table.findAll('tr'):
-        # If there is no 'th', means there is no data in this row
-        if len(info_field.findAll('th')) == 0:
-            continue
+    # Keep the revision id, so an incremental refresh can tell whether the page changed
+    museum_data.update({'revision_id': page.revision_id})
+    return museum_data
 
-        key = info_field.find('th').text
 
-        # For Coordinates, extract values in geo tag
-        if key == 'Coordinates':
-            geo = info_field.find('span', {'class': 'geo'}).text.split('; ')
-            lat = geo[0]
-            lon = geo[1]
-            museum_data.update({'latitude': lat})
-            museum_data.update({'longitude': lon})
-            continue
-
-        if info_field.find('td') is None:
-            continue
+def parse_museum_detail_html(html: str) -> dict:
+    '''
+    Parse museum detail info from the html of a museum wikipedia page.
 
-        # Convert special characters
-        value = info_field.find('td').text.encode('ascii', 'ignore').decode()
-        museum_data.update({key: value})
+    :param html: html of the museum Wikipedia page
+    :return: museum_data: a dictionary of museum characters
+    '''
 
-    return museum_data
+    return parse_infobox(html)
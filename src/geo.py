@@ -0,0 +1,73 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Half the circumference of the earth, no two points are further apart
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    '''
+    Great circle distances from one point to many points.
+
+    :param latitude: latitude of the point in degrees
+    :param longitude: longitude of the point in degrees
+    :param latitudes: latitudes of the other points in degrees
+    :param longitudes: longitudes of the other points in degrees
+    :return: an array of the distances in km
+    '''
+
+    lat = np.radians(latitude)
+    lats = np.radians(np.asarray(latitudes, dtype=np.float64))
+    half_dlat = (lats - lat) / 2
+    half_dlng = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude) / 2
+    a = np.sin(half_dlat) ** 2 + np.cos(lat) * np.cos(lats) * np.sin(half_dlng) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def bounding_boxes(latitude: float, longitude: float, radius_km: float) -> list:
+    '''
+    The boxes of latitudes and longitudes which contain every point within radius_km of a point.
+    A circle around a pole covers all longitudes, a circle across the antimeridian is split into two boxes.
+
+    :param latitude: latitude of the center in degrees
+    :param longitude: longitude of the center in degrees
+    :param radius_km: radius of the circle in km
+    :return: a list of (min_latitude, max_latitude, min_longitude, max_longitude)
+    '''
+
+    angle = radius_km / EARTH_RADIUS_KM
+    min_latitude = latitude - math.degrees(angle)
+    max_latitude = latitude + math.degrees(angle)
+    if min_latitude <= -90 or max_latitude >= 90:
+        return [(max(min_latitude, -90.0), min(max_latitude, 90.0), -180.0, 180.0)]
+
+    # The circle is widest in longitude where its meridians touch it, not at the latitude of its center
+    delta_longitude = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(latitude)), 1.0)))
+    return longitude_boxes(min_latitude, max_latitude, longitude - delta_longitude, longitude + delta_longitude)
+
+
+def longitude_boxes(min_latitude: float, max_latitude: float, min_longitude: float, max_longitude: float) -> list:
+    '''
+    Split a box which crosses the antimeridian into boxes within -180 and 180 degrees of longitude.
+
+    :param min_latitude: southern edge in degrees
+    :param max_latitude: northern edge in degrees
+    :param min_longitude: western edge in degrees, below -180 or above max_longitude when the box crosses
+        the antimeridian
+    :param max_longitude: eastern edge in degrees, above 180 when the box crosses the antimeridian
+    :return: a list of (min_latitude, max_latitude, min_longitude, max_longitude)
+    '''
+
+    if min_longitude > max_longitude:
+        min_longitude -= 360
+    if max_longitude - min_longitude >= 360:
+        return [(min_latitude, max_latitude, -180.0, 180.0)]
+    if min_longitude < -180:
+        return [(min_latitude, max_latitude, min_longitude + 360, 180.0),
+                (min_latitude, max_latitude, -180.0, max_longitude)]
+    if max_longitude > 180:
+        return [(min_latitude, max_latitude, min_longitude, 180.0),
+                (min_latitude, max_latitude, -180.0, max_longitude - 360)]
+    return [(min_latitude, max_latitude, min_longitude, max_longitude)]
@@ -0,0 +1,288 @@
+import pandas as pd
+
+from src.add_city_population import add_city_population_to_museum
+from src.clean_museum_data import clean_museum_character_data
+from src.create_museum_db import (DATABASE_PATH, MUSEUM_COLUMN_NAMES, build_museum_db, bump_database_generation,
+                                  create_museum_keys, index_museum_locations, select_museum_columns_for_sql)
+from src.db_operations import DatabaseOperations, to_sql_column
+from src.fetch_museum_data import (DEFAULT_FETCH_RETRIES, DEFAULT_FETCH_TIMEOUT, DEFAULT_FETCH_WORKERS,
+                                   DEFAULT_RETRY_BACKOFF, fetch_all_museum_details, fetch_all_revision_ids,
+                                   fetch_museum_list_dataframe)
+from src.log_handler import get_logger
+from src.profiling import profile_stage
+from src.page_source import PageSource
+
+log = get_logger()
+
+READ_MUSEUM_STATE_SQL = '''SELECT museum.id, museum.museum_key, museum.revision_id, museum.name,
+  museum.visitors, city.city FROM museum LEFT JOIN city ON museum.city_id = city.city_id'''
+
+CREATE_MUSEUM_KEY_INDEX_SQL = 'CREATE UNIQUE INDEX IF NOT EXISTS museum_key_index ON museum(museum_key);'
+
+# A city is one distinct city, country and population, like in prepare_df_for_db_creat, so cities with the same
+# name in one country stay apart
+SELECT_CITY_ID_SQL = 'SELECT city_id FROM city WHERE city IS ? AND country IS ? AND population IS ?;'
+INSERT_CITY_SQL = 'INSERT INTO city (city_id, city, country, population) VALUES (?, ?, ?, ?);'
+SELECT_NEXT_CITY_ID_SQL = 'SELECT IFNULL(MAX(city_id), 0) + 1 FROM city;'
+
+UPSERT_MUSEUM_SQL = '''INSERT INTO museum (id, {columns}) VALUES (?, {placeholders})
+  ON CONFLICT(museum_key) DO UPDATE SET {updates};'''.format(
+    columns=', '.join(MUSEUM_COLUMN_NAMES.values()),
+    placeholders=', '.join('?' * len(MUSEUM_COLUMN_NAMES)),
+    updates=', '.join(f'{column} = excluded.{column}' for column in MUSEUM_COLUMN_NAMES.values()))
+
+DELETE_MUSEUM_SQL = 'DELETE FROM museum WHERE museum_key = ?;'
+SELECT_MUSEUM_ID_SQL = 'SELECT id FROM museum WHERE museum_key = ?;'
+
+
+@profile_stage()
+def refresh_museum_db(page_source: PageSource, database_path: str = DATABASE_PATH,
+                      max_workers: int = DEFAULT_FETCH_WORKERS, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                      retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF) -> pd.DataFrame:
+    '''
+    Refresh the museum database incrementally.
+
+    Only the list page and the revision ids of the museum pages are fetched for all museums. Museum pages
+    are fetched, cleaned and upserted only when they are new, their revision changed or their row in the
+    list changed. Museums which left the list are deleted. When the database has no incremental state yet,
+    the whole database is built instead.
+
+    :param page_source: where to fetch the Wikipedia pages from
+    :param database_path: the path and database name
+    :param max_workers: number of pages fetched at the same time
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :return: changed_museums_df: a dataframe which contains all main character data of the changed museums
+    '''
+
+    museums_df = fetch_museum_list_dataframe(page_source)
+    museums_df['museum_key'] = create_museum_keys(museums_df)
+
+    stored_df = read_stored_museum_state(database_path)
+    if stored_df is None:
+        log.info(f'No incremental state found in {database_path}, building the whole db...')
+        museum_all_data_df = fetch_and_clean_museums(museums_df, page_source, max_workers=max_workers,
+                                                     timeout=timeout, retries=retries, backoff=backoff)
+        build_museum_db(museum_all_data_df, database_path)
+        return museum_all_data_df
+
+    log.info(f'Checking revision ids of {len(museums_df)} museum pages...')
+    museums_df['revision_id'] = fetch_all_revision_ids(museums_df['wiki_link'], page_source,
+                                                       max_workers=max_workers, timeout=timeout,
+                                                       retries=retries, backoff=backoff)
+
+    changed_df = museums_df[find_changed_museums(museums_df, stored_df)]
+    # The pages are fetched at the revisions just checked, so a cached older revision is not used
+    revision_ids = [None if pd.isna(revision_id) else int(revision_id) for revision_id in changed_df['revision_id']]
+    changed_df = changed_df.drop(columns='revision_id')
+    removed_keys = set(stored_df['museum_key']) - set(museums_df['museum_key'])
+    log.info(f'Found {len(changed_df)} new or changed museums and {len(removed_keys)} removed museums.')
+
+    if len(changed_df) > 0:
+        changed_df = fetch_and_clean_museums(changed_df.reset_index(drop=True), page_source,
+                                             max_workers=max_workers, timeout=timeout, retries=retries,
+                                             backoff=backoff, reduce_columns=False, revision_ids=revision_ids,
+                                             drop_failed=True)
+
+    if len(changed_df) > 0 or removed_keys:
+        update_museum_db(changed_df, removed_keys, stored_df, database_path)
+
+    return changed_df
+
+
+def fetch_and_clean_museums(museums_df: pd.DataFrame, page_source: PageSource,
+                            max_workers: int = DEFAULT_FETCH_WORKERS, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                            retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF,
+                            reduce_columns: bool = True, revision_ids: list = None,
+                            drop_failed: bool = False) -> pd.DataFrame:
+    '''
+    Fetch museum details for museums from the list page, then clean them and add city population.
+
+    :param museums_df: a dataframe of rows from the list page, with a default RangeIndex
+    :param page_source: where to fetch the Wikipedia pages from
+    :param max_workers: number of pages fetched at the same time
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :param reduce_columns: whether to drop columns with mostly NaN values while cleaning
+    :param revision_ids: the expected revision id of every museum page, None where it is unknown
+    :param drop_failed: leave out the museums whose page could not be fetched, so an upsert keeps their
+        stored rows instead of replacing them with empty details
+    :return: museum_all_data_df: a dataframe which contains all main character data of the museums
+    '''
+
+    all_museums_detail = fetch_all_museum_details(museums_df['wiki_link'], page_source, max_workers=max_workers,
+                                                  timeout=timeout, retries=retries, backoff=backoff,
+                                                  revision_ids=revision_ids)
+    # A museum without a page has no details, a museum with a page only has none when its fetch failed
+    fetched = [bool(detail) or pd.isna(wiki_link) for detail, wiki_link in zip(all_museums_detail,
+                                                                                museums_df['wiki_link'])]
+    if drop_failed and not all(fetched):
+        log.warning(f'Keeping the stored rows of {fetched.count(False)} museums whose pages could not be fetched.')
+        museums_df = museums_df[fetched].reset_index(drop=True)
+        all_museums_detail = [detail for detail, is_fetched in zip(all_museums_detail, fetched) if is_fetched]
+
+    museum_details_df = pd.DataFrame(all_museums_detail, index=museums_df.index)
+    if 'revision_id' not in museum_details_df:
+        museum_details_df['revision_id'] = None
+
+    museum_all_data_df = pd.concat([museums_df, museum_details_df], axis=1)
+    museum_all_data_df = clean_museum_character_data(museum_all_data_df, reduce_columns=reduce_columns)
+    return add_city_population_to_museum(museum_all_data_df)
+
+
+def read_stored_museum_state(database_path: str) -> pd.DataFrame:
+    '''
+    Read the key, revision id and list page fields of every museum in the database.
+
+    :param database_path: the path and database name
+    :return: stored_df: a dataframe of the stored museums, None if the database has no incremental state
+    '''
+
+    db = DatabaseOperations(database_path)
+    try:
+        stored_df = db.read_sql(READ_MUSEUM_STATE_SQL)
+    except pd.errors.DatabaseError as e:
+        log.info(f'Could not read museum state from {database_path}: {e}.')
+        stored_df = None
+    db.close_conn()
+    return stored_df
+
+
+def find_changed_museums(museums_df: pd.DataFrame, stored_df: pd.DataFrame) -> pd.Series:
+    '''
+    Find museums which are new, whose page revision changed, or whose row in the list page changed.
+    A museum whose current revision id could not be fetched is treated as unchanged.
+
+    :param museums_df: a dataframe of rows from the list page, with museum_key and revision_id
+    :param stored_df: a dataframe of the stored museums
+    :return: a boolean series, aligned with museums_df, which is True for changed museums
+    '''
+
+    merged_df = pd.merge(museums_df[['museum_key', 'revision_id', 'name', 'city', 'visitors']],
+                         stored_df, how='left', on='museum_key', suffixes=('', '_stored'), indicator=True)
+
+    is_new = merged_df['_merge'] == 'left_only'
+    current_revision = pd.to_numeric(merged_df['revision_id'], errors='coerce')
+    stored_revision = pd.to_numeric(merged_df['revision_id_stored'], errors='coerce')
+    revision_changed = current_revision.notna() & (current_revision != stored_revision)
+    row_changed = (values_differ(merged_df['name'], merged_df['name_stored'])
+                   | values_differ(merged_df['city'], merged_df['city_stored'])
+                   | values_differ(merged_df['visitors'], merged_df['visitors_stored']))
+
+    changed = is_new | revision_changed | row_changed
+    changed.index = museums_df.index
+    return changed
+
+
+def values_differ(left: pd.Series, right: pd.Series) -> pd.Series:
+    '''
+    Compare two series value by value, numbers are compared as numbers and missing values are equal.
+
+    :param left: the first series
+    :param right: the second series, aligned with left
+    :return: a boolean series which is True where the values differ
+    '''
+
+    left_number = pd.to_numeric(left, errors='coerce')
+    right_number = pd.to_numeric(right, errors='coerce')
+    both_numbers = left_number.notna() & right_number.notna()
+    both_missing = left.isna() & right.isna()
+
+    numbers_differ = both_numbers & (left_number != right_number)
+    others_differ = ~both_numbers & ~both_missing & (left.astype(str) != right.astype(str))
+    return numbers_differ | others_differ
+
+
+def update_museum_db(museum_all_data_df: pd.DataFrame, removed_keys: set, stored_df: pd.DataFrame,
+                     database_path: str) -> None:
+    '''
+    Upsert the changed museums and delete the removed museums in one transaction, so readers and a later
+    refresh see either all the changes of a refresh or none of them.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the changed museums
+    :param removed_keys: keys of the museums to delete
+    :param stored_df: a dataframe of the stored museums
+    :param database_path: the path and database name
+    :return: None
+    '''
+
+    db = DatabaseOperations(database_path)
+    try:
+        with db.transaction():
+            db.execute(CREATE_MUSEUM_KEY_INDEX_SQL)
+            museum_ids = upsert_museums(db, museum_all_data_df, stored_df) if len(museum_all_data_df) > 0 else []
+            if removed_keys:
+                museum_ids += delete_museums(db, removed_keys)
+            index_museum_locations(db, museum_ids)
+            bump_database_generation(db)
+    finally:
+        db.close_conn()
+
+
+def upsert_museums(db: DatabaseOperations, museum_all_data_df: pd.DataFrame, stored_df: pd.DataFrame) -> list:
+    '''
+    Insert or update the cities and museums of the changed museums, keeping the ids of existing rows.
+
+    :param db: the database operations of an open connection
+    :param museum_all_data_df: a dataframe which contains all main character data of the changed museums
+    :param stored_df: a dataframe of the stored museums
+    :return: the ids of the upserted museums
+    '''
+
+    city_ids = {}
+    cities = to_sql_values(museum_all_data_df[['city', 'country', 'population']])
+    for city in cities.drop_duplicates().itertuples(index=False, name=None):
+        row = db.execute(SELECT_CITY_ID_SQL, city).fetchone()
+        if row is None:
+            city_id = db.execute(SELECT_NEXT_CITY_ID_SQL).fetchone()[0]
+            db.execute(INSERT_CITY_SQL, (city_id,) + city)
+        else:
+            city_id = row[0]
+        city_ids[city] = city_id
+
+    museum_all_data_df = museum_all_data_df.assign(
+        city_id=[city_ids[city] for city in cities.itertuples(index=False, name=None)])
+    museum_df_for_sql = to_sql_values(select_museum_columns_for_sql(museum_all_data_df))
+
+    # Existing museums keep their id, new museums get ids after the largest stored id
+    stored_ids = dict(zip(stored_df['museum_key'], stored_df['id']))
+    next_id = int(stored_df['id'].max()) + 1 if len(stored_df) > 0 else 1
+    rows = []
+    for row in museum_df_for_sql.itertuples(index=False):
+        museum_id = stored_ids.get(row.museum_key)
+        if museum_id is None:
+            museum_id, next_id = next_id, next_id + 1
+        rows.append((int(museum_id),) + tuple(row))
+
+    db.executemany(UPSERT_MUSEUM_SQL, rows)
+    log.info(f'Upserted {len(rows)} museums and {len(city_ids)} cities.')
+    return [row[0] for row in rows]
+
+
+def delete_museums(db: DatabaseOperations, museum_keys: set) -> list:
+    '''
+    Delete museums from the database.
+
+    :param db: the database operations of an open connection
+    :param museum_keys: keys of the museums to delete
+    :return: the ids of the deleted museums
+    '''
+
+    museum_ids = [museum_id for museum_key in museum_keys
+                  for museum_id, in db.execute(SELECT_MUSEUM_ID_SQL, (museum_key,)).fetchall()]
+    db.executemany(DELETE_MUSEUM_SQL, [(museum_key,) for museum_key in museum_keys])
+    log.info(f'Deleted {len(museum_ids)} museums.')
+    return museum_ids
+
+
+def to_sql_values(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Convert a dataframe to python objects which sqlite3 accepts, with None for missing values.
+
+    :param df: the dataframe to convert
+    :return: the converted dataframe
+    '''
+
+    return df.apply(to_sql_column)
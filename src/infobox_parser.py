@@ -0,0 +1,155 @@
+import bs4
+import lxml.html
+import re
+
+INFOBOX_CLASS = 'infobox vcard'
+
+# Matches the opening tag of the infobox table, whatever the order of its attributes
+INFOBOX_START_PATTERN = re.compile(r'''<table\b[^>]*\bclass\s*=\s*["']infobox vcard["'][^>]*>''', re.IGNORECASE)
+TABLE_TAG_PATTERN = re.compile(r'<(/?)table\b[^>]*>', re.IGNORECASE)
+
+# Text of an element, without the contents of style and script tags, the same as BeautifulSoup's .text
+TEXT_XPATH = './/text()[not(ancestor::style) and not(ancestor::script) and not(ancestor::template)]'
+
+
+def parse_infobox(html: str) -> dict:
+    '''
+    Parse museum characters from the infobox of a museum wikipedia page.
+
+    Only the infobox is parsed: its html is cut out of the page with a regex, and then parsed
+    with lxml and read with XPath. The whole page is only parsed when the infobox cannot be cut out.
+
+    :param html: html of the museum Wikipedia page
+    :return: museum_data: a dictionary of museum characters, the same as parse_infobox_with_soup
+    '''
+
+    info_table = find_infobox_table(html)
+    if info_table is None:
+        return {}
+
+    museum_data = {}
+
+    # Iterating across the rows in the info_table
+    for info_field in info_table.iterfind('.//tr'):
+        # If there is no 'th', means there is no data in this row
+        headers = info_field.xpath('.//th')
+        if len(headers) == 0:
+            continue
+
+        key = element_text(headers[0])
+
+        # For Coordinates, extract values in geo tag
+        if key == 'Coordinates':
+            geo = element_text(info_field.xpath('.//span[@class="geo"]')[0]).split('; ')
+            museum_data.update({'latitude': geo[0]})
+            museum_data.update({'longitude': geo[1]})
+            continue
+
+        cells = info_field.xpath('.//td')
+        if len(cells) == 0:
+            continue
+
+        # Convert special characters
+        value = element_text(cells[0]).encode('ascii', 'ignore').decode()
+        museum_data.update({key: value})
+
+    return museum_data
+
+
+def find_infobox_table(html: str) -> lxml.html.HtmlElement:
+    '''
+    Find the infobox table in the html of a page, parsing as little of the page as possible.
+
+    :param html: html of the Wikipedia page
+    :return: the infobox table element, None if the page has no infobox
+    '''
+
+    if INFOBOX_CLASS not in html:
+        return None
+
+    infobox_html = cut_infobox_html(html)
+    if infobox_html is not None:
+        tables = lxml.html.fragments_fromstring(infobox_html)
+        if tables and tables[0].tag == 'table':
+            return tables[0]
+
+    # The infobox could not be cut out, fall back to parsing the whole page
+    tables = lxml.html.document_fromstring(html).xpath(f'//table[@class="{INFOBOX_CLASS}"]')
+    return tables[0] if tables else None
+
+
+def cut_infobox_html(html: str) -> str:
+    '''
+    Cut the html of the infobox table, including nested tables, out of the html of a page.
+
+    :param html: html of the Wikipedia page
+    :return: html of the infobox table, None if it cannot be found or is not closed
+    '''
+
+    start = INFOBOX_START_PATTERN.search(html)
+    if start is None:
+        return None
+
+    depth = 0
+    for tag in TABLE_TAG_PATTERN.finditer(html, start.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[start.start():tag.end()]
+    return None
+
+
+def element_text(element: lxml.html.HtmlElement) -> str:
+    return ''.join(collapse_whitespace(text) for text in element.xpath(TEXT_XPATH))
+
+
+def collapse_whitespace(text: str) -> str:
+    # BeautifulSoup collapses whitespace-only strings to a single newline or space, do the same here
+    if text.strip() or not text:
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+def parse_infobox_with_soup(html: str) -> dict:
+    '''
+    Parse museum characters from the infobox of a museum wikipedia page with BeautifulSoup.
+    This parses the whole page and is much slower than parse_infobox, it is kept as the reference
+    implementation for tests and benchmarks.
+
+    :param html: html of the museum Wikipedia page
+    :return: museum_data: a dictionary of museum characters
+    '''
+
+    soup = bs4.BeautifulSoup(html, 'lxml')
+
+    # info_table is the table on the right side of the page which contains museum character info
+    info_table = soup.find("table", {"class": "infobox vcard"})
+    if info_table is None:
+        return {}
+
+    museum_data = {}
+
+    # Iterating across the rows in the info_table
+    for info_field in info_table.findAll('tr'):
+        # If there is no 'th', means there is no data in this row
+        if len(info_field.findAll('th')) == 0:
+            continue
+
+        key = info_field.find('th').text
+
+        # For Coordinates, extract values in geo tag
+        if key == 'Coordinates':
+            geo = info_field.find('span', {'class': 'geo'}).text.split('; ')
+            lat = geo[0]
+            lon = geo[1]
+            museum_data.update({'latitude': lat})
+            museum_data.update({'longitude': lon})
+            continue
+
+        if info_field.find('td') is None:
+            continue
+
+        # Convert special characters
+        value = info_field.find('td').text.encode('ascii', 'ignore').decode()
+        museum_data.update({key: value})
+
+    return museum_data
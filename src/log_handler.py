@@ -1,18 +1,222 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import queue
+import sys
+import threading
+import time
 
+LOG_FORMAT = '%(asctime)s\t%(levelname)s -- %(processName)s %(filename)s:%(lineno)s -- %(message)s'
+DEFAULT_LOG_LEVEL = logging.INFO
 
-def get_logger() -> logging:
+# A call site may log this many records below WARNING per interval, the others are dropped and counted.
+# Warnings and errors are never dropped.
+DEFAULT_RATE_LIMIT = 20
+DEFAULT_RATE_INTERVAL = 1.0
+
+# Attributes every LogRecord has, the other attributes come from extra={...} and are added to the JSON output
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'suppressed'}
+
+config_lock = threading.RLock()
+configured = False
+listener = None
+process_queue = None
+process_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Format a record as one JSON object per line, with the fields of extra={...} as additional keys.
+    '''
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'thread': record.threadName,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f'{text} ({suppressed} similar messages suppressed)' if suppressed else text
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Let through at most limit records below WARNING per call site and interval.
+    The number of dropped records is attached to the next record of the call site as record.suppressed.
+    '''
+
+    def __init__(self, limit: int = DEFAULT_RATE_LIMIT, interval: float = DEFAULT_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.call_sites = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window_start, count, suppressed = self.call_sites.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.limit:
+                self.call_sites[key] = (window_start, count, suppressed + 1)
+                return False
+            self.call_sites[key] = (window_start, count + 1, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    '''
+    Put records on a queue of the same process without formatting them. The listener thread formats
+    them, so a log call only costs creating the record.
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class ForwardHandler(logging.Handler):
+    '''
+    Hand the records of worker processes to the root logger of this process, so they are
+    filtered and written like the records of this process.
+    '''
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+def configure_logging(level: int = DEFAULT_LOG_LEVEL, json_output: bool = False, rate_limit: int = DEFAULT_RATE_LIMIT,
+                      rate_interval: float = DEFAULT_RATE_INTERVAL, stream=None) -> logging.Logger:
+    '''
+    Configure the root logger to put records on a queue, from which a single listener thread writes them.
+    Configuring again replaces the previous configuration.
+
+    :param level: level of the root logger
+    :param json_output: write every record as a JSON object instead of a text line
+    :param rate_limit: records below WARNING a call site may log per rate_interval, 0 logs all of them
+    :param rate_interval: seconds of the rate limit window
+    :param stream: stream the records are written to, defaults to sys.stderr
+    :return: the root logger
+    '''
+
+    global configured, listener
     log = logging.getLogger()
+    with config_lock:
+        stop_listener()
+        configured = True
 
-    console = logging.StreamHandler()
+        console = logging.StreamHandler(stream if stream is not None else sys.stderr)
+        console.setFormatter(JsonFormatter() if json_output else TextFormatter(LOG_FORMAT))
 
-    format_str = '%(asctime)s\t%(levelname)s -- %(processName)s %(filename)s:%(lineno)s -- %(message)s'
-    console.setFormatter(logging.Formatter(format_str))
+        records = queue.SimpleQueue()
+        queue_handler = LazyQueueHandler(records)
+        queue_handler.addFilter(RateLimitFilter(rate_limit, rate_interval))
 
-    if log.hasHandlers():
         log.handlers.clear()
+        log.addHandler(queue_handler)
+        log.setLevel(level)
 
-    log.addHandler(console)
-    log.setLevel(logging.INFO)
-
+        listener = logging.handlers.QueueListener(records, console)
+        listener.start()
     return log
+
+
+def get_logger() -> logging.Logger:
+    '''
+    :return: the root logger, configured with the defaults of configure_logging the first time in a process
+    '''
+
+    with config_lock:
+        if not configured:
+            configure_logging()
+    return logging.getLogger()
+
+
+def stop_listener() -> None:
+    '''
+    Write the queued records and stop the listener thread.
+    '''
+
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def shutdown_logging() -> None:
+    global process_queue, process_listener
+    if process_listener is not None:
+        process_listener.stop()
+        process_listener = None
+        process_queue = None
+    with config_lock:
+        stop_listener()
+
+
+atexit.register(shutdown_logging)
+
+
+def worker_logging_args() -> tuple:
+    '''
+    Arguments of configure_worker_logging for the initializer of a process pool. The first call
+    creates the queue of the worker processes, and a listener thread which forwards their records.
+
+    :return: the queue of the worker processes and the level of the root logger
+    '''
+
+    global process_queue, process_listener
+    with config_lock:
+        if process_queue is None:
+            process_queue = multiprocessing.get_context('spawn').Queue()
+            process_listener = logging.handlers.QueueListener(process_queue, ForwardHandler())
+            process_listener.start()
+    return process_queue, logging.getLogger().level
+
+
+def configure_worker_logging(log_queue, level: int = DEFAULT_LOG_LEVEL) -> None:
+    '''
+    Initializer of a worker process, which sends its records to the process which created log_queue.
+
+    :param log_queue: the queue returned by worker_logging_args
+    :param level: level of the root logger
+    :return: None
+    '''
+
+    global configured
+    log = logging.getLogger()
+    with config_lock:
+        stop_listener()
+        configured = True
+        log.handlers.clear()
+        # The records are pickled, so the standard QueueHandler formats the message in the worker
+        log.addHandler(logging.handlers.QueueHandler(log_queue))
+        log.setLevel(level)
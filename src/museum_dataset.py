@@ -0,0 +1,195 @@
+import datetime
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+import shutil
+
+from src.create_museum_db import CITY_TABLE_NAME, MUSEUM_TABLE_NAME
+from src.log_handler import get_logger
+from src.museum_schema import enforce_museum_schema
+from src.profiling import profile_stage
+from src.stage_defaults import DEFAULT_DATASET_DIR
+from typing import Iterator
+
+log = get_logger()
+
+# Every run is a snapshot directory run_date=YYYY-MM-DD of each dataset, split into country=... directories.
+# The snapshot is the outer directory, so a run replaces its snapshot by replacing one directory.
+PARTITIONING = ds.partitioning(pa.schema([('run_date', pa.date32()), ('country', pa.string())]), flavor='hive')
+COUNTRY_PARTITIONING = ds.partitioning(pa.schema([('country', pa.string())]), flavor='hive')
+RUN_DATE_DIRECTORY_PREFIX = 'run_date='
+
+# The museums of a file are sorted by visitors and written in row groups of this many rows, so the min and max
+# statistics of every row group let a filter on visitors skip the row groups it does not need
+DEFAULT_ROWS_PER_GROUP = 10000
+
+CITY_COLUMNS = ['city_id', 'city', 'country', 'population']
+
+# Files are opened memory-mapped, so reading a few columns only pages in those columns
+MMAP_FILESYSTEM = pyarrow.fs.LocalFileSystem(use_mmap=True)
+
+
+@profile_stage()
+def export_museum_dataset(museum_data_df: pd.DataFrame, dataset_dir: str = DEFAULT_DATASET_DIR,
+                          run_date: str = None, rows_per_group: int = DEFAULT_ROWS_PER_GROUP) -> pd.DataFrame:
+    '''
+    Export the museums and their cities as Parquet datasets, partitioned by run date and by country.
+
+    The museum dataset keeps the city, country and population of every museum, so the analysis reads the
+    columns it needs from one dataset. Exporting again on the same run date replaces that snapshot.
+
+    :param museum_data_df: the museum table joined with its city, like read_museum_data_from_db returns
+    :param dataset_dir: directory of the datasets, one sub-directory per dataset
+    :param run_date: date of the snapshot, like '2024-05-31', defaults to today
+    :param rows_per_group: maximum number of rows of a Parquet row group
+    :return: a dataframe of the written files, with their dataset, path and number of rows
+    '''
+
+    run_date = datetime.date.fromisoformat(run_date) if run_date else datetime.date.today()
+    museum_df = museum_data_df.sort_values('visitors', na_position='last', kind='stable')
+    city_df = museum_data_df[CITY_COLUMNS].drop_duplicates('city_id')
+
+    written = []
+    for name, df in ((MUSEUM_TABLE_NAME, museum_df), (CITY_TABLE_NAME, city_df)):
+        written.extend(write_snapshot(name, df, dataset_dir, run_date, rows_per_group))
+    log.info(f'Exported {len(museum_df)} museums and {len(city_df)} cities of {run_date} to {dataset_dir}.')
+    return pd.DataFrame(written, columns=['dataset', 'path', 'rows'])
+
+
+def write_snapshot(name: str, df: pd.DataFrame, dataset_dir: str, run_date: datetime.date,
+                   rows_per_group: int) -> list:
+    '''
+    Write the snapshot of one dataset into a temporary directory, then replace the snapshot with it.
+
+    :param name: name of the dataset
+    :param df: the rows of the snapshot, with a country column
+    :param dataset_dir: directory of the datasets
+    :param run_date: date of the snapshot
+    :param rows_per_group: maximum number of rows of a Parquet row group
+    :return: a list of (dataset, path, rows) of the written files
+    '''
+
+    snapshot_dir = os.path.join(dataset_dir, name, f'{RUN_DATE_DIRECTORY_PREFIX}{run_date.isoformat()}')
+    # Directories starting with a dot are ignored by readers of the dataset until they are renamed
+    tmp_dir = os.path.join(dataset_dir, name, f'.{os.path.basename(snapshot_dir)}.{os.getpid()}.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    written = []
+    file_format = ds.ParquetFileFormat()
+    ds.write_dataset(to_arrow_table(df), tmp_dir, format=file_format, partitioning=COUNTRY_PARTITIONING,
+                     file_options=file_format.make_write_options(compression='zstd', write_statistics=True),
+                     max_rows_per_group=rows_per_group, min_rows_per_group=min(rows_per_group, len(df) or 1),
+                     basename_template='part-{i}.parquet', existing_data_behavior='overwrite_or_ignore',
+                     file_visitor=lambda file: written.append((name, file.path, file.metadata.num_rows)))
+
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.replace(tmp_dir, snapshot_dir)
+    return [(dataset, path.replace(tmp_dir, snapshot_dir, 1), rows) for dataset, path, rows in written]
+
+
+def to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    '''
+    :param df: a dataframe of a snapshot
+    :return: an Arrow table of it, columns of mixed Python objects are written as strings
+    '''
+
+    # Object columns of a sqlite TEXT column can mix strings and numbers, which Arrow cannot store in one column
+    mixed = {column: df[column].astype('string') for column in df.columns if df[column].dtype == object}
+    # The partition values are written as plain strings, not as the codes of a category
+    mixed['country'] = df['country'].astype('string')
+    return pa.Table.from_pandas(df.assign(**mixed), preserve_index=False)
+
+
+def open_dataset(name: str = MUSEUM_TABLE_NAME, dataset_dir: str = DEFAULT_DATASET_DIR) -> ds.Dataset:
+    '''
+    Open a dataset of all snapshots. Nothing is read until the dataset is scanned.
+
+    :param name: name of the dataset, museum or city
+    :param dataset_dir: directory of the datasets
+    :return: the dataset, with run_date and country columns from the partition directories
+    '''
+
+    return ds.dataset(os.path.abspath(os.path.join(dataset_dir, name)), format='parquet', partitioning=PARTITIONING,
+                      filesystem=MMAP_FILESYSTEM)
+
+
+def snapshot_filter(run_dates: list = None, countries: list = None, where: ds.Expression = None) -> ds.Expression:
+    '''
+    Build the filter of a scan. The run dates and countries select partition directories, so the other
+    directories are not opened at all, and where is pushed down to the row group statistics of the files.
+
+    :param run_dates: the run dates to read, like '2024-05-31', defaults to all snapshots
+    :param countries: the countries to read, defaults to all countries
+    :param where: a filter on the columns of the dataset, like ds.field('visitors') > 1000000
+    :return: the filter, None when there is nothing to filter
+    '''
+
+    expressions = []
+    if run_dates is not None:
+        expressions.append(ds.field('run_date').isin(pa.array([datetime.date.fromisoformat(str(run_date))
+                                                               for run_date in run_dates], pa.date32())))
+    if countries is not None:
+        expressions.append(ds.field('country').isin(list(countries)))
+    if where is not None:
+        expressions.append(where)
+
+    combined = None
+    for expression in expressions:
+        combined = expression if combined is None else combined & expression
+    return combined
+
+
+def read_dataset(name: str = MUSEUM_TABLE_NAME, dataset_dir: str = DEFAULT_DATASET_DIR, columns: list = None,
+                 run_dates: list = None, countries: list = None, where: ds.Expression = None) -> pd.DataFrame:
+    '''
+    Read only the needed columns and rows of a dataset, like the population and visitors of the latest snapshot.
+
+    :param name: name of the dataset, museum or city
+    :param dataset_dir: directory of the datasets
+    :param columns: the columns to read, defaults to all columns
+    :param run_dates: the run dates to read, defaults to all snapshots
+    :param countries: the countries to read, defaults to all countries
+    :param where: a filter on the columns of the dataset
+    :return: a dataframe of the rows, with the compact dtypes of MUSEUM_SCHEMA
+    '''
+
+    table = open_dataset(name, dataset_dir).to_table(columns=columns,
+                                                     filter=snapshot_filter(run_dates, countries, where))
+    return enforce_museum_schema(table.to_pandas())
+
+
+def scan_batches(name: str = MUSEUM_TABLE_NAME, dataset_dir: str = DEFAULT_DATASET_DIR, columns: list = None,
+                 run_dates: list = None, countries: list = None,
+                 where: ds.Expression = None) -> Iterator[pa.RecordBatch]:
+    '''
+    Scan the needed columns and rows of a dataset batch by batch, so memory use does not grow with the snapshots.
+
+    :param name: name of the dataset, museum or city
+    :param dataset_dir: directory of the datasets
+    :param columns: the columns to read, defaults to all columns
+    :param run_dates: the run dates to read, defaults to all snapshots
+    :param countries: the countries to read, defaults to all countries
+    :param where: a filter on the columns of the dataset
+    :return: an iterator of record batches
+    '''
+
+    return open_dataset(name, dataset_dir).to_batches(columns=columns,
+                                                      filter=snapshot_filter(run_dates, countries, where))
+
+
+def list_run_dates(name: str = MUSEUM_TABLE_NAME, dataset_dir: str = DEFAULT_DATASET_DIR) -> list:
+    '''
+    List the snapshots of a dataset from its directory names, without reading any file.
+
+    :param name: name of the dataset, museum or city
+    :param dataset_dir: directory of the datasets
+    :return: the run dates, like '2024-05-31', oldest first
+    '''
+
+    dataset_path = os.path.join(dataset_dir, name)
+    if not os.path.isdir(dataset_path):
+        return []
+    return sorted(entry[len(RUN_DATE_DIRECTORY_PREFIX):] for entry in os.listdir(dataset_path)
+                  if entry.startswith(RUN_DATE_DIRECTORY_PREFIX))
@@ -0,0 +1,325 @@
+import itertools
+import multiprocessing
+import os
+import pandas as pd
+import queue
+import threading
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.add_city_population import add_city_population_to_museum
+from src.clean_museum_data import clean_museum_character_data, reduce_columns_with_most_nan
+from src.fetch_museum_data import (DEFAULT_FETCH_RETRIES, DEFAULT_FETCH_TIMEOUT, DEFAULT_RETRY_BACKOFF, fetch_page,
+                                   fetch_museum_list_dataframe, fetch_with_retry)
+from src.infobox_parser import parse_infobox
+from src.log_handler import configure_worker_logging, get_logger, worker_logging_args
+from src.museum_schema import enforce_museum_schema
+from src.page_source import PageSource, RESOLVE_BATCH_SIZE, WikitextPage, WikitextPageSource
+from src.stage_defaults import DEFAULT_BUFFER_SIZE, DEFAULT_CHUNK_SIZE
+from src.wikitext_infobox import parse_infobox_wikitext
+from typing import Iterator
+
+log = get_logger()
+DEFAULT_DOWNLOAD_WORKERS = 8
+
+# Marks the end of a stage's output in its queue
+END_OF_STREAM = object()
+
+
+def stream_museum_data(page_source: PageSource, download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+                       parse_workers: int = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE, timeout: float = DEFAULT_FETCH_TIMEOUT,
+                       retries: int = DEFAULT_FETCH_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF,
+                       museums_df: pd.DataFrame = None) -> pd.DataFrame:
+    '''
+    Fetch, parse, clean and enrich all museums as a streaming pipeline.
+
+    Download threads feed a bounded queue of pages, a process pool parses the infoboxes, and the
+    parsed museums are cleaned in chunks. Every stage blocks when the next one is behind, so only
+    about buffer_size raw pages are held in memory, however many museums there are.
+
+    :param page_source: where to fetch the Wikipedia pages from
+    :param download_workers: number of threads downloading museum pages
+    :param parse_workers: number of processes parsing museum pages, defaults to the number of cores,
+        0 parses in the current process
+    :param buffer_size: maximum number of items waiting between two stages
+    :param chunk_size: number of museums cleaned together
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :param museums_df: the museums to fetch, with a name, city, visitors and wiki_link column, like the
+        museums found by the crawler, defaults to the museums of the most visited museums list
+    :return: museum_all_data_df: a dataframe which contains all main character data of the museums
+    '''
+
+    if museums_df is None:
+        museums_df = fetch_museum_list_dataframe(page_source)
+
+    chunks = list(stream_cleaned_museum_chunks(museums_df, page_source, download_workers=download_workers,
+                                               parse_workers=parse_workers, buffer_size=buffer_size,
+                                               chunk_size=chunk_size, timeout=timeout, retries=retries,
+                                               backoff=backoff))
+    museum_all_data_df = pd.concat(chunks).sort_index() if chunks else museums_df
+
+    # Dropping mostly NaN columns needs all museums, so it is done once after the chunks are cleaned
+    log.info('Reducing columns which has more than 90% NaN values...')
+    museum_all_data_df = reduce_columns_with_most_nan(museum_all_data_df)
+    return add_city_population_to_museum(museum_all_data_df)
+
+
+def stream_cleaned_museum_chunks(museums_df: pd.DataFrame, page_source: PageSource,
+                                 download_workers: int = DEFAULT_DOWNLOAD_WORKERS, parse_workers: int = None,
+                                 buffer_size: int = DEFAULT_BUFFER_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                 timeout: float = DEFAULT_FETCH_TIMEOUT, retries: int = DEFAULT_FETCH_RETRIES,
+                                 backoff: float = DEFAULT_RETRY_BACKOFF) -> Iterator[pd.DataFrame]:
+    '''
+    Yield cleaned chunks of museums, each chunk keeps the index of its rows in museums_df.
+
+    :param museums_df: a dataframe which contains basic museum info from the list page
+    :param page_source: where to fetch the Wikipedia pages from
+    :param download_workers: number of threads downloading museum pages
+    :param parse_workers: number of processes parsing museum pages, 0 parses in the current process
+    :param buffer_size: maximum number of items waiting between two stages
+    :param chunk_size: number of museums cleaned together
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :return: an iterator of cleaned museum dataframes
+    '''
+
+    parse_workers = os.cpu_count() if parse_workers is None else parse_workers
+    links = list(museums_df['wiki_link'].items())
+    page_queue = queue.Queue(maxsize=buffer_size)
+    detail_queue = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    downloader = threading.Thread(target=download_pages, daemon=True,
+                                  args=(links, page_source, page_queue, download_workers, stop,
+                                        timeout, retries, backoff))
+    parser = threading.Thread(target=parse_pages, daemon=True,
+                              args=(len(links), page_queue, detail_queue, parse_workers, stop))
+    downloader.start()
+    parser.start()
+
+    # Details arrive in the order their downloads finish. They are cleaned in chunks of consecutive museums,
+    # so the chunks, and the order of the columns found in them, are the same in every run. The parsed
+    # details waiting for an earlier museum are small dictionaries, not pages.
+    positions = {index: position for position, (index, _) in enumerate(links)}
+    pending = {}
+    details = []
+    next_position = 0
+    try:
+        while True:
+            item = detail_queue.get()
+            if item is END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+            pending[positions[item[0]]] = item[1]
+            while next_position in pending:
+                details.append(pending.pop(next_position))
+                next_position += 1
+                if len(details) == chunk_size:
+                    yield clean_museum_chunk(museums_df.iloc[next_position - chunk_size:next_position], details)
+                    details = []
+        if details:
+            yield clean_museum_chunk(museums_df.iloc[next_position - len(details):next_position], details)
+    finally:
+        stop.set()
+        drain(page_queue)
+        drain(detail_queue)
+
+
+def download_pages(links: list, page_source: PageSource, page_queue: queue.Queue, download_workers: int,
+                   stop: threading.Event, timeout: float, retries: int, backoff: float) -> None:
+    '''
+    Download stage: put (index, page) for every link on page_queue, page is None when there is no page.
+    A WikitextPageSource fetches the pages of up to RESOLVE_BATCH_SIZE links in one request.
+
+    :param links: a list of (index, wiki_link)
+    :param page_source: where to fetch the Wikipedia pages from
+    :param page_queue: the bounded queue feeding the parse stage
+    :param download_workers: number of threads downloading museum pages
+    :param stop: set when the consumer stopped, so the threads finish early
+    :param timeout: seconds to wait for each page request
+    :param retries: number of retries for a failed page request
+    :param backoff: seconds to wait before the first retry, doubled for every next retry
+    :return: None
+    '''
+
+    link_iterator = iter(links)
+    lock = threading.Lock()
+    # A wikitext page source fetches a batch of pages per request, other page sources one page
+    batch_size = RESOLVE_BATCH_SIZE if isinstance(page_source, WikitextPageSource) else 1
+
+    def work():
+        while not stop.is_set():
+            with lock:
+                batch = list(itertools.islice(link_iterator, batch_size))
+            if not batch:
+                return
+
+            page_names = list(dict.fromkeys(name for _, name in batch if name is not None))
+            pages = {}
+            if batch_size > 1 and page_names:
+                try:
+                    pages = fetch_with_retry(page_source.fetch_wikitext_pages, page_names, timeout=timeout,
+                                             retries=retries, backoff=backoff)
+                except Exception as e:
+                    log.error(f'Error while fetching {len(page_names)} Wikipedia pages: {e}')
+            elif page_names:
+                try:
+                    pages[page_names[0]] = fetch_page(page_names[0], page_source, timeout=timeout,
+                                                      retries=retries, backoff=backoff)
+                except Exception as e:
+                    log.error(f'Error while opening Wikipedia page {page_names[0]}: {e}')
+
+            for index, museum_wiki_page_name in batch:
+                put(page_queue, (index, pages.get(museum_wiki_page_name)), stop)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(max(download_workers, 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def parse_pages(total: int, page_queue: queue.Queue, detail_queue: queue.Queue, parse_workers: int,
+                stop: threading.Event) -> None:
+    '''
+    Parse stage: parse the infobox of every page from page_queue and put (index, museum_data) on detail_queue.
+    At most twice parse_workers pages are being parsed at the same time.
+
+    :param total: number of pages the download stage produces
+    :param page_queue: the bounded queue fed by the download stage
+    :param detail_queue: the bounded queue feeding the cleaning stage
+    :param parse_workers: number of processes parsing museum pages, 0 parses in the current process
+    :param stop: set when the consumer stopped
+    :return: None
+    '''
+
+    executor = None
+    if parse_workers > 0:
+        executor = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=configure_worker_logging, initargs=worker_logging_args())
+
+    pending = deque()
+    try:
+        for _ in range(total):
+            item = get(page_queue, stop)
+            if item is END_OF_STREAM:
+                return
+            index, page = item
+
+            if page is None:
+                pending.append((index, None, None))
+            elif executor is None:
+                pending.append((index, page.revision_id, parse_page(page)))
+            else:
+                pending.append((index, page.revision_id, executor.submit(parse_page, page)))
+
+            if len(pending) >= 2 * max(parse_workers, 1):
+                put(detail_queue, collect_detail(*pending.popleft()), stop)
+
+        while pending:
+            put(detail_queue, collect_detail(*pending.popleft()), stop)
+        put(detail_queue, END_OF_STREAM, stop)
+    except Exception as e:
+        put(detail_queue, e, stop)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_page(page) -> dict:
+    '''
+    Parse a fetched museum page, a WikitextPage from its wikitext and a Page from its html.
+
+    :param page: the fetched page
+    :return: museum_data: a dictionary of museum characters
+    '''
+
+    if isinstance(page, WikitextPage):
+        return parse_wikitext_detail(page.wikitext, page.coordinates)
+    return parse_detail(page.html)
+
+
+def parse_wikitext_detail(wikitext: str, coordinates: tuple = None) -> dict:
+    '''
+    Parse the wikitext of a museum page, returning an empty dict when the page cannot be parsed.
+
+    :param wikitext: wikitext of the museum Wikipedia page
+    :param coordinates: (latitude, longitude) of the page, None when it has none
+    :return: museum_data: a dictionary of museum characters
+    '''
+
+    try:
+        return parse_infobox_wikitext(wikitext, coordinates)
+    except Exception as e:
+        log.error(f'Error while parsing museum page wikitext: {e}')
+        return {}
+
+
+def parse_detail(html: str) -> dict:
+    '''
+    Parse a museum page, returning an empty dict when the page cannot be parsed.
+
+    :param html: html of the museum Wikipedia page
+    :return: museum_data: a dictionary of museum characters
+    '''
+
+    try:
+        return parse_infobox(html)
+    except Exception as e:
+        log.error(f'Error while parsing museum page: {e}')
+        return {}
+
+
+def collect_detail(index: int, revision_id: int, museum_data) -> tuple:
+    # museum_data is a Future when the page was parsed in the process pool
+    if museum_data is None:
+        return index, {}
+    if not isinstance(museum_data, dict):
+        museum_data = museum_data.result()
+    return index, dict(museum_data, revision_id=revision_id)
+
+
+def clean_museum_chunk(museums_df: pd.DataFrame, details: list) -> pd.DataFrame:
+    '''
+    Clean stage: join a chunk of list page rows with their details and clean them.
+
+    :param museums_df: the list page rows of the chunk
+    :param details: the museum character dictionaries, in the same order as museums_df
+    :return: the cleaned chunk with the compact dtypes of MUSEUM_SCHEMA, with the index of museums_df
+    '''
+
+    museum_details_df = pd.DataFrame(details, index=museums_df.index)
+    chunk_df = pd.concat([museums_df, museum_details_df], axis=1)
+    return enforce_museum_schema(clean_museum_character_data(chunk_df, reduce_columns=False))
+
+
+def put(target: queue.Queue, item, stop: threading.Event) -> None:
+    # Block while the next stage is behind, but give up when the pipeline is stopped
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def get(source: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return END_OF_STREAM
+
+
+def drain(target: queue.Queue) -> None:
+    while True:
+        try:
+            target.get_nowait()
+        except queue.Empty:
+            return
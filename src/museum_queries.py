@@ -0,0 +1,230 @@
+import numpy as np
+import threading
+
+from collections import namedtuple, OrderedDict
+from src.clean_museum_data import MUSEUM_TYPE_KEYWORDS
+from src.connection_pool import ConnectionPool
+from src.create_museum_db import read_database_generation
+from src.geo import MAX_DISTANCE_KM, bounding_boxes, haversine_km, longitude_boxes
+from src.log_handler import get_logger
+from typing import List
+
+log = get_logger()
+DEFAULT_RESULT_CACHE_SIZE = 256
+
+# The nearest museums are searched within this radius first, which doubles until there are enough museums
+DEFAULT_NEAREST_START_RADIUS_KM = 10.0
+
+Museum = namedtuple('Museum', ['id', 'name', 'visitors', 'city', 'country'])
+CountryStats = namedtuple('CountryStats', ['country', 'museums', 'total_visitors', 'mean_visitors', 'cities'])
+LocatedMuseum = namedtuple('LocatedMuseum', Museum._fields + ('latitude', 'longitude'))
+NearbyMuseum = namedtuple('NearbyMuseum', LocatedMuseum._fields + ('distance_km',))
+
+# The queries are constant strings with ? placeholders, so every connection prepares each of them once and
+# reuses the prepared statement from its statement cache. Each query is covered by an index of create_db.
+MUSEUM_SELECT_SQL = '''SELECT museum.id, museum.name, museum.visitors, city.city, city.country
+  FROM museum LEFT JOIN city ON museum.city_id = city.city_id'''
+
+TOP_MUSEUMS_BY_VISITORS_SQL = f'{MUSEUM_SELECT_SQL} ORDER BY museum.visitors DESC, museum.id LIMIT ?;'
+
+MUSEUMS_IN_CITY_SQL = f'''{MUSEUM_SELECT_SQL}
+  WHERE museum.city_id IN (SELECT city_id FROM city WHERE city = ?) ORDER BY museum.visitors DESC, museum.id;'''
+
+MUSEUMS_IN_COUNTRY_SQL = f'''{MUSEUM_SELECT_SQL}
+  WHERE museum.city_id IN (SELECT city_id FROM city WHERE country = ?) ORDER BY museum.visitors DESC, museum.id;'''
+
+MUSEUMS_OF_TYPE_SQL = {flag: f'{MUSEUM_SELECT_SQL} WHERE museum.{flag} = 1 ORDER BY museum.visitors DESC, museum.id;'
+                       for flag in MUSEUM_TYPE_KEYWORDS}
+
+# The R*Tree finds the museums of a box, the museum table is only read for those museums
+MUSEUMS_IN_BOX_SQL = '''SELECT museum.id, museum.name, museum.visitors, city.city, city.country,
+  museum.latitude, museum.longitude FROM museum_location JOIN museum ON museum.id = museum_location.id
+  LEFT JOIN city ON museum.city_id = city.city_id
+  WHERE museum_location.max_latitude >= ? AND museum_location.min_latitude <= ?
+  AND museum_location.max_longitude >= ? AND museum_location.min_longitude <= ?;'''
+
+COUNTRY_STATS_SQL = '''SELECT city.country, COUNT(*), SUM(museum.visitors), AVG(museum.visitors),
+  COUNT(DISTINCT city.city_id) FROM museum JOIN city ON museum.city_id = city.city_id
+  GROUP BY city.country ORDER BY SUM(museum.visitors) DESC;'''
+
+
+class MuseumQueries:
+    '''
+    Typed queries over the museum database, read through the read-only connections of a ConnectionPool.
+
+    Results are kept in an LRU cache. The cache is emptied when the database generation changes,
+    which happens every time create_db or an incremental refresh changes the database, in this process
+    or in another one. The generation is stored in the database and read with every query, so repeated
+    queries are answered from memory until the data changes.
+    '''
+
+    def __init__(self, pool: ConnectionPool, cache_size: int = DEFAULT_RESULT_CACHE_SIZE) -> None:
+        '''
+        :param pool: the connection pool of the museum database
+        :param cache_size: maximum number of cached query results, 0 disables the cache
+        :return: None
+        '''
+
+        self.pool = pool
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_generation = None
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def top_museums_by_visitors(self, limit: int = 10) -> List[Museum]:
+        '''
+        :param limit: number of museums
+        :return: the museums with the most visitors, most visited first
+        '''
+
+        return self._query_museums(TOP_MUSEUMS_BY_VISITORS_SQL, (limit,))
+
+    def museums_in_city(self, city: str) -> List[Museum]:
+        '''
+        :param city: city name, as in the city table
+        :return: the museums of the city, most visited first
+        '''
+
+        return self._query_museums(MUSEUMS_IN_CITY_SQL, (city,))
+
+    def museums_in_country(self, country: str) -> List[Museum]:
+        '''
+        :param country: country name, as in the city table
+        :return: the museums of the country, most visited first
+        '''
+
+        return self._query_museums(MUSEUMS_IN_COUNTRY_SQL, (country,))
+
+    def museums_of_type(self, type_flag: str) -> List[Museum]:
+        '''
+        :param type_flag: a type flag column, like 'is_art_museum'
+        :return: the museums of the type, most visited first
+        '''
+
+        if type_flag not in MUSEUMS_OF_TYPE_SQL:
+            raise ValueError(f'Unknown museum type flag {type_flag}, expected one of {list(MUSEUM_TYPE_KEYWORDS)}.')
+        return self._query_museums(MUSEUMS_OF_TYPE_SQL[type_flag], ())
+
+    def country_stats(self) -> List[CountryStats]:
+        '''
+        :return: number of museums, total and mean visitors and number of cities per country,
+            the country with the most visitors first
+        '''
+
+        return self._query(COUNTRY_STATS_SQL, (), CountryStats)
+
+    def museums_in_box(self, min_latitude: float, min_longitude: float, max_latitude: float,
+                       max_longitude: float) -> List[LocatedMuseum]:
+        '''
+        :param min_latitude: southern edge of the box in degrees
+        :param min_longitude: western edge of the box in degrees, larger than max_longitude for a box
+            across the antimeridian
+        :param max_latitude: northern edge of the box in degrees
+        :param max_longitude: eastern edge of the box in degrees
+        :return: the museums in the box, by id
+        '''
+
+        museums = self._query_boxes(longitude_boxes(min_latitude, max_latitude, min_longitude, max_longitude))
+        if not museums:
+            return []
+
+        latitudes, longitudes = coordinates_of(museums)
+        inside = (latitudes >= min_latitude) & (latitudes <= max_latitude)
+        if min_longitude <= max_longitude:
+            inside &= (longitudes >= min_longitude) & (longitudes <= max_longitude)
+        else:
+            inside &= (longitudes >= min_longitude) | (longitudes <= max_longitude)
+        return [museum for museum, is_inside in zip(museums, inside) if is_inside]
+
+    def museums_within_radius(self, latitude: float, longitude: float, radius_km: float) -> List[NearbyMuseum]:
+        '''
+        :param latitude: latitude of the center in degrees
+        :param longitude: longitude of the center in degrees
+        :param radius_km: radius in km
+        :return: the museums within the radius of the center, nearest first
+        '''
+
+        museums = self._query_boxes(bounding_boxes(latitude, longitude, radius_km))
+        if not museums:
+            return []
+
+        distances = haversine_km(latitude, longitude, *coordinates_of(museums))
+        order = np.lexsort((np.array([museum.id for museum in museums]), distances))
+        return [NearbyMuseum(*museums[i], float(distances[i])) for i in order if distances[i] <= radius_km]
+
+    def nearest_museums(self, latitude: float, longitude: float, count: int = 10,
+                        start_radius_km: float = DEFAULT_NEAREST_START_RADIUS_KM) -> List[NearbyMuseum]:
+        '''
+        Find the nearest museums with radius searches of a doubling radius. Once a radius has enough museums,
+        the nearest museums are all within it.
+
+        :param latitude: latitude of the point in degrees
+        :param longitude: longitude of the point in degrees
+        :param count: number of museums
+        :param start_radius_km: radius of the first search in km
+        :return: the count nearest museums, nearest first, fewer when the database has fewer museums
+        '''
+
+        radius_km = min(start_radius_km, MAX_DISTANCE_KM)
+        while True:
+            museums = self.museums_within_radius(latitude, longitude, radius_km)
+            if len(museums) >= count or radius_km >= MAX_DISTANCE_KM:
+                return museums[:count]
+            radius_km = min(radius_km * 2, MAX_DISTANCE_KM)
+
+    def cache_info(self) -> dict:
+        '''
+        :return: the cache hits, misses and invalidations, and the number of cached results
+        '''
+
+        with self.lock:
+            return dict(self.stats, size=len(self.cache), generation=self.cache_generation)
+
+    def _query_museums(self, query: str, params: tuple) -> List[Museum]:
+        return self._query(query, params, Museum)
+
+    def _query_boxes(self, boxes: list) -> List[LocatedMuseum]:
+        museums = {}
+        for box in boxes:
+            museums.update((museum.id, museum) for museum in self._query(MUSEUMS_IN_BOX_SQL, box, LocatedMuseum))
+        return sorted(museums.values())
+
+    def _query(self, query: str, params: tuple, row_type: type) -> List[tuple]:
+        key = (query, params)
+        with self.pool.reader() as conn:
+            # The generation is read before the query, so a result is never older than its generation
+            generation = read_database_generation(conn)
+            with self.lock:
+                if generation != self.cache_generation:
+                    if self.cache_generation is not None:
+                        self.stats['invalidations'] += 1
+                    self.cache.clear()
+                    self.cache_generation = generation
+                result = self.cache.get(key)
+                if result is not None:
+                    self.cache.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return list(result)
+                self.stats['misses'] += 1
+
+            result = tuple(row_type._make(row) for row in conn.execute(query, params))
+
+        with self.lock:
+            # Do not cache a result when another query has already seen a newer generation
+            if self.cache_size > 0 and generation == self.cache_generation:
+                self.cache[key] = result
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return list(result)
+
+
+def coordinates_of(museums: List[LocatedMuseum]) -> tuple:
+    '''
+    :param museums: museums with coordinates
+    :return: arrays of their latitudes and longitudes
+    '''
+
+    return (np.array([museum.latitude for museum in museums], dtype=np.float64),
+            np.array([museum.longitude for museum in museums], dtype=np.float64))
@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from src.clean_museum_data import MUSEUM_TYPE_KEYWORDS
+from src.log_handler import get_logger
+
+log = get_logger()
+
+# Column kinds of the schema:
+#   category: repeated strings, stored once per distinct value with small integer codes
+#   float32: coordinates, float32 keeps them to about a metre
+#   integer: the smallest nullable integer type which holds the values, like Int16 for years
+#   flag: 0/1 int8, missing values are 0
+CATEGORY = 'category'
+FLOAT32 = 'float32'
+INTEGER = 'integer'
+FLAG = 'flag'
+
+# The pipeline names the established year Established_year, the museum table established_year.
+# Columns which are not in the schema, like name, wiki_link and the free text infobox fields, are kept as they are.
+MUSEUM_SCHEMA = {
+    'city': CATEGORY,
+    'country': CATEGORY,
+    'latitude': FLOAT32,
+    'longitude': FLOAT32,
+    'visitors': INTEGER,
+    'Established_year': INTEGER,
+    'established_year': INTEGER,
+    'revision_id': INTEGER,
+    'id': INTEGER,
+    'city_id': INTEGER,
+    **{flag: FLAG for flag in MUSEUM_TYPE_KEYWORDS},
+}
+
+NULLABLE_INTEGER_DTYPES = [pd.Int8Dtype(), pd.Int16Dtype(), pd.Int32Dtype(), pd.Int64Dtype()]
+
+
+def enforce_museum_schema(museum_all_data_df: pd.DataFrame, boundary: str = None) -> pd.DataFrame:
+    '''
+    Coerce the columns of a museum dataframe to the compact dtypes of MUSEUM_SCHEMA.
+
+    Values which cannot be parsed, like a latitude which is not a number, become missing values.
+    Coercing a dataframe which already has the schema returns the same values and dtypes.
+
+    :param museum_all_data_df: a dataframe which contains all main character data of the museums
+    :param boundary: name of the stage boundary, like 'enrich', the memory of every column before and
+        after is logged when it is given
+    :return: a new dataframe with the schema's dtypes
+    '''
+
+    coerced = {column: coerce_column(museum_all_data_df[column], MUSEUM_SCHEMA[column])
+               for column in museum_all_data_df.columns if column in MUSEUM_SCHEMA}
+    schema_df = museum_all_data_df.assign(**coerced) if coerced else museum_all_data_df.copy()
+
+    if boundary is not None:
+        log_memory_report(memory_report(museum_all_data_df, schema_df), boundary)
+    return schema_df
+
+
+def coerce_column(column: pd.Series, kind: str) -> pd.Series:
+    '''
+    :param column: a column of a museum dataframe
+    :param kind: the column kind of the schema
+    :return: the column with the compact dtype of the kind
+    '''
+
+    if kind == CATEGORY:
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            return column
+        return column.astype(CATEGORY)
+
+    if kind == FLOAT32:
+        return pd.to_numeric(column, errors='coerce').astype(np.float32)
+
+    if kind == FLAG:
+        return pd.to_numeric(column, errors='coerce').fillna(0).astype(np.int8)
+
+    numbers = pd.to_numeric(column, errors='coerce')
+    return numbers.astype(smallest_integer_dtype(numbers))
+
+
+def smallest_integer_dtype(numbers: pd.Series):
+    '''
+    :param numbers: a numeric series
+    :return: the smallest nullable integer dtype which holds the values, float64 when some values are not integers
+    '''
+
+    values = numbers.dropna().to_numpy(dtype=np.float64)
+    if len(values) == 0:
+        return NULLABLE_INTEGER_DTYPES[0]
+    if not np.all(np.isfinite(values)) or not np.all(values == np.round(values)):
+        return np.float64
+    low, high = values.min(), values.max()
+    for dtype in NULLABLE_INTEGER_DTYPES:
+        info = np.iinfo(dtype.numpy_dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.float64
+
+
+def memory_report(before_df: pd.DataFrame, after_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Compare the memory used by every column of a dataframe before and after coercing it,
+    including the memory of the Python objects in object columns.
+
+    :param before_df: the dataframe before coercing
+    :param after_df: the dataframe after coercing, with the same columns
+    :return: a dataframe of the dtypes and bytes before and after of every column, and a 'total' row
+    '''
+
+    report_df = pd.DataFrame({
+        'dtype_before': before_df.dtypes.astype(str),
+        'bytes_before': before_df.memory_usage(index=False, deep=True),
+        'dtype_after': after_df.dtypes.astype(str),
+        'bytes_after': after_df.memory_usage(index=False, deep=True),
+    })
+    report_df.loc['total'] = ['', report_df['bytes_before'].sum(), '', report_df['bytes_after'].sum()]
+    return report_df
+
+
+def log_memory_report(report_df: pd.DataFrame, boundary: str) -> None:
+    before, after = report_df.loc['total', 'bytes_before'], report_df.loc['total', 'bytes_after']
+    saved = 1 - after / before if before else 0.0
+    log.info(f'Museum schema at {boundary}: {before:,} bytes before, {after:,} bytes after, {saved:.0%} less.')
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Memory of every column at %s:\n%s', boundary, report_df.to_string())
@@ -0,0 +1,273 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from collections import OrderedDict
+from src.log_handler import get_logger
+from src.page_source import Page, PageNotFoundError, PageSource
+from src.profiling import count
+
+log = get_logger()
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../cache/pages')
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MEMO_MAX_BYTES = 32 * 1024 * 1024
+CACHE_INDEX_FILE_NAME = 'index.db'
+
+CREATE_PAGE_INDEX_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS page (
+  title TEXT PRIMARY KEY, revision_id INTEGER, digest TEXT NOT NULL, size INTEGER NOT NULL,
+  checked_at REAL NOT NULL, accessed_at REAL NOT NULL);'''
+
+
+class CacheMissError(PageNotFoundError):
+    '''
+    Raised in offline mode when a page is not in the cache.
+    '''
+
+
+class CachedPageSource(PageSource):
+    '''
+    A page source which keeps the pages of another page source in a memory memo and in an on-disk cache.
+
+    Page html is stored zlib-compressed in files named by the sha256 of the html, so identical pages
+    are stored once. A sqlite index maps every title to its revision id and blob. Entries younger than
+    ttl seconds are served directly, older entries are revalidated with a cheap revision id check and
+    only downloaded again when the revision changed. When the blobs grow over max_bytes, the least
+    recently used entries are evicted. In offline mode the inner source is never called.
+
+    The memo keeps the most recently used pages, up to memo_max_bytes of html, by title and revision id,
+    so a repeated fetch reads neither the index nor a blob. A memo page is served like a disk entry:
+    until it is older than ttl, or only at its own revision when a page is asked for at a revision.
+    '''
+
+    def __init__(self, page_source: PageSource = None, cache_dir: str = DEFAULT_CACHE_DIR,
+                 ttl: float = DEFAULT_CACHE_TTL, max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 offline: bool = False, memo_max_bytes: int = DEFAULT_MEMO_MAX_BYTES) -> None:
+        '''
+        :param page_source: the page source to fetch missing or changed pages from, not needed offline
+        :param cache_dir: directory of the on-disk cache
+        :param ttl: seconds an entry is trusted without checking its revision id
+        :param max_bytes: maximum total size of the compressed pages on disk
+        :param offline: serve only from the cache and never call page_source
+        :param memo_max_bytes: maximum total size of the html of the pages kept in memory, 0 disables the memo
+        :return: None
+        '''
+
+        if page_source is None and not offline:
+            raise ValueError('A page source is required when the cache is not offline.')
+
+        self.page_source = page_source
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.memo_max_bytes = memo_max_bytes
+        # (title, revision id) to (page, checked_at, size), least recently used first
+        self.memo = OrderedDict()
+        self.memo_revisions = {}
+        self.memo_bytes = 0
+        self.stats = {'memo_hits': 0, 'disk_hits': 0, 'revalidations': 0, 'downloads': 0, 'evictions': 0}
+        self.lock = threading.RLock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, CACHE_INDEX_FILE_NAME), check_same_thread=False)
+        self.conn.execute(CREATE_PAGE_INDEX_TABLE_SQL)
+        self.conn.commit()
+
+    def fetch_page(self, page_name: str, timeout: float = None) -> Page:
+        with self.lock:
+            memo_page = self._recall(page_name, self.memo_revisions.get(page_name), fresh=True)
+        if memo_page is not None:
+            return memo_page
+        return self._fetch_through_cache(page_name, self._entry(page_name), timeout)
+
+    def fetch_page_at_revision(self, page_name: str, revision_id: int, timeout: float = None) -> Page:
+        with self.lock:
+            memo_page = self._recall(page_name, revision_id, fresh=False)
+        if memo_page is not None:
+            return memo_page
+
+        entry = self._entry(page_name)
+        # Whatever the age of the entry, a page of another revision is downloaded again
+        if not self.offline and entry is not None and entry[0] != revision_id:
+            log.info('Page %s changed from revision %s to %s.', page_name, entry[0], revision_id)
+            return self._download(page_name, timeout)
+        return self._fetch_through_cache(page_name, entry, timeout)
+
+    def fetch_revision_id(self, page_name: str, timeout: float = None) -> int:
+        if not self.offline:
+            return self.page_source.fetch_revision_id(page_name, timeout=timeout)
+        return self.fetch_page(page_name, timeout=timeout).revision_id
+
+    @property
+    def revision_batch_size(self) -> int:
+        return 1 if self.offline else self.page_source.revision_batch_size
+
+    def fetch_revision_ids(self, page_names: list, timeout: float = None) -> dict:
+        if not self.offline:
+            return self.page_source.fetch_revision_ids(page_names, timeout=timeout)
+        return super().fetch_revision_ids(page_names, timeout=timeout)
+
+    def _fetch_through_cache(self, page_name: str, entry: tuple, timeout: float) -> Page:
+        if entry is None:
+            if self.offline:
+                raise CacheMissError(f'{page_name} is not in the page cache.')
+            return self._download(page_name, timeout)
+
+        revision_id, digest, checked_at = entry
+        if not self.offline and time.time() - checked_at > self.ttl:
+            self._count('revalidations')
+            current_revision_id = self.page_source.fetch_revision_id(page_name, timeout=timeout)
+            if current_revision_id is None or current_revision_id != revision_id:
+                log.info('Page %s changed from revision %s to %s.', page_name, revision_id, current_revision_id)
+                return self._download(page_name, timeout)
+            checked_at = time.time()
+            with self.lock:
+                self.conn.execute('UPDATE page SET checked_at = ? WHERE title = ?', (checked_at, page_name))
+                self.conn.commit()
+
+        html = self._read_blob(digest)
+        if html is None:
+            if self.offline:
+                raise CacheMissError(f'The cached blob of {page_name} is missing.')
+            return self._download(page_name, timeout)
+
+        self._count('disk_hits')
+        page = Page(page_name, revision_id, html)
+        with self.lock:
+            self.conn.execute('UPDATE page SET accessed_at = ? WHERE title = ?', (time.time(), page_name))
+            self.conn.commit()
+            self._remember(page, checked_at)
+        return page
+
+    def _download(self, page_name: str, timeout: float) -> Page:
+        page = self.page_source.fetch_page(page_name, timeout=timeout)
+        self._count('downloads')
+        self.store(page)
+        with self.lock:
+            self._remember(page, time.time())
+        return page
+
+    def _recall(self, page_name: str, revision_id: int, fresh: bool) -> Page:
+        # A memo page is only served while it would be served from disk without revalidating it
+        key = (page_name, revision_id)
+        if key not in self.memo:
+            return None
+        page, checked_at, _ = self.memo[key]
+        if fresh and not self.offline and time.time() - checked_at > self.ttl:
+            return None
+        self.memo.move_to_end(key)
+        self._count('memo_hits')
+        return page
+
+    def _remember(self, page: Page, checked_at: float) -> None:
+        self._forget(page.title)
+        size = len(page.html.encode('utf-8'))
+        if size > self.memo_max_bytes:
+            return
+        self.memo[(page.title, page.revision_id)] = (page, checked_at, size)
+        self.memo_revisions[page.title] = page.revision_id
+        self.memo_bytes += size
+        while self.memo_bytes > self.memo_max_bytes:
+            (title, _), (_, _, evicted_size) = self.memo.popitem(last=False)
+            del self.memo_revisions[title]
+            self.memo_bytes -= evicted_size
+
+    def _forget(self, page_name: str) -> None:
+        if page_name in self.memo_revisions:
+            _, _, size = self.memo.pop((page_name, self.memo_revisions.pop(page_name)))
+            self.memo_bytes -= size
+
+    def store(self, page: Page) -> None:
+        '''
+        Save a page to the on-disk cache and evict old entries if the cache is too big.
+
+        :param page: the page to save
+        :return: None
+        '''
+
+        data = page.html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        compressed = zlib.compress(data)
+
+        with self.lock:
+            if not os.path.exists(blob_path):
+                tmp_path = f'{blob_path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp_path, blob_path)
+
+            now = time.time()
+            self.conn.execute('INSERT OR REPLACE INTO page VALUES (?, ?, ?, ?, ?, ?)',
+                              (page.title, page.revision_id, digest, len(compressed), now, now))
+            self.conn.commit()
+            self.evict()
+
+    def evict(self) -> None:
+        '''
+        Delete least recently used entries until the blobs on disk fit in max_bytes.
+
+        :return: None
+        '''
+
+        with self.lock:
+            total_size = self.size()
+            if total_size <= self.max_bytes:
+                return
+
+            entries = self.conn.execute('SELECT title, digest FROM page ORDER BY accessed_at').fetchall()
+            for title, digest in entries:
+                if total_size <= self.max_bytes:
+                    break
+                size = self.conn.execute('SELECT size FROM page WHERE title = ?', (title,)).fetchone()[0]
+                self.conn.execute('DELETE FROM page WHERE title = ?', (title,))
+                self._forget(title)
+                self._count('evictions')
+
+                # Blobs are content addressed, only delete a blob when no other title refers to it
+                if self.conn.execute('SELECT 1 FROM page WHERE digest = ?', (digest,)).fetchone() is None:
+                    total_size -= size
+                    try:
+                        os.remove(self._blob_path(digest))
+                    except FileNotFoundError:
+                        pass
+            self.conn.commit()
+            log.info(f'Evicted page cache entries, the cache now uses {total_size} bytes.')
+
+    def size(self) -> int:
+        '''
+        Total size of the compressed pages on disk.
+
+        :return: size in bytes
+        '''
+
+        with self.lock:
+            row = self.conn.execute('SELECT SUM(size) FROM (SELECT DISTINCT digest, size FROM page)').fetchone()
+        return row[0] or 0
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+        count(f'page_cache_{name}')
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _entry(self, page_name: str) -> tuple:
+        with self.lock:
+            return self.conn.execute('SELECT revision_id, digest, checked_at FROM page WHERE title = ?',
+                                     (page_name,)).fetchone()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f'{digest}.html.z')
+
+    def _read_blob(self, digest: str) -> str:
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except (FileNotFoundError, zlib.error):
+            return None
@@ -0,0 +1,323 @@
+import json
+import urllib.parse
+import urllib.request
+
+from collections import namedtuple
+from src.log_handler import get_logger
+from src.profiling import count
+
+log = get_logger()
+WIKIPEDIA_API_URL = 'https://en.wikipedia.org/w/api.php'
+USER_AGENT = 'museum_analysis (https://github.com/Olililili/museum_analysis)'
+RESOLVE_BATCH_SIZE = 50
+
+# A fetched page. revision_id is None when the page source cannot tell the revision.
+Page = namedtuple('Page', ['title', 'revision_id', 'html'])
+
+# A page fetched as wikitext. coordinates is the (latitude, longitude) of the page, None when it has none.
+WikitextPage = namedtuple('WikitextPage', ['title', 'revision_id', 'wikitext', 'coordinates'])
+
+
+class PageNotFoundError(Exception):
+    '''
+    Raised by a page source when the requested page does not exist.
+    '''
+
+
+class PageSource:
+    '''
+    Base class for everything that can return the html of a Wikipedia page.
+
+    Subclasses only need to implement fetch_page, which makes it easy to plug in
+    another backend, for example a local stub server in tests.
+    '''
+
+    # Number of pages whose revision ids fetch_revision_ids looks up in one call
+    revision_batch_size = 1
+
+    def fetch_page(self, page_name: str, timeout: float = None) -> Page:
+        '''
+        Fetch the rendered html and the current revision id of a page.
+
+        :param page_name: the Wikipedia page name
+        :param timeout: seconds to wait for the response, None means no timeout
+        :return: the fetched page
+        '''
+
+        raise NotImplementedError
+
+    def fetch_revision_id(self, page_name: str, timeout: float = None) -> int:
+        '''
+        Fetch only the current revision id of a page, which is much cheaper than fetching the page.
+        The default implementation fetches the whole page, subclasses should override it when they can.
+
+        :param page_name: the Wikipedia page name
+        :param timeout: seconds to wait for the response, None means no timeout
+        :return: the revision id, or None if it is unknown
+        '''
+
+        return self.fetch_page(page_name, timeout=timeout).revision_id
+
+    def fetch_revision_ids(self, page_names: list, timeout: float = None) -> dict:
+        '''
+        Fetch the current revision ids of up to revision_batch_size pages.
+        The default implementation fetches them one by one, subclasses which can batch them override it.
+
+        :param page_names: the Wikipedia page names
+        :param timeout: seconds to wait for each response, None means no timeout
+        :return: a dictionary of page names and their revision ids, None for missing pages
+        '''
+
+        revision_ids = {}
+        for page_name in page_names:
+            try:
+                revision_ids[page_name] = self.fetch_revision_id(page_name, timeout=timeout)
+            except PageNotFoundError:
+                revision_ids[page_name] = None
+        return revision_ids
+
+    def fetch_page_at_revision(self, page_name: str, revision_id: int, timeout: float = None) -> Page:
+        '''
+        Fetch a page which is expected to be at a revision, like a revision an incremental refresh just saw.
+        The default implementation fetches the current page, a cache overrides it to fetch the page again
+        when it holds another revision.
+
+        :param page_name: the Wikipedia page name
+        :param revision_id: the expected revision id of the page
+        :param timeout: seconds to wait for the response, None means no timeout
+        :return: the fetched page
+        '''
+
+        return self.fetch_page(page_name, timeout=timeout)
+
+    def fetch_html(self, page_name: str, timeout: float = None) -> str:
+        '''
+        Fetch the rendered html of a page.
+
+        :param page_name: the Wikipedia page name
+        :param timeout: seconds to wait for the response, None means no timeout
+        :return: the html of the page
+        '''
+
+        return self.fetch_page(page_name, timeout=timeout).html
+
+
+class WikipediaPageSource(PageSource):
+    '''
+    Page source backed by the wikipedia package.
+    The wikipedia package does not support timeouts, so the timeout argument is ignored.
+    '''
+
+    def fetch_page(self, page_name: str, timeout: float = None) -> Page:
+        # Imported here, the MediaWiki page source is the default and does not need the wikipedia package
+        import wikipedia
+
+        try:
+            page = wikipedia.page(page_name)
+        except wikipedia.exceptions.PageError as e:
+            raise PageNotFoundError(page_name) from e
+        html = page.html()
+        count('pages_fetched')
+        count('bytes_downloaded', len(html.encode('utf-8')))
+        return Page(page_name, int(page.revision_id), html)
+
+
+class MediaWikiPageSource(PageSource):
+    '''
+    Page source which calls the MediaWiki parse API directly, with a timeout for every request.
+    '''
+
+    revision_batch_size = RESOLVE_BATCH_SIZE
+
+    def __init__(self, api_url: str = WIKIPEDIA_API_URL, user_agent: str = USER_AGENT) -> None:
+        '''
+        :param api_url: url of the api.php endpoint
+        :param user_agent: User-Agent header sent with every request
+        :return: None
+        '''
+
+        self.api_url = api_url
+        self.user_agent = user_agent
+
+    def api_request(self, params: dict, timeout: float = None) -> dict:
+        '''
+        Send a GET request to the MediaWiki API and decode the json response.
+
+        :param params: query parameters, format=json is always added
+        :param timeout: seconds to wait for the response
+        :return: the decoded json response
+        '''
+
+        query = urllib.parse.urlencode(dict(params, format='json', formatversion=2))
+        request = urllib.request.Request(f'{self.api_url}?{query}', headers={'User-Agent': self.user_agent})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+        count('api_requests')
+        count('bytes_downloaded', len(body))
+        return json.loads(body.decode('utf-8'))
+
+    def fetch_page(self, page_name: str, timeout: float = None) -> Page:
+        response = self.api_request({'action': 'parse', 'page': page_name, 'prop': 'text|revid', 'redirects': 1},
+                                    timeout=timeout)
+        if 'error' in response:
+            if response['error'].get('code') == 'missingtitle':
+                raise PageNotFoundError(page_name)
+            raise IOError(f'MediaWiki API error for {page_name}: {response["error"].get("info")}')
+        count('pages_fetched')
+        return Page(page_name, response['parse'].get('revid'), response['parse']['text'])
+
+    def resolve_titles(self, page_names: list, timeout: float = None) -> dict:
+        '''
+        Resolve page names to the canonical page they name, following redirects, in one request.
+        The MediaWiki API resolves at most RESOLVE_BATCH_SIZE titles per request.
+
+        :param page_names: the Wikipedia page names, at most RESOLVE_BATCH_SIZE
+        :param timeout: seconds to wait for the response
+        :return: a dictionary of page names and (page id, canonical page name), None for missing pages
+        '''
+
+        response = self.api_request({'action': 'query', 'titles': '|'.join(page_names), 'redirects': 1},
+                                    timeout=timeout)
+        pages = query_pages(page_names, response.get('query', {}))
+        return {page_name: None if page is None else (page['pageid'], page['title'].replace(' ', '_'))
+                for page_name, page in pages.items()}
+
+    def fetch_category_members(self, category: str, timeout: float = None) -> list:
+        '''
+        Fetch all members of a category page, following the API's continuation.
+
+        :param category: the category page name, like 'Category:Art_museums_in_France'
+        :param timeout: seconds to wait for each response
+        :return: a list of (page id, namespace, page name), namespace 0 is an article, 14 a category
+        '''
+
+        members = []
+        params = {'action': 'query', 'list': 'categorymembers', 'cmtitle': category, 'cmlimit': 500,
+                  'cmtype': 'page|subcat'}
+        while True:
+            response = self.api_request(params, timeout=timeout)
+            if 'error' in response:
+                raise IOError(f'MediaWiki API error for {category}: {response["error"].get("info")}')
+            members.extend((member['pageid'], member['ns'], member['title'].replace(' ', '_'))
+                           for member in response['query']['categorymembers'])
+            if 'continue' not in response:
+                return members
+            params = dict(params, **response['continue'])
+
+    def fetch_revision_id(self, page_name: str, timeout: float = None) -> int:
+        response = self.api_request({'action': 'query', 'titles': page_name, 'prop': 'revisions',
+                                     'rvprop': 'ids', 'redirects': 1}, timeout=timeout)
+        page = response['query']['pages'][0]
+        if page.get('missing') or page.get('invalid'):
+            raise PageNotFoundError(page_name)
+        return page['revisions'][0]['revid']
+
+    def fetch_revision_ids(self, page_names: list, timeout: float = None) -> dict:
+        response = self.api_request({'action': 'query', 'titles': '|'.join(page_names), 'prop': 'revisions',
+                                     'rvprop': 'ids', 'redirects': 1}, timeout=timeout)
+        if 'error' in response:
+            raise IOError(f'MediaWiki API error for {len(page_names)} pages: {response["error"].get("info")}')
+        pages = query_pages(page_names, response.get('query', {}))
+        return {page_name: page['revisions'][0]['revid'] if page is not None and page.get('revisions') else None
+                for page_name, page in pages.items()}
+
+
+class WikitextPageSource(MediaWikiPageSource):
+    '''
+    MediaWiki page source which can fetch museum pages as wikitext, up to RESOLVE_BATCH_SIZE pages per request.
+
+    One query returns the wikitext of the current revision and the coordinates of every page in the batch,
+    with redirects resolved in the same request. The wikitext of an article is a small part of its rendered
+    html, so fetching the museums this way needs fewer requests and transfers much less. Single pages, like
+    the museum list, are still fetched as rendered html.
+    '''
+
+    def fetch_wikitext_pages(self, page_names: list, timeout: float = None) -> dict:
+        '''
+        Fetch the wikitext, revision id and coordinates of pages in one request, following the API's continuation.
+
+        :param page_names: the Wikipedia page names, at most RESOLVE_BATCH_SIZE
+        :param timeout: seconds to wait for each response
+        :return: a dictionary of page names and their WikitextPage, None for missing pages
+        '''
+
+        params = {'action': 'query', 'titles': '|'.join(page_names), 'redirects': 1, 'prop': 'revisions|coordinates',
+                  'rvprop': 'ids|content', 'rvslots': 'main', 'colimit': 'max'}
+        query = {}
+        while True:
+            response = self.api_request(params, timeout=timeout)
+            if 'error' in response:
+                raise IOError(f'MediaWiki API error for {len(page_names)} pages: {response["error"].get("info")}')
+            merge_query(query, response.get('query', {}))
+            if 'continue' not in response:
+                break
+            params = dict(params, **response['continue'])
+
+        pages = {}
+        for page_name, page in query_pages(page_names, query).items():
+            if page is None or not page.get('revisions'):
+                pages[page_name] = None
+                continue
+            revision = page['revisions'][0]
+            coordinates = next(((point['lat'], point['lon']) for point in page.get('coordinates', [])
+                                if point.get('primary', True)), None)
+            pages[page_name] = WikitextPage(page_name, revision.get('revid'), revision['slots']['main']['content'],
+                                            coordinates)
+        count('pages_fetched', sum(page is not None for page in pages.values()))
+        return pages
+
+
+def merge_query(query: dict, continued_query: dict) -> None:
+    '''
+    Merge the query part of a continued response into the query of the previous responses.
+    A continued response repeats the pages, with only the properties which did not fit in the previous one.
+
+    :param query: the merged query, updated in place
+    :param continued_query: the query part of the next response
+    :return: None
+    '''
+
+    for key in ('normalized', 'redirects'):
+        for mapping in continued_query.get(key, []):
+            if mapping not in query.setdefault(key, []):
+                query[key].append(mapping)
+
+    pages = {page['title']: page for page in query.setdefault('pages', [])}
+    for page in continued_query.get('pages', []):
+        if page['title'] not in pages:
+            pages[page['title']] = page
+            query['pages'].append(page)
+            continue
+        merged = pages[page['title']]
+        for name, value in page.items():
+            if isinstance(value, list):
+                merged[name] = merged.get(name, []) + value
+            else:
+                merged.setdefault(name, value)
+
+
+def query_pages(page_names: list, query: dict) -> dict:
+    '''
+    Find the page of every requested name in the query part of a response, following normalizations and redirects.
+
+    :param page_names: the requested page names
+    :param query: the query part of the response
+    :return: a dictionary of page names and the page of the response, None for missing or invalid pages
+    '''
+
+    # The API reports the name it resolved a title from, its normalized name, then the redirect target
+    renamed = {}
+    for mapping in query.get('normalized', []) + query.get('redirects', []):
+        renamed[mapping['from']] = mapping['to']
+    pages = {page['title']: page for page in query.get('pages', [])}
+
+    found = {}
+    for page_name in page_names:
+        title = page_name
+        for _ in range(len(renamed) + 1):
+            if title not in renamed:
+                break
+            title = renamed[title]
+        page = pages.get(title)
+        found[page_name] = None if page is None or page.get('missing') or page.get('invalid') else page
+    return found
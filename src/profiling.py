@@ -0,0 +1,282 @@
+import cProfile
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+import pandas as pd
+
+from contextlib import contextmanager
+from src.log_handler import get_logger
+
+try:
+    import resource
+except ImportError:
+    # resource is Unix only, peak RSS is not reported without it
+    resource = None
+
+log = get_logger()
+RUN_REPORT_FORMAT_VERSION = 1
+
+# Counters of the page cache, the hit rate is the share of pages served without downloading them
+PAGE_CACHE_HIT_COUNTERS = ['page_cache_memo_hits', 'page_cache_disk_hits']
+PAGE_CACHE_MISS_COUNTERS = ['page_cache_downloads']
+
+# The RunProfiler of the current run, stages and counters are not recorded when it is None
+active_profiler = None
+
+
+class StageRecord:
+    '''
+    The measurements of all calls of one stage in a run.
+    '''
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows = 0
+        self.peak_rss_bytes = None
+        self.peak_traced_bytes = None
+        self.counters = {}
+        self.cprofile_path = None
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'calls': self.calls, 'wall_seconds': self.wall_seconds,
+                'cpu_seconds': self.cpu_seconds, 'rows': self.rows,
+                'rows_per_second': self.rows / self.wall_seconds if self.wall_seconds > 0 else None,
+                'peak_rss_bytes': self.peak_rss_bytes, 'peak_traced_bytes': self.peak_traced_bytes,
+                'counters': dict(sorted(self.counters.items())), 'cprofile_path': self.cprofile_path}
+
+
+class RunProfiler:
+    '''
+    Measure the stages of a run, and write the measurements as a JSON run report.
+
+    Every stage records its wall time, the CPU time of the process, which includes the threads it
+    starts but not worker processes, the rows it produced, the peak RSS of the process after it and
+    the counters, like pages fetched and bytes downloaded, incremented while it ran. A stage called
+    several times, like cleaning a chunk of museums, is summed over its calls.
+
+    Tracing memory allocations with tracemalloc slows Python code down several times, so the peak of
+    traced memory per stage is only measured with trace_memory. With cprofile_dir, each stage which is
+    not called inside another profiled stage is profiled with cProfile and dumped to <stage>.prof.
+    '''
+
+    def __init__(self, trace_memory: bool = False, cprofile_dir: str = None, cprofile_stages: list = None) -> None:
+        '''
+        :param trace_memory: measure the peak of memory allocated by Python in each stage with tracemalloc
+        :param cprofile_dir: directory of the cProfile dumps, None disables cProfile
+        :param cprofile_stages: names of the stages to profile with cProfile, defaults to all stages
+        :return: None
+        '''
+
+        self.trace_memory = trace_memory
+        self.cprofile_dir = cprofile_dir
+        self.cprofile_stages = None if cprofile_stages is None else set(cprofile_stages)
+        self.stages = {}
+        self.counters = {}
+        self.profiles = {}
+        self.metadata = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = None
+        self.wall_start = None
+        self.cpu_start = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+
+    def __enter__(self) -> 'RunProfiler':
+        global active_profiler
+        self.started = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        active_profiler = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global active_profiler
+        active_profiler = None
+        self.wall_seconds = time.perf_counter() - self.wall_start
+        self.cpu_seconds = time.process_time() - self.cpu_start
+        if self.trace_memory:
+            tracemalloc.stop()
+        for name, profile in self.profiles.items():
+            self.stages[name].cprofile_path = os.path.join(self.cprofile_dir, f'{name}.prof')
+            profile.dump_stats(self.stages[name].cprofile_path)
+
+    @contextmanager
+    def stage(self, name: str):
+        '''
+        Measure a call of a stage. The stage can set the rows it produced with the yielded record's rows.
+
+        :param name: name of the stage
+        :return: a context manager yielding a dictionary, its 'rows' are added to the stage's rows
+        '''
+
+        stack = self.local.__dict__.setdefault('stack', [])
+        call = {'rows': 0, 'peak_traced_bytes': 0}
+        if self.trace_memory:
+            # reset_peak also resets the peak of the enclosing stage, so its peak so far is kept first
+            if stack:
+                stack[-1]['peak_traced_bytes'] = max(stack[-1]['peak_traced_bytes'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        profile = self._start_cprofile(name, stack)
+        stack.append(call)
+        with self.lock:
+            counters_before = dict(self.counters)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield call
+        finally:
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+                self.local.cprofile_active = False
+            if self.trace_memory:
+                call['peak_traced_bytes'] = max(call['peak_traced_bytes'], tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1]['peak_traced_bytes'] = max(stack[-1]['peak_traced_bytes'], call['peak_traced_bytes'])
+
+            with self.lock:
+                record = self.stages.setdefault(name, StageRecord(name))
+                record.calls += 1
+                record.wall_seconds += wall_seconds
+                record.cpu_seconds += cpu_seconds
+                record.rows += call['rows']
+                record.peak_rss_bytes = peak_rss_bytes()
+                if self.trace_memory:
+                    record.peak_traced_bytes = max(record.peak_traced_bytes or 0, call['peak_traced_bytes'])
+                for counter, value in self.counters.items():
+                    delta = value - counters_before.get(counter, 0)
+                    if delta:
+                        record.counters[counter] = record.counters.get(counter, 0) + delta
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self) -> dict:
+        '''
+        :return: the run report, a dictionary which can be written as JSON
+        '''
+
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+            stages = [record.to_dict() for record in self.stages.values()]
+
+        hits = sum(counters.get(name, 0) for name in PAGE_CACHE_HIT_COUNTERS)
+        misses = sum(counters.get(name, 0) for name in PAGE_CACHE_MISS_COUNTERS)
+        return {'format_version': RUN_REPORT_FORMAT_VERSION, 'started': self.started,
+                'python': platform.python_version(), 'platform': platform.platform(), 'argv': sys.argv[1:],
+                'wall_seconds': self.wall_seconds, 'cpu_seconds': self.cpu_seconds,
+                'peak_rss_bytes': peak_rss_bytes(), 'counters': counters,
+                'page_cache_hit_rate': hits / (hits + misses) if hits + misses else None,
+                'stages': stages, **self.metadata}
+
+    def write_report(self, path: str) -> None:
+        '''
+        Write the run report as JSON.
+
+        :param path: path of the report file
+        :return: None
+        '''
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        log.info(f'Wrote the run report to {path}.')
+
+    def _start_cprofile(self, name: str, stack: list):
+        # Only one cProfile profiler can be enabled at a time, nested stages are in the enclosing stage's dump
+        if self.cprofile_dir is None or getattr(self.local, 'cprofile_active', False) \
+                or (self.cprofile_stages is not None and name not in self.cprofile_stages):
+            return None
+        os.makedirs(self.cprofile_dir, exist_ok=True)
+        with self.lock:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        self.local.cprofile_active = True
+        profile.enable()
+        return profile
+
+
+@contextmanager
+def stage(name: str):
+    '''
+    Measure a stage with the active RunProfiler, or do nothing when no profiler is active.
+
+    :param name: name of the stage
+    :return: a context manager yielding a dictionary, its 'rows' are added to the stage's rows
+    '''
+
+    profiler = active_profiler
+    if profiler is None:
+        yield {'rows': 0}
+        return
+    with profiler.stage(name) as call:
+        yield call
+
+
+def profile_stage(name: str = None):
+    '''
+    Decorate a function as a stage measured by the active RunProfiler.
+    The rows of a call are the length of the dataframe it returns, or else of its first dataframe argument.
+
+    :param name: name of the stage, defaults to the name of the function
+    :return: the decorator
+    '''
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if active_profiler is None:
+                return func(*args, **kwargs)
+            with stage(stage_name) as call:
+                result = func(*args, **kwargs)
+                frames = [result] + list(args) + list(kwargs.values())
+                call['rows'] = next((len(frame) for frame in frames if isinstance(frame, pd.DataFrame)), 0)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, amount: int = 1) -> None:
+    '''
+    Increment a counter of the active RunProfiler, or do nothing when no profiler is active.
+
+    :param name: name of the counter, like 'pages_fetched'
+    :param amount: the increment
+    :return: None
+    '''
+
+    profiler = active_profiler
+    if profiler is not None:
+        profiler.count(name, amount)
+
+
+def peak_rss_bytes() -> int:
+    '''
+    :return: the peak resident set size of the process so far, None when it cannot be measured
+    '''
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
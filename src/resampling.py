@@ -0,0 +1,118 @@
+import numpy as np
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from src.log_handler import configure_worker_logging, get_logger, worker_logging_args
+
+log = get_logger()
+DEFAULT_RESAMPLES = 10000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+
+# Number of resamples evaluated together as one matrix, and the unit of work of a worker process
+DEFAULT_BATCH_SIZE = 1000
+
+ConfidenceInterval = namedtuple('ConfidenceInterval', ['estimate', 'low', 'high'])
+CorrelationResampling = namedtuple('CorrelationResampling', ['pearson_r', 'slope', 'p_value', 'resamples'])
+
+
+def resample_correlation(x: np.ndarray, y: np.ndarray, resamples: int = DEFAULT_RESAMPLES,
+                         confidence: float = DEFAULT_CONFIDENCE, seed: int = DEFAULT_SEED, workers: int = 1,
+                         batch_size: int = DEFAULT_BATCH_SIZE) -> CorrelationResampling:
+    '''
+    Bootstrap confidence intervals of Pearson's r and of the regression slope of y on x, and the
+    permutation test p-value of r.
+
+    Resamples are drawn in batches, and every batch is a matrix of row indices, so a batch of
+    thousands of resamples is evaluated with a few array operations. Every batch has its own random
+    stream derived from seed, so the results only depend on seed, not on the number of workers.
+
+    :param x: values of the explanatory variable, like city population
+    :param y: values of the response variable, like visitors
+    :param resamples: number of bootstrap resamples and of permutations
+    :param confidence: confidence level of the intervals
+    :param seed: random seed
+    :param workers: number of processes evaluating batches, 1 evaluates them in the current process
+    :param batch_size: number of resamples evaluated together
+    :return: the confidence intervals of r and of the slope, and the two-sided p-value of r
+    '''
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    batch_sizes = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    batch_seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    tasks = [(x, y, size, batch_seed) for size, batch_seed in zip(batch_sizes, batch_seeds)]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker_logging,
+                                 initargs=worker_logging_args()) as executor:
+            batches = list(executor.map(resample_batch, *zip(*tasks)))
+    else:
+        batches = [resample_batch(*task) for task in tasks]
+
+    bootstrap_r = np.concatenate([batch[0] for batch in batches])
+    bootstrap_slope = np.concatenate([batch[1] for batch in batches])
+    permuted_r = np.concatenate([batch[2] for batch in batches])
+
+    pearson_r, slope = correlation_and_slope(x[np.newaxis, :], y[np.newaxis, :])
+    # The observed r counts as one of the permutations, so the p-value is never 0
+    p_value = (np.count_nonzero(np.abs(permuted_r) >= abs(pearson_r[0]) - 1e-12) + 1) / (len(permuted_r) + 1)
+
+    return CorrelationResampling(percentile_interval(float(pearson_r[0]), bootstrap_r, confidence),
+                                 percentile_interval(float(slope[0]), bootstrap_slope, confidence), p_value, resamples)
+
+
+def resample_batch(x: np.ndarray, y: np.ndarray, size: int, seed: np.random.SeedSequence) -> tuple:
+    '''
+    Evaluate a batch of bootstrap resamples and of permutations.
+
+    :param x: values of the explanatory variable
+    :param y: values of the response variable
+    :param size: number of resamples in the batch
+    :param seed: random stream of the batch
+    :return: r and slope of every bootstrap resample, and r of every permutation
+    '''
+
+    rng = np.random.default_rng(seed)
+    n = len(x)
+
+    indices = rng.integers(0, n, size=(size, n))
+    bootstrap_r, bootstrap_slope = correlation_and_slope(x[indices], y[indices])
+
+    # Permuting y keeps the means and the spread of x and y, only the co-moment changes
+    permutations = rng.permuted(np.broadcast_to(np.arange(n), (size, n)), axis=1)
+    x_centered = x - x.mean()
+    y_centered = y - y.mean()
+    scale = np.sqrt((x_centered @ x_centered) * (y_centered @ y_centered))
+    permuted_r = y_centered[permutations] @ x_centered / scale if scale > 0 else np.full(size, np.nan)
+
+    return bootstrap_r, bootstrap_slope, permuted_r
+
+
+def correlation_and_slope(x: np.ndarray, y: np.ndarray) -> tuple:
+    '''
+    Pearson's r and the regression slope of every row of two matrices.
+
+    :param x: a matrix, every row is a sample of the explanatory variable
+    :param y: a matrix of the same shape, every row is a sample of the response variable
+    :return: an array of r and an array of slopes, NaN for rows without spread
+    '''
+
+    x_centered = x - x.mean(axis=1, keepdims=True)
+    y_centered = y - y.mean(axis=1, keepdims=True)
+    sxx = np.einsum('ij,ij->i', x_centered, x_centered)
+    syy = np.einsum('ij,ij->i', y_centered, y_centered)
+    sxy = np.einsum('ij,ij->i', x_centered, y_centered)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sxy / np.sqrt(sxx * syy), sxy / sxx
+
+
+def percentile_interval(estimate: float, samples: np.ndarray, confidence: float) -> ConfidenceInterval:
+    # Resamples without spread, where r and the slope are undefined, are left out
+    samples = samples[np.isfinite(samples)]
+    if len(samples) == 0:
+        return ConfidenceInterval(estimate, np.nan, np.nan)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(samples, [tail, 100 - tail])
+    return ConfidenceInterval(estimate, float(low), float(high))
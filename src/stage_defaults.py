@@ -0,0 +1,29 @@
+import os
+
+# Default settings of the pipeline stages which the command line exposes. They are kept in a module without
+# dependencies, so parsing the command line does not import the stages, and are re-exported by the stage modules.
+
+# Fetching the museum pages, see fetch_museum_data
+DEFAULT_FETCH_TIMEOUT = 30
+DEFAULT_FETCH_RETRIES = 3
+
+# The museums on Wikipedia change, so the checkpoint of the fetch stage is only used for this many seconds,
+# like the pages of the page cache
+DEFAULT_FETCH_CHECKPOINT_MAX_AGE = 24 * 60 * 60
+
+# The streaming pipeline, see museum_pipeline
+DEFAULT_BUFFER_SIZE = 32
+DEFAULT_CHUNK_SIZE = 50
+
+# Repeated k-fold cross-validation, see cross_validation
+DEFAULT_FOLDS = 5
+DEFAULT_REPEATS = 10
+
+# Crawling museum list pages and category pages, see crawler
+DEFAULT_CRAWL_STATE_PATH = os.path.join(os.path.dirname(__file__), '../cache/crawl_state.db')
+DEFAULT_CRAWL_RATE = 20.0
+DEFAULT_HOST_RATE = 5.0
+DEFAULT_MAX_DEPTH = 2
+
+# The Parquet snapshots of the museum and city tables, see museum_dataset. Next to the database, like it.
+DEFAULT_DATASET_DIR = 'museum_dataset'
@@ -0,0 +1,58 @@
+import importlib
+
+STAGE_NAMES = ['fetch', 'build_db', 'export', 'correlate']
+
+# The modules whose source is the code version of each stage, a change to any of them runs the stage again.
+# They are the modules of the stage and every module of src they import, except log_handler and profiling,
+# which do not change the output, and stage_defaults, whose settings main passes to the stages as arguments.
+# main is one of them where it builds the output of the stage around the functions of src.
+# They are named rather than imported, so checking the checkpoint of a stage does not import the stage.
+# 'refresh' is the incremental refresh, which is the fetch stage with --incremental, and 'crawl' the crawler,
+# which finds the museums of the fetch stage with --crawl-seed.
+STAGE_MODULES = {
+    'fetch': ('main', 'src.fetch_museum_data', 'src.museum_pipeline', 'src.page_source', 'src.page_cache',
+              'src.infobox_parser', 'src.wikitext_infobox', 'src.clean_museum_data', 'src.onehot_enum',
+              'src.add_city_population', 'src.city_resolver', 'src.world_cities_index', 'src.museum_schema',
+              'src.geo'),
+    'refresh': ('src.incremental_refresh',),
+    'crawl': ('src.crawler',),
+    'build_db': ('main', 'src.create_museum_db', 'src.db_operations', 'src.clean_museum_data', 'src.onehot_enum',
+                 'src.museum_schema', 'src.geo'),
+    'export': ('src.museum_dataset', 'src.create_museum_db', 'src.db_operations', 'src.clean_museum_data',
+               'src.onehot_enum', 'src.museum_schema'),
+    'correlate': ('main', 'src.correlate_pop_visitor', 'src.resampling', 'src.cross_validation',
+                  'src.feature_matrix', 'src.streaming_stats', 'src.museum_dataset', 'src.create_museum_db',
+                  'src.db_operations', 'src.clean_museum_data', 'src.onehot_enum', 'src.museum_schema'),
+}
+
+
+class LazyFunction:
+    '''
+    A function of a stage which is imported on its first call, so the dependencies of the stage,
+    like scikit-learn or BeautifulSoup, are only imported by a run which needs the stage.
+    '''
+
+    def __init__(self, target: str) -> None:
+        '''
+        :param target: the module and name of the function, like 'src.create_museum_db:build_museum_db'
+        :return: None
+        '''
+
+        self.module_name, self.function_name = target.split(':')
+        self.__name__ = self.function_name
+        self.function = None
+
+    def load(self):
+        '''
+        :return: the function, imported the first time
+        '''
+
+        if self.function is None:
+            self.function = getattr(importlib.import_module(self.module_name), self.function_name)
+        return self.function
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f'LazyFunction({self.module_name}:{self.function_name})'
@@ -0,0 +1,207 @@
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import time
+import pandas as pd
+
+from collections import namedtuple
+from src.log_handler import get_logger
+
+log = get_logger()
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), '../cache/checkpoints')
+
+# Changing how checkpoints are keyed or written must change this, so checkpoints of the old format are not used
+CHECKPOINT_FORMAT_VERSION = 1
+
+# run is called with the output dataframes of the stages named in inputs and returns the stage's dataframe.
+# The source of modules is the code version of the stage, params are the settings which change its output,
+# and artifacts are files the stage writes besides its output, like the database, which must still exist
+# for the checkpoint to be used. A checkpoint older than max_age seconds is not used, like the output of a
+# stage which reads data from outside the pipeline that changes over time, None keeps it until the key changes.
+Stage = namedtuple('Stage', ['name', 'run', 'inputs', 'modules', 'params', 'artifacts', 'max_age'],
+                   defaults=((), (), None, (), None))
+StageResult = namedtuple('StageResult', ['name', 'df', 'key', 'output_hash', 'skipped', 'seconds'])
+
+
+class StageRunner:
+    '''
+    Run a pipeline of stages, and save the output dataframe of every stage as a Parquet checkpoint.
+
+    A checkpoint is named by a hash of the stage's code, its params and the outputs of its input stages,
+    so a stage whose inputs and code did not change is skipped and its output is read from the checkpoint.
+    The hash of every output is saved with its checkpoint, and the stages after it are keyed by it, so
+    they only run again when the data they read changed.
+    '''
+
+    def __init__(self, stages: list, checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR, selected: list = None,
+                 force: list = (), use_checkpoints: bool = True) -> None:
+        '''
+        :param stages: the stages, every stage after the stages it reads
+        :param checkpoint_dir: directory of the checkpoints
+        :param selected: names of the stages to run, with the stages they read, defaults to all stages
+        :param force: names of the stages which run even when they have a checkpoint
+        :param use_checkpoints: False runs every stage and saves no checkpoints
+        :return: None
+        '''
+
+        self.stages = {stage.name: stage for stage in stages}
+        self.checkpoint_dir = checkpoint_dir
+        self.selected = list(self.stages) if selected is None else list(selected)
+        self.force = set(force)
+        self.use_checkpoints = use_checkpoints
+
+        unknown = [name for name in self.selected + list(self.force) if name not in self.stages]
+        if unknown:
+            raise ValueError(f'Unknown stages {unknown}, expected some of {list(self.stages)}.')
+
+    def run(self) -> dict:
+        '''
+        Run the selected stages and the stages they read.
+
+        :return: a dictionary of stage names and StageResults, in the order the stages ran
+        '''
+
+        needed = set()
+        pending = list(self.selected)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].inputs)
+
+        results = {}
+        for name, stage in self.stages.items():
+            if name in needed:
+                results[name] = self.run_stage(stage, [results[input_name] for input_name in stage.inputs])
+        return results
+
+    def run_stage(self, stage: Stage, inputs: list) -> StageResult:
+        '''
+        Read the output of a stage from its checkpoint, or run the stage and save its checkpoint.
+
+        :param stage: the stage
+        :param inputs: the StageResults of the stages it reads
+        :return: the result of the stage
+        '''
+
+        key = stage_key(stage, [result.output_hash for result in inputs])
+        df_path, meta_path = self.checkpoint_paths(stage.name, key)
+
+        if self.use_checkpoints and stage.name not in self.force and os.path.exists(meta_path) \
+                and all(os.path.exists(path) for path in stage.artifacts):
+            start = time.perf_counter()
+            with open(meta_path) as f:
+                meta = json.load(f)
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(meta['created']))
+            if stage.max_age is not None and time.time() - meta['created'] > stage.max_age:
+                log.info(f'The checkpoint of stage {stage.name} from {created} is older than {stage.max_age}s.')
+            else:
+                df = pd.read_parquet(df_path)
+                seconds = time.perf_counter() - start
+                log.info(f'Stage {stage.name} is unchanged, read {len(df)} rows from its checkpoint from {created} '
+                         f'in {seconds:.3f}s.')
+                return StageResult(stage.name, df, key, meta['output_hash'], True, seconds)
+
+        log.info(f'Running stage {stage.name}...')
+        start = time.perf_counter()
+        df = stage.run(*[result.df for result in inputs])
+        seconds = time.perf_counter() - start
+        output_hash = hash_dataframe(df)
+        log.info(f'Finished stage {stage.name} in {seconds:.3f}s.')
+
+        if self.use_checkpoints:
+            self.save_checkpoint(df, df_path, meta_path, {'stage': stage.name, 'key': key,
+                                                          'output_hash': output_hash, 'rows': len(df),
+                                                          'seconds': seconds, 'created': time.time()})
+        return StageResult(stage.name, df, key, output_hash, False, seconds)
+
+    def checkpoint_paths(self, name: str, key: str) -> tuple:
+        '''
+        :param name: name of the stage
+        :param key: key of the stage's inputs and code
+        :return: the paths of the checkpoint's dataframe and of its metadata
+        '''
+
+        prefix = os.path.join(self.checkpoint_dir, f'{name}-{key}')
+        return f'{prefix}.parquet', f'{prefix}.json'
+
+    def save_checkpoint(self, df: pd.DataFrame, df_path: str, meta_path: str, meta: dict) -> None:
+        # The metadata is written last, so a checkpoint is only used when its dataframe was written completely
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        tmp_path = f'{df_path}.{os.getpid()}.tmp'
+        try:
+            df.to_parquet(tmp_path, engine='pyarrow')
+        except (TypeError, ValueError) as e:
+            # pyarrow cannot write object columns mixing types, like numbers and strings
+            log.warning(f'Could not save the checkpoint of stage {meta["stage"]}, it will run again next time: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, df_path)
+
+        tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+
+def stage_key(stage: Stage, input_hashes: list) -> str:
+    '''
+    Hash the code version of a stage, its params and the hashes of its inputs.
+
+    :param stage: the stage
+    :param input_hashes: the output hashes of the stages it reads
+    :return: a hex digest
+    '''
+
+    digest = hashlib.sha256(f'{CHECKPOINT_FORMAT_VERSION}:{stage.name}'.encode('utf-8'))
+    digest.update(code_version(stage.modules).encode('utf-8'))
+    digest.update(json.dumps(stage.params or {}, sort_keys=True, default=str).encode('utf-8'))
+    for input_hash in input_hashes:
+        digest.update(input_hash.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def code_version(modules: list) -> str:
+    '''
+    :param modules: the modules of a stage, or their dotted names, which are found without importing them
+    :return: a hash of the source of the modules
+    '''
+
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module_source_path(module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def module_source_path(module) -> str:
+    '''
+    :param module: a module, or its dotted name like 'src.create_museum_db'
+    :return: path of the source file of the module
+    '''
+
+    if isinstance(module, str):
+        spec = importlib.util.find_spec(module)
+        if spec is None or spec.origin is None:
+            raise ImportError(f'Cannot find the source of module {module}.')
+        return spec.origin
+    return inspect.getsourcefile(module)
+
+
+def hash_dataframe(df: pd.DataFrame) -> str:
+    '''
+    Hash the column names and values of a dataframe.
+
+    :param df: the dataframe
+    :return: a hex digest
+    '''
+
+    digest = hashlib.sha256(f'{list(df.columns)}'.encode('utf-8'))
+    # Hash the values as strings, so the hash does not change with the dtype a column was read with,
+    # and every missing value as None, which Parquet reads back for NaN in a column of strings
+    values_df = df.astype(object).where(df.notna(), None).astype(str)
+    digest.update(pd.util.hash_pandas_object(values_df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,235 @@
+import math
+import numpy as np
+import pyarrow.dataset as ds
+import sqlite3
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from src.create_museum_db import DATABASE_PATH, MUSEUM_TABLE_NAME
+from src.log_handler import get_logger
+from src.museum_dataset import scan_batches
+from src.stage_defaults import DEFAULT_DATASET_DIR
+
+log = get_logger()
+DEFAULT_STATS_CHUNK_SIZE = 10000
+
+# Every museum whose id % 10 is below 3 is in the test set, a fixed 30% split which needs no shuffling
+TEST_SET_MODULUS = 10
+TEST_SET_REMAINDERS = 3
+
+# The columns of the museum dataset the regression of every snapshot reads, the other columns are not read
+HISTORY_COLUMNS = ['run_date', 'id', 'population', 'visitors']
+
+READ_ID_RANGE_SQL = 'SELECT MIN(id), MAX(id) FROM museum;'
+
+READ_POPULATION_VISITORS_SQL = '''SELECT museum.id, CAST(city.population AS REAL), CAST(museum.visitors AS REAL)
+  FROM museum JOIN city ON museum.city_id = city.city_id
+  WHERE museum.id BETWEEN ? AND ? AND city.population IS NOT NULL AND museum.visitors IS NOT NULL;'''
+
+RegressionResult = namedtuple('RegressionResult', ['slope', 'intercept', 'pearson_r', 'r_squared', 'train_size',
+                                                   'test_size', 'mean_squared_error', 'root_mean_squared_error'])
+
+
+class RunningMoments:
+    '''
+    Count, means, sums of squared deviations and co-moment of two variables, updated chunk by chunk.
+
+    Each chunk's moments are computed around the chunk's own means and then merged with the pairwise
+    update of Chan et al., which stays accurate for large values like populations and visitor counts,
+    unlike sums of squares. Two RunningMoments of different parts of the data merge into the moments
+    of all of it, so parts can be computed in parallel.
+    '''
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x = 0.0
+        self.m2_y = 0.0
+        self.co_moment = 0.0
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> 'RunningMoments':
+        '''
+        Add a chunk of values.
+
+        :param x: values of the first variable
+        :param y: values of the second variable, the same length as x
+        :return: self
+        '''
+
+        if len(x) == 0:
+            return self
+
+        chunk = RunningMoments()
+        chunk.count = len(x)
+        chunk.mean_x = float(np.mean(x))
+        chunk.mean_y = float(np.mean(y))
+        dx = x - chunk.mean_x
+        dy = y - chunk.mean_y
+        chunk.m2_x = float(dx @ dx)
+        chunk.m2_y = float(dy @ dy)
+        chunk.co_moment = float(dx @ dy)
+        return self.merge(chunk)
+
+    def merge(self, other: 'RunningMoments') -> 'RunningMoments':
+        '''
+        Merge the moments of other into these moments.
+
+        :param other: moments of other values
+        :return: self
+        '''
+
+        if other.count == 0:
+            return self
+
+        count = self.count + other.count
+        delta_x = other.mean_x - self.mean_x
+        delta_y = other.mean_y - self.mean_y
+        weight = self.count * other.count / count
+
+        self.mean_x += delta_x * other.count / count
+        self.mean_y += delta_y * other.count / count
+        self.m2_x += other.m2_x + delta_x * delta_x * weight
+        self.m2_y += other.m2_y + delta_y * delta_y * weight
+        self.co_moment += other.co_moment + delta_x * delta_y * weight
+        self.count = count
+        return self
+
+    @property
+    def slope(self) -> float:
+        return self.co_moment / self.m2_x if self.m2_x > 0 else math.nan
+
+    @property
+    def intercept(self) -> float:
+        return self.mean_y - self.slope * self.mean_x
+
+    @property
+    def pearson_r(self) -> float:
+        denominator = math.sqrt(self.m2_x * self.m2_y)
+        return self.co_moment / denominator if denominator > 0 else math.nan
+
+    def sum_squared_error(self, slope: float, intercept: float) -> float:
+        '''
+        Sum of squared residuals of the line y = slope * x + intercept over the values, from the moments only.
+
+        :param slope: slope of the line
+        :param intercept: intercept of the line
+        :return: the sum of squared residuals
+        '''
+
+        mean_residual = self.mean_y - intercept - slope * self.mean_x
+        centered = self.m2_y - 2 * slope * self.co_moment + slope * slope * self.m2_x
+        return self.count * mean_residual * mean_residual + max(centered, 0.0)
+
+
+def regression_result(train: RunningMoments, test: RunningMoments) -> RegressionResult:
+    '''
+    Fit the least squares line on the training moments and measure its error on the test moments.
+
+    :param train: moments of the training set
+    :param test: moments of the test set
+    :return: the regression result
+    '''
+
+    slope, intercept = train.slope, train.intercept
+    mean_squared_error = test.sum_squared_error(slope, intercept) / test.count if test.count else math.nan
+    pearson_r = train.pearson_r
+    return RegressionResult(slope, intercept, pearson_r, pearson_r * pearson_r, train.count, test.count,
+                            mean_squared_error, math.sqrt(mean_squared_error))
+
+
+def stream_population_visitor_stats(database_path: str = DATABASE_PATH, chunk_size: int = DEFAULT_STATS_CHUNK_SIZE,
+                                    workers: int = 1) -> RegressionResult:
+    '''
+    Regress visitors on city population in one pass over the museum and city tables.
+    Rows are read in chunks of chunk_size, so memory use does not grow with the number of museums.
+    With several workers, every worker reads a range of museum ids and their moments are merged.
+
+    :param database_path: the path and database name
+    :param chunk_size: number of rows read at a time
+    :param workers: number of threads reading id ranges at the same time
+    :return: the regression result, the error metrics are measured on a fixed 30% test set
+    '''
+
+    conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        min_id, max_id = conn.execute(READ_ID_RANGE_SQL).fetchone()
+    finally:
+        conn.close()
+    if min_id is None:
+        return regression_result(RunningMoments(), RunningMoments())
+
+    bounds = np.linspace(min_id, max_id + 1, max(workers, 1) + 1).astype(np.int64)
+    id_ranges = [(int(low), int(high) - 1) for low, high in zip(bounds[:-1], bounds[1:]) if high > low]
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        parts = list(executor.map(lambda id_range: read_moments(database_path, *id_range, chunk_size), id_ranges))
+
+    train, test = RunningMoments(), RunningMoments()
+    for part_train, part_test in parts:
+        train.merge(part_train)
+        test.merge(part_test)
+
+    result = regression_result(train, test)
+    log.info(f'Streamed {train.count + test.count} museums for the population and visitors regression.')
+    return result
+
+
+def read_moments(database_path: str, first_id: int, last_id: int, chunk_size: int) -> tuple:
+    '''
+    Read the population and visitors of a range of museum ids chunk by chunk.
+
+    :param database_path: the path and database name
+    :param first_id: first museum id of the range
+    :param last_id: last museum id of the range
+    :param chunk_size: number of rows read at a time
+    :return: the moments of the training set and of the test set in the range
+    '''
+
+    train, test = RunningMoments(), RunningMoments()
+    conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(READ_POPULATION_VISITORS_SQL, (first_id, last_id))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.float64)
+            is_test = chunk[:, 0] % TEST_SET_MODULUS < TEST_SET_REMAINDERS
+            train.update(chunk[~is_test, 1], chunk[~is_test, 2])
+            test.update(chunk[is_test, 1], chunk[is_test, 2])
+    finally:
+        conn.close()
+    return train, test
+
+
+def stream_population_visitor_history(dataset_dir: str = DEFAULT_DATASET_DIR, run_dates: list = None,
+                                      countries: list = None) -> dict:
+    '''
+    Regress visitors on city population in every snapshot of the museum dataset, in one pass over it.
+    Only the id, population and visitors columns are read, batch by batch, and museums without them are
+    filtered out while scanning, so the memory use does not grow with the number of snapshots.
+
+    :param dataset_dir: directory of the datasets written by export_museum_dataset
+    :param run_dates: the run dates of the snapshots, defaults to all snapshots
+    :param countries: only regress the museums of these countries, defaults to all countries
+    :return: a dictionary of run dates, like '2024-05-31', and their regression results, oldest first
+    '''
+
+    moments = {}
+    where = ds.field('population').is_valid() & ds.field('visitors').is_valid()
+    for batch in scan_batches(MUSEUM_TABLE_NAME, dataset_dir, columns=HISTORY_COLUMNS, run_dates=run_dates,
+                              countries=countries, where=where):
+        batch_run_dates = batch.column('run_date').to_numpy(zero_copy_only=False)
+        ids = batch.column('id').to_numpy(zero_copy_only=False)
+        population = batch.column('population').to_numpy(zero_copy_only=False).astype(np.float64)
+        visitors = batch.column('visitors').to_numpy(zero_copy_only=False).astype(np.float64)
+        for run_date in np.unique(batch_run_dates):
+            in_snapshot = batch_run_dates == run_date
+            is_test = in_snapshot & (ids % TEST_SET_MODULUS < TEST_SET_REMAINDERS)
+            is_train = in_snapshot & ~is_test
+            train, test = moments.setdefault(str(run_date), (RunningMoments(), RunningMoments()))
+            train.update(population[is_train], visitors[is_train])
+            test.update(population[is_test], visitors[is_test])
+
+    log.info(f'Streamed {len(moments)} snapshots for the population and visitors regression.')
+    return {run_date: regression_result(train, test) for run_date, (train, test) in sorted(moments.items())}
@@ -0,0 +1,269 @@
+import calendar
+import html
+import re
+
+# Matches the start of the museum infobox template, its name is case insensitive and can use underscores
+INFOBOX_TEMPLATE_PATTERN = re.compile(r'\{\{\s*infobox[ _]+museum\s*(?=[|}<\n])', re.IGNORECASE)
+
+# The parameters of Template:Infobox museum and the labels of their rows in the rendered infobox,
+# so the parsed dictionary has the same keys as parse_infobox. Parameters which are not rows, like
+# the image or the map, are not in it and are skipped.
+INFOBOX_LABELS = {
+    'former_name': 'Former name',
+    'established': 'Established',
+    'dissolved': 'Dissolved',
+    'location': 'Location',
+    'type': 'Type',
+    'accreditation': 'Accreditation',
+    'key_holdings': 'Key holdings',
+    'collections': 'Collections',
+    'collection': 'Collection size',
+    'collection_size': 'Collection size',
+    'visitors': 'Visitors',
+    'founder': 'Founder',
+    'director': 'Director',
+    'president': 'President',
+    'chairperson': 'Chairperson',
+    'curator': 'Curator',
+    'architect': 'Architect',
+    'historian': 'Historian',
+    'owner': 'Owner',
+    'employees': 'Employees',
+    'publictransit': 'Public transit access',
+    'car_park': 'Nearest car park',
+    'network': 'Network',
+    'website': 'Website',
+}
+COORDINATES_PARAMETER = 'coordinates'
+
+# Templates inside values which render to nothing, like citations and the arrows next to visitor numbers
+DROPPED_TEMPLATES = {'efn', 'sfn', 'refn', 'r', 'citation needed', 'cn', 'increase', 'decrease', 'steady'}
+LIST_TEMPLATES = {'ubl', 'unbulleted list', 'plainlist', 'plain list', 'flatlist', 'hlist', 'bulleted list'}
+DATE_TEMPLATES = {'start date', 'start date and age', 'end date', 'date', 'opening date'}
+URL_TEMPLATES = {'url', 'official url', 'official website'}
+COORDINATES_TEMPLATE = 'coord'
+
+COMMENT_PATTERN = re.compile(r'<!--.*?(-->|$)', re.DOTALL)
+REF_PATTERN = re.compile(r'<ref\b[^>]*/>|<ref\b[^>]*>.*?</ref\s*>', re.DOTALL | re.IGNORECASE)
+FILE_LINK_PATTERN = re.compile(r'\[\[\s*(?:file|image):[^\[\]]*(?:\[\[[^\[\]]*\]\][^\[\]]*)*\]\]', re.IGNORECASE)
+WIKI_LINK_PATTERN = re.compile(r'\[\[([^\[\]|]*)(?:\|([^\[\]]*))?\]\]')
+EXTERNAL_LINK_PATTERN = re.compile(r'\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]')
+BREAK_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'</?[a-z][^>]*>', re.IGNORECASE)
+BULLET_PATTERN = re.compile(r'^\s*[*#]+\s*', re.MULTILINE)
+EMPHASIS_PATTERN = re.compile(r"'{2,}")
+WHITESPACE_PATTERN = re.compile(r'\s+')
+URL_SCHEME_PATTERN = re.compile(r'^(?:https?:)?//')
+
+
+def parse_infobox_wikitext(wikitext: str, coordinates: tuple = None) -> dict:
+    '''
+    Parse museum characters from the Infobox museum template in the wikitext of a museum Wikipedia page.
+
+    The values are rendered to plain text, links become their label, references and comments are dropped,
+    so the dictionary has the same keys and about the same values as parse_infobox of the rendered page.
+
+    :param wikitext: wikitext of the museum Wikipedia page
+    :param coordinates: (latitude, longitude) of the page from the MediaWiki API, used when the infobox
+        has no coordinates
+    :return: museum_data: a dictionary of museum characters, the same as parse_infobox
+    '''
+
+    start = INFOBOX_TEMPLATE_PATTERN.search(wikitext)
+    if start is None:
+        return {}
+    template = split_template(wikitext, start.start())
+    if template is None:
+        return {}
+
+    museum_data = {}
+    parts, _ = template
+    for name, value in template_parameters(parts[1:]).items():
+        name = name.lower().replace(' ', '_')
+        # Like the Coordinates row of the rendered infobox, the coordinates are at the place of their parameter
+        if name == COORDINATES_PARAMETER:
+            infobox_coordinates = parse_coordinates(value)
+            if infobox_coordinates is not None:
+                museum_data.update({'latitude': infobox_coordinates[0]})
+                museum_data.update({'longitude': infobox_coordinates[1]})
+            continue
+        if name not in INFOBOX_LABELS:
+            continue
+        text = wikitext_to_text(value).encode('ascii', 'ignore').decode()
+        if text:
+            museum_data.update({INFOBOX_LABELS[name]: text})
+
+    if coordinates is not None and 'latitude' not in museum_data:
+        museum_data.update({'latitude': str(coordinates[0])})
+        museum_data.update({'longitude': str(coordinates[1])})
+    return museum_data
+
+
+def split_template(wikitext: str, start: int) -> tuple:
+    '''
+    Split a template into its name and raw parameters, at the | which are not inside a nested template or link.
+
+    :param wikitext: the wikitext
+    :param start: index of the {{ which opens the template
+    :return: (parts, end), parts are the name and the raw parameters, end is the index after the closing }},
+        None when the template is not closed
+    '''
+
+    depth = 0
+    parts = []
+    part_start = i = start + 2
+    while i < len(wikitext):
+        pair = wikitext[i:i + 2]
+        if pair in ('{{', '[['):
+            depth += 1
+            i += 2
+        elif pair in ('}}', ']]'):
+            if depth == 0 and pair == '}}':
+                parts.append(wikitext[part_start:i])
+                return parts, i + 2
+            depth = max(depth - 1, 0)
+            i += 2
+        elif wikitext[i] == '|' and depth == 0:
+            parts.append(wikitext[part_start:i])
+            part_start = i = i + 1
+        else:
+            i += 1
+    return None
+
+
+def template_parameters(raw_parameters: list) -> dict:
+    '''
+    :param raw_parameters: the raw parameters of a template, as split by split_template
+    :return: a dictionary of the parameters, positional parameters are named by their number from 1
+    '''
+
+    parameters = {}
+    position = 0
+    for raw in raw_parameters:
+        equals = raw.find('=')
+        nested = min((index for index in (raw.find('{{'), raw.find('[['), raw.find('<')) if index >= 0),
+                     default=len(raw))
+        if 0 <= equals < nested:
+            parameters[raw[:equals].strip()] = raw[equals + 1:].strip()
+        else:
+            position += 1
+            parameters[str(position)] = raw.strip()
+    return parameters
+
+
+def positional_values(parameters: dict) -> list:
+    return [parameters[str(position)] for position in range(1, len(parameters) + 1) if str(position) in parameters]
+
+
+def wikitext_to_text(wikitext: str) -> str:
+    '''
+    Render a wikitext value to the plain text the reader sees.
+
+    :param wikitext: the wikitext of an infobox value
+    :return: the text, with whitespace collapsed
+    '''
+
+    text = REF_PATTERN.sub('', COMMENT_PATTERN.sub('', wikitext))
+    text = render_templates(text)
+    text = FILE_LINK_PATTERN.sub('', text)
+    text = WIKI_LINK_PATTERN.sub(lambda link: link.group(2) if link.group(2) is not None else link.group(1), text)
+    text = EXTERNAL_LINK_PATTERN.sub(r'\1', text)
+    text = TAG_PATTERN.sub('', BREAK_PATTERN.sub(' ', text))
+    text = EMPHASIS_PATTERN.sub('', BULLET_PATTERN.sub('', text))
+    return WHITESPACE_PATTERN.sub(' ', html.unescape(text)).strip()
+
+
+def render_templates(wikitext: str) -> str:
+    '''
+    Replace every template in the wikitext with the text it renders to.
+
+    :param wikitext: the wikitext
+    :return: the wikitext without templates
+    '''
+
+    rendered = []
+    position = 0
+    while True:
+        start = wikitext.find('{{', position)
+        if start < 0:
+            break
+        template = split_template(wikitext, start)
+        if template is None:
+            break
+        parts, end = template
+        rendered.append(wikitext[position:start])
+        rendered.append(render_template(parts[0], template_parameters(parts[1:])))
+        position = end
+    rendered.append(wikitext[position:])
+    return ''.join(rendered)
+
+
+def render_template(name: str, parameters: dict) -> str:
+    '''
+    Render the common templates of infobox values to text, other templates render to their positional values.
+
+    :param name: the template name
+    :param parameters: the template parameters, as returned by template_parameters
+    :return: the text of the template
+    '''
+
+    name = WHITESPACE_PATTERN.sub(' ', name.replace('_', ' ')).strip().lower()
+    values = positional_values(parameters)
+    if name in DROPPED_TEMPLATES or name == COORDINATES_TEMPLATE:
+        return ''
+    if name in LIST_TEMPLATES:
+        items = [item for value in values for item in BULLET_PATTERN.split(value)]
+        return ', '.join(text for text in (wikitext_to_text(item) for item in items) if text)
+    if name in DATE_TEMPLATES:
+        return format_date(values)
+    if name in URL_TEMPLATES:
+        return URL_SCHEME_PATTERN.sub('', values[0]).rstrip('/') if values else ''
+    return ' '.join(render_templates(value) for value in values)
+
+
+def format_date(values: list) -> str:
+    '''
+    :param values: year, month and day of a date template, the month and day are optional
+    :return: the date like the template renders it, like '10 August 1793'
+    '''
+
+    numbers = [value for value in values[:3] if value.isdigit()]
+    if len(numbers) == 3 and 1 <= int(numbers[1]) <= 12:
+        return f'{int(numbers[2])} {calendar.month_name[int(numbers[1])]} {numbers[0]}'
+    if len(numbers) == 2 and 1 <= int(numbers[1]) <= 12:
+        return f'{calendar.month_name[int(numbers[1])]} {numbers[0]}'
+    return ' '.join(values[:1])
+
+
+def parse_coordinates(wikitext: str) -> tuple:
+    '''
+    Parse the first coord template of a wikitext value, in decimal degrees or in degrees, minutes and seconds.
+
+    :param wikitext: the wikitext of the coordinates parameter
+    :return: (latitude, longitude) as text, decimal values are kept as they are written, like the geo tag of
+        the rendered page, None when there are no coordinates
+    '''
+
+    start = wikitext.lower().find('{{' + COORDINATES_TEMPLATE)
+    template = split_template(wikitext, start) if start >= 0 else None
+    if template is None:
+        return None
+
+    values = positional_values(template_parameters(template[0][1:]))
+    hemispheres = [i for i, value in enumerate(values) if value.upper() in ('N', 'S', 'E', 'W')]
+    try:
+        if len(hemispheres) < 2:
+            # Decimal degrees, converted only to check they are numbers
+            float(values[0]), float(values[1])
+            return values[0], values[1]
+        latitude = degrees(values[:hemispheres[0]], values[hemispheres[0]])
+        longitude = degrees(values[hemispheres[0] + 1:hemispheres[1]], values[hemispheres[1]])
+    except (IndexError, ValueError):
+        return None
+    return str(latitude), str(longitude)
+
+
+def degrees(values: list, hemisphere: str) -> float:
+    # degrees, minutes and seconds, the minutes and seconds are optional
+    value = sum(float(number) / 60 ** i for i, number in enumerate(values[:3]))
+    return round(-value if hemisphere.upper() in ('S', 'W') else value, 5)
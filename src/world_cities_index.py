@@ -0,0 +1,238 @@
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import re
+
+from src.log_handler import get_logger
+
+log = get_logger()
+WORLD_CITIES_CSV_PATH = os.path.join(os.path.dirname(__file__), '../doc/worldcities.csv')
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(__file__), '../cache/world_cities')
+INDEX_FORMAT_VERSION = 2
+MANIFEST_FILE_NAME = 'manifest.json'
+EMPTY_SLOT = -1
+
+# City names used on Wikipedia which differ from the names in the world cities csv file
+CITY_NAME_ALIASES = {
+    'New York City': 'New York',
+    'Washington, D.C.': 'Washington',
+}
+
+ARRAY_NAMES = ['population', 'lat', 'lng', 'country_code', 'name_offsets', 'name_bytes', 'name_hashes', 'slot_hashes',
+               'slot_rows']
+
+
+def normalize_city_name(name: str) -> str:
+    '''
+    Normalize a city name for lookups: typographic apostrophes replaced and whitespace collapsed.
+    Case is kept, the csv file has different cities whose names only differ in case.
+
+    :param name: a city name
+    :return: the normalized name
+    '''
+
+    return re.sub(r'\s+', ' ', name.replace('’', "'").replace('‘', "'")).strip()
+
+
+def hash_city_name(normalized_name: str) -> int:
+    # A stable 64 bit hash, Python's hash() changes between processes
+    return int.from_bytes(hashlib.blake2b(normalized_name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class WorldCitiesIndex:
+    '''
+    A compiled, memory-mapped version of the world cities csv file.
+
+    Every column is a .npy file, city names are one utf-8 blob with offsets, and an open addressing
+    hash table maps normalized city names to rows. The files are opened with mmap, so loading the
+    index does not read or copy the data, and a lookup probes a few slots of the hash table.
+    Slots only keep the 64 bit hash of the name, so aliases can point at the row of another name.
+    When a city name is used more than once, the index keeps the first row, which is the city with the
+    most population because the csv file is sorted by population. name_hashes keeps the name hash of
+    every row, homonyms included, so they can be matched by name after being found another way.
+    '''
+
+    def __init__(self, index_dir: str, countries: list) -> None:
+        '''
+        :param index_dir: directory of the compiled index
+        :param countries: country names, country_code is an index into this list
+        :return: None
+        '''
+
+        self.index_dir = index_dir
+        self.countries = np.array(countries + [np.nan], dtype=object)
+        for name in ARRAY_NAMES:
+            setattr(self, name, np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r'))
+
+    @classmethod
+    def load(cls, csv_path: str = WORLD_CITIES_CSV_PATH, index_dir: str = DEFAULT_INDEX_DIR) -> 'WorldCitiesIndex':
+        '''
+        Load the compiled index, compiling it first when it is missing or the csv file changed.
+
+        :param csv_path: path of the world cities csv file
+        :param index_dir: directory of the compiled index
+        :return: the index
+        '''
+
+        csv_hash = hash_file(csv_path)
+        manifest = read_manifest(index_dir)
+        if manifest is None or manifest['csv_sha256'] != csv_hash or manifest['version'] != INDEX_FORMAT_VERSION:
+            log.info(f'Compiling world cities index from {csv_path}...')
+            manifest = build_world_cities_index(csv_path, index_dir, csv_hash)
+        return cls(index_dir, manifest['countries'])
+
+    def __len__(self) -> int:
+        return len(self.population)
+
+    def lookup(self, name: str) -> int:
+        '''
+        Find the row of a city.
+
+        :param name: the city name
+        :return: the row, -1 if the city is not in the index
+        '''
+
+        if not isinstance(name, str):
+            return EMPTY_SLOT
+
+        normalized_name = normalize_city_name(name)
+        name_hash = hash_city_name(normalized_name)
+        mask = len(self.slot_rows) - 1
+        slot = name_hash & mask
+        while True:
+            row = int(self.slot_rows[slot])
+            if row == EMPTY_SLOT:
+                return EMPTY_SLOT
+            # A collision of two 64 bit hashes among a few ten thousands names is practically impossible
+            if int(self.slot_hashes[slot]) == name_hash:
+                return row
+            slot = (slot + 1) & mask
+
+    def lookup_many(self, names: pd.Series) -> np.ndarray:
+        '''
+        Find the rows of many cities, every distinct name is only looked up once.
+
+        :param names: a series of city names
+        :return: an array of rows, -1 for cities which are not in the index
+        '''
+
+        codes, uniques = pd.factorize(names)
+        rows = np.array([self.lookup(name) for name in uniques] + [EMPTY_SLOT], dtype=np.int64)
+        return rows[codes]
+
+    def name_hashes_of(self, names: pd.Series) -> np.ndarray:
+        '''
+        Hash many city names the same way as the name_hashes of the rows, aliases hash as the name they stand for.
+
+        :param names: a series of city names
+        :return: an array of 64 bit hashes, 0 for missing names
+        '''
+
+        codes, uniques = pd.factorize(names)
+        hashes = [hash_city_name(normalize_city_name(CITY_NAME_ALIASES.get(name, name))) for name in uniques]
+        return np.array(hashes + [0], dtype=np.uint64)[codes]
+
+    def city_name(self, row: int) -> str:
+        return bytes(self.name_bytes[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+    def country_of(self, rows: np.ndarray) -> np.ndarray:
+        # country_code -1 and row -1 both pick the NaN at the end of countries
+        codes = np.where(rows >= 0, self.country_code[rows], -1)
+        return self.countries[codes]
+
+    def population_of(self, rows: np.ndarray) -> np.ndarray:
+        return np.where(rows >= 0, self.population[rows], np.nan)
+
+
+def build_world_cities_index(csv_path: str, index_dir: str, csv_hash: str) -> dict:
+    '''
+    Compile the world cities csv file into the binary index files.
+
+    :param csv_path: path of the world cities csv file
+    :param index_dir: directory of the compiled index
+    :param csv_hash: sha256 of the csv file, saved in the manifest
+    :return: the manifest of the compiled index
+    '''
+
+    df = pd.read_csv(csv_path, usecols=['city', 'lat', 'lng', 'country', 'population'])
+    country_codes, countries = pd.factorize(df['country'])
+
+    names = [name.encode('utf-8') for name in df['city']]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    name_offsets[1:] = np.cumsum([len(name) for name in names])
+
+    # Open addressing hash table with linear probing, at most half full
+    table_size = 1 << max(int(2 * len(df) + len(CITY_NAME_ALIASES)).bit_length(), 4)
+    slot_hashes = np.zeros(table_size, dtype=np.uint64)
+    slot_rows = np.full(table_size, EMPTY_SLOT, dtype=np.int32)
+    first_rows = {}
+
+    def insert(normalized_name, row):
+        name_hash = hash_city_name(normalized_name)
+        slot = name_hash & (table_size - 1)
+        while slot_rows[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (table_size - 1)
+        slot_hashes[slot] = name_hash
+        slot_rows[slot] = row
+
+    name_hashes = np.zeros(len(df), dtype=np.uint64)
+    for row, name in enumerate(df['city']):
+        normalized_name = normalize_city_name(name)
+        name_hashes[row] = hash_city_name(normalized_name)
+        if normalized_name not in first_rows:
+            first_rows[normalized_name] = row
+            insert(normalized_name, row)
+
+    # Aliases point at the row of the name they stand for
+    for alias, name in CITY_NAME_ALIASES.items():
+        normalized_alias = normalize_city_name(alias)
+        row = first_rows.get(normalize_city_name(name))
+        if row is not None and normalized_alias not in first_rows:
+            first_rows[normalized_alias] = row
+            insert(normalized_alias, row)
+
+    arrays = {
+        'population': df['population'].to_numpy(dtype=np.float64),
+        'lat': df['lat'].to_numpy(dtype=np.float64),
+        'lng': df['lng'].to_numpy(dtype=np.float64),
+        'country_code': country_codes.astype(np.int16),
+        'name_offsets': name_offsets,
+        'name_bytes': np.frombuffer(b''.join(names), dtype=np.uint8),
+        'name_hashes': name_hashes,
+        'slot_hashes': slot_hashes,
+        'slot_rows': slot_rows,
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(index_dir, f'{name}.npy'), array)
+
+    manifest = {'version': INDEX_FORMAT_VERSION, 'csv_sha256': csv_hash, 'rows': len(df),
+                'countries': list(countries)}
+    write_manifest(index_dir, manifest)
+
+    log.info(f'Compiled {len(df)} world cities into {index_dir}.')
+    return manifest
+
+
+def hash_file(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_manifest(index_dir: str) -> dict:
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(index_dir: str, manifest: dict) -> None:
+    # The manifest is written last and atomically, an interrupted build is rebuilt on the next load
+    tmp_path = os.path.join(index_dir, f'{MANIFEST_FILE_NAME}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE_NAME))
@@ -0,0 +1,20 @@
+import numpy as np
+
+
+def make_population_visitors(count: int, noise: float = 1e6, seed: int = 0, slope: float = 0.1,
+                             offset: float = 0.0) -> tuple:
+    '''
+    Random city populations and museum visitors which grow linearly with the population.
+
+    :param count: number of museums
+    :param noise: standard deviation of the visitors around the line
+    :param seed: seed of the random numbers
+    :param slope: visitors per inhabitant
+    :param offset: added to every population, a large offset tests the numerical stability of the statistics
+    :return: arrays of the populations and visitors
+    '''
+
+    rng = np.random.default_rng(seed)
+    population = rng.uniform(1e5, 3e7, count) + offset
+    visitors = slope * population + rng.normal(0, noise, count)
+    return population, visitors
@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubWikiServer:
+    '''
+    A local stand-in for the MediaWiki API, serving pages from a dict of {title: html}.
+    '''
+
+    def __init__(self, pages: dict, delay: float = 0, failures: dict = None, revisions: dict = None,
+                 redirects: dict = None, categories: dict = None, category_page_size: int = 500,
+                 wikitexts: dict = None, coordinates: dict = None) -> None:
+        '''
+        :param pages: a dict of page title to page html
+        :param revisions: a dict of page title to revision id, pages which are not in it have revision 1
+        :param delay: seconds to sleep before answering each request
+        :param failures: a dict of page title to the number of times the request fails with a 500 error
+        :param redirects: a dict of redirect title to the title it redirects to
+        :param categories: a dict of category title, like 'Category:Museums', to the titles of its members
+        :param category_page_size: number of category members returned per request
+        :param wikitexts: a dict of page title to page wikitext, pages which are not in it have empty wikitext
+        :param coordinates: a dict of page title to its (latitude, longitude)
+        :return: None
+        '''
+
+        self.pages = pages
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.revisions = revisions if revisions is not None else {}
+        self.redirects = redirects or {}
+        self.categories = categories or {}
+        self.category_page_size = category_page_size
+        self.wikitexts = wikitexts or {}
+        self.coordinates = coordinates or {}
+        self.bytes_sent = 0
+        self.page_ids = {}
+        self.active = 0
+        self.max_active = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def count(self, action: str, title: str = None) -> int:
+        '''
+        Count the received requests of an API action, optionally only for one title.
+        '''
+
+        return sum(1 for params in self.requests if params.get('action') == action
+                   and title in (None, params.get('page'), params.get('titles')))
+
+    def page_id(self, title: str) -> int:
+        with self.lock:
+            return self.page_ids.setdefault(title, len(self.page_ids) + 1)
+
+    def query_page(self, title: str, revision_id: int, params: dict) -> dict:
+        if title in self.categories:
+            return {'pageid': self.page_id(title), 'ns': 14, 'title': title}
+        if title not in self.pages:
+            return {'title': title, 'missing': True}
+        page = {'pageid': self.page_id(title), 'ns': 0, 'title': title, 'revisions': [{'revid': revision_id}]}
+        properties = params.get('prop', '').split('|')
+        if 'content' in params.get('rvprop', '').split('|'):
+            page['revisions'][0]['slots'] = {'main': {'contentmodel': 'wikitext',
+                                                      'content': self.wikitexts.get(title, '')}}
+        if 'coordinates' in properties and title in self.coordinates:
+            latitude, longitude = self.coordinates[title]
+            page['coordinates'] = [{'lat': latitude, 'lon': longitude, 'primary': True, 'globe': 'earth'}]
+        return page
+
+    def category_members(self, params: dict) -> dict:
+        members = self.categories.get(params['cmtitle'], [])
+        start = int(params.get('cmcontinue', 0))
+        end = start + self.category_page_size
+        body = {'query': {'categorymembers': [{'pageid': self.page_id(title), 'ns': 14 if title in self.categories
+                                               else 0, 'title': title} for title in members[start:end]]}}
+        if end < len(members):
+            body['continue'] = {'cmcontinue': str(end), 'continue': '-||'}
+        return body
+
+    @property
+    def api_url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_address[1]}/w/api.php'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                with stub.lock:
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    self.answer(params)
+                finally:
+                    with stub.lock:
+                        stub.active -= 1
+
+            def answer(self, params):
+                with stub.lock:
+                    stub.requests.append(params)
+                    title = params.get('page') or params.get('titles')
+                    should_fail = stub.failures.get(title, 0) > 0
+                    if should_fail:
+                        stub.failures[title] -= 1
+
+                if stub.delay:
+                    time.sleep(stub.delay)
+
+                if should_fail:
+                    self.send_error(500)
+                    return
+
+                if params.get('action') == 'query' and params.get('list') == 'categorymembers':
+                    self._send_json(stub.category_members(params))
+                    return
+
+                titles = title.split('|') if title else []
+                redirects = [{'from': name, 'to': stub.redirects[name]} for name in titles
+                             if params.get('redirects') and name in stub.redirects]
+                targets = {redirect['from']: redirect['to'] for redirect in redirects}
+                title = targets.get(title, title)
+                revision_id = stub.revisions.get(title, 1)
+                if params.get('action') == 'query':
+                    targets_of_titles = dict.fromkeys(targets.get(name, name) for name in titles)
+                    body = {'query': {'pages': [stub.query_page(name, stub.revisions.get(name, 1), params)
+                                                for name in targets_of_titles]}}
+                    if redirects:
+                        body['query']['redirects'] = redirects
+                elif title in stub.pages:
+                    body = {'parse': {'title': title, 'pageid': stub.page_id(title), 'revid': revision_id,
+                                      'text': stub.pages[title]}}
+                else:
+                    body = {'error': {'code': 'missingtitle', 'info': "The page you specified doesn't exist."}}
+                self._send_json(body)
+
+            def _send_json(self, body):
+                data = json.dumps(body).encode('utf-8')
+                with stub.lock:
+                    stub.bytes_sent += len(data)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from benchmark.bench_suite import (BENCHMARK_STAGES, BenchmarkResult, compare_to_baseline, read_baseline,
+                                   run_benchmarks, write_baseline)
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_every_stage_runs_on_generated_data(self):
+        results = run_benchmarks(sizes=[20], repeat=1, max_fetch_pages=10)
+
+        self.assertEqual(list(BENCHMARK_STAGES), [result.stage for result in results])
+        self.assertEqual({'fetch': 10, 'fetch_wikitext': 10},
+                         {result.stage: result.rows for result in results if result.rows != 20})
+        self.assertTrue(all(result.seconds > 0 for result in results))
+
+    def test_regressions_above_the_threshold_fail(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            baseline_path = os.path.join(tmp_dir, 'baseline.json')
+            write_baseline(baseline_path, [BenchmarkResult('parse', 100, 100, 1.0, 100.0),
+                                           BenchmarkResult('clean', 100, 100, 0.001, 1e5)])
+            write_baseline(baseline_path, [BenchmarkResult('parse', 1000, 1000, 2.0, 500.0)])
+            baseline = read_baseline(baseline_path)
+
+        self.assertEqual(['clean:100', 'parse:100', 'parse:1000'], list(baseline['results']))
+        regressions = compare_to_baseline([BenchmarkResult('parse', 100, 100, 1.2, 83.0),
+                                           BenchmarkResult('parse', 1000, 1000, 2.6, 385.0),
+                                           BenchmarkResult('clean', 100, 100, 0.003, 3e4),
+                                           BenchmarkResult('sqlite_load', 100, 100, 9.0, 11.0)],
+                                          baseline, threshold=0.25)
+
+        self.assertEqual([('parse', 1000)], [(regression.stage, regression.size) for regression in regressions])
+        self.assertAlmostEqual(1.3, regressions[0].slowdown)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.city_resolver import CityResolver, chord_to_km, to_unit_vectors
+from src.world_cities_index import WorldCitiesIndex
+
+# Sorted by population like the world cities csv file
+CITIES = [
+    ('Paris', 48.8566, 2.3522, 'France', 11020000),
+    ('New York', 40.6943, -73.9249, 'United States', 18713220),
+    ('London', 51.5072, -0.1275, 'United Kingdom', 10979000),
+    ('London', 42.9836, -81.2497, 'Canada', 383822),
+    ('Versailles', 48.8053, 2.1350, 'France', 85862),
+    ('Paris', 33.6688, -95.5460, 'United States', 24782),
+]
+
+
+class TestCityResolver(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        csv_path = os.path.join(self.tmp_dir.name, 'worldcities.csv')
+        pd.DataFrame(CITIES, columns=['city', 'lat', 'lng', 'country', 'population']).to_csv(csv_path, index=False)
+        self.index = WorldCitiesIndex.load(csv_path, os.path.join(self.tmp_dir.name, 'index'))
+        self.resolver = CityResolver(self.index)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def resolve(self, names, latitudes, longitudes):
+        rows = self.resolver.resolve(pd.Series(names), pd.Series(latitudes), pd.Series(longitudes))
+        return list(zip(self.index.country_of(rows), self.index.population_of(rows)))
+
+    def test_coordinates_pick_the_homonym(self):
+        resolved = self.resolve(['Paris', 'London', 'London'], [33.66, 42.98, 51.52], [-95.55, -81.25, -0.13])
+        self.assertEqual([('United States', 24782), ('Canada', 383822), ('United Kingdom', 10979000)], resolved)
+
+    def test_name_is_the_tie_break_among_plausible_cities(self):
+        # Closer to Versailles, but Paris is also plausible and is the museum's city
+        resolved = self.resolve(['Paris', 'Versailles', 'New York City'], [48.81, 48.81, 40.78],
+                                [2.15, 2.15, -73.96])
+        self.assertEqual([('France', 11020000), ('France', 85862), ('United States', 18713220)], resolved)
+
+    def test_nearest_city_for_unknown_city_names(self):
+        self.assertEqual([('France', 85862)], self.resolve(['Le Chesnay'], [48.82], [2.12]))
+
+    def test_name_lookup_without_plausible_coordinates(self):
+        resolved = self.resolve(['Paris', 'London', 'Atlantis'], [np.nan, 0.0, 'unknown'], [np.nan, -30.0, 1.0])
+        self.assertEqual(('France', 11020000), resolved[0])
+        self.assertEqual(('United Kingdom', 10979000), resolved[1])
+        self.assertTrue(pd.isna(resolved[2][0]))
+
+        rows = self.resolver.resolve(pd.Series(['London']), None, None)
+        self.assertEqual([self.index.lookup('London')], list(rows))
+
+    def test_chord_distance_is_haversine_distance(self):
+        points = to_unit_vectors(np.array([48.8566, 51.5072]), np.array([2.3522, -0.1275]))
+        self.assertAlmostEqual(343.5, chord_to_km(np.linalg.norm(points[0] - points[1])), delta=1)
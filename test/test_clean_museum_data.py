@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.clean_museum_data import (clean_established, clean_established_column, clean_museum_character_data,
+                                   one_hot_encode_museum_types, one_hot_encoding_museum_type)
+
+TYPES = ['Art museum', 'Natural history museum', 'Science museum', 'Archaeology museum', 'Culture centre',
+         'History and Art', 'Museum of Modern ART', 'Maritime museum', np.nan]
+ESTABLISHED = ['1793', '7 June 1753; 270 years ago', 'c. 1900 (reopened 2012)', 'March 17, 1910', np.nan]
+
+
+class TestCleanMuseumData(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame({
+            'name': [f'Museum {i}' for i in range(1000)],
+            'Type': pd.Series(TYPES, dtype=object).iloc[rng.integers(0, len(TYPES), 1000)].to_numpy(),
+            'Established': pd.Series(ESTABLISHED, dtype=object).iloc[rng.integers(0, len(ESTABLISHED), 1000)]
+                .to_numpy(),
+            'Visitors': '1 million',
+        })
+
+    def test_established_column_same_as_row_function(self):
+        expected = self.df['Established'].apply(clean_established)
+        pd.testing.assert_series_equal(expected, clean_established_column(self.df['Established']))
+
+    def test_museum_types_same_as_row_function(self):
+        expected = self.df.apply(one_hot_encoding_museum_type, axis=1, result_type='expand')
+        actual = one_hot_encode_museum_types(self.df['Type'])
+        np.testing.assert_array_equal(expected.to_numpy(), actual.to_numpy())
+        self.assertTrue((actual.dtypes == np.int8).all())
+
+    def test_culture_only_for_culture_or_archaeology(self):
+        flags = one_hot_encode_museum_types(pd.Series(['Art museum', 'Archaeology museum', 'Culture centre', np.nan]))
+        self.assertEqual([0, 1, 1, 0], flags['is_culture_museum'].tolist())
+        self.assertEqual(0, one_hot_encoding_museum_type({'Type': 'Art museum'})[3])
+
+    def test_clean_museum_character_data(self):
+        df = clean_museum_character_data(self.df.copy())
+        self.assertNotIn('Type', df)
+        self.assertNotIn('Established', df)
+        self.assertIn('Visitors_rank', df)
+        self.assertEqual(['1753', '1793', '1910', '2012'], sorted(df['Established_year'].dropna().unique()))
+        self.assertEqual(np.int8, df['is_art_museum'].dtype)
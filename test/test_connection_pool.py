@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from src.connection_pool import ConnectionPool, PoolClosedError, PoolTimeoutError
+from src.create_museum_db import create_db, prepare_df_for_db_creat
+from test_create_museum_db import make_museum_all_data_df
+
+COUNT_MUSEUMS_SQL = 'SELECT COUNT(*) FROM museum;'
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp_dir.name, 'museum_analysis.db')
+        self.pool = ConnectionPool(self.database_path, max_readers=2, checkout_timeout=5)
+        self.rebuild(10)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def rebuild(self, count):
+        city_df_for_sql, museum_df_for_sql = prepare_df_for_db_creat(make_museum_all_data_df(count))
+        with self.pool.writer() as conn:
+            create_db(city_df_for_sql, museum_df_for_sql, conn=conn)
+
+    def count_museums(self):
+        with self.pool.reader() as conn:
+            return conn.execute(COUNT_MUSEUMS_SQL).fetchone()[0]
+
+    def test_readers_do_not_wait_for_the_writer(self):
+        with self.pool.writer() as conn:
+            conn.execute('DELETE FROM museum;')
+            # Another thread reads while the delete is not committed yet
+            counts = []
+            reader = threading.Thread(target=lambda: counts.append(self.count_museums()))
+            reader.start()
+            reader.join(timeout=2)
+            self.assertEqual([10], counts)
+        self.assertEqual(0, self.count_museums())
+
+    def test_readers_see_whole_rebuilds(self):
+        counts = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                counts.append(self.count_museums())
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        for count in [500, 20, 300]:
+            self.rebuild(count)
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+        self.assertTrue(set(counts) <= {10, 500, 20, 300})
+        self.assertEqual(300, self.count_museums())
+
+    def test_checkout_timeout(self):
+        with self.pool.reader(), self.pool.reader():
+            with self.assertRaises(PoolTimeoutError):
+                with self.pool.reader(timeout=0.05):
+                    pass
+        self.assertEqual(1, self.pool.metrics()['timeouts'])
+        self.assertEqual(10, self.count_museums())
+
+    def test_readers_are_read_only(self):
+        with self.pool.reader() as conn:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute('DELETE FROM museum;')
+
+    def test_broken_connections_are_replaced(self):
+        with self.pool.reader() as conn:
+            pass
+        conn.close()
+
+        self.assertEqual(10, self.count_museums())
+        metrics = self.pool.metrics()
+        self.assertEqual(1, metrics['replaced'])
+        self.assertEqual(1, metrics['idle_readers'])
+        self.assertEqual(0, metrics['readers_in_use'])
+
+    def test_closed_pool(self):
+        self.pool.close()
+        with self.assertRaises(PoolClosedError):
+            self.count_museums()
+        with self.assertRaises(PoolClosedError):
+            with self.pool.writer():
+                pass
@@ -0,0 +1,135 @@
+import os
+import re
+import tempfile
+import unittest
+
+from src.crawler import Crawler, DEFAULT_FOLLOW_PATTERN, HostPoliteness, parse_museum_list, parse_seed, TokenBucket
+from stub_wiki_server import StubWikiServer
+
+MOST_VISITED_HTML = '''<div>
+    <table class="wikitable"><tr><th>Name<a href="#cite_note-13">[13]</a></th><th>City</th><th>Visitors</th></tr>
+    <tr><td><a href="/wiki/Museum_A">Museum A</a></td><td><a href="/wiki/Paris">Paris</a></td>
+        <td>9,600,000<sup class="reference"><a href="#cite_note-1">[1]</a></sup></td></tr>
+    <tr><td><a href="/wiki/Museum_A_redirect">Museum A</a></td><td>Paris</td><td>9,600,000</td></tr>
+    <tr><td><a href="/w/index.php?title=Nowhere&amp;action=edit&amp;redlink=1">Nowhere Museum</a></td>
+        <td>Rome</td><td>1,000</td></tr>
+    <tr><td><a href="/wiki/File:Museum.jpg">Image</a> <a href="/wiki/Museum_B">Museum B</a></td><td>London</td>
+        <td>2.5 million (2019)</td></tr>
+    </table>
+    <p>See also <a href="/wiki/List_of_museums_in_France">museums in France</a> and <a href="/wiki/Paris">Paris</a>.</p>
+    </div>'''
+
+# Another layout: the museum is the second column, and the location spans two rows
+FRANCE_HTML = '''<table class="wikitable sortable"><thead><tr><th>Location</th><th>Museum</th><th colspan="2">Annual
+    visitors</th></tr></thead><tbody>
+    <tr><td rowspan="2">Lyon</td><td><a href="/wiki/Museum_C">Museum C</a></td><td>300,000</td><td>2019</td></tr>
+    <tr><td><a href="/wiki/Museum_D">Museum D</a></td><td>150,000</td><td>2018</td></tr>
+    </tbody></table>
+    <table class="navbox"><tr><th>Museums</th></tr><tr><td><a href="/wiki/Museum_Z">Museum Z</a></td></tr></table>
+    <a href="/wiki/List_of_most-visited_museums">most visited</a> <a href="/wiki/List_of_museums_in_Paris">Paris</a>'''
+
+FRENCH_EDITION_HTML = '''<table><tr><th>Nom</th><th>Ville</th><th>Visiteurs</th></tr>
+    <tr><td><a href="/wiki/Musée_X">Musée X</a></td><td>Lille</td><td>500 000</td></tr></table>'''
+
+
+def make_english_wiki() -> StubWikiServer:
+    pages = {'List_of_most-visited_museums': MOST_VISITED_HTML, 'List_of_museums_in_France': FRANCE_HTML,
+             **{f'Museum_{name}': f'<p>Museum {name}</p>' for name in 'ABCDEFZ'}}
+    return StubWikiServer(pages, redirects={'Museum_A_redirect': 'Museum_A',
+                                            'List_of_museums_in_Paris': 'List_of_museums_in_France'},
+                          categories={'Category:Art_museums': ['Museum_B', 'Museum_E',
+                                                               'Category:Art_museums_in_Spain'],
+                                      'Category:Art_museums_in_Spain': ['Museum_F', 'Museum_E']},
+                          category_page_size=2)
+
+
+class TestCrawler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmp_dir.name, 'crawl_state.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def crawl(self, english_wiki, french_wiki, max_pages=None, **options):
+        politeness = HostPoliteness(rate=0, host_rate=0)
+        with Crawler(self.state_path, politeness=politeness, backoff=0, **options) as crawler:
+            crawler.add_seeds([(english_wiki.api_url, 'List_of_most-visited_museums'),
+                               (english_wiki.api_url, 'Category:Art_museums'),
+                               (french_wiki.api_url, 'Liste_des_musées')])
+            crawler.run(max_pages=max_pages)
+            return crawler.museums_df()
+
+    def test_every_museum_is_found_once(self):
+        with make_english_wiki() as english_wiki, StubWikiServer({'Liste_des_musées': FRENCH_EDITION_HTML,
+                                                                  'Musée_X': '<p>Musée X</p>'}) as french_wiki:
+            museums_df = self.crawl(english_wiki, french_wiki)
+
+            self.assertEqual(1, english_wiki.count('parse', 'List_of_most-visited_museums'))
+            self.assertEqual(1, english_wiki.count('parse', 'List_of_museums_in_France'))
+
+        museums = museums_df.set_index('wiki_link')
+        self.assertEqual(sorted(['Musée_X'] + [f'Museum_{name}' for name in 'ABCDEF']), sorted(museums.index))
+        self.assertEqual(('Museum A', 'Paris', 9600000), tuple(museums.loc['Museum_A', ['name', 'city', 'visitors']]))
+        self.assertEqual(('London', 2500000), tuple(museums.loc['Museum_B', ['city', 'visitors']]))
+        self.assertEqual(['Lyon', 'Lyon'], list(museums.loc[['Museum_C', 'Museum_D'], 'city']))
+        self.assertEqual([300000, 150000], list(museums.loc[['Museum_C', 'Museum_D'], 'visitors']))
+        self.assertEqual('Category:Art_museums_in_Spain', museums.loc['Museum_F', 'source'])
+        self.assertEqual(('Lille', 500000), tuple(museums.loc['Musée_X', ['city', 'visitors']]))
+        self.assertNotEqual(museums.loc['Musée_X', 'api_url'], museums.loc['Museum_A', 'api_url'])
+
+    def test_stopped_crawl_resumes_without_crawling_pages_again(self):
+        with make_english_wiki() as english_wiki, StubWikiServer({'Liste_des_musées': FRENCH_EDITION_HTML,
+                                                                  'Musée_X': '<p>Musée X</p>'}) as french_wiki:
+            partial_df = self.crawl(english_wiki, french_wiki, max_pages=1, workers=1)
+            resumed_df = self.crawl(english_wiki, french_wiki, workers=1)
+
+            self.assertEqual(1, english_wiki.count('parse', 'List_of_most-visited_museums'))
+            self.assertEqual(1, english_wiki.count('parse', 'List_of_museums_in_France'))
+
+        self.assertEqual(['Museum_A', 'Museum_B'], sorted(partial_df['wiki_link']))
+        self.assertEqual(7, len(resumed_df))
+
+    def test_max_depth_limits_the_followed_pages(self):
+        with make_english_wiki() as english_wiki, StubWikiServer({}) as french_wiki:
+            museums_df = self.crawl(english_wiki, french_wiki, max_depth=0)
+
+        self.assertEqual(['Museum_A', 'Museum_B', 'Museum_E'], sorted(museums_df['wiki_link']))
+
+    def test_requests_to_a_host_are_limited(self):
+        with make_english_wiki() as english_wiki:
+            english_wiki.delay = 0.02
+            politeness = HostPoliteness(rate=0, host_rate=0, host_concurrency=1)
+            with Crawler(self.state_path, workers=4, politeness=politeness) as crawler:
+                crawler.add_seeds([(english_wiki.api_url, 'List_of_most-visited_museums'),
+                                   (english_wiki.api_url, 'Category:Art_museums')])
+                crawler.run()
+
+            self.assertEqual(1, english_wiki.max_active)
+
+    def test_token_bucket_spreads_bursts(self):
+        now = [0.0]
+        slept = []
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=slept.append)
+
+        self.assertEqual([0.0, 0.0, 0.5, 1.0], [bucket.acquire() for _ in range(4)])
+        self.assertEqual([0.5, 1.0], slept)
+        now[0] = 10.0
+        self.assertEqual(0.0, bucket.reserve())
+
+    def test_list_columns_are_found_by_their_headers(self):
+        rows, list_titles = parse_museum_list(FRANCE_HTML, re.compile(DEFAULT_FOLLOW_PATTERN, re.IGNORECASE))
+
+        self.assertEqual([('Museum_C', 'Museum C', 'Lyon', 300000), ('Museum_D', 'Museum D', 'Lyon', 150000)],
+                         [(row['title'], row['name'], row['city'], row['visitors']) for row in rows])
+        self.assertEqual(['List_of_most-visited_museums', 'List_of_museums_in_Paris'], list_titles)
+
+    def test_seeds_are_page_names_or_urls(self):
+        self.assertEqual(('https://fr.wikipedia.org/w/api.php', 'Liste_des_musées_de_Paris'),
+                         parse_seed('https://fr.wikipedia.org/wiki/Liste_des_mus%C3%A9es_de_Paris'))
+        self.assertEqual(('http://localhost/w/api.php', 'Category:Art_museums'),
+                         parse_seed('Category:Art museums', api_url='http://localhost/w/api.php'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.create_museum_db import create_db, prepare_df_for_db_creat, read_database_generation, read_museum_data_from_db
+
+
+def make_museum_all_data_df(count: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'name': [f'Museum {i}' for i in range(count)],
+        'city': [['Paris', 'London', 'Rome'][i % 3] for i in range(count)],
+        'country': [['France', 'United Kingdom', 'Italy'][i % 3] for i in range(count)],
+        'population': [[11020000.0, 10979000.0, np.nan][i % 3] for i in range(count)],
+        'visitors': [1000 * (i + 1) for i in range(count)],
+        'wiki_link': [f'Museum_{i}' if i % 4 else None for i in range(count)],
+        'Established_year': ['1793' if i % 2 else np.nan for i in range(count)],
+        'is_art_museum': np.array([i % 2 for i in range(count)], dtype=np.int8),
+        'revision_id': [7] * count,
+    })
+
+
+class TestCreateMuseumDb(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp_dir.name, 'museum_analysis.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_db(self, count):
+        city_df_for_sql, museum_df_for_sql = prepare_df_for_db_creat(make_museum_all_data_df(count))
+        create_db(city_df_for_sql, museum_df_for_sql, self.database_path)
+
+    def test_declared_schema_is_kept(self):
+        self.create_db(10)
+
+        with sqlite3.connect(self.database_path) as conn:
+            museum_columns = {row[1]: (row[2], row[5]) for row in conn.execute('PRAGMA table_info(museum)')}
+            city_columns = {row[1]: (row[2], row[5]) for row in conn.execute('PRAGMA table_info(city)')}
+            foreign_keys = [(row[2], row[3], row[4]) for row in conn.execute('PRAGMA foreign_key_list(museum)')]
+            indexes = {row[1]: row[2] for row in conn.execute('PRAGMA index_list(museum)')}
+
+        self.assertEqual(('INTEGER', 1), museum_columns['id'])
+        self.assertEqual(('TEXT', 0), museum_columns['established_year'])
+        self.assertEqual(('INTEGER', 1), city_columns['city_id'])
+        self.assertEqual([('city', 'city_id', 'city_id')], foreign_keys)
+        self.assertEqual(0, indexes['museum_city_id_index'])
+        self.assertEqual(0, indexes['museum_visitors_index'])
+        self.assertEqual(0, indexes['museum_is_art_museum_index'])
+        self.assertIn(1, indexes.values())
+
+    def test_rows_are_loaded_and_replaced(self):
+        self.create_db(10)
+        self.create_db(6)
+
+        museum_data_df = read_museum_data_from_db(self.database_path)
+        self.assertEqual(list(range(1, 7)), list(museum_data_df['id']))
+        self.assertEqual(['Paris', 'London', 'Rome'] * 2, list(museum_data_df['city']))
+        self.assertEqual([pd.NA, 1793] * 3, list(museum_data_df['established_year']))
+        self.assertEqual('Int16', str(museum_data_df['established_year'].dtype))
+        self.assertEqual([0, 1] * 3, list(museum_data_df['is_art_museum']))
+        self.assertTrue(museum_data_df['population'].isna().equals(pd.Series([False, False, True] * 2)))
+        self.assertEqual(['Museum 0', 'Museum_1'], list(museum_data_df['museum_key'][:2]))
+
+    def test_failed_load_keeps_the_previous_tables(self):
+        self.create_db(10)
+
+        city_df_for_sql, museum_df_for_sql = prepare_df_for_db_creat(make_museum_all_data_df(6))
+        museum_df_for_sql['museum_key'] = 'Duplicate'
+        with sqlite3.connect(self.database_path) as conn:
+            generation = read_database_generation(conn)
+        with self.assertRaises(sqlite3.IntegrityError):
+            create_db(city_df_for_sql, museum_df_for_sql, self.database_path)
+
+        museum_data_df = read_museum_data_from_db(self.database_path)
+        self.assertEqual(list(range(1, 11)), list(museum_data_df['id']))
+        with sqlite3.connect(self.database_path) as conn:
+            self.assertEqual(3, conn.execute('SELECT COUNT(*) FROM city').fetchone()[0])
+            self.assertEqual(generation, read_database_generation(conn))
+
+    def test_cities_with_the_same_name_are_different_cities(self):
+        museum_all_data_df = make_museum_all_data_df(4)
+        museum_all_data_df['city'] = 'Cambridge'
+        museum_all_data_df['country'] = ['United Kingdom', 'United States', 'United Kingdom', 'United States']
+        museum_all_data_df['population'] = [145674.0, 118403.0, 145674.0, 118403.0]
+        city_df_for_sql, museum_df_for_sql = prepare_df_for_db_creat(museum_all_data_df)
+        create_db(city_df_for_sql, museum_df_for_sql, self.database_path)
+
+        museum_data_df = read_museum_data_from_db(self.database_path)
+        self.assertEqual([1, 2, 1, 2], list(museum_data_df['city_id']))
+        self.assertEqual(list(museum_all_data_df['country']), list(museum_data_df['country']))
+        self.assertEqual(list(museum_all_data_df['population']), list(museum_data_df['population']))
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from population_visitors import make_population_visitors
+from sklearn.linear_model import Ridge
+from src.correlate_pop_visitor import cross_validate_population_visitors
+from src.cross_validation import cross_validate
+
+SCORE_NAMES = ['repeat', 'fold', 'train_size', 'test_size', 'mean_absolute_error', 'mean_squared_error',
+               'root_mean_squared_error']
+
+
+def scores(result):
+    return [tuple(getattr(fold, name) for name in SCORE_NAMES) for fold in result.folds]
+
+
+class TestCrossValidation(unittest.TestCase):
+    def test_repeated_folds(self):
+        population, visitors = make_population_visitors(53)
+        result = cross_validate(population, visitors, folds=5, repeats=3, seed=1)
+
+        self.assertEqual(15, len(result.folds))
+        self.assertEqual([(repeat, fold) for repeat in range(3) for fold in range(5)],
+                         [(fold.repeat, fold.fold) for fold in result.folds])
+        for repeat in range(3):
+            self.assertEqual(53, sum(fold.test_size for fold in result.folds if fold.repeat == repeat))
+        self.assertTrue(all(fold.train_size + fold.test_size == 53 for fold in result.folds))
+
+        self.assertAlmostEqual(np.mean([fold.mean_squared_error for fold in result.folds]),
+                               result.mean['mean_squared_error'])
+        self.assertAlmostEqual(np.std([fold.mean_absolute_error for fold in result.folds], ddof=1),
+                               result.std['mean_absolute_error'])
+        self.assertGreater(result.mean['fit_seconds'], 0)
+
+        self.assertEqual(scores(result), scores(cross_validate(population, visitors, folds=5, repeats=3, seed=1)))
+        self.assertNotEqual(scores(result), scores(cross_validate(population, visitors, folds=5, repeats=3, seed=2)))
+
+    def test_worker_processes_give_the_same_scores(self):
+        population, visitors = make_population_visitors(40)
+        x = np.column_stack([population, np.sqrt(population)])
+        expected = cross_validate(x, visitors, Ridge(alpha=0.5), folds=4, repeats=2)
+
+        self.assertEqual(scores(expected), scores(cross_validate(x, visitors, Ridge(alpha=0.5), folds=4, repeats=2,
+                                                                 workers=2)))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            x_path = os.path.join(tmp_dir, 'x.npy')
+            np.save(x_path, x)
+            self.assertEqual(scores(expected), scores(cross_validate(x, visitors, Ridge(alpha=0.5), folds=4,
+                                                                     repeats=2, workers=2, x_path=x_path)))
+
+    def test_museums_without_population_are_left_out(self):
+        population, visitors = make_population_visitors(30)
+        df = pd.DataFrame({'population': np.append(population, np.nan), 'visitors': np.append(visitors, 5)})
+        result = cross_validate_population_visitors(df, folds=3, repeats=2)
+        self.assertEqual(scores(cross_validate(population, visitors, folds=3, repeats=2)), scores(result))
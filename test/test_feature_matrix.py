@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from src import feature_matrix
+from src.correlate_pop_visitor import DEFAULT_VISITOR_MODELS, model_visitors_with_features
+from src.feature_matrix import FEATURE_COLUMNS, load_or_build_design_matrix
+
+
+def make_museum_all_data_df(count: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'name': [f'Museum {i}' for i in range(count)],
+        'visitors': rng.integers(1000, 10 ** 7, count),
+        'population': rng.uniform(1e5, 3e7, count),
+        'latitude': [f'{40 + i / 100}' for i in range(count)],
+        'longitude': [f'{-i / 100}' if i % 5 else np.nan for i in range(count)],
+        'Established_year': [str(1800 + i) if i % 3 else np.nan for i in range(count)],
+        'is_art_museum': np.array([i % 2 for i in range(count)], dtype=np.int8),
+        'is_history_museum': np.int8(0), 'is_natural_museum': np.int8(1), 'is_culture_museum': np.int8(0),
+        'is_science_museum': np.int8(0),
+    })
+
+
+class TestFeatureMatrix(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_design_matrix(self):
+        df = make_museum_all_data_df(30)
+        df.loc[4, 'visitors'] = np.nan
+        design = load_or_build_design_matrix(df, self.cache_dir)
+
+        self.assertEqual(list(FEATURE_COLUMNS), design.feature_names)
+        self.assertEqual((29, len(FEATURE_COLUMNS)), design.x.shape)
+        self.assertEqual(np.float32, design.x.dtype)
+        self.assertTrue(design.x.flags['C_CONTIGUOUS'])
+        self.assertIsInstance(design.x, np.memmap)
+
+        kept = df.drop(index=4).reset_index(drop=True)
+        np.testing.assert_array_equal(kept['visitors'].to_numpy(dtype=float), design.y)
+        latitude = design.x[:, design.feature_names.index('latitude')]
+        np.testing.assert_allclose(kept['latitude'].astype(float), latitude, rtol=1e-6)
+
+        # Missing years are filled with the median year
+        years = design.x[:, design.feature_names.index('established_year')]
+        median_year = pd.to_numeric(kept['Established_year']).median()
+        self.assertEqual(1801, years[1])
+        self.assertEqual(np.float32(median_year), years[0])
+
+    def test_cached_by_input_hash(self):
+        df = make_museum_all_data_df(30)
+        design = load_or_build_design_matrix(df, self.cache_dir)
+
+        with patch.object(feature_matrix, 'build_design_matrix', wraps=feature_matrix.build_design_matrix) as build:
+            # The museum table names the columns in lower case
+            db_df = df.rename(columns={'Established_year': 'established_year'})
+            self.assertEqual(design.x_path, load_or_build_design_matrix(db_df, self.cache_dir).x_path)
+            self.assertEqual(0, build.call_count)
+
+            df.loc[3, 'Established_year'] = '1900'
+            changed = load_or_build_design_matrix(df, self.cache_dir)
+            self.assertEqual(1, build.call_count)
+        self.assertNotEqual(design.input_hash, changed.input_hash)
+        self.assertEqual(1900, changed.x[3, changed.feature_names.index('established_year')])
+        self.assertEqual(6, len(os.listdir(self.cache_dir)))
+
+    def test_models_share_one_matrix(self):
+        results = model_visitors_with_features(make_museum_all_data_df(40), folds=4, repeats=2,
+                                               cache_dir=self.cache_dir)
+        self.assertEqual(list(DEFAULT_VISITOR_MODELS), list(results))
+        self.assertTrue(all(len(result.folds) == 8 for result in results.values()))
+        self.assertEqual(3, len(os.listdir(self.cache_dir)))
@@ -0,0 +1,78 @@
+import unittest
+
+from benchmark.generators import make_museum_list_html
+from src.fetch_museum_data import (create_museum_dataframe, fetch_all_museum_details, fetch_all_revision_ids,
+                                   MOST_VISITED_MUSEUMS_PAGE_NAME)
+from src.page_source import MediaWikiPageSource, PageSource
+from stub_wiki_server import StubWikiServer
+
+
+def make_infobox_html(name: str, established: str, lat: str, lon: str) -> str:
+    return f'''<div><table class="infobox vcard"><tbody>
+        <tr><th colspan="2">{name}</th></tr>
+        <tr><th>Established</th><td>{established}</td></tr>
+        <tr><th>Coordinates</th><td><span class="geo">{lat}; {lon}</span></td></tr>
+        <tr><th>Type</th><td>Art museum</td></tr>
+        </tbody></table><p>{name} is a museum.</p></div>'''
+
+
+class TestFetchMuseumData(unittest.TestCase):
+    def setUp(self):
+        self.titles = [f'Museum_{i}' for i in range(12)]
+        self.pages = {title: make_infobox_html(title, f'19{i:02d}', f'{i}.5', f'-{i}.25')
+                      for i, title in enumerate(self.titles)}
+
+    def test_concurrent_fetch_keeps_order(self):
+        with StubWikiServer(self.pages, delay=0.05) as server:
+            details = fetch_all_museum_details(self.titles + [None], MediaWikiPageSource(server.api_url),
+                                               max_workers=6, timeout=5)
+
+        self.assertEqual(13, len(details))
+        self.assertEqual({}, details[-1])
+        for i, detail in enumerate(details[:-1]):
+            self.assertEqual(f'19{i:02d}', detail['Established'])
+            self.assertEqual(f'{i}.5', detail['latitude'])
+            self.assertEqual(f'-{i}.25', detail['longitude'])
+
+    def test_fetch_retries_failed_requests(self):
+        with StubWikiServer(self.pages, failures={'Museum_3': 2}) as server:
+            details = fetch_all_museum_details(self.titles, MediaWikiPageSource(server.api_url),
+                                               max_workers=4, timeout=5, retries=2, backoff=0.01)
+
+        self.assertEqual('1903', details[3]['Established'])
+
+    def test_fetch_gives_up_after_retries(self):
+        with StubWikiServer(self.pages, failures={'Museum_3': 5}) as server:
+            details = fetch_all_museum_details(self.titles, MediaWikiPageSource(server.api_url),
+                                               max_workers=4, timeout=5, retries=1, backoff=0.01)
+
+        self.assertEqual({}, details[3])
+        self.assertEqual('1904', details[4]['Established'])
+
+    def test_revision_ids_are_fetched_in_batches(self):
+        titles = [f'Museum_{i}' for i in range(120)]
+        pages = {title: '' for title in titles[:-1]}
+        links = titles + [None, 'Museum_0']
+        with StubWikiServer(pages, revisions={'Museum_7': 3}) as server:
+            page_source = MediaWikiPageSource(server.api_url)
+            revision_ids = fetch_all_revision_ids(links, page_source, max_workers=2, timeout=5)
+            self.assertEqual(3, server.count('query'))
+
+            # A page source which cannot batch fetches every revision id on its own
+            single_source = PageSource()
+            single_source.fetch_revision_id = page_source.fetch_revision_id
+            self.assertEqual(revision_ids, fetch_all_revision_ids(links, single_source, max_workers=2, timeout=5))
+            self.assertEqual(3 + 120, server.count('query'))
+
+        self.assertEqual([1] * 7 + [3] + [1] * 111 + [None, None, 1], revision_ids)
+
+    def test_create_museum_dataframe_aligns_rows(self):
+        list_html = make_museum_list_html(self.titles, [f'City {i}' for i in range(12)],
+                                          [f'{i} million' for i in range(12)])
+        pages = dict(self.pages, **{MOST_VISITED_MUSEUMS_PAGE_NAME: list_html})
+        with StubWikiServer(pages, delay=0.01) as server:
+            df = create_museum_dataframe(MediaWikiPageSource(server.api_url), max_workers=5, timeout=5)
+
+        self.assertEqual(self.titles, list(df['wiki_link']))
+        self.assertEqual([title.replace('_', ' ') for title in self.titles], list(df['name']))
+        self.assertEqual([f'19{i:02d}' for i in range(12)], list(df['Established']))
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import unittest
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+# Starting a run of the stages which do not fetch must stay within this many seconds of imports.
+# pandas takes about a third of it, scikit-learn alone would take more than all of it.
+IMPORT_TIME_BUDGET_SECONDS = 1.0
+
+# The dependencies of the stages which the startup must not import
+STAGE_ONLY_MODULES = ['sklearn', 'scipy', 'bs4', 'lxml', 'wikipedia', 'src.fetch_museum_data', 'src.museum_pipeline',
+                      'src.correlate_pop_visitor', 'src.incremental_refresh', 'pyarrow.dataset', 'src.museum_dataset']
+
+STARTUP_CODE = '''
+import main
+args = main.parse_args({argv!r})
+main.StageRunner(main.build_stages(args, None), selected=args.stages)
+'''
+
+
+def import_times(argv: list) -> dict:
+    '''
+    Start main with argv, up to building its stages, under python -X importtime.
+
+    :param argv: command line arguments of main
+    :return: a dictionary of the imported module names and their cumulative import time in seconds,
+        with the total of the top-level imports as 'total'
+    '''
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE.format(argv=argv)],
+                             cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    times = {'total': 0.0}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        seconds = int(cumulative) / 1e6
+        times[name.strip()] = seconds
+        # Nested imports are indented by two spaces for every level
+        if not name[1:].startswith(' '):
+            times['total'] += seconds
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def assert_startup_within_budget(self, argv: list):
+        times = import_times(argv)
+
+        self.assertIn('main', times)
+        self.assertEqual([], [name for name in STAGE_ONLY_MODULES if name in times])
+        self.assertLess(times['total'], IMPORT_TIME_BUDGET_SECONDS,
+                        f'{times["total"]:.3f}s of imports, the slowest: '
+                        f'{sorted(times.items(), key=lambda item: -item[1])[1:6]}')
+
+    def test_db_only_command_starts_within_budget(self):
+        self.assert_startup_within_budget(['--stage', 'build_db'])
+
+    def test_correlation_only_command_starts_within_budget(self):
+        self.assert_startup_within_budget(['--stage', 'correlate', '--cv', '--multi-feature'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from benchmark.generators import make_museum_list_html
+from src.create_museum_db import build_museum_db, read_database_generation
+from src.fetch_museum_data import MOST_VISITED_MUSEUMS_PAGE_NAME
+from src.incremental_refresh import read_stored_museum_state, refresh_museum_db, update_museum_db
+from src.page_cache import CachedPageSource
+from src.page_source import MediaWikiPageSource
+from stub_wiki_server import StubWikiServer
+from test_create_museum_db import make_museum_all_data_df
+from unittest import mock
+
+
+def make_museum_html(established: str, museum_type: str) -> str:
+    return f'''<table class="infobox vcard"><tbody>
+        <tr><th>Established</th><td>{established}</td></tr>
+        <tr><th>Type</th><td>{museum_type}</td></tr>
+        <tr><th>Coordinates</th><td><span class="geo">48.86; 2.33</span></td></tr>
+        </tbody></table>'''
+
+
+class TestIncrementalRefresh(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp_dir.name, 'museum_analysis.db')
+        self.museums = [('Louvre', 'Paris', '9,600,000'), ('British_Museum', 'London', '6,239,983'),
+                        ('Tate_Modern', 'London', '6,098,340')]
+        self.revisions = {}
+        self.pages = {title: make_museum_html('1793', 'Art museum') for title, _, _ in self.museums}
+        self.pages[MOST_VISITED_MUSEUMS_PAGE_NAME] = make_museum_list_html(*zip(*self.museums))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def refresh(self, cached: bool = False):
+        with StubWikiServer(self.pages, revisions=self.revisions) as server:
+            page_source = MediaWikiPageSource(server.api_url)
+            if cached:
+                page_source = CachedPageSource(page_source, cache_dir=os.path.join(self.tmp_dir.name, 'pages'))
+            refresh_museum_db(page_source, self.database_path)
+            if cached:
+                page_source.close()
+        return server
+
+    def read_museums(self):
+        with sqlite3.connect(self.database_path) as conn:
+            return {key: (museum_id, revision_id, year) for museum_id, key, revision_id, year in conn.execute(
+                'SELECT id, museum_key, revision_id, established_year FROM museum')}
+
+    def test_unchanged_refresh_only_checks_revisions(self):
+        self.refresh()
+        server = self.refresh()
+
+        self.assertEqual(0, sum(server.count('parse', title) for title, _, _ in self.museums))
+        # The revision ids of all museums are checked in one request
+        self.assertEqual(1, server.count('query'))
+
+    def test_changed_pages_are_upserted_with_stable_ids(self):
+        self.refresh()
+        before = self.read_museums()
+
+        self.revisions['Tate_Modern'] = 2
+        self.pages['Tate_Modern'] = make_museum_html('2000', 'Modern art museum')
+        server = self.refresh()
+        after = self.read_museums()
+
+        self.assertEqual(1, server.count('parse', 'Tate_Modern'))
+        self.assertEqual(0, server.count('parse', 'Louvre'))
+        self.assertEqual(before['Louvre'], after['Louvre'])
+        self.assertEqual((before['Tate_Modern'][0], 2, '2000'), after['Tate_Modern'])
+
+    def test_changed_pages_are_not_served_from_the_page_cache(self):
+        self.refresh(cached=True)
+        before = self.read_museums()
+
+        # The cached revision is younger than the cache TTL, but it is not the revision the refresh found
+        self.revisions['Tate_Modern'] = 2
+        self.pages['Tate_Modern'] = make_museum_html('2000', 'Modern art museum')
+        server = self.refresh(cached=True)
+        self.assertEqual(1, server.count('parse', 'Tate_Modern'))
+        self.assertEqual((before['Tate_Modern'][0], 2, '2000'), self.read_museums()['Tate_Modern'])
+
+        # The page cache now holds the new revision
+        server = self.refresh(cached=True)
+        self.assertEqual(0, server.count('parse', 'Tate_Modern'))
+        self.assertEqual((before['Tate_Modern'][0], 2, '2000'), self.read_museums()['Tate_Modern'])
+
+    def test_museums_whose_page_failed_keep_their_stored_rows(self):
+        self.refresh()
+        before = self.read_museums()
+
+        self.revisions['Tate_Modern'] = 2
+        self.revisions['Louvre'] = 2
+        self.pages['Tate_Modern'] = make_museum_html('2000', 'Modern art museum')
+        with StubWikiServer(self.pages, revisions=self.revisions, failures={'Tate_Modern': 10}) as server:
+            refresh_museum_db(MediaWikiPageSource(server.api_url), self.database_path, retries=0)
+        after = self.read_museums()
+
+        self.assertEqual(before['Tate_Modern'], after['Tate_Modern'])
+        self.assertEqual((before['Louvre'][0], 2, '1793'), after['Louvre'])
+
+        # The next refresh still sees the new revision
+        self.refresh()
+        self.assertEqual((before['Tate_Modern'][0], 2, '2000'), self.read_museums()['Tate_Modern'])
+
+    def test_new_and_removed_museums(self):
+        self.refresh()
+        before = self.read_museums()
+
+        self.museums = self.museums[1:] + [('Rijksmuseum', 'Amsterdam', '2,700,000')]
+        self.pages['Rijksmuseum'] = make_museum_html('1800', 'Art museum')
+        self.pages[MOST_VISITED_MUSEUMS_PAGE_NAME] = make_museum_list_html(*zip(*self.museums))
+        server = self.refresh()
+        after = self.read_museums()
+
+        self.assertEqual(1, server.count('parse', 'Rijksmuseum'))
+        self.assertEqual(0, server.count('parse', 'British_Museum'))
+        self.assertNotIn('Louvre', after)
+        self.assertEqual(before['British_Museum'], after['British_Museum'])
+        self.assertEqual(max(museum_id for museum_id, _, _ in before.values()) + 1, after['Rijksmuseum'][0])
+        with sqlite3.connect(self.database_path) as conn:
+            population = conn.execute('''SELECT population FROM museum JOIN city USING (city_id)
+                WHERE museum_key = 'Rijksmuseum' ''').fetchone()[0]
+        self.assertGreater(population, 0)
+
+        # The R*Tree of the coordinates follows the deleted and the new museums
+        with sqlite3.connect(self.database_path) as conn:
+            located = {museum_id for museum_id, in conn.execute('SELECT id FROM museum_location')}
+        self.assertEqual({museum_id for museum_id, _, _ in after.values()}, located)
+
+    def test_failed_refresh_changes_nothing(self):
+        self.refresh()
+        before = self.read_museums()
+        with sqlite3.connect(self.database_path) as conn:
+            cities = conn.execute('SELECT COUNT(*) FROM city').fetchone()[0]
+            generation = read_database_generation(conn)
+
+        self.museums = self.museums[1:] + [('Rijksmuseum', 'Amsterdam', '2,700,000')]
+        self.pages['Rijksmuseum'] = make_museum_html('1800', 'Art museum')
+        self.pages[MOST_VISITED_MUSEUMS_PAGE_NAME] = make_museum_list_html(*zip(*self.museums))
+        # The new museum and its city are written before the removed museum is deleted
+        with mock.patch('src.incremental_refresh.delete_museums', side_effect=sqlite3.OperationalError('disk I/O')):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.refresh()
+
+        self.assertEqual(before, self.read_museums())
+        with sqlite3.connect(self.database_path) as conn:
+            self.assertEqual(cities, conn.execute('SELECT COUNT(*) FROM city').fetchone()[0])
+            self.assertEqual(generation, read_database_generation(conn))
+
+    def test_cities_with_the_same_name_in_one_country_stay_apart(self):
+        museum_all_data_df = make_museum_all_data_df(2).assign(city='Springfield', country='United States',
+                                                               population=[167882.0, 116250.0])
+        build_museum_db(museum_all_data_df, self.database_path)
+
+        changed_df = museum_all_data_df.iloc[[1]].assign(visitors=5000)
+        update_museum_db(changed_df, set(), read_stored_museum_state(self.database_path), self.database_path)
+
+        with sqlite3.connect(self.database_path) as conn:
+            self.assertEqual([(1, 1, 167882), (2, 2, 116250)], conn.execute(
+                'SELECT museum.id, city.city_id, city.population FROM museum JOIN city USING (city_id) '
+                'ORDER BY museum.id').fetchall())
+            self.assertEqual(5000, conn.execute('SELECT visitors FROM museum WHERE id = 2').fetchone()[0])
@@ -0,0 +1,43 @@
+import glob
+import os
+import unittest
+
+from src.infobox_parser import cut_infobox_html, parse_infobox, parse_infobox_with_soup
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class TestInfoboxParser(unittest.TestCase):
+    def test_same_output_as_soup_on_fixtures(self):
+        fixture_files = sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+        self.assertGreater(len(fixture_files), 0)
+        for fixture_file in fixture_files:
+            with open(fixture_file, encoding='utf-8') as f:
+                html = f.read()
+            with self.subTest(fixture=os.path.basename(fixture_file)):
+                museum_data = parse_infobox(html)
+                self.assertEqual(parse_infobox_with_soup(html), museum_data)
+                self.assertIn('latitude', museum_data)
+                self.assertIn('longitude', museum_data)
+
+    def test_coordinates_are_split(self):
+        html = '''<table class="infobox vcard"><tr><th>Coordinates</th><td><style>.geo{}</style>
+            <span class="geo-dec">1; 2</span><span class="geo">48.86; 2.33</span></td></tr></table>'''
+        self.assertEqual({'latitude': '48.86', 'longitude': '2.33'}, parse_infobox(html))
+
+    def test_page_without_infobox(self):
+        html = '<p>No infobox</p><table class="infobox"><tr><th>Type</th><td>Art</td></tr></table>'
+        self.assertEqual({}, parse_infobox(html))
+        self.assertEqual(parse_infobox_with_soup(html), parse_infobox(html))
+
+    def test_nested_tables_are_cut_with_the_infobox(self):
+        html = '''<table id="before"></table><table style="x" class='infobox vcard'><tr><th>A</th><td>
+            <table><tr><td>x</td></tr></table></td></tr><tr><th>B</th><td>b</td></tr></table><table></table>'''
+        self.assertTrue(cut_infobox_html(html).endswith('<td>b</td></tr></table>'))
+        self.assertEqual({'A': '\nx', 'B': 'b'}, parse_infobox(html))
+        self.assertEqual(parse_infobox_with_soup(html), parse_infobox(html))
+
+    def test_unclosed_infobox_falls_back_to_full_parse(self):
+        html = '<div><table class="infobox vcard"><tr><th>Type</th><td>Art museum</td></tr></div>'
+        self.assertIsNone(cut_infobox_html(html))
+        self.assertEqual({'Type': 'Art museum'}, parse_infobox(html))
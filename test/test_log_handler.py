@@ -0,0 +1,98 @@
+import io
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+from src import log_handler
+from src.log_handler import configure_logging, configure_worker_logging, get_logger, worker_logging_args
+
+
+def log_in_worker(number: int) -> int:
+    logging.getLogger().warning('Worker record %d', number)
+    return number
+
+
+class FormatCounter:
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return 'formatted'
+
+
+class TestLogHandler(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        configure_logging()
+
+    def written_lines(self) -> list:
+        log_handler.stop_listener()
+        return self.stream.getvalue().splitlines()
+
+    def test_get_logger_configures_once(self):
+        log = configure_logging(stream=self.stream)
+        handlers = list(log.handlers)
+
+        self.assertIs(log, get_logger())
+        self.assertEqual(handlers, get_logger().handlers)
+        self.assertIsInstance(handlers[0], log_handler.LazyQueueHandler)
+
+    def test_json_output_has_the_extra_fields(self):
+        log = configure_logging(json_output=True, stream=self.stream)
+        log.info('Fetched %d pages', 3, extra={'stage': 'fetch'})
+
+        entry = json.loads(self.written_lines()[0])
+        self.assertEqual('Fetched 3 pages', entry['message'])
+        self.assertEqual('INFO', entry['level'])
+        self.assertEqual('fetch', entry['stage'])
+        self.assertEqual('test_log_handler.py', entry['file'])
+
+    def test_messages_are_formatted_by_the_listener_and_only_when_enabled(self):
+        log = configure_logging(stream=self.stream)
+        counter = FormatCounter()
+        log.debug('Query %s', counter)
+        log.info('Query %s', counter)
+
+        self.assertEqual(['Query formatted'], [line.split(' -- ')[-1] for line in self.written_lines()])
+        self.assertEqual(1, len(counter.threads))
+        self.assertNotEqual(threading.current_thread().name, counter.threads[0])
+
+    def test_high_frequency_messages_are_rate_limited(self):
+        log = configure_logging(stream=self.stream, rate_limit=5, rate_interval=0.2)
+        for i in range(51):
+            if i == 50:
+                time.sleep(0.25)
+            log.info('Row %d', i)
+            log.warning('Warning %d', i)
+
+        lines = self.written_lines()
+        rows = [line for line in lines if 'Row' in line]
+        self.assertEqual(6, len(rows))
+        self.assertTrue(rows[-1].endswith('Row 50 (45 similar messages suppressed)'))
+        self.assertEqual(51, sum('Warning' in line for line in lines))
+
+    def test_records_of_worker_processes_are_collected(self):
+        configure_logging(stream=self.stream, rate_limit=0)
+        executor = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=configure_worker_logging, initargs=worker_logging_args())
+        with executor:
+            self.assertEqual([0, 1, 2], list(executor.map(log_in_worker, range(3))))
+
+        deadline = time.monotonic() + 10
+        while self.stream.getvalue().count('Worker record') < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        lines = [line for line in self.written_lines() if 'Worker record' in line]
+        self.assertEqual(['Worker record 0', 'Worker record 1', 'Worker record 2'],
+                         sorted(line.split(' -- ')[-1] for line in lines))
+        self.assertTrue(all('SpawnProcess' in line for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
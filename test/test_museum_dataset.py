@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from population_visitors import make_population_visitors
+from src.correlate_pop_visitor import correlate_population_visitors_in_dataset
+from src.create_museum_db import create_db, read_museum_data_from_db
+from src.museum_dataset import (export_museum_dataset, list_run_dates, open_dataset, read_dataset,
+                                snapshot_filter)
+from src.streaming_stats import stream_population_visitor_history, stream_population_visitor_stats
+
+
+class TestMuseumDataset(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp_dir.name, 'museum_analysis.db')
+        self.dataset_dir = os.path.join(self.tmp_dir.name, 'museum_dataset')
+
+        population, visitors = make_population_visitors(1000, noise=5e5, slope=0.05, offset=1e9)
+        population[::7] = np.nan
+        city_df = pd.DataFrame({'city': [f'City {i}' for i in range(1000)],
+                                'country': [['France', 'Japan', None][i % 3] for i in range(1000)],
+                                'population': population, 'city_id': range(1, 1001)})
+        museum_df = pd.DataFrame({'id': range(1, 1001), 'name': [f'Museum {i}' for i in range(1000)],
+                                  'city_id': range(1, 1001), 'visitors': visitors.round()})
+        create_db(city_df, museum_df, self.database_path)
+        self.museum_data_df = read_museum_data_from_db(self.database_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip_of_the_museums_and_cities(self):
+        written = export_museum_dataset(self.museum_data_df, self.dataset_dir, run_date='2024-05-31')
+        self.assertEqual({'museum': 1000, 'city': 1000}, written.groupby('dataset')['rows'].sum().to_dict())
+
+        df = read_dataset(dataset_dir=self.dataset_dir).sort_values('id').reset_index(drop=True)
+        self.assertEqual({pd.Timestamp('2024-05-31')}, set(pd.to_datetime(df['run_date'])))
+        expected = self.museum_data_df.sort_values('id').reset_index(drop=True)
+        pd.testing.assert_series_equal(expected['visitors'], df['visitors'], check_dtype=False)
+        pd.testing.assert_series_equal(expected['population'], df['population'], check_dtype=False)
+        # A museum without a country is in the default partition and is read back without a country
+        self.assertEqual(expected['country'].isna().tolist(), df['country'].isna().tolist())
+
+        city_df = read_dataset('city', self.dataset_dir, columns=['city_id', 'country'], countries=['Japan'])
+        self.assertEqual(333, len(city_df))
+
+    def test_partitions_and_row_groups_are_pruned(self):
+        export_museum_dataset(self.museum_data_df, self.dataset_dir, run_date='2024-05-30', rows_per_group=50)
+        export_museum_dataset(self.museum_data_df, self.dataset_dir, run_date='2024-05-31', rows_per_group=50)
+        dataset = open_dataset(dataset_dir=self.dataset_dir)
+
+        fragments = list(dataset.get_fragments(filter=snapshot_filter(['2024-05-31'], ['France'])))
+        self.assertEqual(1, len(fragments))
+        self.assertIn(os.path.join('run_date=2024-05-31', 'country=France'), fragments[0].path)
+
+        # The museums are sorted by visitors, so most row groups are outside a range of visitors
+        threshold = int(self.museum_data_df['visitors'].quantile(0.8))
+        where = ds.field('visitors') > threshold
+        row_groups = [row_group for fragment in fragments for row_group in fragment.split_by_row_group(where)]
+        self.assertLess(len(row_groups), fragments[0].num_row_groups)
+        df = read_dataset(dataset_dir=self.dataset_dir, columns=['id', 'visitors'], run_dates=['2024-05-31'],
+                          countries=['France'], where=where)
+        expected = self.museum_data_df[(self.museum_data_df['country'] == 'France')
+                                       & (self.museum_data_df['visitors'] > threshold)]
+        self.assertEqual(sorted(expected['id']), sorted(df['id']))
+
+    def test_export_on_the_same_run_date_replaces_the_snapshot(self):
+        export_museum_dataset(self.museum_data_df, self.dataset_dir, run_date='2024-05-31')
+        export_museum_dataset(self.museum_data_df.head(10), self.dataset_dir, run_date='2024-05-31')
+        export_museum_dataset(self.museum_data_df.head(20), self.dataset_dir, run_date='2024-06-01')
+
+        self.assertEqual(['2024-05-31', '2024-06-01'], list_run_dates(dataset_dir=self.dataset_dir))
+        self.assertEqual(10, len(read_dataset(dataset_dir=self.dataset_dir, columns=['id'],
+                                              run_dates=['2024-05-31'])))
+        self.assertEqual([], list_run_dates(dataset_dir=os.path.join(self.tmp_dir.name, 'missing')))
+
+    def test_history_is_the_same_as_the_database_regression(self):
+        export_museum_dataset(self.museum_data_df, self.dataset_dir, run_date='2024-05-30')
+        export_museum_dataset(self.museum_data_df.head(500), self.dataset_dir, run_date='2024-05-31')
+
+        history = stream_population_visitor_history(self.dataset_dir)
+        self.assertEqual(['2024-05-30', '2024-05-31'], list(history))
+        expected = stream_population_visitor_stats(self.database_path, chunk_size=100)
+        np.testing.assert_allclose(expected, history['2024-05-30'], rtol=1e-9)
+        self.assertLess(history['2024-05-31'].train_size, expected.train_size)
+
+    def test_correlate_reads_the_latest_snapshot(self):
+        with self.assertRaises(FileNotFoundError):
+            correlate_population_visitors_in_dataset(self.dataset_dir)
+
+        export_museum_dataset(self.museum_data_df.head(100), self.dataset_dir, run_date='2024-05-30')
+        export_museum_dataset(self.museum_data_df, self.dataset_dir, run_date='2024-05-31')
+        latest = correlate_population_visitors_in_dataset(self.dataset_dir, resamples=50)
+        first = correlate_population_visitors_in_dataset(self.dataset_dir, run_date='2024-05-30', resamples=50)
+        self.assertNotEqual(latest['pearson_r'], first['pearson_r'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+from benchmark.generators import make_museum_list_html
+from src.add_city_population import add_city_population_to_museum
+from src.clean_museum_data import clean_museum_character_data
+from src.fetch_museum_data import create_museum_dataframe, MOST_VISITED_MUSEUMS_PAGE_NAME
+from src.museum_pipeline import stream_cleaned_museum_chunks, stream_museum_data
+from src.page_source import Page, PageSource
+
+CITIES = ['Paris', 'London', 'Tokyo', 'Madrid', 'Rome']
+TYPES = ['Art museum', 'Natural history museum', 'Science museum', 'History museum']
+
+
+def make_museum_html(i: int) -> str:
+    rows = f'''<tr><th>Established</th><td>{1800 + i}</td></tr>
+        <tr><th>Type</th><td>{TYPES[i % len(TYPES)]}</td></tr>
+        <tr><th>Coordinates</th><td><span class="geo">{i}.5; {i}.25</span></td></tr>'''
+    if i % 3 == 0:
+        rows += f'<tr><th>Director</th><td>Director {i}</td></tr>'
+    return f'<table class="infobox vcard"><tbody>{rows}</tbody></table>'
+
+
+class CountingPageSource(PageSource):
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.fetched = 0
+        self.lock = threading.Lock()
+
+    def fetch_page(self, page_name: str, timeout: float = None) -> Page:
+        if page_name == MOST_VISITED_MUSEUMS_PAGE_NAME:
+            return Page(page_name, 1, make_museum_list_html([f'Museum_{i}' for i in range(self.count)],
+                                                           [CITIES[i % len(CITIES)] for i in range(self.count)]))
+        with self.lock:
+            self.fetched += 1
+        return Page(page_name, 7, make_museum_html(int(page_name.split('_')[1])))
+
+
+class TestMuseumPipeline(unittest.TestCase):
+    def batch_museum_data(self, page_source):
+        museum_all_data_df = create_museum_dataframe(page_source)
+        museum_all_data_df = clean_museum_character_data(museum_all_data_df)
+        return add_city_population_to_museum(museum_all_data_df)
+
+    def assert_same_as_batch(self, count, **kwargs):
+        expected = self.batch_museum_data(CountingPageSource(count))
+        actual = stream_museum_data(CountingPageSource(count), **kwargs)
+        pd.testing.assert_frame_equal(expected, actual[expected.columns], check_dtype=False)
+        self.assertEqual(set(expected.columns), set(actual.columns))
+
+    def test_same_result_as_batch_in_process(self):
+        self.assert_same_as_batch(120, download_workers=4, parse_workers=0, chunk_size=16)
+
+    def test_same_result_as_batch_with_process_pool(self):
+        self.assert_same_as_batch(40, download_workers=4, parse_workers=2, chunk_size=16)
+
+    def test_bounded_buffers_apply_backpressure(self):
+        page_source = CountingPageSource(500)
+        museums_df = pd.DataFrame({'name': [f'Museum {i}' for i in range(500)], 'city': 'Paris', 'visitors': 1,
+                                   'wiki_link': [f'Museum_{i}' for i in range(500)]})
+
+        buffer_size, chunk_size, download_workers = 4, 10, 3
+        chunks = stream_cleaned_museum_chunks(museums_df, page_source, download_workers=download_workers,
+                                              parse_workers=0, buffer_size=buffer_size, chunk_size=chunk_size)
+        consumed = 0
+        max_ahead = 0
+        for chunk in chunks:
+            # A slow consumer, so the download and parse stages have to wait for it
+            time.sleep(0.01)
+            consumed += len(chunk)
+            max_ahead = max(max_ahead, page_source.fetched - consumed)
+
+        self.assertEqual(500, consumed)
+        # Pages in the two queues, in the download threads, being parsed and in the chunk being built
+        self.assertLessEqual(max_ahead, 2 * buffer_size + download_workers + 2 + chunk_size + 1)
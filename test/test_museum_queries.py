@@ -0,0 +1,166 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmark.bench_bulk_load import make_museum_db_dfs
+from src.connection_pool import ConnectionPool
+from src.create_museum_db import build_museum_db, create_db
+from src.geo import haversine_km
+from src.museum_queries import (COUNTRY_STATS_SQL, MUSEUMS_IN_BOX_SQL, MUSEUMS_IN_COUNTRY_SQL,
+                                TOP_MUSEUMS_BY_VISITORS_SQL, Museum, MuseumQueries)
+from test_create_museum_db import make_museum_all_data_df
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+BUILD_CODE = '''
+import sys
+sys.path.insert(0, 'test')
+from src.create_museum_db import build_museum_db
+from test_create_museum_db import make_museum_all_data_df
+build_museum_db(make_museum_all_data_df({count}), {database_path!r})
+'''
+
+
+class TestMuseumQueries(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp_dir.name, 'museum_analysis.db'))
+        self.build(10)
+        self.queries = MuseumQueries(self.pool)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def build(self, count):
+        with self.pool.writer() as conn:
+            build_museum_db(make_museum_all_data_df(count), conn=conn)
+
+    def test_queries(self):
+        self.assertEqual([Museum(10, 'Museum 9', 10000, 'Paris', 'France'),
+                          Museum(9, 'Museum 8', 9000, 'Rome', 'Italy')], self.queries.top_museums_by_visitors(2))
+        self.assertEqual([10, 7, 4, 1], [museum.id for museum in self.queries.museums_in_city('Paris')])
+        self.assertEqual([9, 6, 3], [museum.id for museum in self.queries.museums_in_country('Italy')])
+        self.assertEqual([10, 8, 6, 4, 2], [museum.id for museum in self.queries.museums_of_type('is_art_museum')])
+        self.assertEqual([], self.queries.museums_in_city('Atlantis'))
+
+        stats = self.queries.country_stats()
+        self.assertEqual(['France', 'Italy', 'United Kingdom'], [row.country for row in stats])
+        self.assertEqual((4, 22000, 5500.0, 1), tuple(stats[0][1:]))
+
+        with self.assertRaises(ValueError):
+            self.queries.museums_of_type('is_museum; DROP TABLE museum')
+
+    def test_cached_until_the_database_is_rebuilt(self):
+        first = self.queries.top_museums_by_visitors(3)
+        first.clear()
+        self.assertEqual(3, len(self.queries.top_museums_by_visitors(3)))
+        self.assertEqual({'hits': 1, 'misses': 1, 'invalidations': 0},
+                         {key: value for key, value in self.queries.cache_info().items()
+                          if key in ('hits', 'misses', 'invalidations')})
+
+        self.build(20)
+        self.assertEqual('Museum 19', self.queries.top_museums_by_visitors(3)[0].name)
+        info = self.queries.cache_info()
+        self.assertEqual((1, 2, 1), (info['hits'], info['misses'], info['invalidations']))
+
+    def test_cache_is_invalidated_by_a_build_in_another_process(self):
+        self.assertEqual('Museum 9', self.queries.top_museums_by_visitors(1)[0].name)
+        subprocess.run([sys.executable, '-c', BUILD_CODE.format(count=20, database_path=self.pool.database_path)],
+                       cwd=REPO_DIR, check=True)
+
+        self.assertEqual('Museum 19', self.queries.top_museums_by_visitors(1)[0].name)
+        info = self.queries.cache_info()
+        self.assertEqual((0, 2, 1), (info['hits'], info['misses'], info['invalidations']))
+
+    def test_least_recently_used_results_are_evicted(self):
+        queries = MuseumQueries(self.pool, cache_size=2)
+        queries.museums_in_city('Paris')
+        queries.museums_in_city('London')
+        queries.museums_in_city('Paris')
+        queries.museums_in_city('Rome')
+        queries.museums_in_city('Paris')
+        queries.museums_in_city('London')
+
+        info = queries.cache_info()
+        self.assertEqual((2, 4, 2), (info['hits'], info['misses'], info['size']))
+
+    def test_queries_use_covering_indexes(self):
+        with self.pool.reader() as conn:
+            for query, params in [(TOP_MUSEUMS_BY_VISITORS_SQL, (3,)), (MUSEUMS_IN_COUNTRY_SQL, ('Italy',)),
+                                  (COUNTRY_STATS_SQL, ())]:
+                plan = ' '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+                self.assertIn('USING COVERING INDEX museum_', plan)
+                self.assertNotIn('SCAN museum ', plan.replace('SCAN museum USING', ''))
+
+
+class TestSpatialQueries(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp_dir.name, 'museum_analysis.db'))
+        city_df_for_sql, self.museum_df = make_museum_db_dfs(3000, cities=20)
+        # Museums without coordinates, or with coordinates which are not numbers, are not indexed
+        self.museum_df.loc[::50, 'latitude'] = None
+        self.museum_df.loc[1::50, 'longitude'] = 'unknown'
+        self.museum_df.loc[2, ['latitude', 'longitude']] = (10.0, 179.9)
+        self.museum_df.loc[3, ['latitude', 'longitude']] = (10.0, -179.9)
+        with self.pool.writer() as conn:
+            create_db(city_df_for_sql, self.museum_df, conn=conn)
+        self.queries = MuseumQueries(self.pool)
+
+        located = self.museum_df[self.museum_df.index % 50 > 1]
+        self.ids = located['id'].to_numpy()
+        self.latitudes = located['latitude'].to_numpy(dtype=np.float64)
+        self.longitudes = located['longitude'].to_numpy(dtype=np.float64)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def test_museums_in_box(self):
+        museums = self.queries.museums_in_box(-10, 20, 30, 60)
+        inside = ((self.latitudes >= -10) & (self.latitudes <= 30) & (self.longitudes >= 20)
+                  & (self.longitudes <= 60))
+        self.assertEqual(sorted(self.ids[inside]), [museum.id for museum in museums])
+        self.assertGreater(len(museums), 10)
+
+        # A box across the antimeridian
+        self.assertEqual([3, 4], [museum.id for museum in self.queries.museums_in_box(9, 179, 11, -179)])
+        self.assertEqual([], self.queries.museums_in_box(80, 0, 90, 10))
+
+    def test_museums_within_radius_are_the_same_as_a_scan(self):
+        for latitude, longitude, radius_km in [(48.86, 2.35, 1500), (10, 179.5, 200), (69, 0, 3000),
+                                               (0, 0, 30000)]:
+            with self.subTest(latitude=latitude, longitude=longitude):
+                distances = haversine_km(latitude, longitude, self.latitudes, self.longitudes)
+                expected = self.ids[np.lexsort((self.ids, distances))]
+                expected = expected[np.sort(distances) <= radius_km]
+
+                museums = self.queries.museums_within_radius(latitude, longitude, radius_km)
+                self.assertEqual(list(expected), [museum.id for museum in museums])
+                self.assertTrue(all(museum.distance_km <= radius_km for museum in museums))
+        self.assertEqual(len(self.ids), len(self.queries.museums_within_radius(0, 0, 30000)))
+
+    def test_nearest_museums_are_the_same_as_a_scan(self):
+        for latitude, longitude, count in [(48.86, 2.35, 5), (-89, 100, 20), (10, -179.95, 2), (0, 0, 10000)]:
+            with self.subTest(latitude=latitude, longitude=longitude):
+                distances = haversine_km(latitude, longitude, self.latitudes, self.longitudes)
+                expected = self.ids[np.lexsort((self.ids, distances))][:count]
+
+                museums = self.queries.nearest_museums(latitude, longitude, count)
+                self.assertEqual(list(expected), [museum.id for museum in museums])
+        self.assertEqual([3, 4], [museum.id for museum in self.queries.nearest_museums(10, 180, 2)])
+
+    def test_box_query_uses_the_rtree(self):
+        with self.pool.reader() as conn:
+            plan = ' '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {MUSEUMS_IN_BOX_SQL}', (0, 1, 0, 1)))
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+        self.assertIn('SEARCH museum USING INTEGER PRIMARY KEY', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
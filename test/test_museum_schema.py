@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.create_museum_db import build_museum_db
+from src.museum_schema import enforce_museum_schema, memory_report
+
+
+def make_object_museum_df(count: int) -> pd.DataFrame:
+    # The dtypes the pipeline had before the schema: strings from the infobox, int64 flags and repeated city names
+    return pd.DataFrame({
+        'name': [f'Museum {i}' for i in range(count)],
+        'wiki_link': [f'Museum_{i}' for i in range(count)],
+        'city': [['Paris', 'London', 'Rome'][i % 3] for i in range(count)],
+        'country': [['France', 'United Kingdom', 'Italy'][i % 3] for i in range(count)],
+        'visitors': [str(1000 * (i + 1)) for i in range(count)],
+        'latitude': [['48.8606', '51.5194', 'not a number'][i % 3] for i in range(count)],
+        'longitude': [['2.3376', '-0.127', None][i % 3] for i in range(count)],
+        'Established_year': ['1793' if i % 2 else np.nan for i in range(count)],
+        'is_art_museum': [i % 2 for i in range(count)],
+        'revision_id': [1_000_000_000 + i for i in range(count)],
+        'population': [[11020000.0, 10979000.0, np.nan][i % 3] for i in range(count)],
+    })
+
+
+class TestMuseumSchema(unittest.TestCase):
+    def test_columns_are_coerced_to_compact_dtypes(self):
+        schema_df = enforce_museum_schema(make_object_museum_df(6))
+
+        self.assertEqual({'name': 'object', 'wiki_link': 'object', 'city': 'category', 'country': 'category',
+                          'visitors': 'Int16', 'latitude': 'float32', 'longitude': 'float32',
+                          'Established_year': 'Int16', 'is_art_museum': 'int8', 'revision_id': 'Int32',
+                          'population': 'float64'},
+                         schema_df.dtypes.astype(str).to_dict())
+        self.assertEqual([1000, 2000, 3000, 4000, 5000, 6000], list(schema_df['visitors']))
+        self.assertEqual([pd.NA, 1793] * 3, list(schema_df['Established_year']))
+        self.assertEqual([48.8606, 51.5194], schema_df['latitude'][:2].astype(str).astype(float).tolist())
+        self.assertTrue(schema_df['latitude'].isna().equals(pd.Series([False, False, True] * 2)))
+        self.assertTrue(schema_df['longitude'].isna().equals(pd.Series([False, False, True] * 2)))
+
+    def test_integers_get_the_smallest_type_and_fractions_stay_float(self):
+        schema_df = enforce_museum_schema(pd.DataFrame({'visitors': [1, 2 ** 40], 'id': [1, 2],
+                                                        'city_id': [1.5, 2.0], 'revision_id': [np.nan, np.nan]}))
+
+        self.assertEqual({'visitors': 'Int64', 'id': 'Int8', 'city_id': 'float64', 'revision_id': 'Int8'},
+                         schema_df.dtypes.astype(str).to_dict())
+
+    def test_enforcing_twice_keeps_the_values_and_dtypes(self):
+        schema_df = enforce_museum_schema(make_object_museum_df(9))
+        pd.testing.assert_frame_equal(schema_df, enforce_museum_schema(schema_df))
+
+    def test_memory_report_shows_a_large_reduction(self):
+        museum_df = make_object_museum_df(30000)
+        report_df = memory_report(museum_df, enforce_museum_schema(museum_df))
+
+        self.assertEqual(list(museum_df.columns) + ['total'], list(report_df.index))
+        self.assertEqual('float32', report_df.loc['latitude', 'dtype_after'])
+        for column in ['city', 'country', 'visitors', 'latitude', 'longitude', 'Established_year', 'is_art_museum']:
+            self.assertLess(report_df.loc[column, 'bytes_after'], report_df.loc[column, 'bytes_before'] / 4, column)
+        self.assertEqual(report_df.loc['name', 'bytes_after'], report_df.loc['name', 'bytes_before'])
+        self.assertLess(report_df.loc['total', 'bytes_after'], report_df.loc['total', 'bytes_before'] / 2)
+
+    def test_compact_coordinates_are_stored_as_their_decimals(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database_path = os.path.join(tmp_dir, 'museum_analysis.db')
+            build_museum_db(enforce_museum_schema(make_object_museum_df(3)), database_path)
+            conn = sqlite3.connect(database_path)
+            try:
+                rows = conn.execute('SELECT latitude, longitude, established_year FROM museum ORDER BY id').fetchall()
+            finally:
+                conn.close()
+
+        self.assertEqual([(48.8606, 2.3376, None), (51.5194, -0.127, '1793'), (None, None, None)], rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
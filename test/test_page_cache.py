@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from src.page_cache import CachedPageSource, CacheMissError
+from src.page_source import MediaWikiPageSource, Page
+from stub_wiki_server import StubWikiServer
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+        self.pages = {f'Museum_{i}': f'<p>museum {i}</p>' * 50 for i in range(5)}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fetch_all(self, server, **kwargs):
+        cache = CachedPageSource(MediaWikiPageSource(server.api_url), cache_dir=self.cache_dir, **kwargs)
+        pages = [cache.fetch_page(title) for title in self.pages]
+        cache.close()
+        return pages, cache.stats
+
+    def test_second_fetch_is_served_from_memory(self):
+        with StubWikiServer(self.pages) as server:
+            cache = CachedPageSource(MediaWikiPageSource(server.api_url), cache_dir=self.cache_dir)
+            first = cache.fetch_html('Museum_1')
+            second = cache.fetch_html('Museum_1')
+            cache.close()
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, server.count('parse'))
+        self.assertEqual(1, cache.stats['memo_hits'])
+        self.assertEqual(0, cache.stats['disk_hits'])
+
+    def test_memo_is_bounded(self):
+        page_size = len(self.pages['Museum_0'])
+        with StubWikiServer(self.pages) as server:
+            cache = CachedPageSource(MediaWikiPageSource(server.api_url), cache_dir=self.cache_dir,
+                                     memo_max_bytes=2 * page_size)
+            for _ in range(2):
+                for title in self.pages:
+                    cache.fetch_page(title)
+            cache.close()
+
+        # Every page left the memo before it was fetched again, so the second round is read from disk
+        self.assertLessEqual(cache.memo_bytes, 2 * page_size)
+        self.assertEqual(2, len(cache.memo))
+        self.assertEqual(0, cache.stats['memo_hits'])
+        self.assertEqual(5, cache.stats['disk_hits'])
+
+    def test_memo_is_keyed_by_revision(self):
+        revisions = {}
+        with StubWikiServer(self.pages, revisions=revisions) as server:
+            cache = CachedPageSource(MediaWikiPageSource(server.api_url), cache_dir=self.cache_dir)
+            first = cache.fetch_page_at_revision('Museum_2', 1)
+            revisions['Museum_2'] = 2
+            self.pages['Museum_2'] = '<p>renovated</p>'
+            second = cache.fetch_page_at_revision('Museum_2', 2)
+            third = cache.fetch_page_at_revision('Museum_2', 2)
+            cache.close()
+
+        self.assertEqual(1, first.revision_id)
+        self.assertEqual(Page('Museum_2', 2, '<p>renovated</p>'), second)
+        self.assertEqual(second, third)
+        self.assertEqual(2, cache.stats['downloads'])
+        self.assertEqual(1, cache.stats['memo_hits'])
+
+    def test_warm_rerun_only_checks_revisions(self):
+        with StubWikiServer(self.pages) as server:
+            cold_pages, _ = self.fetch_all(server, ttl=0)
+            warm_pages, stats = self.fetch_all(server, ttl=0)
+
+        self.assertEqual(cold_pages, warm_pages)
+        self.assertEqual(5, server.count('parse'))
+        self.assertEqual(5, server.count('query'))
+        self.assertEqual(0, stats['downloads'])
+        self.assertEqual(5, stats['disk_hits'])
+
+    def test_fresh_entries_are_not_revalidated(self):
+        with StubWikiServer(self.pages) as server:
+            self.fetch_all(server)
+            self.fetch_all(server)
+
+        self.assertEqual(0, server.count('query'))
+
+    def test_changed_revision_is_downloaded_again(self):
+        revisions = {}
+        with StubWikiServer(self.pages, revisions=revisions) as server:
+            self.fetch_all(server, ttl=0)
+            revisions['Museum_2'] = 2
+            self.pages['Museum_2'] = '<p>renovated</p>'
+            pages, stats = self.fetch_all(server, ttl=0)
+
+        self.assertEqual(1, stats['downloads'])
+        self.assertEqual(Page('Museum_2', 2, '<p>renovated</p>'), pages[2])
+
+    def test_offline_serves_from_cache(self):
+        with StubWikiServer(self.pages) as server:
+            cold_pages, _ = self.fetch_all(server)
+
+        cache = CachedPageSource(cache_dir=self.cache_dir, ttl=0, offline=True)
+        self.assertEqual(cold_pages, [cache.fetch_page(title) for title in self.pages])
+        self.assertRaises(CacheMissError, cache.fetch_page, 'Museum_99')
+        cache.close()
+
+    def test_lru_eviction_bounds_cache_size(self):
+        with StubWikiServer(self.pages) as server:
+            cache = CachedPageSource(MediaWikiPageSource(server.api_url), cache_dir=self.cache_dir)
+            cache.fetch_page('Museum_0')
+            max_bytes = cache.size() * 3
+            cache.max_bytes = max_bytes
+            for title in self.pages:
+                cache.fetch_page(title)
+            size = cache.size()
+            cache.close()
+
+        self.assertLessEqual(size, max_bytes)
+        self.assertEqual(2, cache.stats['evictions'])
+        blobs = [name for name in os.listdir(self.cache_dir) if name.endswith('.html.z')]
+        self.assertEqual(3, len(blobs))
@@ -0,0 +1,112 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import profiling
+from src.page_cache import CachedPageSource
+from src.page_source import MediaWikiPageSource
+from src.profiling import count, profile_stage, RunProfiler
+from stub_wiki_server import StubWikiServer
+
+
+@profile_stage()
+def double_rows(df: pd.DataFrame) -> pd.DataFrame:
+    count('pages_fetched', len(df))
+    return pd.concat([df, df])
+
+
+@profile_stage('allocate')
+def allocate_and_clean(df: pd.DataFrame) -> None:
+    np.ones(1_000_000)
+    for _ in range(2):
+        double_rows(df)
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({'visitors': range(10)})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stages_are_summed_over_their_calls(self):
+        with RunProfiler() as profiler:
+            allocate_and_clean(self.df)
+        stages = {stage['name']: stage for stage in profiler.report()['stages']}
+
+        self.assertEqual(2, stages['double_rows']['calls'])
+        self.assertEqual(40, stages['double_rows']['rows'])
+        self.assertEqual({'pages_fetched': 20}, stages['double_rows']['counters'])
+        self.assertEqual(1, stages['allocate']['calls'])
+        self.assertEqual(10, stages['allocate']['rows'])
+        self.assertEqual({'pages_fetched': 20}, stages['allocate']['counters'])
+        self.assertGreaterEqual(stages['allocate']['wall_seconds'], stages['double_rows']['wall_seconds'])
+        self.assertGreater(stages['allocate']['rows_per_second'], 0)
+        self.assertGreater(stages['allocate']['peak_rss_bytes'], 0)
+        self.assertIsNone(stages['allocate']['peak_traced_bytes'])
+
+    def test_traced_peak_of_a_stage_includes_its_nested_stages(self):
+        with RunProfiler(trace_memory=True) as profiler:
+            allocate_and_clean(self.df)
+        stages = {stage['name']: stage for stage in profiler.report()['stages']}
+
+        self.assertGreaterEqual(stages['allocate']['peak_traced_bytes'], 8_000_000)
+        self.assertLess(stages['double_rows']['peak_traced_bytes'], 8_000_000)
+
+    def test_nothing_is_recorded_without_a_profiler(self):
+        allocate_and_clean(self.df)
+        count('pages_fetched')
+        self.assertIsNone(profiling.active_profiler)
+
+    def test_cprofile_dumps_the_outermost_stage(self):
+        cprofile_dir = os.path.join(self.tmp_dir.name, 'profiles')
+        with RunProfiler(cprofile_dir=cprofile_dir) as profiler:
+            allocate_and_clean(self.df)
+        stages = {stage['name']: stage for stage in profiler.report()['stages']}
+
+        self.assertEqual(['allocate.prof'], os.listdir(cprofile_dir))
+        self.assertEqual(os.path.join(cprofile_dir, 'allocate.prof'), stages['allocate']['cprofile_path'])
+        functions = {function[2] for function in pstats.Stats(stages['allocate']['cprofile_path']).stats}
+        self.assertIn('double_rows', functions)
+
+    def test_cprofile_of_selected_nested_stage(self):
+        cprofile_dir = os.path.join(self.tmp_dir.name, 'profiles')
+        with RunProfiler(cprofile_dir=cprofile_dir, cprofile_stages=['double_rows']):
+            allocate_and_clean(self.df)
+
+        self.assertEqual(['double_rows.prof'], os.listdir(cprofile_dir))
+
+    def test_report_has_page_counters_and_cache_hit_rate(self):
+        pages = {f'Museum_{i}': f'<p>museum {i}</p>' * 50 for i in range(4)}
+        report_path = os.path.join(self.tmp_dir.name, 'reports', 'run.json')
+
+        with StubWikiServer(pages) as server, RunProfiler() as profiler:
+            for _ in range(2):
+                cache = CachedPageSource(MediaWikiPageSource(server.api_url),
+                                         cache_dir=os.path.join(self.tmp_dir.name, 'pages'))
+                for title in pages:
+                    cache.fetch_page(title)
+                    cache.fetch_page(title)
+                cache.close()
+        profiler.write_report(report_path)
+
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertEqual(4, report['counters']['pages_fetched'])
+        self.assertEqual(4, report['counters']['api_requests'])
+        self.assertGreater(report['counters']['bytes_downloaded'], 4 * 50 * len('<p>museum 0</p>'))
+        self.assertEqual(4, report['counters']['page_cache_downloads'])
+        self.assertEqual(4, report['counters']['page_cache_disk_hits'])
+        self.assertEqual(8, report['counters']['page_cache_memo_hits'])
+        self.assertEqual(0.75, report['page_cache_hit_rate'])
+        self.assertGreater(report['wall_seconds'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from population_visitors import make_population_visitors
+from src.correlate_pop_visitor import calculate_resampling_statistics, correlate_population_visitors
+from src.resampling import correlation_and_slope, resample_correlation
+
+
+class TestResampling(unittest.TestCase):
+    def test_row_statistics_match_numpy(self):
+        x, y = make_population_visitors(40, 1e6)
+        matrix_x = np.stack([x, x[::-1]])
+        matrix_y = np.stack([y, y])
+        r, slope = correlation_and_slope(matrix_x, matrix_y)
+        for i in range(2):
+            self.assertAlmostEqual(np.corrcoef(matrix_x[i], matrix_y[i])[0, 1], r[i])
+            self.assertAlmostEqual(np.polyfit(matrix_x[i], matrix_y[i], 1)[0], slope[i])
+
+    def test_intervals_and_p_value(self):
+        x, y = make_population_visitors(50, 1e6)
+        result = resample_correlation(x, y, resamples=2000, seed=1)
+        self.assertLess(result.pearson_r.low, result.pearson_r.estimate)
+        self.assertLess(result.pearson_r.estimate, result.pearson_r.high)
+        self.assertLess(result.slope.low, 0.1)
+        self.assertLess(0.1, result.slope.high)
+        self.assertAlmostEqual(1 / 2001, result.p_value)
+
+        # Without a relation, r is not significant
+        rng = np.random.default_rng(2)
+        result = resample_correlation(x, rng.permutation(y), resamples=2000, seed=1)
+        self.assertGreater(result.p_value, 0.05)
+
+    def test_seeded_results_do_not_depend_on_workers(self):
+        x, y = make_population_visitors(30, 3e6)
+        result = resample_correlation(x, y, resamples=2500, seed=7, batch_size=1000)
+        self.assertEqual(result, resample_correlation(x, y, resamples=2500, seed=7, batch_size=1000))
+        self.assertEqual(result, resample_correlation(x, y, resamples=2500, seed=7, batch_size=1000, workers=2))
+        self.assertNotEqual(result, resample_correlation(x, y, resamples=2500, seed=8, batch_size=1000))
+
+    def test_museums_without_population_are_left_out(self):
+        x, y = make_population_visitors(30, 3e6)
+        df = pd.DataFrame({'population': np.append(x, np.nan), 'visitors': np.append(y, 5)})
+        self.assertEqual(resample_correlation(x, y, resamples=500),
+                         calculate_resampling_statistics(df, resamples=500))
+
+    def test_correlation_is_the_same_on_every_run(self):
+        x, y = make_population_visitors(60, 3e6)
+        df = pd.DataFrame({'population': x, 'visitors': y})
+        result = correlate_population_visitors(df, resamples=500, seed=3)
+        self.assertEqual(result, correlate_population_visitors(df, resamples=500, seed=3))
+
+        # The estimates are those of all museums, which their intervals are around
+        slope, intercept = np.polyfit(x, y, 1)
+        self.assertAlmostEqual(np.corrcoef(x, y)[0, 1], result['pearson_r'])
+        self.assertAlmostEqual(1, result['coefficient'] / slope)
+        self.assertAlmostEqual(1, result['intercept'] / intercept)
+        self.assertLessEqual(result['pearson_r_low'], result['pearson_r'])
+        self.assertLessEqual(result['pearson_r'], result['pearson_r_high'])
+        self.assertLessEqual(result['coefficient_low'], result['coefficient'])
+        self.assertLessEqual(result['coefficient'], result['coefficient_high'])
@@ -0,0 +1,166 @@
+import ast
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src import stage_runner
+from src.stage_registry import STAGE_MODULES
+from src.stage_runner import code_version, hash_dataframe, module_source_path, Stage, StageRunner
+from test_create_museum_db import make_museum_all_data_df
+
+
+class TestStageRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.tmp_dir.name, 'checkpoints')
+        self.source_df = pd.DataFrame({'city': ['Paris', 'London', 'Rome'], 'visitors': [3, 2, 1]})
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def stages(self, artifacts=()):
+        def fetch():
+            self.calls.append('fetch')
+            return self.source_df.copy()
+
+        def double(df):
+            self.calls.append('double')
+            return df.assign(visitors=df['visitors'] * 2)
+
+        def total(df):
+            self.calls.append('total')
+            return pd.DataFrame({'total': [df['visitors'].sum()]})
+
+        return [Stage('fetch', fetch, modules=(stage_runner,)),
+                Stage('double', double, inputs=('fetch',), artifacts=artifacts),
+                Stage('total', total, inputs=('double',), params={'metric': 'sum'})]
+
+    def run_stages(self, stages=None, **kwargs):
+        return StageRunner(stages or self.stages(), checkpoint_dir=self.checkpoint_dir, **kwargs).run()
+
+    def test_unchanged_stages_are_read_from_checkpoints(self):
+        first = self.run_stages()
+        second = self.run_stages()
+
+        self.assertEqual(['fetch', 'double', 'total'], self.calls)
+        self.assertEqual([False] * 3, [result.skipped for result in first.values()])
+        self.assertEqual([True] * 3, [result.skipped for result in second.values()])
+        self.assertEqual(12, second['total'].df['total'][0])
+        pd.testing.assert_frame_equal(first['double'].df, second['double'].df)
+
+    def test_changed_output_runs_the_stages_after_it(self):
+        self.run_stages()
+        self.source_df.loc[0, 'visitors'] = 10
+        results = self.run_stages(force=['fetch'])
+
+        self.assertEqual(['fetch', 'double', 'total'] * 2, self.calls)
+        self.assertEqual(26, results['total'].df['total'][0])
+
+    def test_forced_stage_with_unchanged_output_skips_the_stages_after_it(self):
+        self.run_stages()
+        results = self.run_stages(force=['fetch'])
+
+        self.assertEqual(['fetch', 'double', 'total', 'fetch'], self.calls)
+        self.assertTrue(results['total'].skipped)
+
+    def test_changed_params_run_the_stage_again(self):
+        self.run_stages()
+        stages = self.stages()
+        stages[2] = stages[2]._replace(params={'metric': 'mean'})
+        self.run_stages(stages)
+
+        self.assertEqual(['fetch', 'double', 'total', 'total'], self.calls)
+
+    def test_selected_stage_only_runs_with_the_stages_it_reads(self):
+        results = self.run_stages(selected=['double'])
+        self.assertEqual(['fetch', 'double'], list(results))
+
+        results = self.run_stages(selected=['total'], force=['total'])
+        self.assertEqual(['fetch', 'double', 'total'], self.calls)
+        self.assertEqual([True, True, False], [result.skipped for result in results.values()])
+
+    def test_missing_artifact_runs_the_stage_again(self):
+        artifact_path = os.path.join(self.tmp_dir.name, 'museum_analysis.db')
+        open(artifact_path, 'w').close()
+        self.run_stages(self.stages(artifacts=(artifact_path,)))
+        os.remove(artifact_path)
+        self.run_stages(self.stages(artifacts=(artifact_path,)))
+
+        self.assertEqual(['fetch', 'double', 'total', 'double'], self.calls)
+
+    def test_expired_checkpoint_runs_the_stage_again(self):
+        stages = self.stages()
+        stages[0] = stages[0]._replace(max_age=60 * 60)
+        first = self.run_stages(stages)
+        self.run_stages(stages)
+
+        # Age the checkpoint of fetch by two hours
+        _, meta_path = StageRunner(stages, checkpoint_dir=self.checkpoint_dir).checkpoint_paths('fetch',
+                                                                                                first['fetch'].key)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['created'] -= 2 * 60 * 60
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        results = self.run_stages(stages)
+
+        # The fetched museums did not change, so the stages after fetch are read from their checkpoints
+        self.assertEqual(['fetch', 'double', 'total', 'fetch'], self.calls)
+        self.assertFalse(results['fetch'].skipped)
+        self.assertTrue(results['total'].skipped)
+
+    def test_no_checkpoints_runs_every_stage(self):
+        self.run_stages(use_checkpoints=False)
+        self.run_stages(use_checkpoints=False)
+
+        self.assertEqual(['fetch', 'double', 'total'] * 2, self.calls)
+        self.assertFalse(os.path.exists(self.checkpoint_dir))
+
+    def test_unknown_stage_is_rejected(self):
+        with self.assertRaises(ValueError):
+            StageRunner(self.stages(), checkpoint_dir=self.checkpoint_dir, selected=['correlate'])
+
+    def test_museum_data_round_trips_with_the_same_hash(self):
+        museum_all_data_df = make_museum_all_data_df(20)
+        results = self.run_stages([Stage('fetch', lambda: museum_all_data_df)])
+        checkpointed = self.run_stages([Stage('fetch', lambda: museum_all_data_df)])['fetch']
+
+        self.assertTrue(checkpointed.skipped)
+        self.assertEqual(hash_dataframe(museum_all_data_df), results['fetch'].output_hash)
+        self.assertEqual(hash_dataframe(museum_all_data_df), hash_dataframe(checkpointed.df))
+
+    def test_modules_are_versioned_by_name_without_importing_them(self):
+        self.assertEqual(code_version([stage_runner]), code_version(['src.stage_runner']))
+        with self.assertRaises(ImportError):
+            code_version(['src.no_such_stage'])
+
+
+    def test_stages_are_versioned_with_the_modules_they_import(self):
+        def imported_modules(module):
+            with open(module_source_path(module)) as f:
+                tree = ast.parse(f.read())
+            names = {node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom)}
+            names |= {alias.name for node in ast.walk(tree) if isinstance(node, ast.Import) for alias in node.names}
+            return {name for name in names if name and name.startswith('src.')}
+
+        unversioned = {'src.log_handler', 'src.profiling', 'src.stage_defaults', 'src.stage_registry',
+                       'src.stage_runner'}
+        # The refresh and the crawler only run as part of the fetch stage
+        stage_modules = {'fetch': STAGE_MODULES['fetch'],
+                         'refresh': STAGE_MODULES['fetch'] + STAGE_MODULES['refresh'] + STAGE_MODULES['build_db'],
+                         'crawl': STAGE_MODULES['fetch'] + STAGE_MODULES['crawl'],
+                         'build_db': STAGE_MODULES['build_db'], 'export': STAGE_MODULES['export'],
+                         'correlate': STAGE_MODULES['correlate']}
+        # main imports the modules of every stage, only its functions which build the output belong to a stage
+        for stage, modules in stage_modules.items():
+            with self.subTest(stage=stage):
+                imported = set().union(*(imported_modules(module) for module in modules if module != 'main'))
+                self.assertEqual(set(), imported - unversioned - set(modules))
+
+
+if __name__ == '__main__':
+    unittest.main()
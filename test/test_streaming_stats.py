@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from population_visitors import make_population_visitors
+from sklearn.linear_model import LinearRegression
+from src.create_museum_db import create_db
+from src.streaming_stats import RunningMoments, stream_population_visitor_stats
+
+
+class TestRunningMoments(unittest.TestCase):
+    def test_chunks_and_merges_equal_one_pass(self):
+        x, y = make_population_visitors(10000, noise=5e5, slope=0.05, offset=1e9)
+        expected_slope, expected_intercept = np.polyfit(x, y, 1)
+
+        # Uneven chunks, merged in a different order than they were computed
+        parts = [RunningMoments().update(x[start:end], y[start:end])
+                 for start, end in [(0, 1), (1, 2500), (2500, 2500), (2500, 9999), (9999, 10000)]]
+        moments = RunningMoments()
+        for part in reversed(parts):
+            moments.merge(part)
+
+        self.assertEqual(10000, moments.count)
+        self.assertAlmostEqual(expected_slope, moments.slope, places=6)
+        self.assertAlmostEqual(expected_intercept / 1e9, moments.intercept / 1e9, places=6)
+        self.assertAlmostEqual(np.corrcoef(x, y)[0, 1], moments.pearson_r, places=10)
+
+        residuals = y - (0.04 * x + 1e6)
+        self.assertAlmostEqual(1, moments.sum_squared_error(0.04, 1e6) / (residuals @ residuals), places=9)
+
+    def test_empty_moments(self):
+        moments = RunningMoments().update(np.array([]), np.array([]))
+        self.assertEqual(0, moments.count)
+        self.assertTrue(np.isnan(moments.slope))
+        self.assertTrue(np.isnan(moments.pearson_r))
+
+
+class TestStreamPopulationVisitorStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp_dir.name, 'museum_analysis.db')
+
+        population, visitors = make_population_visitors(2000, noise=5e5, slope=0.05, offset=1e9)
+        population[::7] = np.nan
+        self.city_df = pd.DataFrame({'city': [f'City {i}' for i in range(2000)], 'country': 'Country',
+                                     'population': population, 'city_id': range(1, 2001)})
+        self.museum_df = pd.DataFrame({'id': range(1, 2001), 'name': [f'Museum {i}' for i in range(2000)],
+                                       'city_id': range(1, 2001), 'visitors': visitors.round()})
+        create_db(self.city_df, self.museum_df, self.database_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_same_as_sklearn_on_the_fixed_split(self):
+        df = pd.merge(self.museum_df, self.city_df, on='city_id').dropna(subset=['population'])
+        is_test = df['id'] % 10 < 3
+        model = LinearRegression().fit(df.loc[~is_test, ['population']], df.loc[~is_test, 'visitors'])
+        predictions = model.predict(df.loc[is_test, ['population']])
+        expected_mse = np.mean((df.loc[is_test, 'visitors'] - predictions) ** 2)
+
+        result = stream_population_visitor_stats(self.database_path, chunk_size=97)
+        self.assertEqual((int((~is_test).sum()), int(is_test.sum())), (result.train_size, result.test_size))
+        self.assertAlmostEqual(model.coef_[0], result.slope, places=6)
+        self.assertAlmostEqual(1, result.intercept / model.intercept_, places=5)
+        self.assertAlmostEqual(1, result.mean_squared_error / expected_mse, places=6)
+        self.assertAlmostEqual(1, result.root_mean_squared_error ** 2 / result.mean_squared_error)
+
+    def test_parallel_workers_give_the_same_result(self):
+        result = stream_population_visitor_stats(self.database_path, chunk_size=100)
+        parallel_result = stream_population_visitor_stats(self.database_path, chunk_size=100, workers=3)
+        np.testing.assert_allclose(result, parallel_result, rtol=1e-9)
@@ -0,0 +1,95 @@
+import re
+import unittest
+
+import pandas as pd
+
+from benchmark.generators import make_infobox_html, make_infobox_wikitext, make_wiki_pages, make_wiki_wikitexts
+from src.infobox_parser import parse_infobox
+from src.museum_pipeline import stream_museum_data
+from src.page_source import MediaWikiPageSource, WikitextPage, WikitextPageSource
+from src.wikitext_infobox import parse_infobox_wikitext
+from stub_wiki_server import StubWikiServer
+
+CITATION_PATTERN = re.compile(r'\[\d+\]')
+
+LOUVRE_WIKITEXT = """{{Short description|Art museum in Paris, France}}
+{{Infobox museum
+| name = Louvre <!-- the name is the caption, not a row -->
+| image = [[File:Louvre Museum.jpg|thumb|The [[Louvre Pyramid]]]]
+| established = {{start date and age|1793|08|10|df=y}}<ref name="history">{{cite web |title=History}}</ref>
+| location = [[Musée du Louvre|Rue de Rivoli]], 75001 [[Paris]], France
+| coordinates = {{coord|48|51|40|N|2|20|11|E|region:FR|display=inline,title}}
+| type = [[Art museum]] and ''design'' museum
+| collection = 615,797<ref>Collection</ref>
+| visitors = {{increase}} 8.9&nbsp;million (2023)<ref name="visitors" />
+| director = {{ubl|[[Laurence des Cars]]|Someone Else}}
+| website = {{URL|https://www.louvre.fr/}}
+| publictransit = {{plainlist|
+* Palais Royal – Musée du Louvre
+* Bus 21}}
+}}
+The '''Louvre''' is the world's most visited museum.
+{{Infobox museum | type = Another infobox}}"""
+
+
+class TestWikitextInfobox(unittest.TestCase):
+    def test_same_rows_as_the_rendered_infobox(self):
+        for i in range(12):
+            with self.subTest(museum=i):
+                rendered = {key: CITATION_PATTERN.sub('', value)
+                            for key, value in parse_infobox(make_infobox_html(i)).items()}
+                self.assertEqual(rendered, parse_infobox_wikitext(make_infobox_wikitext(i)))
+
+    def test_templates_links_and_references_are_rendered_to_text(self):
+        self.assertEqual({'Established': '10 August 1793', 'Location': 'Rue de Rivoli, 75001 Paris, France',
+                          'Type': 'Art museum and design museum', 'Collection size': '615,797',
+                          'Visitors': '8.9 million (2023)', 'Director': 'Laurence des Cars, Someone Else',
+                          'Website': 'www.louvre.fr', 'Public transit access': 'Palais Royal  Muse du Louvre, Bus 21',
+                          'latitude': '48.86111', 'longitude': '2.33639'}, parse_infobox_wikitext(LOUVRE_WIKITEXT))
+
+    def test_coordinates_of_the_page_are_used_when_the_infobox_has_none(self):
+        wikitext = '{{infobox_museum|type=Art}}'
+        self.assertEqual({'Type': 'Art', 'latitude': '1.5', 'longitude': '-2.25'},
+                         parse_infobox_wikitext(wikitext, (1.5, -2.25)))
+        self.assertEqual({}, parse_infobox_wikitext('No infobox {{coord|1|2}}', (1.5, -2.25)))
+        self.assertEqual({}, parse_infobox_wikitext('{{Infobox museum | type = not closed'))
+
+
+class TestWikitextPageSource(unittest.TestCase):
+    def test_batch_resolves_redirects_and_missing_pages(self):
+        with StubWikiServer({'Museum_A': '', 'Museum_B': ''}, revisions={'Museum_A': 5},
+                            redirects={'Museum_A_redirect': 'Museum_A'},
+                            wikitexts={'Museum_A': '{{Infobox museum|type=Art}}'},
+                            coordinates={'Museum_A': (1.5, 2.5)}) as server:
+            pages = WikitextPageSource(server.api_url).fetch_wikitext_pages(
+                ['Museum_A_redirect', 'Museum_A', 'Museum_B', 'Missing'])
+
+            self.assertEqual(1, len(server.requests))
+
+        self.assertEqual(WikitextPage('Museum_A_redirect', 5, '{{Infobox museum|type=Art}}', (1.5, 2.5)),
+                         pages['Museum_A_redirect'])
+        self.assertEqual(pages['Museum_A_redirect'][1:], pages['Museum_A'][1:])
+        self.assertEqual((1, '', None), pages['Museum_B'][1:])
+        self.assertIsNone(pages['Missing'])
+
+    def test_pipeline_fetches_batches_with_fewer_requests_and_bytes(self):
+        wiki_pages = make_wiki_pages(120, ['Paris', 'London', 'Tokyo'], fixtures_dir='')
+        museums = {}
+        for page_source_class in (MediaWikiPageSource, WikitextPageSource):
+            with StubWikiServer(wiki_pages, wikitexts=make_wiki_wikitexts(wiki_pages)) as server:
+                museum_all_data_df = stream_museum_data(page_source_class(server.api_url), parse_workers=0)
+                museums[page_source_class] = (museum_all_data_df, server.count('parse') + server.count('query'),
+                                              server.bytes_sent)
+
+        html_df, html_requests, html_bytes = museums[MediaWikiPageSource]
+        wikitext_df, wikitext_requests, wikitext_bytes = museums[WikitextPageSource]
+        # The list page is fetched twice as html, the 120 museum pages one by one or in 3 batches
+        self.assertEqual(122, html_requests)
+        self.assertEqual(5, wikitext_requests)
+        self.assertLess(wikitext_bytes, html_bytes)
+        self.assertEqual(120, len(wikitext_df))
+        pd.testing.assert_frame_equal(html_df.drop(columns='revision_id'), wikitext_df.drop(columns='revision_id'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.add_city_population import fetch_world_cities_df, WORLD_CITIES_POPULATION_FILE_PATH
+from src.world_cities_index import WorldCitiesIndex
+
+WORLD_CITIES_CSV = os.path.join(os.path.dirname(__file__), '../src', WORLD_CITIES_POPULATION_FILE_PATH)
+CSV_HEADER = '"city","city_ascii","lat","lng","country","iso2","iso3","admin_name","capital","population","id"\n'
+
+
+class TestWorldCitiesIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_dir = os.path.join(self.tmp_dir.name, 'index')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_csv(self, rows):
+        csv_path = os.path.join(self.tmp_dir.name, 'worldcities.csv')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write(CSV_HEADER)
+            for city, country, population in rows:
+                f.write(f'"{city}","{city}","1.0","2.0","{country}","XX","XXX","","","{population}","1"\n')
+        return csv_path
+
+    def test_same_as_merge_with_world_cities_df(self):
+        world_cities_df = fetch_world_cities_df()
+        museums_df = pd.DataFrame({'city': list(world_cities_df['city']) + ['Atlantis']})
+        expected = pd.merge(museums_df, world_cities_df, how='left', on='city')
+
+        index = WorldCitiesIndex.load(WORLD_CITIES_CSV, self.index_dir)
+        rows = index.lookup_many(museums_df['city'])
+        np.testing.assert_array_equal(expected['country'].fillna('').to_numpy(),
+                                      pd.Series(index.country_of(rows)).fillna('').to_numpy())
+        np.testing.assert_allclose(expected['population'].to_numpy(), index.population_of(rows))
+        self.assertIsInstance(index.population, np.memmap)
+
+    def test_aliases_and_normalized_names(self):
+        index = WorldCitiesIndex.load(WORLD_CITIES_CSV, self.index_dir)
+        self.assertEqual(index.lookup('New York'), index.lookup('New York City'))
+        self.assertEqual(index.lookup('Washington'), index.lookup('Washington, D.C.'))
+        self.assertEqual(index.lookup('Xi’an'), index.lookup("Xi'an"))
+        self.assertNotEqual(index.lookup('LaFayette'), index.lookup('Lafayette'))
+        self.assertEqual('Xi’an', index.city_name(index.lookup("Xi'an")))
+        self.assertEqual(-1, index.lookup(np.nan))
+
+    def test_rebuilt_when_csv_changes(self):
+        csv_path = self.write_csv([('Springfield', 'United States', 1000), ('Springfield', 'Canada', 10)])
+        index = WorldCitiesIndex.load(csv_path, self.index_dir)
+        self.assertEqual(1000, index.population_of(np.array([index.lookup('Springfield')]))[0])
+
+        self.write_csv([('Springfield', 'United States', 2000), ('Shelbyville', 'United States', 500)])
+        index = WorldCitiesIndex.load(csv_path, self.index_dir)
+        self.assertEqual(2, len(index))
+        rows = index.lookup_many(pd.Series(['Springfield', 'Shelbyville', 'Springfield']))
+        self.assertEqual([2000, 500, 2000], list(index.population_of(rows)))